@@ -0,0 +1,44 @@
+"""
+Rebuild the hourly/daily rollup collections from raw_events.
+
+Run once after enabling rollups to cover history, or to repair a period
+after a failed rollup update. Each day in the range is rebuilt from scratch,
+so the command can be re-run safely. By default it stops at midnight UTC
+today; pass --end tomorrow's date to also rebuild today (events that arrive
+while it runs may then be missed or counted twice for the current hour).
+
+Usage:
+    python scripts/backfill_rollups.py --days 90
+    python scripts/backfill_rollups.py --start 2025-01-01 --end 2025-02-01
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.rollups import backfill_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill event rollups from raw_events")
+    parser.add_argument("--days", type=int, default=30, help="Days of history to rebuild (default: 30)")
+    parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD, overrides --days)")
+    parser.add_argument("--end", help="Day to stop at, exclusive (YYYY-MM-DD, default: now)")
+    args = parser.parse_args()
+    
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = datetime.fromisoformat(args.end) if args.end else today
+    start = datetime.fromisoformat(args.start) if args.start else end - timedelta(days=args.days)
+    
+    print(f"Rebuilding rollups from {start.date()} to {end.date()}...")
+    total = backfill_rollups(start, end)
+    print(f"Rolled up {total} events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare the in-process and shared-memory rate limiters.
+
+Measures single-process throughput with many distinct IPs, throughput with
+several processes hitting the limiter at once, and how many requests one IP
+gets through when it spreads them over all processes (the in-process limiter
+allows burst x processes, the shared one allows burst).
+
+Usage:
+    python scripts/benchmark_rate_limiter.py [--processes 4] [--requests 200000] [--keys 10000]
+"""
+
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.rate_limiter import TokenBucketLimiter
+from src.shared_memory import SharedTokenBucketLimiter, is_supported
+
+RATE = 20
+BURST = 20
+
+
+def make_limiter(kind, path):
+    if kind == "shared":
+        return SharedTokenBucketLimiter(RATE, BURST, path)
+    return TokenBucketLimiter(RATE, BURST)
+
+
+def run(kind, path, requests, keys, results):
+    limiter = make_limiter(kind, path)
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(keys)]
+    started = time.perf_counter()
+    for i in range(requests):
+        limiter.hit(ips[i % keys])
+    results.put(time.perf_counter() - started)
+
+
+def allowed_for_one_ip(kind, path, attempts, results):
+    limiter = make_limiter(kind, path)
+    results.put(sum(not limiter.hit("203.0.113.7")[0] for _ in range(attempts)))
+
+
+def in_processes(context, target, processes, args):
+    results = context.Queue()
+    workers = [context.Process(target=target, args=(*args, results)) for _ in range(processes)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    values = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return values, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rate limiter backends")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes (default: 4)")
+    parser.add_argument("--requests", type=int, default=200000, help="Requests per process (default: 200000)")
+    parser.add_argument("--keys", type=int, default=10000, help="Distinct client IPs (default: 10000)")
+    args = parser.parse_args()
+
+    kinds = ["memory"] + (["shared"] if is_supported() else [])
+    if not is_supported():
+        print("Shared-memory backend needs fcntl; only benchmarking the in-process limiter")
+    context = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'backend':<8} {'1 process':>14} {f'{args.processes} processes':>16} {'one IP allowed':>16}")
+        for kind in kinds:
+            path = Path(directory) / f"bench-{kind}.bin"
+            single, _ = in_processes(context, run, 1, (kind, path, args.requests, args.keys))
+            _, elapsed = in_processes(context, run, args.processes,
+                                      (kind, path.with_suffix(".multi"), args.requests, args.keys))
+            allowed, _ = in_processes(context, allowed_for_one_ip, args.processes,
+                                      (kind, path.with_suffix(".one"), BURST * 2))
+            print(f"{kind:<8} {args.requests / single[0]:>10,.0f} /s "
+                  f"{args.requests * args.processes / elapsed:>12,.0f} /s "
+                  f"{sum(allowed):>9} of {BURST}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Copy raw_events into the time-series events collection.
+
+The existing collection is split into time chunks that are copied in
+parallel. Finished chunks are recorded, so an interrupted run can simply be
+started again. Events keep their _id; the source collection is not modified.
+
+Typical switch-over:
+    python scripts/migrate_to_timeseries.py --workers 8
+    # set RAW_EVENTS_TIMESERIES=true and deploy
+    python scripts/migrate_to_timeseries.py   # copies events written meanwhile
+
+Usage:
+    python scripts/migrate_to_timeseries.py [--workers 4] [--chunk-hours 24] [--batch-size 1000]
+"""
+
+import argparse
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.config import RAW_EVENTS_TIMESERIES_COLLECTION, RAW_EVENTS_TIMESERIES_GRANULARITY
+from src.database import get_backend_status, get_collection
+from src.indexes import sync_indexes
+from src.timeseries import MIGRATIONS_COLLECTION, migrate_to_timeseries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy raw_events into the time-series collection")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel copy threads (default: 4)")
+    parser.add_argument("--chunk-hours", type=int, default=24, help="Hours of events per chunk (default: 24)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents per insert (default: 1000)")
+    parser.add_argument("--restart", action="store_true", help="Forget recorded progress and copy every chunk again")
+    args = parser.parse_args()
+
+    db = get_collection(MIGRATIONS_COLLECTION).database
+    target = RAW_EVENTS_TIMESERIES_COLLECTION
+    if args.restart:
+        db[MIGRATIONS_COLLECTION].delete_many({"migration": f"raw_events->{target}"})
+
+    backend = get_backend_status()["backend"]
+    print(f"Migrating raw_events to {target} ({backend}, {args.workers} workers)...")
+    stats = migrate_to_timeseries(
+        db, "raw_events", target,
+        chunk=timedelta(hours=args.chunk_hours),
+        workers=args.workers,
+        batch_size=args.batch_size,
+        granularity=RAW_EVENTS_TIMESERIES_GRANULARITY
+    )
+    sync_indexes(db, [target])
+    print(f"Copied {stats['copied']} events in {stats['chunks']} chunks "
+          f"({stats['resumed']} chunks already done, {stats['duplicates']} already present)")
+    if stats["skipped"]:
+        print(f"Skipped {stats['skipped']} events without a datetime timestamp")
+
+
+if __name__ == "__main__":
+    main()
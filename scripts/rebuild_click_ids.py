@@ -0,0 +1,41 @@
+"""
+Rebuild the click_ids collection from raw_events.
+
+Run once after enabling click id lookups to cover history, or to repair a
+period after a failed update. The updates only move first touches earlier
+and last-seen times later, so the command can be re-run safely.
+
+Usage:
+    python scripts/rebuild_click_ids.py --days 90
+    python scripts/rebuild_click_ids.py --start 2025-01-01 --end 2025-02-01
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.click_ids import rebuild_click_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild click id first touches from raw_events")
+    parser.add_argument("--days", type=int, default=30, help="Days of history to rebuild (default: 30)")
+    parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD, overrides --days)")
+    parser.add_argument("--end", help="Day to stop at, exclusive (YYYY-MM-DD, default: now)")
+    args = parser.parse_args()
+    
+    end = datetime.fromisoformat(args.end) if args.end else datetime.utcnow()
+    start = datetime.fromisoformat(args.start) if args.start else end - timedelta(days=args.days)
+    
+    print(f"Rebuilding click ids from events between {start.date()} and {end.date()}...")
+    total = rebuild_click_ids(start, end)
+    print(f"Read {total} events")
+
+
+if __name__ == "__main__":
+    main()
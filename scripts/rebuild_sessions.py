@@ -0,0 +1,41 @@
+"""
+Rebuild the sessions collection from raw_events.
+
+Run once after enabling session summaries to cover history, or to repair a
+period after a failed session update. Every session with events in the range
+is recomputed from all of its events, so the command can be re-run safely.
+
+Usage:
+    python scripts/rebuild_sessions.py --days 90
+    python scripts/rebuild_sessions.py --start 2025-01-01 --end 2025-02-01
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.sessions import rebuild_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild session summaries from raw_events")
+    parser.add_argument("--days", type=int, default=30, help="Days of history to rebuild (default: 30)")
+    parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD, overrides --days)")
+    parser.add_argument("--end", help="Day to stop at, exclusive (YYYY-MM-DD, default: now)")
+    args = parser.parse_args()
+    
+    end = datetime.fromisoformat(args.end) if args.end else datetime.utcnow()
+    start = datetime.fromisoformat(args.start) if args.start else end - timedelta(days=args.days)
+    
+    print(f"Rebuilding sessions with events from {start.date()} to {end.date()}...")
+    total = rebuild_sessions(start, end)
+    print(f"Rebuilt {total} sessions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Drain the local event log into MongoDB.
+
+Useful after a MongoDB outage, or to drain segments left behind by workers
+that were shut down before their replayer caught up.
+"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.config import EVENT_LOG_DIR, EVENT_BATCH_SIZE
+from src.event_log import EventLog, EventLogReplayer
+from src.track_handler import replay_events
+
+
+def main():
+    log = EventLog(EVENT_LOG_DIR)
+    replayer = EventLogReplayer(log, replay_events, batch_size=EVENT_BATCH_SIZE)
+    
+    print(f"Replaying event log in {EVENT_LOG_DIR}...")
+    replayed = replayer.replay()
+    stats = log.get_stats()
+    print(f"Replayed {replayed} events; {stats['segments']} segments ({stats['backlog_bytes']} bytes) remaining")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Attribute conversions to marketing touches, per day (src/analysis/attribution.py).
+
+Each run computes the days that have no stored results yet, plus today, so
+it can be scheduled as often as needed (e.g. hourly). --start recomputes
+from a day onwards, e.g. after replaying late events.
+
+Usage:
+    python scripts/run_attribution.py
+    python scripts/run_attribution.py --every 3600
+    python scripts/run_attribution.py --start 2024-01-01
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.analysis.attribution import run_attribution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attribute conversions to marketing touches")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Recompute from this day (YYYY-MM-DD)")
+    parser.add_argument("--every", type=float, help="Keep running, once every this many seconds")
+    args = parser.parse_args()
+    
+    start = args.start
+    while True:
+        result = run_attribution(start=start)
+        print(f"Attributed {result['conversions']} conversions over {len(result['days'])} days")
+        start = None
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Process new raw_events into the page pathway tables (src/pathways.py).
+
+Each run picks up where the previous one stopped, so it can be scheduled as
+often as needed (e.g. a cron job every minute, or --every 60). Runs on
+several hosts do not overlap: a run that finds another one in progress
+skips.
+
+Usage:
+    python scripts/run_pathways.py
+    python scripts/run_pathways.py --every 60 --workers 8
+    python scripts/run_pathways.py --rebuild
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.pathways import rebuild_pathways, run_pathways_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build page pathways from raw_events")
+    parser.add_argument("--workers", type=int, help="Parallel time partitions (default: PATHWAYS_WORKERS)")
+    parser.add_argument("--every", type=float, help="Keep running, once every this many seconds")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the pathway tables and start over")
+    args = parser.parse_args()
+    
+    if args.rebuild:
+        print(f"Rebuilt pathways: {rebuild_pathways(workers=args.workers)}")
+        if not args.every:
+            return
+        time.sleep(args.every)
+    
+    while True:
+        print(f"Pathways: {run_pathways_job(workers=args.workers)}")
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Create or update MongoDB indexes from the registry in src/indexes.py.
+
+Safe to run repeatedly; run it on every deploy (see render.yaml).
+
+Usage:
+    python scripts/sync_indexes.py [--dry-run] [--drop-unknown]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.database import create_indexes, get_backend_status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync MongoDB indexes with the index registry")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--drop-unknown", action="store_true", help="Drop indexes that are not in the registry")
+    args = parser.parse_args()
+    
+    report = create_indexes(drop_unknown=args.drop_unknown, dry_run=args.dry_run)
+    backend = get_backend_status()["backend"]
+    print(f"Index sync ({backend}{', dry run' if args.dry_run else ''}):")
+    for collection, result in report.items():
+        print(f"  {collection}:")
+        for action in ("created", "rebuilt", "dropped", "unknown"):
+            if result[action]:
+                print(f"    {action}: {', '.join(result[action])}")
+        print(f"    unchanged: {len(result['unchanged'])}")
+
+
+if __name__ == "__main__":
+    main()
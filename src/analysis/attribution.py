@@ -0,0 +1,336 @@
+"""
+Multi-touch attribution of conversions to marketing touches.
+
+A touch is an event that carries a marketing channel: a utm_source that is
+not a backend source (ATTRIBUTION_EXCLUDED_SOURCES / _MEDIUMS, e.g. the
+Easy!Appointments booking event), or a platform click id. A conversion is
+joined to the touches made before it, within ATTRIBUTION_LOOKBACK_DAYS:
+
+- in its own session,
+- in the session where one of its click ids (gclid / fbclid / ttclid /
+  msclkid) was first seen, looked up by _id in click_ids (src/click_ids.py).
+
+Consecutive touches of the same channel collapse into one. Credit models
+(each conversion's credit sums to 1; revenue is credit x conversion_value):
+
+    first_touch     all credit to the first touch
+    last_touch      all credit to the last touch
+    linear          equal credit to every touch
+    time_decay      weight 2^(-age / ATTRIBUTION_HALF_LIFE_DAYS), normalized
+    position_based  40% first, 40% last, 20% shared by the touches between
+
+Conversions without a touch are credited to utm_source "(direct)".
+
+The join and the models run on NumPy arrays: join keys are integer codes,
+(conversion, touch) pairs come from one sorted searchsorted expansion, and
+credits are summed with np.bincount. Results are stored per conversion day
+in attribution_daily. run_attribution() only computes days that are not
+stored yet (plus today, which is still changing), so adding a day of data
+does not recompute history.
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import InsertOne
+from ..config import ATTRIBUTION_LOOKBACK_DAYS, ATTRIBUTION_HALF_LIFE_DAYS
+from ..click_ids import click_key, is_backend_event, resolve_keys
+from ..database import get_collection
+import logging
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTION = "attribution_daily"
+JOBS = "jobs"
+JOB_ID = "attribution"
+
+MODELS = ("first_touch", "last_touch", "linear", "time_decay", "position_based")
+CHANNEL_FIELDS = ("utm_source", "utm_medium", "utm_campaign", "platform_detected")
+CLICK_IDS = ("gclid", "fbclid", "ttclid", "msclkid")
+DIRECT = "(direct)"
+
+_EVENT_FIELDS = ("session_id", "timestamp", "event_type", "conversion_value") + CHANNEL_FIELDS + CLICK_IDS
+_PROJECTION = {field: 1 for field in _EVENT_FIELDS}
+# Values per $in query
+_CHUNK = 1000
+_MS_PER_DAY = 86_400_000
+
+
+def _day(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _is_touch(event):
+    # Backend events only link to touches through their click ids
+    if is_backend_event(event):
+        return False
+    return bool(event.get("utm_source")) or any(event.get(field) for field in CLICK_IDS)
+
+
+def _keys(event):
+    """Join keys of an event: its session(s) and its click ids."""
+    sessions = [event["session_id"]] if event.get("session_id") else []
+    sessions.extend(event.get("linked_sessions", ()))
+    keys = [("session_id", session) for session in dict.fromkeys(sessions)]
+    keys.extend((field, event[field]) for field in CLICK_IDS if event.get(field))
+    return keys
+
+
+def _find_in(collection, field, values, extra):
+    values = list(values)
+    for i in range(0, len(values), _CHUNK):
+        yield from collection.find({field: {"$in": values[i:i + _CHUNK]}, **extra}, _PROJECTION)
+
+
+def load_day(day):
+    """
+    Read the conversions of one day and every touch they can be joined to.
+
+    Each conversion gets "linked_sessions": the sessions its click ids were
+    first seen in.
+
+    Returns:
+        tuple: (conversions, touches) as lists of event dicts
+    """
+    raw_events = get_collection("raw_events")
+    conversions = list(raw_events.find(
+        {"event_type": "conversion", "timestamp": {"$gte": day, "$lt": day + timedelta(days=1)}}, _PROJECTION
+    ))
+    window = {"timestamp": {"$gte": day - timedelta(days=ATTRIBUTION_LOOKBACK_DAYS), "$lt": day + timedelta(days=1)}}
+
+    keys = {c["_id"]: [click_key(field, c[field]) for field in CLICK_IDS if c.get(field)] for c in conversions}
+    clicks = resolve_keys([key for conversion_keys in keys.values() for key in conversion_keys])
+
+    sessions = set()
+    for conversion in conversions:
+        linked = {clicks[key]["first_touch"].get("session_id") for key in keys[conversion["_id"]] if key in clicks}
+        linked.discard(None)
+        conversion["linked_sessions"] = sorted(linked)
+        sessions |= linked
+        if conversion.get("session_id"):
+            sessions.add(conversion["session_id"])
+    return conversions, [event for event in _find_in(raw_events, "session_id", sessions, window) if _is_touch(event)]
+
+
+def _codes(values, index):
+    return np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+
+
+def _join(conv_keys, touch_keys):
+    """
+    All (conversion, touch) pairs that share a key.
+
+    Args:
+        conv_keys, touch_keys: (row index array, key code array) pairs
+
+    Returns:
+        tuple: (conversion indices, touch indices), unique pairs
+    """
+    conv_rows, conv_codes = conv_keys
+    touch_rows, touch_codes = touch_keys
+    order = np.argsort(touch_codes, kind="stable")
+    sorted_codes = touch_codes[order]
+    lo = np.searchsorted(sorted_codes, conv_codes, side="left")
+    hi = np.searchsorted(sorted_codes, conv_codes, side="right")
+    counts = hi - lo
+    total = int(counts.sum())
+    starts = np.repeat(lo, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    pairs_conv = np.repeat(conv_rows, counts)
+    pairs_touch = touch_rows[order[starts + offsets]]
+    if not total:
+        return pairs_conv, pairs_touch
+    n_touches = int(touch_rows.max()) + 1
+    unique = np.unique(pairs_conv * n_touches + pairs_touch)
+    return unique // n_touches, unique % n_touches
+
+
+def compute_credits(conv_time, conv_value, touch_time, touch_channel, pairs):
+    """
+    Credit per channel under every model.
+
+    Args:
+        conv_time, touch_time (ndarray): int64 ms timestamps
+        conv_value (ndarray): Conversion values
+        touch_channel (ndarray): Channel code per touch
+        pairs (tuple): (conversion indices, touch indices) from _join
+
+    Returns:
+        dict: {model: (channel codes, conversions credit, revenue credit)};
+        channel code -1 is "(direct)"
+    """
+    conv, touch = pairs
+    # Only touches up to the conversion, inside the lookback window
+    age = conv_time[conv] - touch_time[touch]
+    keep = (age >= 0) & (age <= ATTRIBUTION_LOOKBACK_DAYS * _MS_PER_DAY)
+    conv, touch, age = conv[keep], touch[keep], age[keep]
+
+    # Order each conversion's touches by time and drop repeats of the same channel
+    order = np.lexsort((touch_time[touch], conv))
+    conv, touch, age = conv[order], touch[order], age[order]
+    channel = touch_channel[touch]
+    repeat = np.zeros(len(conv), dtype=bool)
+    repeat[1:] = (conv[1:] == conv[:-1]) & (channel[1:] == channel[:-1])
+    conv, channel, age = conv[~repeat], channel[~repeat], age[~repeat]
+
+    n_conv = len(conv_time)
+    per_conv = np.bincount(conv, minlength=n_conv)
+    first_row = np.cumsum(per_conv) - per_conv
+    rank = np.arange(len(conv)) - first_row[conv]
+    n = per_conv[conv]
+    is_first = rank == 0
+    is_last = rank == n - 1
+
+    decay = np.exp2(-age / (ATTRIBUTION_HALF_LIFE_DAYS * _MS_PER_DAY))
+    decay_total = np.bincount(conv, weights=decay, minlength=n_conv)
+    middle = np.where(n > 2, 0.2 / np.maximum(n - 2, 1), 0.0)
+    ends = np.where(n == 1, 1.0, np.where(n == 2, 0.5, 0.4))
+    weights = {
+        "first_touch": is_first.astype(float),
+        "last_touch": is_last.astype(float),
+        "linear": 1.0 / n,
+        "time_decay": decay / decay_total[conv],
+        "position_based": np.where(is_first | is_last, ends, middle),
+    }
+
+    # Conversions without any touch go to (direct)
+    direct = np.flatnonzero(per_conv == 0)
+    channel = np.concatenate([channel, np.full(len(direct), -1)])
+    values = np.concatenate([conv_value[conv], conv_value[direct]])
+    results = {}
+    for model, weight in weights.items():
+        weight = np.concatenate([weight, np.ones(len(direct))])
+        codes, inverse = np.unique(channel, return_inverse=True)
+        results[model] = (
+            codes,
+            np.bincount(inverse, weights=weight, minlength=len(codes)),
+            np.bincount(inverse, weights=weight * values, minlength=len(codes)),
+        )
+    return results
+
+
+def _value(event):
+    value = event.get("conversion_value")
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+def attribute(conversions, touches):
+    """
+    Attribute a set of conversions to touches.
+
+    Returns:
+        list: Dicts with model, the channel fields, conversions and revenue credit
+    """
+    if not conversions:
+        return []
+    key_index = {}
+    conv_rows, conv_keys = [], []
+    for i, event in enumerate(conversions):
+        for key in _keys(event):
+            conv_rows.append(i)
+            conv_keys.append(key)
+    touch_rows, touch_keys = [], []
+    for i, event in enumerate(touches):
+        for key in _keys(event):
+            touch_rows.append(i)
+            touch_keys.append(key)
+    conv_codes = _codes(conv_keys, key_index)
+    touch_codes = _codes(touch_keys, key_index)
+    pairs = _join((np.array(conv_rows, dtype=np.int64), conv_codes),
+                  (np.array(touch_rows, dtype=np.int64), touch_codes))
+
+    channel_index = {}
+    touch_channel = _codes([tuple(t.get(f) for f in CHANNEL_FIELDS) for t in touches], channel_index)
+    channels = list(channel_index)
+    as_ms = lambda events: np.array([e["timestamp"] for e in events], dtype="datetime64[ms]").astype(np.int64)
+    credits = compute_credits(
+        as_ms(conversions), np.array([_value(c) for c in conversions]),
+        as_ms(touches) if touches else np.zeros(0, dtype=np.int64), touch_channel, pairs
+    )
+
+    rows = []
+    for model, (codes, conversions_credit, revenue) in credits.items():
+        for code, credit, value in zip(codes, conversions_credit, revenue):
+            if not credit:
+                continue
+            fields = channels[code] if code >= 0 else (DIRECT, None, None, None)
+            rows.append({"model": model, **dict(zip(CHANNEL_FIELDS, fields)),
+                         "conversions": float(credit), "revenue": float(value)})
+    return rows
+
+
+def attribute_day(day):
+    """
+    Compute and store the attribution of one day's conversions (replacing it).
+
+    Returns:
+        int: Number of conversions attributed
+    """
+    day = _day(day)
+    conversions, touches = load_day(day)
+    rows = attribute(conversions, touches)
+    collection = get_collection(ATTRIBUTION)
+    collection.delete_many({"day": day})
+    if rows:
+        collection.bulk_write([InsertOne({"day": day, **row}) for row in rows], ordered=False)
+    return len(conversions)
+
+
+def run_attribution(start=None, until=None):
+    """
+    Attribute every day that has not been stored yet, and today.
+
+    Complete days are computed once and recorded in the jobs collection;
+    today is recomputed on every run. Pass `start` to recompute from a day
+    onwards (e.g. after late events).
+
+    Returns:
+        dict: {"days": [...], "conversions": int}
+    """
+    today = _day(until or datetime.utcnow())
+    jobs = get_collection(JOBS)
+    job = jobs.find_one({"_id": JOB_ID}) or {}
+    if start is not None:
+        day = _day(start)
+    elif job.get("through"):
+        day = job["through"] + timedelta(days=1)
+    else:
+        first = get_collection("raw_events").find_one(
+            {"event_type": "conversion"}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        day = _day(first["timestamp"]) if first else today
+
+    days, total = [], 0
+    while day <= today:
+        total += attribute_day(day)
+        days.append(day)
+        if day < today:
+            jobs.update_one({"_id": JOB_ID}, {"$set": {"through": day}}, upsert=True)
+        day += timedelta(days=1)
+    logger.info(f"Attributed {total} conversions over {len(days)} days")
+    return {"days": days, "conversions": total}
+
+
+def get_attribution(start, end, model="linear", group_by=("utm_source", "utm_campaign")):
+    """
+    Attributed conversions and revenue per channel for the days in [start, end).
+
+    Returns:
+        list: Dicts with the group_by fields, conversions and revenue, most revenue first
+    """
+    if model not in MODELS:
+        raise ValueError(f"model must be one of: {', '.join(MODELS)}")
+    if any(field not in CHANNEL_FIELDS for field in group_by):
+        raise ValueError(f"group_by fields must be in: {', '.join(CHANNEL_FIELDS)}")
+    pipeline = [
+        {"$match": {"model": model, "day": {"$gte": _day(start), "$lt": end}}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in group_by},
+            "conversions": {"$sum": "$conversions"},
+            "revenue": {"$sum": "$revenue"},
+        }},
+        {"$sort": {"revenue": -1}},
+    ]
+    return [
+        {**{field: row["_id"].get(field) for field in group_by},
+         "conversions": row["conversions"], "revenue": row["revenue"]}
+        for row in get_collection(ATTRIBUTION).aggregate(pipeline)
+    ]
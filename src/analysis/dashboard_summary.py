@@ -0,0 +1,190 @@
+"""
+Dashboard summary from the hourly and daily rollups.
+
+One call returns what the dashboard shows above its event table:
+
+- totals: events, conversions, revenue and conversions per event;
+- series: the same counters per hour or per day of a timezone, with empty
+  buckets filled in;
+- breakdowns: the top values of platform_detected, utm_source,
+  utm_campaign and domain (derived from the rollup's site/host).
+
+Totals and breakdowns come from one query_rollups() call grouped by site,
+utm_source, utm_campaign and platform_detected; the series from one
+aggregation over the rollups grouped by bucket. Nothing reads raw_events,
+so the cost depends on the number of rollup documents in the range, not on
+the number of events. Rollups are kept in UTC hours: a timezone whose
+offset is not a whole hour gets each UTC hour in the local bucket the hour
+starts in. Daily series in a timezone whose days are not UTC days are
+summed from the hourly rollups.
+
+Results are cached for DASHBOARD_SUMMARY_CACHE_TTL_S per set of arguments,
+so the dashboard's auto-refresh does not re-run the aggregations.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from ..config import DASHBOARD_SUMMARY_CACHE_ENTRIES, DASHBOARD_SUMMARY_CACHE_TTL_S
+from ..database import get_collection
+from ..event_schema import split_host
+from ..query_cache import QueryCache, query_key
+from ..rollups import COUNTERS, DAILY, HOURLY, query_rollups
+
+INTERVALS = ("hour", "day")
+BREAKDOWN_FIELDS = ("platform_detected", "utm_source", "utm_campaign", "domain")
+# Rollup dimensions the summary can be filtered on (besides domain)
+FILTER_FIELDS = ("utm_source", "utm_medium", "utm_campaign", "platform_detected")
+MAX_BUCKETS = 1000
+
+_GROUP_BY = ["site", "utm_source", "utm_campaign", "platform_detected"]
+
+_cache = QueryCache(DASHBOARD_SUMMARY_CACHE_ENTRIES, ttl=DASHBOARD_SUMMARY_CACHE_TTL_S)
+
+
+def _zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def _utc(local):
+    """Aware local datetime as naive UTC (the way rollup buckets are stored)."""
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_starts(date_from, date_to, interval, tz):
+    """
+    UTC starts of the local hours or days from date_from to date_to (inclusive).
+
+    Returns:
+        tuple: ([naive UTC bucket starts], naive UTC end of the range)
+    """
+    start = _utc(datetime.combine(date_from, time(), tz))
+    end = _utc(datetime.combine(date_to + timedelta(days=1), time(), tz))
+    if interval == "hour":
+        starts = [start + timedelta(hours=i) for i in range(int((end - start).total_seconds() // 3600))]
+    else:
+        starts = [_utc(datetime.combine(date_from + timedelta(days=i), time(), tz))
+                  for i in range((date_to - date_from).days + 1)]
+    return starts, end
+
+
+def _whole(start, unit):
+    return start == start.replace(minute=0, second=0, microsecond=0, **({"hour": 0} if unit == "day" else {}))
+
+
+def _first_hour(start):
+    """First rollup hour that starts at or after `start`."""
+    return start if _whole(start, "hour") else start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+
+def _counters():
+    return {counter: 0 for counter in COUNTERS}
+
+
+def _add(total, row):
+    for counter in COUNTERS:
+        total[counter] += row.get(counter) or 0
+
+
+def _finish(counters):
+    counters["revenue"] = round(counters["revenue"], 2)
+    counters["conversion_rate"] = counters["conversions"] / counters["events"] if counters["events"] else 0.0
+    return counters
+
+
+def _series(starts, end, interval, match, domain, tz):
+    # Whole UTC days can be read from the daily rollups
+    name = DAILY if interval == "day" and all(_whole(start, "day") for start in starts) else HOURLY
+    group = {"bucket": "$bucket", **({"site": "$site"} if domain else {})}
+    pipeline = [
+        {"$match": {"bucket": {"$gte": starts[0], "$lt": end}, **match}},
+        {"$group": {"_id": group, **{counter: {"$sum": f"${counter}"} for counter in COUNTERS}}},
+    ]
+    buckets = [_counters() for _ in starts]
+    for row in get_collection(name).aggregate(pipeline):
+        if domain and split_host(row["_id"].get("site") or "")[0] != domain:
+            continue
+        index = bisect_right(starts, row["_id"]["bucket"]) - 1
+        if index >= 0:
+            _add(buckets[index], row)
+    return [
+        {"bucket": start.replace(tzinfo=timezone.utc).astimezone(tz).isoformat(), **_finish(counters)}
+        for start, counters in zip(starts, buckets)
+    ]
+
+
+def _top(values, limit):
+    """The `limit` values with the most events, with their counters."""
+    ranked = sorted(values.items(), key=lambda item: (-item[1]["events"], str(item[0])))
+    return [{"value": value, **_finish(counters)} for value, counters in ranked[:limit]]
+
+
+def dashboard_summary(date_from, date_to, interval="day", tz="UTC", filters=None, limit=10):
+    """
+    Totals, a time series and breakdowns of the events in a local date range.
+
+    Args:
+        date_from (date): First local day
+        date_to (date): Last local day (inclusive)
+        interval (str): "hour" or "day"
+        tz (str): IANA timezone of the dates and buckets
+        filters (dict): Equality filters on FILTER_FIELDS, and "domain"
+        limit (int): Values per breakdown (the ones with the most events)
+
+    Returns:
+        dict: start/end (UTC), totals, series, breakdowns, and whether the
+        result came from the cache
+
+    Raises:
+        ValueError: If an argument is invalid
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval} (expected one of: {', '.join(INTERVALS)})")
+    if date_from > date_to:
+        raise ValueError("date_from must not be after date_to")
+    zone = _zone(tz)
+    filters = {field: value for field, value in (filters or {}).items() if value}
+    unknown = set(filters) - set(FILTER_FIELDS) - {"domain"}
+    if unknown:
+        raise ValueError(f"Cannot filter the summary on: {', '.join(sorted(unknown))}")
+    starts, end = bucket_starts(date_from, date_to, interval, zone)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f"Too many {interval} buckets ({len(starts)}, at most {MAX_BUCKETS})")
+
+    key = query_key(date_from.isoformat(), date_to.isoformat(), interval, tz, filters, limit)
+    hit, result = _cache.get(key)
+    if hit:
+        return {**result, "cached": True}
+
+    domain = filters.pop("domain", None)
+    rows = query_rollups(_first_hour(starts[0]), end, _GROUP_BY, match=filters)
+    totals = _counters()
+    breakdowns = {field: {} for field in BREAKDOWN_FIELDS}
+    for row in rows:
+        row["domain"] = split_host(row["site"])[0] if row.get("site") else None
+        if domain and row["domain"] != domain:
+            continue
+        _add(totals, row)
+        for field in BREAKDOWN_FIELDS:
+            _add(breakdowns[field].setdefault(row.get(field), _counters()), row)
+
+    result = {
+        "start": starts[0].isoformat(),
+        "end": end.isoformat(),
+        "interval": interval,
+        "timezone": tz,
+        "totals": _finish(totals),
+        "series": _series(starts, end, interval, filters, domain, zone),
+        "breakdowns": {field: _top(values, limit) for field, values in breakdowns.items()},
+    }
+    _cache.put(key, result)
+    return {**result, "cached": False}
+
+
+def default_range(tz="UTC", days=7):
+    """The last `days` local days, today included."""
+    today = datetime.now(_zone(tz)).date()
+    return today - timedelta(days=days - 1), today
@@ -0,0 +1,276 @@
+"""
+Funnel analysis with NumPy.
+
+A funnel is an ordered list of steps, each matching events by event_type
+and/or page (current_page, exact or a prefix ending in "*"):
+
+    {"steps": [{"name": "Landing", "event_type": "page_view"},
+               {"name": "Booking", "page": "/booking*"},
+               {"name": "Conversion", "event_type": "conversion"}]}
+
+A session completes step k if it has an event matching step k after the
+event that completed step k-1. Sessions are broken down by the campaign and
+platform of the event that entered the funnel.
+
+Only the events that can match a step are read, as columns (session, time,
+page, event type, breakdown fields). The rows are sorted by (session, time)
+once. Each step is then a boolean mask plus "first matching row per
+session after the previous step's row" (np.unique on the sorted session
+codes), and the per-group counts come from np.bincount. No per-event Python
+work happens after loading.
+
+Results are cached per (definition, date range, raw_events data version).
+"""
+
+import re
+import numpy as np
+from ..config import FUNNEL_CACHE_ENTRIES, QUERY_CACHE_TTL_S
+from ..database import get_collection, get_data_version, lookup_values
+from ..event_schema import COMPACT_FIELDS, LOOKUPS, VERSION_FIELD, SCHEMA_V2
+from ..query_cache import QueryCache, query_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+BREAKDOWNS = ("utm_campaign", "platform_detected", "utm_source")
+MAX_STEPS = 10
+
+_PAGE_FIELD = COMPACT_FIELDS["current_page"][0]
+_BATCH_SIZE = 5000
+
+
+def normalize_definition(definition):
+    """
+    Validate a funnel definition.
+
+    Returns:
+        dict: {"steps": [{"name", "event_type", "page"}], "breakdowns": [...]}
+
+    Raises:
+        ValueError: If the definition is invalid
+    """
+    if not isinstance(definition, dict):
+        raise ValueError("Funnel definition must be a JSON object")
+    steps = definition.get("steps")
+    if not isinstance(steps, list) or not 1 <= len(steps) <= MAX_STEPS:
+        raise ValueError(f"A funnel needs 1 to {MAX_STEPS} steps")
+
+    normalized = []
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ValueError(f"Step {i + 1} must be an object")
+        event_type, page = step.get("event_type"), step.get("page")
+        if not event_type and not page:
+            raise ValueError(f"Step {i + 1} needs an event_type or a page")
+        if any(value is not None and not isinstance(value, str) for value in (event_type, page)):
+            raise ValueError(f"Step {i + 1}: event_type and page must be strings")
+        normalized.append({"name": str(step.get("name") or page or event_type),
+                           "event_type": event_type or None, "page": page or None})
+
+    breakdowns = definition.get("breakdowns", ["utm_campaign", "platform_detected"])
+    if not isinstance(breakdowns, list) or any(field not in BREAKDOWNS for field in breakdowns):
+        raise ValueError(f"breakdowns must be a list of: {', '.join(BREAKDOWNS)}")
+    return {"steps": normalized, "breakdowns": list(dict.fromkeys(breakdowns))}
+
+
+def _page_condition(page):
+    if page.endswith("*"):
+        return {"$regex": "^" + re.escape(page[:-1])}
+    return page
+
+
+def _page_matches(page, value):
+    if not isinstance(value, str):
+        return False
+    return value.startswith(page[:-1]) if page.endswith("*") else value == page
+
+
+def _events_filter(steps, start, end):
+    """Events in the range that can match at least one step (either storage layout)."""
+    url_lookups = get_collection(LOOKUPS["url"])
+    clauses = []
+    for step in steps:
+        clause = {}
+        if step["event_type"]:
+            clause["event_type"] = step["event_type"]
+        if step["page"]:
+            condition = _page_condition(step["page"])
+            # Compact (v2) events store the interned id of the page
+            ids = [doc["_id"] for doc in url_lookups.find({"value": condition}, {"_id": 1})]
+            clause["$or"] = [{"current_page": condition}, {_PAGE_FIELD: {"$in": ids}}]
+        clauses.append(clause)
+    return {
+        "timestamp": {"$gte": start, "$lt": end},
+        "session_id": {"$nin": [None, ""]},
+        "$or": clauses,
+    }
+
+
+def _codes(values):
+    """Integer codes for a list of hashable values, and the values per code."""
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return codes, list(index)
+
+
+def load_columns(steps, breakdowns, start, end):
+    """
+    Read the events a funnel needs as NumPy columns.
+
+    Returns:
+        dict: "session", "time" (int64 ms), "page", "event_type" and each
+        breakdown field as int code arrays, plus "<field>_values" lists
+        mapping codes back to values
+    """
+    projection = {"_id": 0, "session_id": 1, "timestamp": 1, "event_type": 1, "current_page": 1,
+                  _PAGE_FIELD: 1, VERSION_FIELD: 1, **{field: 1 for field in breakdowns}}
+    cursor = get_collection("raw_events").find(_events_filter(steps, start, end), projection).batch_size(_BATCH_SIZE)
+
+    sessions, times, pages, event_types = [], [], [], []
+    groups = {field: [] for field in breakdowns}
+    compact = set()
+    for doc in cursor:
+        sessions.append(doc["session_id"])
+        times.append(doc["timestamp"])
+        event_types.append(doc.get("event_type"))
+        if doc.get(VERSION_FIELD) == SCHEMA_V2 and _PAGE_FIELD in doc:
+            pages.append(("id", doc[_PAGE_FIELD]))
+            compact.add(doc[_PAGE_FIELD])
+        else:
+            pages.append(doc.get("current_page"))
+        for field in breakdowns:
+            groups[field].append(doc.get(field))
+
+    columns = {"time": np.array(times, dtype="datetime64[ms]").astype(np.int64)}
+    columns["session"], columns["session_values"] = _codes(sessions)
+    columns["event_type"], columns["event_type_values"] = _codes(event_types)
+    columns["page"], page_values = _codes(pages)
+    if compact:
+        urls = lookup_values("url", compact)
+        page_values = [urls.get(v[1]) if isinstance(v, tuple) else v for v in page_values]
+    columns["page_values"] = page_values
+    for field in breakdowns:
+        columns[field], columns[f"{field}_values"] = _codes(groups[field])
+    return columns
+
+
+def _step_mask(step, columns):
+    mask = np.ones(len(columns["session"]), dtype=bool)
+    if step["event_type"]:
+        matches = np.array([value == step["event_type"] for value in columns["event_type_values"]], dtype=bool)
+        mask &= matches[columns["event_type"]] if len(matches) else False
+    if step["page"]:
+        matches = np.array([_page_matches(step["page"], value) for value in columns["page_values"]], dtype=bool)
+        mask &= matches[columns["page"]] if len(matches) else False
+    return mask
+
+
+def _rates(counts):
+    """Sessions per step, the share of the previous step and of the first step."""
+    rates = []
+    for i, count in enumerate(counts):
+        previous = counts[i - 1] if i else counts[0]
+        rates.append({
+            "sessions": int(count),
+            "step_rate": float(count / previous) if previous else 0.0,
+            "overall_rate": float(count / counts[0]) if counts[0] else 0.0,
+        })
+    return rates
+
+
+def compute_funnel(columns, steps, breakdowns):
+    """
+    Ordered step completion per session, vectorized.
+
+    Args:
+        columns (dict): As returned by load_columns
+        steps (list): Normalized steps
+        breakdowns (list): Breakdown fields present in `columns`
+
+    Returns:
+        dict: {"steps": [...], "breakdowns": {field: [{"value", "steps"}]}}
+    """
+    session = columns["session"]
+    n_sessions = len(columns["session_values"])
+    order = np.lexsort((columns["time"], session))
+    session = session[order]
+    rows = np.arange(len(session))
+
+    # Row of the event that completed the previous step, per session (-1: none needed yet)
+    reached = np.full(n_sessions, -1, dtype=np.int64)
+    entered = np.zeros(n_sessions, dtype=bool)
+    entry_row = np.zeros(n_sessions, dtype=np.int64)
+    completed = []
+    for k, step in enumerate(steps):
+        candidates = _step_mask(step, columns)[order] & (rows > reached[session])
+        if k:
+            candidates &= reached[session] >= 0
+        hit_rows = np.flatnonzero(candidates)
+        # Rows are sorted by session then time: the first hit per session is the earliest
+        hit_sessions, first = np.unique(session[hit_rows], return_index=True)
+        reached = np.full(n_sessions, -1, dtype=np.int64)
+        reached[hit_sessions] = hit_rows[first]
+        if k == 0:
+            entered[hit_sessions] = True
+            entry_row[hit_sessions] = order[hit_rows[first]]
+        completed.append(reached >= 0)
+
+    counts = [int(done.sum()) for done in completed]
+    result = {
+        "steps": [{"name": step["name"], **rates} for step, rates in zip(steps, _rates(counts))],
+        "breakdowns": {},
+    }
+    for field in breakdowns:
+        values = columns[f"{field}_values"]
+        group = columns[field][entry_row]
+        per_step = np.stack([np.bincount(group[done], minlength=len(values)) for done in completed]) \
+            if values else np.zeros((len(steps), 0), dtype=np.int64)
+        groups = [
+            {"value": values[g], "steps": [{"name": step["name"], **rates}
+                                           for step, rates in zip(steps, _rates(per_step[:, g]))]}
+            for g in np.flatnonzero(per_step[0])
+        ]
+        groups.sort(key=lambda g: -g["steps"][0]["sessions"])
+        result["breakdowns"][field] = groups
+    result["events"] = len(session)
+    result["sessions"] = int(entered.sum())
+    return result
+
+
+_cache = QueryCache(FUNNEL_CACHE_ENTRIES, ttl=QUERY_CACHE_TTL_S)
+
+
+def get_funnel_cache_stats():
+    """Size, hit/miss and eviction counts of this process's funnel result cache."""
+    return _cache.stats()
+
+
+def run_funnel(definition, start, end):
+    """
+    Step completion counts and conversion rates of a funnel over [start, end).
+
+    Args:
+        definition (dict): Funnel definition (see module docstring); optional
+            "breakdowns" list (default: utm_campaign and platform_detected)
+        start (datetime): Start of the range (UTC)
+        end (datetime): End of the range, exclusive (UTC)
+
+    Returns:
+        dict: Overall steps with step_rate / overall_rate, the same per
+        breakdown value, and whether the result came from the cache
+
+    Raises:
+        ValueError: If the definition is invalid
+    """
+    definition = normalize_definition(definition)
+    version = get_data_version("raw_events")
+    key = query_key(definition, start.isoformat(), end.isoformat(), version)
+    hit, cached = _cache.get(key)
+    if hit:
+        return {**cached, "cached": True}
+
+    columns = load_columns(definition["steps"], definition["breakdowns"], start, end)
+    result = compute_funnel(columns, definition["steps"], definition["breakdowns"])
+    result["data_version"] = version
+    _cache.put(key, result)
+    return {**result, "cached": False}
@@ -1,73 +1,64 @@
 
 import json
 from datetime import datetime, timedelta
-from ..database import get_collection
+from ..rollups import query_rollups
+from ..sessions import session_summary, landing_page_performance
 
 def aggregate_campaign_performance(days=30):
     """
     Aggregate campaign performance data for LLM analysis.
     
+    Reads the hourly/daily rollups (see src/rollups.py) rather than raw events.
+    
     Args:
         days (int): Number of days to look back
         
     Returns:
         dict: Aggregated data summary
     """
-    collection = get_collection("raw_events")
-    start_date = datetime.utcnow() - timedelta(days=days)
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
     
-    pipeline = [
-        {
-            "$match": {
-                "timestamp": {"$gte": start_date}
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "source": "$utm_source",
-                    "campaign": "$utm_campaign",
-                    "medium": "$utm_medium"
-                },
-                "total_clicks": {"$sum": 1},
-                "conversions": {
-                    "$sum": {
-                        "$cond": [{"$eq": ["$event_type", "conversion"]}, 1, 0]
-                    }
-                },
-                "total_revenue": {
-                    "$sum": {
-                        "$cond": [{"$eq": ["$event_type", "conversion"]}, "$conversion_value", 0]
-                    }
-                }
-            }
-        },
-        {
-            "$project": {
-                "_id": 0,
-                "source": "$_id.source",
-                "campaign": "$_id.campaign",
-                "medium": "$_id.medium",
-                "clicks": "$total_clicks",
-                "conversions": "$conversions",
-                "revenue": "$total_revenue",
-                "conversion_rate": {
-                    "$cond": [
-                        {"$eq": ["$total_clicks", 0]},
-                        0,
-                        {"$divide": ["$conversions", "$total_clicks"]}
-                    ]
-                }
-            }
-        },
+    rows = query_rollups(start_date, end_date, ["utm_source", "utm_campaign", "utm_medium"])
+    
+    results = [
         {
-            "$sort": {"revenue": -1}
+            "source": row["utm_source"],
+            "campaign": row["utm_campaign"],
+            "medium": row["utm_medium"],
+            "clicks": row["events"],
+            "conversions": row["conversions"],
+            "revenue": row["revenue"],
+            "conversion_rate": row["conversions"] / row["events"] if row["events"] else 0
         }
+        for row in rows
     ]
-    
-    results = list(collection.aggregate(pipeline))
+    results.sort(key=lambda r: r["revenue"], reverse=True)
     return results
 
+def aggregate_session_performance(days=30, top_landing_pages=10):
+    """
+    Session metrics for LLM analysis: pages per session, duration, bounce and
+    conversion rates, and the landing pages that start the most sessions.
+    
+    Reads the sessions collection (see src/sessions.py) rather than grouping
+    raw events by session.
+    
+    Args:
+        days (int): Number of days to look back
+        top_landing_pages (int): Landing pages to include
+        
+    Returns:
+        dict: Session totals and per landing page breakdown
+    """
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+    
+    return {
+        **session_summary(start_date, end_date),
+        "landing_pages": landing_page_performance(start_date, end_date, limit=top_landing_pages)
+    }
+
 def export_for_llm(output_file="data/llm_analysis_input.json"):
     """
     Export aggregated data to a JSON file for LLM consumption.
@@ -78,7 +69,8 @@ def export_for_llm(output_file="data/llm_analysis_input.json"):
         "analysis_date": datetime.utcnow().isoformat(),
         "period_days": 30,
         "total_campaigns": len(data),
-        "campaign_data": data
+        "campaign_data": data,
+        "session_data": aggregate_session_performance()
     }
     
     with open(output_file, 'w') as f:
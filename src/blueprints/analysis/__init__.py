@@ -1,10 +1,21 @@
 from flask import Blueprint, request, jsonify
 from src.llm.service import llm_service
 from src.database import get_events
+from src.analysis.attribution import get_attribution
+from src.analysis.funnel import run_funnel
+from src.analysis.llm_preprocessor import aggregate_campaign_performance, aggregate_session_performance
+from src.rate_limiter import rate_limit_exceeded
+from src.track_handler import get_client_ip
 from datetime import datetime, timedelta
 
 analysis_bp = Blueprint('analysis', __name__, url_prefix='/api/analysis')
 
+@analysis_bp.before_request
+def limit_analysis_requests():
+    """/ask calls the LLM and has its own, much lower limit."""
+    route = "ask" if request.endpoint == "analysis.ask_data" else "api"
+    return rate_limit_exceeded(get_client_ip(), route)
+
 @analysis_bp.route('/ask', methods=['POST'])
 def ask_data():
     """
@@ -23,15 +34,20 @@ def ask_data():
     
     filter_dict = {
         "timestamp": {
-            "$gte": start_date.isoformat(),
-            "$lte": end_date.isoformat()
+            "$gte": start_date,
+            "$lte": end_date
         }
     }
     
     events = get_events(filter_dict=filter_dict, limit=100) # Limit context size
     
-    # Prepare context
+    # Prepare context: campaign totals from the rollups, session totals from the
+    # sessions collection, plus a sample of recent events
     context_data = {
+        "campaign_summary": aggregate_campaign_performance(days=7),
+        "session_summary": aggregate_session_performance(days=7),
+        # Revenue credited to the channels before each booking, not the booking event's own UTM
+        "attributed_revenue": get_attribution(start_date, end_date, model="linear"),
         "events": events,
         "count": len(events),
         "period": "last_7_days"
@@ -47,3 +63,84 @@ def ask_data():
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
+
+
+@analysis_bp.route('/campaigns', methods=['GET'])
+def campaign_performance():
+    """
+    Campaign performance (clicks, conversions, revenue) over the last `days` days,
+    computed from the rollup collections.
+    """
+    try:
+        days = int(request.args.get('days', 30))
+        return jsonify({
+            "success": True,
+            "days": days,
+            "campaigns": aggregate_campaign_performance(days=days)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+def _parse_utc(value):
+    """ISO date or datetime as naive UTC (the way events are stored)."""
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    return parsed
+
+
+@analysis_bp.route('/funnel', methods=['POST'])
+def funnel():
+    """
+    Step conversion rates of a funnel, overall and per campaign / platform.
+    
+    Body: {"steps": [{"name", "event_type", "page"}, ...], "breakdowns": [...],
+           "start": ISO date, "end": ISO date} or "days" instead of start/end
+           (default: the last 30 days).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('start'):
+            start = _parse_utc(data['start'])
+            end = _parse_utc(data['end']) if data.get('end') else datetime.utcnow()
+        else:
+            # Whole minutes, so repeated requests share a cache entry
+            end = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(minutes=1)
+            start = end - timedelta(days=int(data.get('days', 30)))
+        if start >= end:
+            raise ValueError("start must be before end")
+        result = run_funnel(data, start, end)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify({"success": True, "start": start.isoformat(), "end": end.isoformat(), **result})
+
+
+@analysis_bp.route('/attribution', methods=['GET'])
+def attribution():
+    """
+    Conversions and revenue credited to marketing channels by an attribution model.
+    
+    Query: model (first_touch, last_touch, linear, time_decay, position_based;
+    default linear), group_by (comma-separated channel fields, default
+    utm_source,utm_campaign), start/end ISO dates or days (default 30).
+    Reads the per-day results of scripts/run_attribution.py.
+    """
+    try:
+        if request.args.get('start'):
+            start = _parse_utc(request.args['start'])
+            end = _parse_utc(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        else:
+            end = datetime.utcnow()
+            start = end - timedelta(days=int(request.args.get('days', 30)))
+        model = request.args.get('model', 'linear')
+        group_by = [f for f in request.args.get('group_by', 'utm_source,utm_campaign').split(',') if f]
+        channels = get_attribution(start, end, model=model, group_by=group_by)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify({"success": True, "model": model, "start": start.isoformat(), "end": end.isoformat(),
+                    "channels": channels})
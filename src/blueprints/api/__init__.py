@@ -1,15 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from src.url_generator import generate_url_data, build_tracking_url
 from src.validators import validate_all_inputs
 from src.config import load_url_history, save_url_history, is_test_mode, BASE_URL
 from src.platform_suggestions import get_platform_suggestion
 from src.mock_data_generator import build_full_url_with_platform_params
-from src.database import get_events, count_events, get_unique_values
-from datetime import datetime, timedelta
+from src.database import (
+    get_events,
+    get_events_page,
+    count_events,
+    estimate_count_events,
+    get_cached_count,
+    get_backend_status,
+    get_query_cache_stats,
+)
+from src.sessions import get_session, session_summary, landing_page_performance
+from src.pathways import get_pathways
+from src.filter_values import FILTER_FIELDS, DEFAULT_FILTER_FIELDS, get_filter_values, domain_filter
+from src.click_ids import KINDS, resolve_click_id, get_click_id_cache_stats
+from src.track_handler import get_ingest_stats, get_client_ip
+from src.rate_limiter import get_rate_limit_stats, rate_limit_exceeded
+from src.serialization import json_response
+from src.export import FORMATS as EXPORT_FORMATS, export_events
+from src.analysis.dashboard_summary import FILTER_FIELDS as SUMMARY_FILTER_FIELDS, dashboard_summary, default_range
+from src.analysis.funnel import get_funnel_cache_stats
+from datetime import date, datetime, timedelta
 import logging
+import re
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+@api_bp.before_request
+def limit_api_requests():
+    """Per-IP rate limit shared by all /api endpoints."""
+    return rate_limit_exceeded(get_client_ip(), "api")
+
 @api_bp.route('/platform-suggestion', methods=['POST'])
 def get_platform_suggestion_api():
     """Get platform suggestion for utm_source and utm_medium."""
@@ -179,63 +203,141 @@ def preview_full_url():
         }), 500
 
 
+# Field names accepted by /api/events?fields=
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+MAX_FIELDS = 50
+# Events per /api/events page
+MAX_EVENTS_LIMIT = 100
+
+
+def _parse_limit(value):
+    """
+    `limit` parameter of /api/events (default 25).
+    
+    Raises:
+        ValueError: If it is not an integer from 1 to MAX_EVENTS_LIMIT
+    """
+    try:
+        limit = int(value) if value not in (None, '') else 25
+    except ValueError:
+        raise ValueError(f"Invalid limit: {value}")
+    if not 1 <= limit <= MAX_EVENTS_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_EVENTS_LIMIT}")
+    return limit
+
+
+def _parse_fields(value):
+    """
+    Comma-separated `fields` parameter as a list (None: whole events).
+    
+    Raises:
+        ValueError: If a name is not a plain field name
+    """
+    fields = [f.strip() for f in (value or '').split(',') if f.strip()]
+    if not fields:
+        return None
+    invalid = [f for f in fields if not _FIELD_NAME.match(f)]
+    if invalid or len(fields) > MAX_FIELDS:
+        raise ValueError(f"Invalid fields: {', '.join(invalid) or f'more than {MAX_FIELDS}'}")
+    return list(dict.fromkeys(fields))
+
+
+def _event_filter(args):
+    """
+    raw_events filter from the /api/events query parameters (campaign_id,
+    utm_source, utm_medium, platform_detected, domain, date_from, date_to).
+    """
+    # Get filter parameters
+    campaign_id = args.get('campaign_id', '').strip()
+    utm_source = args.get('utm_source', '').strip()
+    date_from = args.get('date_from', '').strip()
+    date_to = args.get('date_to', '').strip()
+    
+    # Build filter dictionary
+    filter_dict = {}
+    
+    if campaign_id:
+        filter_dict["campaign_id"] = campaign_id
+    
+    if utm_source:
+        filter_dict["utm_source"] = utm_source
+    
+    for field in ("utm_medium", "platform_detected"):
+        value = args.get(field, '').strip()
+        if value:
+            filter_dict[field] = value
+    
+    domain = args.get('domain', '').strip()
+    if domain:
+        filter_dict.update(domain_filter(domain))
+    
+    if date_from or date_to:
+        date_filter = {}
+        if date_from:
+            try:
+                date_filter["$gte"] = datetime.fromisoformat(date_from.replace("Z", "+00:00"))
+            except:
+                pass
+        if date_to:
+            try:
+                # Add one day to include the entire end date
+                end_date = datetime.fromisoformat(date_to.replace("Z", "+00:00"))
+                date_filter["$lte"] = end_date + timedelta(days=1)
+            except:
+                pass
+        if date_filter:
+            filter_dict["timestamp"] = date_filter
+    
+    return filter_dict
+
+
 @api_bp.route('/events', methods=['GET'])
 def get_events_api():
     """
     API endpoint to fetch tracking events with filtering.
-    Supports filtering by campaign_id, utm_source, and date range.
+    Supports filtering by campaign_id, utm_source, utm_medium,
+    platform_detected, domain and date range.
+    
+    Pages are fetched with keyset pagination: pass the returned next_cursor
+    as `cursor` to get the following page. The total is approximate unless
+    `count=exact` is requested (`count=none` skips it). Passing `page`
+    without a cursor keeps the old offset-based behaviour. `fields`
+    (comma-separated) limits each event to those fields and _id; only they
+    are read from the database.
     """
     try:
-        # Get filter parameters
-        campaign_id = request.args.get('campaign_id', '').strip()
-        utm_source = request.args.get('utm_source', '').strip()
-        date_from = request.args.get('date_from', '').strip()
-        date_to = request.args.get('date_to', '').strip()
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 25))
-        
-        # Build filter dictionary
-        filter_dict = {}
-        
-        if campaign_id:
-            filter_dict["campaign_id"] = campaign_id
-        
-        if utm_source:
-            filter_dict["utm_source"] = utm_source
+        cursor = request.args.get('cursor', '').strip()
+        count_mode = request.args.get('count', 'estimate').strip()
+        filter_dict = _event_filter(request.args)
         
-        if date_from or date_to:
-            date_filter = {}
-            if date_from:
-                try:
-                    date_filter["$gte"] = datetime.fromisoformat(date_from.replace("Z", "+00:00"))
-                except:
-                    pass
-            if date_to:
-                try:
-                    # Add one day to include the entire end date
-                    end_date = datetime.fromisoformat(date_to.replace("Z", "+00:00"))
-                    date_filter["$lte"] = end_date + timedelta(days=1)
-                except:
-                    pass
-            if date_filter:
-                filter_dict["timestamp"] = date_filter
+        try:
+            limit = _parse_limit(request.args.get('limit'))
+            fields = _parse_fields(request.args.get('fields'))
+            if 'page' in request.args and not cursor:
+                return _get_events_offset(filter_dict, int(request.args.get('page', 1)), limit, fields)
+            page = get_events_page(filter_dict=filter_dict, limit=limit, cursor=cursor or None, fields=fields)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        # Calculate pagination
-        skip = (page - 1) * limit
+        if count_mode == "exact":
+            total = count_events(filter_dict=filter_dict)
+        elif count_mode == "none":
+            total = None
+        else:
+            total = get_cached_count(filter_dict)
         
-        # Get events
-        events = get_events(filter_dict=filter_dict, limit=limit, skip=skip)
-        total_count = count_events(filter_dict=filter_dict)
-        total_pages = (total_count + limit - 1) // limit  # Ceiling division
-        
-        return jsonify({
+        return json_response({
             "success": True,
-            "events": events,
+            "events": page["events"],
             "pagination": {
-                "page": page,
                 "limit": limit,
-                "total": total_count,
-                "total_pages": total_pages
+                "next_cursor": page["next_cursor"],
+                "has_more": page["next_cursor"] is not None,
+                "total": total,
+                "total_is_estimate": count_mode != "exact" and total is not None
             }
         })
         
@@ -247,20 +349,236 @@ def get_events_api():
         }), 500
 
 
+def _get_events_offset(filter_dict, page, limit, fields=None):
+    """Offset-based page of events (legacy `page` parameter)."""
+    # Calculate pagination
+    skip = (page - 1) * limit
+    
+    # Get events
+    events = get_events(filter_dict=filter_dict, limit=limit, skip=skip, fields=fields)
+    # An unfiltered count_documents scans the whole collection; metadata is exact enough
+    total_count = count_events(filter_dict=filter_dict) if filter_dict else estimate_count_events()
+    total_pages = (total_count + limit - 1) // limit  # Ceiling division
+    
+    return json_response({
+        "success": True,
+        "events": events,
+        "pagination": {
+            "page": page,
+            "limit": limit,
+            "total": total_count,
+            "total_pages": total_pages
+        }
+    })
+
+
+@api_bp.route('/events/export', methods=['GET'])
+def export_events_api():
+    """
+    Stream the events matching the /api/events filters, oldest first.
+    
+    `format` is ndjson (default) or csv, `fields` limits the exported
+    fields, and `gzip=1` compresses the stream. Events are read and encoded
+    a batch at a time, so the export size does not affect worker memory.
+    """
+    try:
+        fmt = request.args.get('format', 'ndjson').strip().lower()
+        compress = request.args.get('gzip', '').strip().lower() in ('1', 'true', 'yes')
+        fields = _parse_fields(request.args.get('fields'))
+        chunks = export_events(_event_filter(request.args), fmt, fields, compress)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logging.error(f"Error in /api/events/export: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    filename = f"events-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(_logged_stream(chunks)),
+        mimetype="application/gzip" if compress else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def _logged_stream(chunks):
+    """Log an error that ends an export after the response has started."""
+    try:
+        yield from chunks
+    except Exception as e:
+        logging.error(f"Error streaming /api/events/export: {e}")
+        raise
+
+
 @api_bp.route('/events/filters', methods=['GET'])
 def get_filter_options():
-    """Get unique values for filter dropdowns."""
+    """
+    Values for the filter dropdowns, from the incrementally maintained sets
+    of src/filter_values.py. `fields` is a comma-separated list of
+    campaign_id, utm_source, utm_medium, platform_detected and domain
+    (default: campaign_id,utm_source).
+    """
+    fields = [f for f in request.args.get('fields', ','.join(DEFAULT_FILTER_FIELDS)).split(',') if f]
+    unknown = [f for f in fields if f not in FILTER_FIELDS]
+    if unknown:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown filter fields: {', '.join(unknown)}"
+        }), 400
     try:
-        campaign_ids = get_unique_values("campaign_id")
-        utm_sources = get_unique_values("utm_source")
-        
+        values = get_filter_values(fields)
         return jsonify({
             "success": True,
-            "campaign_ids": sorted([c for c in campaign_ids if c]),
-            "utm_sources": sorted([u for u in utm_sources if u])
+            "values": values,
+            # Keys of the original endpoint
+            "campaign_ids": values.get("campaign_id", []),
+            "utm_sources": values.get("utm_source", [])
         })
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
+
+
+@api_bp.route('/sessions/summary', methods=['GET'])
+def get_sessions_summary():
+    """
+    Pages per session, session duration, bounce and conversion rates and the
+    top landing pages for sessions that started in the last `days` days,
+    read from the sessions collection. Optional utm_source / utm_campaign
+    filter on the session's entry.
+    """
+    try:
+        days = int(request.args.get('days', 7))
+        end = datetime.utcnow()
+        start = end - timedelta(days=days)
+        match = {f"entry.{field}": request.args[field]
+                 for field in ("utm_source", "utm_campaign") if request.args.get(field)}
+        return jsonify({
+            "success": True,
+            "days": days,
+            "summary": session_summary(start, end, match),
+            "landing_pages": landing_page_performance(start, end, match,
+                                                      limit=min(int(request.args.get('limit', 20)), 100))
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@api_bp.route('/sessions/<session_id>', methods=['GET'])
+def get_session_api(session_id):
+    """One session's summary (a point lookup on the sessions collection)."""
+    session = get_session(session_id)
+    if not session:
+        return jsonify({"success": False, "error": "Session not found"}), 404
+    for field in ("first_seen", "last_seen"):
+        session[field] = session[field].isoformat()
+    session["entry"]["at"] = session["entry"]["at"].isoformat()
+    return jsonify({"success": True, "session": session})
+
+
+@api_bp.route('/pathways', methods=['GET'])
+def get_pathways_api():
+    """
+    Most common page paths and page-to-page transitions, optionally for one
+    site (host) and/or utm_campaign, from the tables precomputed by
+    scripts/run_pathways.py.
+    """
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        pathways = get_pathways(request.args.get('site'), request.args.get('campaign'), limit=limit)
+        for field in ("updated_at", "through"):
+            if pathways[field]:
+                pathways[field] = pathways[field].isoformat()
+        return jsonify({"success": True, **pathways})
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@api_bp.route('/clicks/<click_id>', methods=['GET'])
+def get_click_api(click_id):
+    """
+    First touch (session, campaign, platform, landing page) of a click id or
+    session ID. Optional `kind` (gclid, fbclid, ttclid, msclkid, session_id);
+    by default every kind is tried.
+    """
+    kind = request.args.get('kind')
+    if kind and kind not in KINDS:
+        return jsonify({"success": False, "error": f"kind must be one of: {', '.join(KINDS)}"}), 400
+    doc = resolve_click_id(click_id, kind)
+    if not doc:
+        return jsonify({"success": False, "error": "Click id not found"}), 404
+    return jsonify({
+        "success": True,
+        "kind": doc["kind"],
+        "click_id": doc["value"],
+        "first_touch": {**doc["first_touch"], "at": doc["first_touch"]["at"].isoformat()},
+        "last_seen": doc["last_seen"].isoformat(),
+    })
+
+
+@api_bp.route('/dashboard/summary', methods=['GET'])
+def get_dashboard_summary():
+    """
+    Totals, a time series and breakdowns for the dashboard, from the rollups.
+    
+    Query: date_from/date_to (local YYYY-MM-DD, inclusive; default the last
+    7 days), tz (IANA name, default UTC), interval (hour or day), limit
+    (values per breakdown), and utm_source, utm_medium, utm_campaign,
+    platform_detected or domain filters. Results are cached for a few
+    seconds.
+    """
+    try:
+        tz = request.args.get('tz', 'UTC').strip() or 'UTC'
+        date_from, date_to = default_range(tz)
+        if request.args.get('date_from'):
+            date_from = date.fromisoformat(request.args['date_from'].strip())
+        if request.args.get('date_to'):
+            date_to = date.fromisoformat(request.args['date_to'].strip())
+        filters = {field: request.args.get(field, '').strip() for field in (*SUMMARY_FILTER_FIELDS, 'domain')}
+        summary = dashboard_summary(
+            date_from, date_to,
+            interval=request.args.get('interval', 'day').strip(),
+            tz=tz,
+            filters=filters,
+            limit=int(request.args.get('limit', 10))
+        )
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logging.error(f"Error in /api/dashboard/summary: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    
+    return json_response({"success": True, **summary})
+
+
+@api_bp.route('/health', methods=['GET'])
+def health():
+    """Report database backend / circuit breaker state and ingestion buffer health."""
+    return jsonify({
+        "success": True,
+        "database": get_backend_status(),
+        "ingest": get_ingest_stats(),
+        "rate_limits": get_rate_limit_stats(),
+        "click_id_cache": get_click_id_cache_stats(),
+        "funnel_cache": get_funnel_cache_stats(),
+        "query_cache": get_query_cache_stats()
+    })
@@ -1,45 +1,86 @@
-from flask import Blueprint, request, jsonify
-from src.track_handler import process_tracking_event, store_event, get_client_ip
-from src.rate_limiter import is_rate_limited
+from flask import Blueprint, g, request, jsonify
+from src.track_handler import (
+    SESSION_COOKIE,
+    SESSION_TIMEOUT,
+    process_tracking_event,
+    store_event,
+    store_events,
+    get_client_ip,
+)
+from src.rate_limiter import LIMITS, is_rate_limited
+from src.config import TRACK_BATCH_MAX_EVENTS
 import logging
 
 tracking_bp = Blueprint('tracking', __name__)
 
+# List of allowed origins - in production this should be stricter
+# For now we allow the specific domains mentioned by the user
+ALLOWED_ORIGINS = [
+    'https://dnstrainer.com',
+    'https://www.dnstrainer.com',
+    'https://booking.dnstrainer.com',
+    'https://www.booking.dnstrainer.com',
+    'http://localhost:5000',
+    'http://127.0.0.1:5000'
+]
+
+
+def add_cors_headers(response):
+    """Helper to set CORS headers on a tracking response."""
+    # Get the origin from the request
+    origin = request.headers.get('Origin')
+    
+    if origin:
+        # If origin is in our allowed list, or if we want to be permissive for debugging
+        # For now, let's reflect the origin if it's provided, to fix the immediate issue
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+    else:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Max-Age'] = '3600'
+    return response
+
+
+def set_session_cookie(response):
+    """Hand the refreshed session token back as a cookie (if the request issued one)."""
+    token = g.get("session_token")
+    if token:
+        # The tracker posts cross-site, which needs SameSite=None and therefore HTTPS
+        secure = request.is_secure or request.headers.get('X-Forwarded-Proto') == 'https'
+        response.set_cookie(
+            SESSION_COOKIE,
+            token,
+            max_age=int(SESSION_TIMEOUT.total_seconds()),
+            secure=secure,
+            httponly=True,
+            samesite='None' if secure else 'Lax'
+        )
+    return response
+
+
+def rate_limit_response(ip_address, cost=1):
+    """Return a 429 response if the IP is over its rate limit, else None."""
+    is_limited, remaining, reset_time = is_rate_limited(ip_address, "track", cost)
+    
+    if is_limited:
+        response = jsonify({
+            "status": "error",
+            "message": f"Rate limit exceeded. Maximum {LIMITS['track'].rate:g} requests per second.",
+            "retry_after": reset_time
+        })
+        return add_cors_headers(response), 429
+    return None
+
+
 @tracking_bp.route('/track', methods=['GET', 'POST', 'OPTIONS'])
 def track():
     """
     Tracking endpoint that captures all query parameters and stores them in MongoDB.
     Accepts both GET and POST requests.
     """
-    # Get the origin from the request
-    origin = request.headers.get('Origin')
-    
-    # List of allowed origins - in production this should be stricter
-    # For now we allow the specific domains mentioned by the user
-    allowed_origins = [
-        'https://dnstrainer.com',
-        'https://www.dnstrainer.com',
-        'https://booking.dnstrainer.com',
-        'https://www.booking.dnstrainer.com',
-        'http://localhost:5000',
-        'http://127.0.0.1:5000'
-    ]
-    
-    # Helper to set CORS headers
-    def add_cors_headers(response):
-        if origin:
-            # If origin is in our allowed list, or if we want to be permissive for debugging
-            # For now, let's reflect the origin if it's provided, to fix the immediate issue
-            response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-        else:
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-        response.headers['Access-Control-Max-Age'] = '3600'
-        return response
-
     # Handle CORS preflight
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
@@ -49,16 +90,9 @@ def track():
         # Get client IP for rate limiting
         ip_address = get_client_ip()
         
-        # Check rate limit (20 requests per second)
-        is_limited, remaining, reset_time = is_rate_limited(ip_address, max_requests=20)
-        
-        if is_limited:
-            response = jsonify({
-                "status": "error",
-                "message": "Rate limit exceeded. Maximum 20 requests per second.",
-                "retry_after": reset_time
-            })
-            return add_cors_headers(response), 429
+        limited = rate_limit_response(ip_address)
+        if limited:
+            return limited
         
         # Process and validate tracking event
         event_data = process_tracking_event()
@@ -68,9 +102,10 @@ def track():
         
         response = jsonify({
             "status": "ok",
-            "id": doc_id
+            "id": doc_id,
+            "session_token": g.get("session_token")
         })
-        return add_cors_headers(response), 200
+        return add_cors_headers(set_session_cookie(response)), 200
         
     except ValueError as e:
         # Validation error
@@ -88,3 +123,81 @@ def track():
             "message": "Internal server error"
         })
         return add_cors_headers(response), 500
+
+
+@tracking_bp.route('/track/batch', methods=['POST', 'OPTIONS'])
+def track_batch():
+    """
+    Batch tracking endpoint used by tracker.js.
+    Accepts a JSON array of events (or {"events": [...]}), normalises each one
+    like /track and stores the valid ones with a single bulk write.
+    Invalid events are reported back by index and do not fail the batch.
+    """
+    # Handle CORS preflight
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        return add_cors_headers(response), 200
+    
+    try:
+        ip_address = get_client_ip()
+        
+        payload = request.get_json(force=True, silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get("events")
+        
+        if not isinstance(payload, list):
+            response = jsonify({
+                "status": "error",
+                "message": "Expected a JSON array of events"
+            })
+            return add_cors_headers(response), 400
+        
+        if len(payload) > TRACK_BATCH_MAX_EVENTS:
+            response = jsonify({
+                "status": "error",
+                "message": f"Too many events in batch. Maximum {TRACK_BATCH_MAX_EVENTS}."
+            })
+            return add_cors_headers(response), 413
+        
+        # Charged after the size check, one token per event like the same events sent to /track
+        limited = rate_limit_response(ip_address, cost=max(1, len(payload)))
+        if limited:
+            return limited
+        
+        events = []
+        rejected = []
+        for index, params in enumerate(payload):
+            try:
+                events.append(process_tracking_event(params))
+            except ValueError as e:
+                rejected.append({"index": index, "message": str(e)})
+        
+        if rejected and not events:
+            # Validation error for every event in the batch
+            response = jsonify({
+                "status": "error",
+                "message": "No valid events in batch",
+                "rejected": rejected
+            })
+            return add_cors_headers(response), 400
+        
+        # Store all valid events with one bulk write
+        doc_ids = store_events(events)
+        
+        response = jsonify({
+            "status": "ok",
+            "ids": doc_ids,
+            "accepted": len(doc_ids),
+            "rejected": rejected,
+            "session_token": g.get("session_token")
+        })
+        return add_cors_headers(set_session_cookie(response)), 200
+        
+    except Exception as e:
+        # Internal server error
+        logging.error(f"Error in /track/batch endpoint: {e}")
+        response = jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        })
+        return add_cors_headers(response), 500
@@ -0,0 +1,117 @@
+"""
+Circuit breaker for the MongoDB connection.
+
+While the breaker is open, callers skip the database entirely and use the
+fallback instead of paying a full connection timeout on every request. The
+connection is re-probed with exponential backoff.
+"""
+
+import random
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker.
+
+    closed:    requests go through; `failure_threshold` consecutive failures open it
+    open:      requests are rejected until the backoff expires
+    half_open: a single probe request is let through; success closes the
+               breaker, failure re-opens it with a doubled backoff
+    """
+
+    def __init__(self, failure_threshold=1, base_backoff=1.0, max_backoff=60.0, jitter=0.1):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures before opening
+            base_backoff (float): Seconds before the first re-probe
+            max_backoff (float): Upper bound on the re-probe delay
+            jitter (float): Random fraction added to each delay so workers
+                do not all probe at the same moment
+        """
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._backoff = 0
+        self._next_probe = 0
+        self._opened_at = None
+        self._last_error = None
+        self._rejected = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        """
+        Check whether a request may try the protected resource.
+
+        Returns:
+            bool: True if the caller should try it (possibly as the half-open probe)
+        """
+        if self._state == CLOSED:
+            return True
+
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._next_probe:
+                # Let exactly one caller through to probe the resource
+                self._state = HALF_OPEN
+                return True
+            if self._state == CLOSED:
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        """Close the breaker after a successful call."""
+        if self._state == CLOSED and not self._failures:
+            return
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._backoff = 0
+            self._opened_at = None
+
+    def record_failure(self, error=None):
+        """Count a failed call and open the breaker if needed."""
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error else None
+
+            if self._state == HALF_OPEN:
+                self._backoff = min(self.max_backoff, self._backoff * 2 or self.base_backoff)
+                self._trip()
+            elif self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._backoff = self.base_backoff
+                self._trip()
+
+    def _trip(self):
+        """Open the breaker (called with the lock held)."""
+        self._state = OPEN
+        if self._opened_at is None:
+            self._opened_at = time.time()
+        delay = self._backoff * (1 + random.uniform(0, self.jitter))
+        self._next_probe = time.monotonic() + delay
+
+    def get_state(self):
+        """Get breaker state for health reporting."""
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "backoff_s": round(self._backoff, 3),
+                "next_probe_in_s": round(max(0, self._next_probe - time.monotonic()), 3) if self._state == OPEN else None,
+                "opened_at": self._opened_at,
+                "rejected": self._rejected,
+                "last_error": self._last_error,
+            }
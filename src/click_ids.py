@@ -0,0 +1,243 @@
+"""
+First touch per click id and per session, maintained at ingest.
+
+One document per platform click id (gclid / fbclid / ttclid / msclkid) and
+per session ID, keyed "<kind>:<value>":
+
+    {
+        "_id": "gclid:Cj0KCQ...",
+        "kind": "gclid", "value": "Cj0KCQ...",
+        "first_touch": {"at": datetime, "session_id": "sess_1a2b3c4d5e",
+                        "utm_source": ..., "utm_campaign": ..., "platform_detected": ..., ...},
+        "last_seen": datetime
+    }
+
+Every batch written by the ingest path is folded into one $min / $max
+upsert per key ("at" comes first in first_touch, so the earliest event wins
+whatever order batches are written in). The updates are idempotent, so
+rebuild_click_ids() can re-apply any period of raw_events.
+
+Backend-reported events (ATTRIBUTION_EXCLUDED_SOURCES / _MEDIUMS, e.g. the
+Easy!Appointments booking) are not touches: they are resolved here, never
+recorded. Resolving a conversion's click ids or session is a lookup by _id,
+through a per-process LRU (CLICK_IDS_CACHE_ENTRIES). Entries expire after
+CLICK_IDS_CACHE_TTL_S, since other workers' batches can still move a first
+touch earlier. Conversions get their first touch on the writer thread, just
+before their batch is stored (attach_first_touches), never on the request
+path.
+"""
+
+from datetime import datetime
+from pymongo import UpdateOne
+from .config import (
+    CLICK_IDS_CACHE_ENTRIES, CLICK_IDS_CACHE_TTL_S, ATTRIBUTION_EXCLUDED_SOURCES, ATTRIBUTION_EXCLUDED_MEDIUMS,
+)
+from .database import get_collection, expand_events
+from .query_cache import QueryCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLICK_IDS = "click_ids"
+
+# Lookup keys, in resolution order: a click id identifies the ad click itself
+KINDS = ("gclid", "fbclid", "ttclid", "msclkid", "session_id")
+# Fields of the first event kept in "first_touch"
+TOUCH_FIELDS = (
+    "session_id", "host", "current_page", "platform_detected",
+    "utm_source", "utm_medium", "utm_campaign", "utm_content", "utm_term",
+    "campaign_id", "adset_id", "ad_id",
+)
+
+# Events per raw_events batch when rebuilding
+_REBUILD_BATCH = 5000
+
+
+def click_key(kind, value):
+    return f"{kind}:{value}"
+
+
+def _utc(timestamp):
+    if timestamp.tzinfo is not None:
+        return timestamp.replace(tzinfo=None) - timestamp.utcoffset()
+    return timestamp
+
+
+def is_backend_event(event):
+    return event.get("utm_source") in ATTRIBUTION_EXCLUDED_SOURCES \
+        or event.get("utm_medium") in ATTRIBUTION_EXCLUDED_MEDIUMS
+
+
+def _touch(event, timestamp):
+    touch = {"at": timestamp}
+    touch.update((field, event[field]) for field in TOUCH_FIELDS if event.get(field) is not None)
+    return touch
+
+
+def _fold(events):
+    """First touch and last seen per key of a list of events: {key: summary}."""
+    keys = {}
+    for event in events:
+        timestamp = event.get("timestamp")
+        if not isinstance(timestamp, datetime) or is_backend_event(event):
+            continue
+        timestamp = _utc(timestamp)
+        for kind in KINDS:
+            value = event.get(kind)
+            if not value or not isinstance(value, str):
+                continue
+            summary = keys.get(click_key(kind, value))
+            if summary is None:
+                keys[click_key(kind, value)] = {"kind": kind, "value": value,
+                                                "first_touch": _touch(event, timestamp), "last_seen": timestamp}
+                continue
+            if timestamp < summary["first_touch"]["at"]:
+                summary["first_touch"] = _touch(event, timestamp)
+            summary["last_seen"] = max(summary["last_seen"], timestamp)
+    return keys
+
+
+def build_click_id_updates(keys):
+    """
+    One upsert per click id / session.
+
+    Args:
+        keys (dict): As returned by _fold
+
+    Returns:
+        list: UpdateOne operations for the click_ids collection
+    """
+    return [
+        UpdateOne({"_id": key}, {
+            "$setOnInsert": {"kind": summary["kind"], "value": summary["value"]},
+            "$min": {"first_touch": summary["first_touch"]},
+            "$max": {"last_seen": summary["last_seen"]},
+        }, upsert=True)
+        for key, summary in keys.items()
+    ]
+
+
+_cache = QueryCache(CLICK_IDS_CACHE_ENTRIES, ttl=CLICK_IDS_CACHE_TTL_S)
+
+
+def get_click_id_cache_stats():
+    """Size, hit/miss and eviction counts of this process's click id LRU."""
+    return _cache.stats()
+
+
+def update_click_ids(events):
+    """
+    Record the click ids and sessions of a batch of newly stored events.
+
+    Args:
+        events (list): Event documents that were just inserted
+    """
+    keys = _fold(events)
+    if keys:
+        get_collection(CLICK_IDS).bulk_write(build_click_id_updates(keys), ordered=False)
+        # A batch written out of order can move a first touch earlier
+        _cache.discard(keys)
+
+
+def resolve_keys(keys):
+    """
+    click_ids documents for a list of keys, from the LRU or one $in query.
+
+    Returns:
+        dict: {key: document} for the keys that are known
+    """
+    found, missing = {}, []
+    for key in dict.fromkeys(keys):
+        hit, doc = _cache.get(key)
+        if hit:
+            found[key] = doc
+        else:
+            missing.append(key)
+    if missing:
+        for doc in get_collection(CLICK_IDS).find({"_id": {"$in": missing}}):
+            _cache.put(doc["_id"], doc)
+            found[doc["_id"]] = doc
+    return found
+
+
+def resolve_click_id(value, kind=None):
+    """
+    First touch of a click id or session ID.
+
+    Args:
+        value (str): The click id / session ID
+        kind (str): One of KINDS; by default every kind is tried, in KINDS order
+
+    Returns:
+        dict | None: The click_ids document
+    """
+    kinds = [kind] if kind else KINDS
+    found = resolve_keys([click_key(k, value) for k in kinds])
+    return next((found[click_key(k, value)] for k in kinds if click_key(k, value) in found), None)
+
+
+def first_touch(event):
+    """
+    First touch behind an event (e.g. a backend conversion), from its click
+    ids or else its session.
+
+    Returns:
+        dict | None: The first_touch document of the first known key
+    """
+    keys = [click_key(kind, event[kind]) for kind in KINDS if isinstance(event.get(kind), str) and event[kind]]
+    found = resolve_keys(keys)
+    return next((found[key]["first_touch"] for key in keys if key in found), None)
+
+
+def attach_first_touches(events):
+    """
+    Set "first_touch" on the conversions of a batch that is about to be
+    stored, from their click ids or else their session.
+
+    All the batch's keys are resolved at once (LRU, then one $in query), and
+    touches earlier in the same batch count too: a tracker batch often
+    carries both the ad click and the conversion.
+
+    Args:
+        events (list): v1 events; conversions are updated in place
+    """
+    conversions = [e for e in events if e.get("event_type") == "conversion" and "first_touch" not in e]
+    if not conversions:
+        return
+    keys = {
+        id(event): [click_key(kind, event[kind]) for kind in KINDS if isinstance(event.get(kind), str) and event[kind]]
+        for event in conversions
+    }
+    found = resolve_keys([key for event_keys in keys.values() for key in event_keys])
+    batch = _fold(events)
+    for event in conversions:
+        for key in keys[id(event)]:
+            touches = [doc["first_touch"] for doc in (found.get(key), batch.get(key)) if doc]
+            if touches:
+                event["first_touch"] = min(touches, key=lambda touch: touch["at"])
+                break
+
+
+def rebuild_click_ids(start=None, end=None):
+    """
+    Re-apply the raw_events of a period (default: all) to click_ids.
+
+    Returns:
+        int: Number of events read
+    """
+    match = {"$or": [{kind: {"$nin": [None, ""]}} for kind in KINDS]}
+    if start or end:
+        match["timestamp"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    cursor = get_collection("raw_events").find(match).batch_size(_REBUILD_BATCH)
+    batch, total = [], 0
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= _REBUILD_BATCH:
+            update_click_ids(expand_events(batch))
+            total += len(batch)
+            batch = []
+    if batch:
+        update_click_ids(expand_events(batch))
+        total += len(batch)
+    logger.info(f"Rebuilt click_ids from {total} events")
+    return total
@@ -72,6 +72,133 @@ def is_test_mode():
 MONGODB_URI = os.getenv("MONGODB_URI", "")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "DNStrainerDB")
 
+# Local fallback database used when MongoDB is unavailable (one directory per collection)
+MOCK_DB_DIR = os.getenv("MOCK_DB_DIR", str(DATA_DIR / "mock_db"))
+
+# Circuit breaker for the MongoDB connection: seconds before the first
+# re-probe after a failure, doubling up to the maximum
+DB_BREAKER_BASE_BACKOFF_S = float(os.getenv("DB_BREAKER_BASE_BACKOFF_S", "1"))
+DB_BREAKER_MAX_BACKOFF_S = float(os.getenv("DB_BREAKER_MAX_BACKOFF_S", "60"))
+
+# Seconds a cached /api/events total count is served before it is refreshed in the background
+EVENT_COUNT_CACHE_TTL_S = float(os.getenv("EVENT_COUNT_CACHE_TTL_S", "60"))
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+
+# Event ingestion buffer (write-behind batching for /track)
+# Events are queued in-process and written to MongoDB in batches by a background thread
+EVENT_BUFFER_ENABLED = os.getenv("EVENT_BUFFER_ENABLED", "True").lower() == "true"
+EVENT_BUFFER_MAX_SIZE = int(os.getenv("EVENT_BUFFER_MAX_SIZE", "10000"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+EVENT_BATCH_MAX_AGE_MS = int(os.getenv("EVENT_BATCH_MAX_AGE_MS", "250"))
+
+# Maximum number of events accepted by /track/batch in one request
+TRACK_BATCH_MAX_EVENTS = int(os.getenv("TRACK_BATCH_MAX_EVENTS", "100"))
+
+# A client-sent event timestamp is kept when it is within this many seconds of
+# the server clock (batched events are sent up to tracker.js's flushInterval
+# late); otherwise the event gets the time it was received
+TRACK_CLIENT_TIMESTAMP_MAX_SKEW_S = float(os.getenv("TRACK_CLIENT_TIMESTAMP_MAX_SKEW_S", "300"))
+
+# Durable local event log (write-ahead log in front of MongoDB)
+# When enabled, /track acknowledges once the event is fsynced to disk and a
+# background replayer drains the log into MongoDB
+EVENT_LOG_ENABLED = os.getenv("EVENT_LOG_ENABLED", "False").lower() == "true"
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", str(DATA_DIR / "event_log"))
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+EVENT_LOG_FSYNC_INTERVAL_MS = int(os.getenv("EVENT_LOG_FSYNC_INTERVAL_MS", "5"))
+
+# Hourly/daily rollups of event counts, updated in bulk from the ingest path
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "True").lower() == "true"
+
+# Per-session summaries (sessions collection), updated in bulk from the ingest path
+SESSIONS_ENABLED = os.getenv("SESSIONS_ENABLED", "True").lower() == "true"
+
+# How long a worker reuses a collection's data version before re-reading it
+# (results cached per version may lag other workers' writes by this much)
+DATA_VERSION_POLL_S = float(os.getenv("DATA_VERSION_POLL_S", "1"))
+
+# Results of get_events / count_events / get_unique_values cached per raw_events
+# data version: at most this many results, bytes (JSON size) and seconds old
+# (0 entries disables the cache)
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", "300"))
+
+# Filter dropdown values (src/filter_values.py): how often a worker re-reads the
+# shared value sets, and how often a field is recomputed from raw_events
+FILTER_VALUES_REFRESH_S = float(os.getenv("FILTER_VALUES_REFRESH_S", "30"))
+FILTER_VALUES_RECONCILE_S = float(os.getenv("FILTER_VALUES_RECONCILE_S", "21600"))
+# Add new values at ingest (off: new values appear at the next reconciliation)
+FILTER_VALUES_ENABLED = os.getenv("FILTER_VALUES_ENABLED", "True").lower() == "true"
+
+# /api/events/export: events per cursor batch (memory per export is bounded by
+# one batch) and the gzip level of compressed exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+# /api/dashboard/summary results: how many argument sets are cached and for
+# how many seconds (the dashboard auto-refreshes every 5 s)
+DASHBOARD_SUMMARY_CACHE_ENTRIES = int(os.getenv("DASHBOARD_SUMMARY_CACHE_ENTRIES", "256"))
+DASHBOARD_SUMMARY_CACHE_TTL_S = float(os.getenv("DASHBOARD_SUMMARY_CACHE_TTL_S", "15"))
+
+# Funnel results cached per (definition, date range, data version), for at most
+# QUERY_CACHE_TTL_S
+FUNNEL_CACHE_ENTRIES = int(os.getenv("FUNNEL_CACHE_ENTRIES", "128"))
+
+# Page pathway job (scripts/run_pathways.py): parallel time partitions per run,
+# pages per path key, and how old an event must be before it is processed
+PATHWAYS_WORKERS = int(os.getenv("PATHWAYS_WORKERS", "4"))
+PATHWAYS_MAX_DEPTH = int(os.getenv("PATHWAYS_MAX_DEPTH", "5"))
+PATHWAYS_LAG_S = float(os.getenv("PATHWAYS_LAG_S", "60"))
+
+# First touch per click id / session (click_ids collection), updated at ingest,
+# and the per-process LRU in front of it: entries and seconds an entry is
+# served (0 entries disables the LRU)
+CLICK_IDS_ENABLED = os.getenv("CLICK_IDS_ENABLED", "True").lower() == "true"
+CLICK_IDS_CACHE_ENTRIES = int(os.getenv("CLICK_IDS_CACHE_ENTRIES", "10000"))
+CLICK_IDS_CACHE_TTL_S = float(os.getenv("CLICK_IDS_CACHE_TTL_S", "300"))
+
+# Conversion attribution (src/analysis/attribution.py): how far back touches
+# are joined to a conversion, the time-decay half-life, and the utm values of
+# backend-reported conversions that are not marketing touches (comma-separated)
+ATTRIBUTION_LOOKBACK_DAYS = int(os.getenv("ATTRIBUTION_LOOKBACK_DAYS", "30"))
+ATTRIBUTION_HALF_LIFE_DAYS = float(os.getenv("ATTRIBUTION_HALF_LIFE_DAYS", "7"))
+ATTRIBUTION_EXCLUDED_SOURCES = {s.strip() for s in os.getenv("ATTRIBUTION_EXCLUDED_SOURCES", "easyappointments").split(",") if s.strip()}
+ATTRIBUTION_EXCLUDED_MEDIUMS = {s.strip() for s in os.getenv("ATTRIBUTION_EXCLUDED_MEDIUMS", "backend").split(",") if s.strip()}
+
+# Store raw_events in a MongoDB time-series collection (timeField timestamp,
+# metaField site/platform). Run scripts/migrate_to_timeseries.py before enabling
+RAW_EVENTS_TIMESERIES = os.getenv("RAW_EVENTS_TIMESERIES", "False").lower() == "true"
+RAW_EVENTS_TIMESERIES_COLLECTION = os.getenv("RAW_EVENTS_TIMESERIES_COLLECTION", "raw_events_ts")
+RAW_EVENTS_TIMESERIES_GRANULARITY = os.getenv("RAW_EVENTS_TIMESERIES_GRANULARITY", "seconds")
+
+# Storage layout for new events: 1 (one field per value) or 2 (compact, see
+# src/event_schema.py). Readers handle both, so it can be switched at any time
+EVENT_SCHEMA_VERSION = int(os.getenv("EVENT_SCHEMA_VERSION", "1"))
+
+# Token-bucket rate limits per client IP: sustained requests per second and
+# burst size, per route group
+RATE_LIMIT_TRACK_PER_S = float(os.getenv("RATE_LIMIT_TRACK_PER_S", "20"))
+RATE_LIMIT_TRACK_BURST = int(os.getenv("RATE_LIMIT_TRACK_BURST", "20"))
+RATE_LIMIT_API_PER_S = float(os.getenv("RATE_LIMIT_API_PER_S", "10"))
+RATE_LIMIT_API_BURST = int(os.getenv("RATE_LIMIT_API_BURST", "40"))
+# /api/analysis/ask calls the LLM: 6 per minute
+RATE_LIMIT_ASK_PER_S = float(os.getenv("RATE_LIMIT_ASK_PER_S", "0.1"))
+RATE_LIMIT_ASK_BURST = int(os.getenv("RATE_LIMIT_ASK_BURST", "3"))
+# Hard cap on tracked IPs per route (least recently seen are evicted first)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# "shared" keeps rate-limit buckets and request counters in shared memory so
+# all gunicorn workers on a host enforce one limit ("memory": per process)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_SHARED_SLOTS = int(os.getenv("RATE_LIMIT_SHARED_SLOTS", "65536"))
+# Directory and file name prefix of the shared-memory tables (default: /dev/shm)
+SHARED_MEMORY_DIR = os.getenv("SHARED_MEMORY_DIR", "")
+SHARED_MEMORY_NAMESPACE = os.getenv("SHARED_MEMORY_NAMESPACE", "dnstracking")
+
+# HMAC key for the signed session tokens issued by /track; every worker must
+# share it. Unset: SECRET_KEY, else a random key per process
+SESSION_SECRET = os.getenv("SESSION_SECRET") or os.getenv("SECRET_KEY", "")
@@ -0,0 +1,108 @@
+"""
+Cached document counts refreshed in the background.
+
+An exact count_documents over a large filtered collection scans every
+matching index entry, so /api/events does not run one per page. Counts are
+cached per filter; a stale entry is still served while a background thread
+recomputes it.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from bson import json_util
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def filter_key(filter_dict):
+    """Stable cache key for a MongoDB filter."""
+    return json_util.dumps(filter_dict or {}, sort_keys=True)
+
+
+class CountCache:
+    """
+    LRU cache of counts keyed by filter, with stale-while-revalidate refresh.
+
+    get() never blocks on a count: a missing entry returns None and schedules
+    a refresh, an entry older than `ttl` is returned as-is and refreshed.
+    """
+
+    def __init__(self, counter, ttl=60.0, max_entries=256, workers=2):
+        """
+        Args:
+            counter (callable): Function returning the exact count for a filter
+            ttl (float): Seconds before a cached count is refreshed
+            max_entries (int): Maximum number of cached filters
+            workers (int): Maximum number of concurrent background counts
+        """
+        self.counter = counter
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (count, computed_at)
+        self._refreshing = set()
+        self._executor = None
+        self._pid = None
+
+    def _submit(self, key, filter_dict):
+        """Schedule a refresh unless one is already running (called with the lock held)."""
+        if key in self._refreshing:
+            return
+        if self._executor is None or self._pid != os.getpid():
+            # Thread pools do not survive a gunicorn fork
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="count-cache")
+            self._pid = os.getpid()
+            self._refreshing.clear()
+        self._refreshing.add(key)
+        self._executor.submit(self._refresh, key, filter_dict)
+
+    def _refresh(self, key, filter_dict):
+        try:
+            count = self.counter(filter_dict)
+        except Exception as e:
+            logger.warning(f"Background count failed: {e}")
+            count = None
+        with self._lock:
+            self._refreshing.discard(key)
+            if count is not None:
+                self._store(key, count)
+
+    def _store(self, key, count):
+        self._entries[key] = (count, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, filter_dict):
+        """
+        Get the cached count for a filter.
+
+        Returns:
+            tuple: (count or None, age in seconds or None)
+        """
+        key = filter_key(filter_dict)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._submit(key, filter_dict)
+                return None, None
+            self._entries.move_to_end(key)
+            age = time.monotonic() - entry[1]
+            if age >= self.ttl:
+                self._submit(key, filter_dict)
+            return entry[0], age
+
+    def put(self, filter_dict, count):
+        """Store a count computed by the caller."""
+        with self._lock:
+            self._store(filter_key(filter_dict), count)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,80 @@
+"""
+Per-collection data versions.
+
+A data version is a counter that the ingest path increments after every
+write to a collection. Results computed from a collection can be cached
+under its version: a new write moves the version and the old entries are
+simply never read again, with no explicit invalidation.
+
+Versions live in the "counters" collection ({_id: "version:<collection>"})
+so that every worker sees the writes of the others. Reads are cached for
+`poll_interval` seconds; a worker sees its own writes immediately.
+"""
+
+import threading
+import time
+from pymongo import ReturnDocument
+from .event_schema import COUNTERS_COLLECTION
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _counter_id(name):
+    return f"version:{name}"
+
+
+class DataVersions:
+    """Shared write counters per collection, with a short-lived local cache."""
+
+    def __init__(self, get_collection, poll_interval=1.0, clock=time.monotonic):
+        """
+        Args:
+            get_collection (callable): Returns a collection by name
+            poll_interval (float): Seconds a version read from the database is reused
+            clock (callable): Monotonic time source in seconds
+        """
+        self.get_collection = get_collection
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._cached = {}  # name -> (version, read_at)
+
+    def bump(self, name, amount=1):
+        """
+        Record a write to a collection.
+
+        Returns:
+            int: The new version
+        """
+        counter = self.get_collection(COUNTERS_COLLECTION).find_one_and_update(
+            {"_id": _counter_id(name)}, {"$inc": {"value": amount}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        version = counter["value"]
+        with self._lock:
+            cached = self._cached.get(name)
+            if cached is None or cached[0] < version:
+                self._cached[name] = (version, self.clock())
+        return version
+
+    def get(self, name):
+        """
+        Current version of a collection (0 before its first write).
+
+        May lag writes made by other workers by up to `poll_interval` seconds.
+        """
+        now = self.clock()
+        with self._lock:
+            cached = self._cached.get(name)
+        if cached is not None and now - cached[1] < self.poll_interval:
+            return cached[0]
+        counter = self.get_collection(COUNTERS_COLLECTION).find_one({"_id": _counter_id(name)})
+        version = counter["value"] if counter else 0
+        with self._lock:
+            self._cached[name] = (version, now)
+        return version
+
+    def clear(self):
+        with self._lock:
+            self._cached.clear()
@@ -4,8 +4,38 @@ MongoDB database operations for tracking events.
 
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from bson import ObjectId, json_util
 from datetime import datetime
-from .config import MONGODB_URI, MONGODB_DB_NAME
+from functools import wraps
+from itertools import islice
+import atexit
+import base64
+from .config import (
+    MONGODB_URI,
+    MONGODB_DB_NAME,
+    DB_BREAKER_BASE_BACKOFF_S,
+    DB_BREAKER_MAX_BACKOFF_S,
+    DATA_DIR,
+    MOCK_DB_DIR,
+    EVENT_COUNT_CACHE_TTL_S,
+    RAW_EVENTS_TIMESERIES,
+    RAW_EVENTS_TIMESERIES_COLLECTION,
+    RAW_EVENTS_TIMESERIES_GRANULARITY,
+    EVENT_SCHEMA_VERSION,
+    DATA_VERSION_POLL_S,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_CACHE_MAX_BYTES,
+    QUERY_CACHE_TTL_S,
+)
+from .circuit_breaker import CircuitBreaker
+from .count_cache import CountCache
+from .data_version import DataVersions
+from .event_schema import SCHEMA_V2, StringLookup, stored_projection
+from .indexes import INDEXES, sync_indexes
+from .mock_db import MockDatabase
+from .query_cache import QueryCache, query_key
+from .serialization import to_json
+from .timeseries import META_FIELD, ensure_timeseries_collection, insert_timeseries
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +44,24 @@ logger = logging.getLogger(__name__)
 _client = None
 _db = None
 
+# Whether the raw_events time-series collection is known to exist
+_timeseries_ready = False
+
+# Interned strings of compact (v2) events
+_lookups = StringLookup()
+
+# Breaker around the MongoDB connection: while it is open, get_collection()
+# goes straight to the mock database instead of waiting for a timeout
+_breaker = CircuitBreaker(
+    failure_threshold=1,
+    base_backoff=DB_BREAKER_BASE_BACKOFF_S,
+    max_backoff=DB_BREAKER_MAX_BACKOFF_S
+)
+
+
+class MongoUnavailableError(Exception):
+    """MongoDB is configured but unavailable, and the write must not go to the mock database."""
+
 
 def get_client():
     """Get or create MongoDB client connection."""
@@ -30,14 +78,19 @@ def get_client():
             # Replace <db_password> placeholder if still present (though the check above should catch it)
             uri = MONGODB_URI.replace("<db_password>", "")
             
-            _client = MongoClient(
+            client = MongoClient(
                 uri,
                 serverSelectionTimeoutMS=5000,  # 5 second timeout
                 retryWrites=True
             )
             
-            # Test connection
-            _client.admin.command('ping')
+            # Test connection (only keep the client if it works)
+            try:
+                client.admin.command('ping')
+            except Exception:
+                client.close()
+                raise
+            _client = client
             logger.info("✅ Successfully connected to MongoDB Atlas")
             
         except (ConnectionFailure, ServerSelectionTimeoutError) as e:
@@ -61,10 +114,81 @@ def get_database():
     return _db
 
 
-def get_collection(collection_name="raw_events"):
-    """Get collection instance."""
-    db = get_database()
-    return db[collection_name]
+def _reset_connection(error):
+    """Drop the cached connection after a connection error and open the breaker."""
+    global _client, _db
+    
+    client = _client
+    _client = None
+    _db = None
+    _breaker.record_failure(error)
+    if client is not None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+def _tracks_connection(func):
+    """Report connection errors from a database operation to the breaker."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+            logger.error(f"❌ Lost connection to MongoDB: {e}")
+            _reset_connection(e)
+            raise
+    return wrapper
+
+
+def _writes_events(func):
+    """Move the raw_events data version after a write, even a partly failed one."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        attempted = True
+        try:
+            return func(*args, **kwargs)
+        except MongoUnavailableError:
+            # Refused before anything was written
+            attempted = False
+            raise
+        finally:
+            if attempted:
+                try:
+                    bump_data_version("raw_events")
+                except Exception as e:
+                    logger.error(f"Failed to bump the raw_events data version: {e}")
+    return wrapper
+
+
+def _cached_query(func):
+    """
+    Serve a raw_events query from _query_cache while the collection's data
+    version is unchanged.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _query_cache.enabled:
+            return func(*args, **kwargs)
+        # Read the version first: a write during the query only makes the entry unreachable
+        version = get_data_version("raw_events")
+        key = (func.__name__, id(get_collection().database), version, query_key(args, kwargs))
+        hit, result = _query_cache.get(key)
+        if hit:
+            return result
+        result = func(*args, **kwargs)
+        _query_cache.put(key, result)
+        return result
+    return wrapper
+
+
+def get_backend_status():
+    """Get the active database backend and circuit breaker state."""
+    return {
+        "backend": "mongodb" if _db is not None else "mock",
+        "breaker": _breaker.get_state()
+    }
 
 
 def test_connection():
@@ -87,28 +211,33 @@ def test_connection():
         }
 
 
-def create_indexes():
-    """Create indexes for efficient querying."""
-    collection = get_collection()
+def create_indexes(drop_unknown=False, dry_run=False):
+    """
+    Create the indexes declared in src/indexes.py on every registered collection.
     
-    indexes = [
-        ("timestamp", 1),
-        ("campaign_id", 1),
-        ("utm_source", 1),
-        ("utm_campaign", 1),
-        ("session_id", 1),
-        ("gclid", 1),
-        ("fbclid", 1),
-        ("platform_detected", 1),
-        ("created_at", 1)
-    ]
-    
-    for field, direction in indexes:
-        try:
-            collection.create_index([(field, direction)])
-            logger.info(f"Created index on {field}")
-        except Exception as e:
-            logger.warning(f"Index on {field} may already exist: {e}")
+    Idempotent: indexes that already match are left alone. The time-series
+    events collection is only synced when RAW_EVENTS_TIMESERIES is enabled
+    (building an index on a missing collection would create a regular one).
+    
+    Returns:
+        dict: Per-collection report from indexes.sync_indexes()
+    """
+    db = get_collection("raw_events").database
+    collections = list(INDEXES)
+    if RAW_EVENTS_TIMESERIES:
+        if not dry_run:
+            _ensure_timeseries(db)
+    else:
+        collections.remove(RAW_EVENTS_TIMESERIES_COLLECTION)
+    return sync_indexes(db, collections, drop_unknown=drop_unknown, dry_run=dry_run)
+
+
+def _ensure_timeseries(db):
+    """Create the raw_events time-series collection once per process."""
+    global _timeseries_ready
+    if not _timeseries_ready:
+        ensure_timeseries_collection(db, RAW_EVENTS_TIMESERIES_COLLECTION, RAW_EVENTS_TIMESERIES_GRANULARITY)
+        _timeseries_ready = True
 
 
 def insert_event(event_data):
@@ -121,9 +250,70 @@ def insert_event(event_data):
     Returns:
         str: Inserted document ID
     """
+    if RAW_EVENTS_TIMESERIES or EVENT_SCHEMA_VERSION == SCHEMA_V2:
+        # insert_events moves the data version itself
+        return insert_events([event_data])[0]
+    return _insert_one(event_data)
+
+
+@_writes_events
+@_tracks_connection
+def _insert_one(event_data):
     collection = get_collection()
     
-    # Ensure timestamps are set
+    result = collection.insert_one(_prepare_event(event_data))
+    return str(result.inserted_id)
+
+
+@_writes_events
+@_tracks_connection
+def insert_events(events, require_mongodb=False):
+    """
+    Insert a batch of tracking events with a single bulk write.
+    
+    The write is unordered, so one bad document does not stop the rest of
+    the batch from being stored. With EVENT_SCHEMA_VERSION=2 the events are
+    stored in the compact layout of src/event_schema.py. In time-series mode
+    the events also get their metaField, and _ids that are already stored
+    are reported as duplicate-key errors like a regular collection would.
+    
+    Args:
+        events (list): List of event data dictionaries
+        require_mongodb (bool): Raise instead of writing to the process-local
+            mock database while a configured MongoDB is unavailable
+        
+    Returns:
+        list: Inserted document IDs
+        
+    Raises:
+        MongoUnavailableError: If require_mongodb is set and MongoDB is down
+    """
+    if not events:
+        return []
+    
+    collection = get_collection()
+    if require_mongodb and MONGODB_URI and collection.database is _mock_db:
+        raise MongoUnavailableError(f"MongoDB is unavailable, not writing {len(events)} events to the mock database")
+    
+    documents = [_prepare_event(e) for e in events]
+    if EVENT_SCHEMA_VERSION == SCHEMA_V2:
+        # Stored documents are copies: the caller's events keep the v1 layout
+        for event in documents:
+            event.setdefault("_id", ObjectId())
+        documents = _lookups.compact(collection.database, documents)
+    
+    if RAW_EVENTS_TIMESERIES:
+        _ensure_timeseries(collection.database)
+        return [str(doc_id) for doc_id in insert_timeseries(collection, documents)]
+    result = collection.insert_many(documents, ordered=False)
+    return [str(doc_id) for doc_id in result.inserted_ids]
+
+
+def _prepare_event(event_data):
+    """Ensure timestamps are set and stored as datetimes, and stamp the write time."""
+    # When the event reached raw_events (created_at is when it was received):
+    # incremental jobs read from here, so late writes are not skipped
+    event_data["ingested_at"] = datetime.utcnow()
     if "timestamp" not in event_data:
         event_data["timestamp"] = datetime.utcnow()
     if "created_at" not in event_data:
@@ -136,11 +326,12 @@ def insert_event(event_data):
         except:
             event_data["timestamp"] = datetime.utcnow()
     
-    result = collection.insert_one(event_data)
-    return str(result.inserted_id)
+    return event_data
 
 
-def get_events(filter_dict=None, limit=25, skip=0, sort_field="timestamp", sort_direction=-1):
+@_cached_query
+@_tracks_connection
+def get_events(filter_dict=None, limit=25, skip=0, sort_field="timestamp", sort_direction=-1, fields=None):
     """
     Query events from the database.
     
@@ -150,6 +341,7 @@ def get_events(filter_dict=None, limit=25, skip=0, sort_field="timestamp", sort_
         skip (int): Number of results to skip
         sort_field (str): Field to sort by
         sort_direction (int): 1 for ascending, -1 for descending
+        fields (list): Fields to return (plus _id); None for whole events
         
     Returns:
         list: List of event documents
@@ -159,21 +351,182 @@ def get_events(filter_dict=None, limit=25, skip=0, sort_field="timestamp", sort_
     if filter_dict is None:
         filter_dict = {}
     
-    cursor = collection.find(filter_dict).sort(sort_field, sort_direction).skip(skip).limit(limit)
+    cursor = collection.find(filter_dict, _projection(fields)).sort(sort_field, sort_direction).skip(skip).limit(limit)
     
-    # Convert ObjectId to string and datetime to ISO format for JSON serialization
-    events = []
-    for event in cursor:
-        event["_id"] = str(event["_id"])
-        if isinstance(event.get("timestamp"), datetime):
-            event["timestamp"] = event["timestamp"].isoformat()
-        if isinstance(event.get("created_at"), datetime):
-            event["created_at"] = event["created_at"].isoformat()
-        events.append(event)
+    return _serialize_events(expand_events(list(cursor), collection.database), fields)
+
+
+def _projection(fields):
+    """Stored-layout projection for a list of v1 fields (timestamp is kept for paging)."""
+    if not fields:
+        return None
+    return stored_projection([*fields, "timestamp"])
+
+
+def expand_events(documents, db=None):
+    """
+    Convert stored events to the v1 layout.
     
-    return events
+    Compact (v2) documents are expanded with their interned strings resolved
+    in one lookup query per kind; v1 documents are returned unchanged.
+    
+    Args:
+        documents (list): Documents read from raw_events
+        db: Database holding the lookup collections (default: the current one)
+        
+    Returns:
+        list: Events with the v1 field names
+    """
+    if not any(doc.get("v") == SCHEMA_V2 for doc in documents):
+        return documents
+    return _lookups.expand(db if db is not None else get_collection().database, documents)
+
+
+def lookup_values(kind, ids):
+    """
+    Strings interned for compact events.
+    
+    Args:
+        kind (str): Lookup kind ("ua", "host" or "url")
+        ids (iterable): Interned ids
+        
+    Returns:
+        dict: {id: value}
+    """
+    return _lookups.values(get_collection().database, kind, ids)
+
+
+def _serialize_events(events, fields=None):
+    """
+    JSON-compatible events (ObjectIds and datetimes as strings, in one pass),
+    limited to `fields` and _id when given.
+    """
+    if fields:
+        wanted = {"_id", *fields}
+        events = [{k: v for k, v in event.items() if k in wanted} for event in events]
+    else:
+        for event in events:
+            # Time-series metaField duplicates host/platform_detected
+            event.pop(META_FIELD, None)
+    return to_json(events)
 
 
+def encode_cursor(event):
+    """Opaque pagination cursor pointing just past an event, by (timestamp, _id)."""
+    payload = json_util.dumps({"t": event.get("timestamp"), "i": event["_id"]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor created by encode_cursor().
+    
+    Returns:
+        tuple: (timestamp, _id)
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return payload["t"], payload["i"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+@_cached_query
+@_tracks_connection
+def get_events_page(filter_dict=None, limit=25, cursor=None, sort_direction=-1, fields=None):
+    """
+    Query one page of events with keyset pagination on (timestamp, _id).
+    
+    Instead of skipping over earlier pages, each page starts right after the
+    last event of the previous one, so every page costs the same index seek
+    (served by the timestamp/_id compound index) however deep it is.
+    
+    Args:
+        filter_dict (dict): MongoDB filter dictionary
+        limit (int): Maximum number of results
+        cursor (str): next_cursor from the previous page (None for the first page)
+        sort_direction (int): 1 for oldest first, -1 for newest first
+        fields (list): Fields to return (plus _id); None for whole events
+        
+    Returns:
+        dict: {"events": [...], "next_cursor": str or None}
+        
+    Raises:
+        ValueError: If the cursor is malformed or limit is below 1
+    """
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+    collection = get_collection()
+    
+    query = dict(filter_dict or {})
+    if cursor:
+        timestamp, event_id = decode_cursor(cursor)
+        op = "$lt" if sort_direction < 0 else "$gt"
+        bound = "$lte" if sort_direction < 0 else "$gte"
+        # The plain range on timestamp comes first so it bounds the index scan
+        clauses = [{"timestamp": {bound: timestamp}}]
+        if query:
+            clauses.append(query)
+        clauses.append({"$or": [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "_id": {op: event_id}},
+        ]})
+        query = {"$and": clauses}
+    
+    # One extra event tells whether another page exists
+    sort = [("timestamp", sort_direction), ("_id", sort_direction)]
+    events = list(collection.find(query, _projection(fields)).sort(sort).limit(limit + 1))
+    
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1])
+    
+    return {
+        "events": _serialize_events(expand_events(events, collection.database), fields),
+        "next_cursor": next_cursor
+    }
+
+
+def iter_events(filter_dict=None, fields=None, batch_size=1000):
+    """
+    Stream matching events, oldest first, in batches.
+    
+    Events are read from one cursor `batch_size` at a time and expanded and
+    serialized per batch, so memory does not grow with the number of
+    events. Results are not cached.
+    
+    Args:
+        filter_dict (dict): Filter criteria
+        fields (list): Fields to return (plus _id); None for whole events
+        batch_size (int): Events per batch (and per cursor round trip)
+        
+    Yields:
+        list: JSON-compatible events
+    """
+    collection = get_collection()
+    cursor = collection.find(filter_dict or {}, _projection(fields))
+    cursor = cursor.sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+    try:
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                return
+            yield _serialize_events(expand_events(batch, collection.database), fields)
+    except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+        logger.error(f"❌ Lost connection to MongoDB: {e}")
+        _reset_connection(e)
+        raise
+    finally:
+        cursor.close()
+
+
+@_cached_query
+@_tracks_connection
 def count_events(filter_dict=None):
     """Count events matching filter."""
     collection = get_collection()
@@ -184,107 +537,95 @@ def count_events(filter_dict=None):
     return collection.count_documents(filter_dict)
 
 
-# Mock Database for testing/fallback
-class MockCollection:
-    def __init__(self, name, db):
-        self.name = name
-        self.db = db
+@_tracks_connection
+def estimate_count_events():
+    """Approximate total number of events from collection metadata (no scan)."""
+    collection = get_collection()
+    
+    return collection.estimated_document_count()
 
-    def insert_one(self, document):
-        if "_id" not in document:
-            document["_id"] = str(uuid.uuid4())
-        
-        if self.name not in self.db.data:
-            self.db.data[self.name] = []
-        
-        self.db.data[self.name].append(document)
-        self.db._save()
-            
-        return MagicMock(inserted_id=document["_id"])
 
-    def find(self, filter_dict=None):
-        results = []
-        events = self.db.data.get(self.name, [])
-        
-        if not filter_dict:
-            results = events
-        else:
-            for event in events:
-                match = True
-                for k, v in filter_dict.items():
-                    if k not in event or event[k] != v:
-                        match = False
-                        break
-                if match:
-                    results.append(event)
-        
-        cursor = MagicMock()
-        cursor.sort = MagicMock(return_value=cursor)
-        cursor.skip = MagicMock(return_value=cursor)
-        cursor.limit = MagicMock(return_value=results)
-        cursor.__iter__ = MagicMock(return_value=iter(results))
-        return cursor
-
-    def count_documents(self, filter_dict=None):
-        cursor = self.find(filter_dict)
-        return len(list(cursor))
-
-    def distinct(self, field):
-        events = self.db.data.get(self.name, [])
-        return list(set(e.get(field) for e in events if field in e))
-
-    def create_index(self, keys):
-        pass
-
-class MockDatabase:
-    def __init__(self):
-        self.data = {}
-        self.collections = {}
-
-    def __getitem__(self, name):
-        if name not in self.collections:
-            self.collections[name] = MockCollection(name, self)
-        return self.collections[name]
-
-    def _save(self):
-        # Save to file for persistence in test mode
-        try:
-            with open("data/mock_db.json", "w") as f:
-                # Convert datetime to str for JSON
-                json_data = {}
-                for col_name, docs in self.data.items():
-                    json_data[col_name] = []
-                    for doc in docs:
-                        doc_copy = doc.copy()
-                        for k, v in doc_copy.items():
-                            if isinstance(v, datetime):
-                                doc_copy[k] = v.isoformat()
-                        json_data[col_name].append(doc_copy)
-                json.dump(json_data, f, indent=2)
-        except Exception as e:
-            logger.warning(f"Failed to save mock DB: {e}")
+# Per-filter counts for pagination, refreshed in the background
+_count_cache = CountCache(count_events, ttl=EVENT_COUNT_CACHE_TTL_S)
+
+
+def get_cached_count(filter_dict=None):
+    """
+    Count events without blocking on a scan.
+    
+    An unfiltered count uses the collection metadata estimate. Filtered counts
+    come from a cache refreshed in the background; the first request for a
+    filter returns None while the count is computed.
+    
+    Returns:
+        int | None: Approximate number of matching events
+    """
+    if not filter_dict:
+        return estimate_count_events()
+    count, _ = _count_cache.get(filter_dict)
+    return count
+
+
+# Write counters per collection, for caches of results computed from them
+_data_versions = DataVersions(lambda name: get_collection(name), poll_interval=DATA_VERSION_POLL_S)
 
-import uuid
-import json
-from unittest.mock import MagicMock
 
-_mock_db = MockDatabase()
+def get_data_version(collection_name="raw_events"):
+    """Version of a collection's data; it changes after every ingest write."""
+    return _data_versions.get(collection_name)
+
+
+def bump_data_version(collection_name="raw_events"):
+    """Record a write to a collection (insert_event/insert_events do it for raw_events)."""
+    return _data_versions.bump(collection_name)
+
+
+# Results of get_events, get_events_page, count_events and get_unique_values,
+# keyed by the raw_events data version
+_query_cache = QueryCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TTL_S)
+
+
+def get_query_cache_stats():
+    """Size, hit/miss and eviction counts of the query-result cache."""
+    return _query_cache.stats()
+
+
+# Mock Database for testing/fallback (append-only JSONL store on disk)
+_mock_db = MockDatabase(MOCK_DB_DIR, legacy_file=DATA_DIR / "mock_db.json")
+atexit.register(_mock_db.close)
 
 def get_collection(collection_name="raw_events"):
-    """Get collection instance (or mock)."""
-    global _client, _db
+    """
+    Get collection instance (or mock).
     
-    try:
-        # Try to get real DB
-        if _db is None:
-            get_database()
-        return _db[collection_name]
-    except:
-        # Fallback to mock
-        logger.warning(f"Using Mock Database for collection: {collection_name}")
-        return _mock_db[collection_name]
+    Once connected the cached database is used directly. While MongoDB is
+    unavailable the circuit breaker is open and the mock database is returned
+    immediately; the connection is only re-probed when the breaker's backoff
+    expires. With RAW_EVENTS_TIMESERIES enabled, "raw_events" resolves to the
+    time-series collection.
+    """
+    if collection_name == "raw_events" and RAW_EVENTS_TIMESERIES:
+        collection_name = RAW_EVENTS_TIMESERIES_COLLECTION
+    
+    db = _db
+    if db is not None:
+        return db[collection_name]
+    
+    if _breaker.allow_request():
+        try:
+            db = get_database()
+            _breaker.record_success()
+            return db[collection_name]
+        except Exception as e:
+            _breaker.record_failure(e)
+            logger.warning(f"MongoDB unavailable, using Mock Database until next probe: {e}")
+    
+    # Fallback to mock
+    return _mock_db[collection_name]
 
 
+@_cached_query
+@_tracks_connection
 def get_unique_values(field):
     """Get unique values for a field (for filter dropdowns)."""
     collection = get_collection()
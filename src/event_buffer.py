@@ -0,0 +1,216 @@
+"""
+Write-behind buffer for tracking events.
+
+Events are accepted into a bounded in-process queue and written to the
+database in batches by a background thread, so /track does not wait on a
+MongoDB round trip. A batch that fails with one of `retry_errors` (MongoDB
+unavailable) is retried with backoff instead of being dropped; meanwhile new
+events queue up until the buffer is full.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Queued by stop() to wake the writer thread immediately
+_STOP = object()
+
+
+class EventBuffer:
+    """
+    Bounded queue of events flushed by a background writer.
+
+    A batch is written when it reaches `batch_size` events or when its oldest
+    event is older than `max_age` seconds, whichever comes first.
+    """
+
+    def __init__(self, writer, max_size=10000, batch_size=500, max_age=0.25, retry_errors=(), max_backoff=30):
+        """
+        Args:
+            writer (callable): Function that persists a list of events;
+                must tolerate events that were already written if retried
+            max_size (int): Maximum number of queued events
+            batch_size (int): Maximum number of events per write
+            max_age (float): Maximum age in seconds of a pending batch
+            retry_errors (tuple): Exception types after which a batch is retried
+            max_backoff (float): Maximum seconds between retries of a batch
+        """
+        self.writer = writer
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.retry_errors = tuple(retry_errors)
+        self.max_backoff = max_backoff
+
+        # Capacity is enforced in put_many(); the extra slot is for _STOP
+        self._queue = queue.Queue(maxsize=max_size + 1)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self._flush_latencies = deque(maxlen=100)
+        self._enqueued = 0
+        self._written = 0
+        self._failed = 0
+        self._rejected = 0
+        self._retries = 0
+        self._batches = 0
+
+    def _ensure_started(self):
+        """Start the writer thread on first use (after any gunicorn fork)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="event-buffer-writer", daemon=True)
+                self._thread.start()
+
+    def put(self, event):
+        """
+        Queue a single event.
+
+        Returns:
+            bool: False if the buffer is full and the event was not queued
+        """
+        return self.put_many([event])
+
+    def put_many(self, events):
+        """
+        Queue several events.
+
+        Either all events are queued or none are, so callers can fall back to
+        a synchronous write without duplicating anything.
+
+        Returns:
+            bool: False if the buffer does not have room for all events
+        """
+        if self._stopping.is_set():
+            return False
+
+        self._ensure_started()
+
+        with self._stats_lock:
+            if self._queue.qsize() + len(events) > self.max_size:
+                self._rejected += len(events)
+                return False
+            for event in events:
+                self._queue.put_nowait(event)
+            self._enqueued += len(events)
+        return True
+
+    def _drain(self, limit):
+        """Take up to `limit` events from the queue without blocking."""
+        batch = []
+        while len(batch) < limit:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                batch.append(event)
+        return batch
+
+    def _run(self):
+        """Writer loop: collect batches by size or age and write them."""
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.max_age)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_age
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    self._stopping.set()
+                    break
+                batch.append(event)
+
+            self._write(batch)
+
+    def _write(self, batch):
+        """Write one batch, retrying while the database is unavailable, and record its latency."""
+        started = time.perf_counter()
+        backoff = 0
+        with self._write_lock:
+            while True:
+                try:
+                    self.writer(batch)
+                    ok = True
+                except self.retry_errors as e:
+                    if self._stopping.is_set():
+                        logger.error(f"Dropping batch of {len(batch)} events on shutdown: {e}")
+                        ok = False
+                    else:
+                        backoff = min(self.max_backoff, max(1, backoff * 2))
+                        with self._stats_lock:
+                            self._retries += 1
+                        logger.warning(f"Failed to write batch of {len(batch)} events, retrying in {backoff}s: {e}")
+                        self._stopping.wait(backoff)
+                        continue
+                except Exception as e:
+                    logger.error(f"Failed to write batch of {len(batch)} events: {e}")
+                    ok = False
+                break
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._batches += 1
+            self._flush_latencies.append(elapsed_ms)
+            if ok:
+                self._written += len(batch)
+            else:
+                self._failed += len(batch)
+
+    def flush(self):
+        """Synchronously write everything currently queued."""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self._write(batch)
+
+    def stop(self, timeout=5):
+        """Stop the writer thread and flush remaining events (worker shutdown)."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put_nowait(_STOP)
+            thread.join(timeout)
+        self.flush()
+
+    def get_stats(self):
+        """Get queue depth, throughput counters and flush latency."""
+        with self._stats_lock:
+            latencies = list(self._flush_latencies)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_size": self.max_size,
+                "batch_size": self.batch_size,
+                "max_age_ms": int(self.max_age * 1000),
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "retries": self._retries,
+                "batches": self._batches,
+                "last_flush_ms": round(latencies[-1], 3) if latencies else None,
+                "avg_flush_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                "max_flush_ms": round(max(latencies), 3) if latencies else None,
+            }
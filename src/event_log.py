@@ -0,0 +1,385 @@
+"""
+Durable local write-ahead log for tracking events.
+
+Events are appended to segment files on disk and acknowledged once they are
+fsynced; a background replayer drains the segments into MongoDB with bulk
+inserts. /track therefore keeps a constant latency and loses nothing while
+MongoDB is slow or unreachable.
+
+Layout of the log directory:
+    seg-<pid>-<seq>.log    append-only segment, one record per line
+    seg-<pid>-<seq>.ckpt   replay checkpoint (byte offset already in MongoDB)
+    seg-<pid>-<seq>.lock   pid of the process that owns the segment
+
+Each record is "<crc32 hex> <extended JSON>\n". A record with a bad checksum
+or without its trailing newline (torn write after a crash) is skipped.
+"""
+
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from bson import json_util
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(event):
+    """Encode one event as a log record."""
+    payload = json_util.dumps(event, json_options=json_util.RELAXED_JSON_OPTIONS).encode("utf-8")
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+
+def _decode(line):
+    """Decode one log record, or return None if it is torn or corrupt."""
+    if not line.endswith(b"\n") or len(line) < 10:
+        return None
+    checksum, payload = line[:8], line[9:-1]
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json_util.loads(payload)
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    """Check whether a process is still running."""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _write_atomic(path, data):
+    """Replace a small file so readers never see a partial write."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class EventLog:
+    """
+    Append-only, segment-rotated event log with group-commit fsync.
+
+    Concurrent appends share fsyncs: the first caller to reach the sync step
+    waits `fsync_interval` seconds for others to join, then fsyncs once for
+    all of them.
+    """
+
+    def __init__(self, directory, segment_max_bytes=16 * 1024 * 1024, fsync_interval=0.005):
+        """
+        Args:
+            directory (str | Path): Directory holding the segment files
+            segment_max_bytes (int): Size at which the active segment is rotated
+            fsync_interval (float): Seconds to wait for more appends before an fsync
+        """
+        self.directory = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._file = None
+        self._segment = None
+        self._pid = None
+        self._seq = 0
+        self._appended = 0  # Appends written to the OS
+        self._durable = 0   # Appends known to be fsynced
+        self._syncing = False
+
+        self._records = 0
+        self._fsyncs = 0
+
+    def _segment_path(self, seq):
+        return self.directory / f"seg-{os.getpid()}-{seq:08d}.log"
+
+    def _open_segment(self):
+        """Start a new segment owned by this process (called with the lock held)."""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._pid != os.getpid():
+            # New process (e.g. gunicorn fork): never append to a parent's
+            # segment, nor to one left behind by an earlier process with this pid
+            self._pid = os.getpid()
+            existing = [int(p.stem.rsplit("-", 1)[1]) for p in self.directory.glob(f"seg-{self._pid}-*.log")]
+            self._seq = max(existing, default=0)
+
+        self._seq += 1
+        self._segment = self._segment_path(self._seq)
+        self._segment.with_suffix(".lock").write_text(str(self._pid))
+        self._file = open(self._segment, "ab")
+
+    def active_segment(self):
+        """Path of the segment currently being written by this process."""
+        with self._lock:
+            return self._segment if self._pid == os.getpid() else None
+
+    def append(self, events):
+        """
+        Append events and return once they are durable on disk.
+
+        Args:
+            events (list): List of event dictionaries
+        """
+        data = b"".join(_encode(e) for e in events)
+
+        with self._lock:
+            if (self._file is None or self._pid != os.getpid()
+                    or self._file.tell() >= self.segment_max_bytes):
+                self._open_segment()
+            self._file.write(data)
+            self._appended += 1
+            self._records += len(events)
+            ticket = self._appended
+
+            while self._durable < ticket:
+                if self._syncing:
+                    self._synced.wait()
+                    continue
+
+                # This caller performs the fsync for everyone queued so far
+                self._syncing = True
+                self._lock.release()
+                try:
+                    if self.fsync_interval:
+                        time.sleep(self.fsync_interval)
+                finally:
+                    self._lock.acquire()
+                target = self._appended
+                try:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._durable = target
+                    self._fsyncs += 1
+                finally:
+                    self._syncing = False
+                    self._synced.notify_all()
+
+    def close(self):
+        """Flush and close the active segment."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def segments(self):
+        """List all segment files (oldest first within each process)."""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("seg-*.log"))
+
+    def get_stats(self):
+        """Get append and fsync counters and the on-disk backlog."""
+        segments = self.segments()
+        backlog = 0
+        for segment in segments:
+            try:
+                backlog += segment.stat().st_size - _read_checkpoint(segment)
+            except OSError:
+                pass
+        return {
+            "directory": str(self.directory),
+            "records_appended": self._records,
+            "fsyncs": self._fsyncs,
+            "segments": len(segments),
+            "backlog_bytes": backlog,
+        }
+
+
+def _read_checkpoint(segment):
+    """Byte offset of a segment that has already been replayed."""
+    try:
+        return int(segment.with_suffix(".ckpt").read_text() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+class EventLogReplayer:
+    """
+    Drains event log segments into the database.
+
+    Records are read in batches from the last checkpoint, handed to `writer`
+    and the checkpoint is advanced only after the write succeeds, so a crash
+    replays at most one batch. Fully replayed segments that are no longer
+    being written are deleted. Segments left behind by dead processes are
+    adopted and drained as well.
+    """
+
+    def __init__(self, log, writer, batch_size=500, idle_interval=0.5, max_backoff=30):
+        """
+        Args:
+            log (EventLog): Log to drain
+            writer (callable): Function that persists a list of events;
+                must tolerate events that were already written
+            batch_size (int): Maximum number of events per write
+            idle_interval (float): Seconds to sleep when there is nothing to replay
+            max_backoff (float): Maximum seconds between retries after a failed write
+        """
+        self.log = log
+        self.writer = writer
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._replay_lock = threading.Lock()
+        self._backoff = 0
+        self._replayed = 0
+        self._last_error = None
+
+    def start(self):
+        """Start the background replayer thread if it is not running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="event-log-replayer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the replayer thread and try one final drain."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        try:
+            self.replay()
+        except Exception as e:
+            logger.warning(f"Event log not fully replayed on shutdown: {e}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                replayed = self.replay()
+                self._backoff = 0
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                self._backoff = min(self.max_backoff, max(1, self._backoff * 2))
+                logger.warning(f"Event log replay failed, retrying in {self._backoff}s: {e}")
+                self._stopping.wait(self._backoff)
+                continue
+
+            if not replayed:
+                self._stopping.wait(self.idle_interval)
+
+    def _claim(self, segment):
+        """Check that this process owns a segment, adopting it if its owner died."""
+        lock = segment.with_suffix(".lock")
+        try:
+            owner = int(lock.read_text() or 0)
+        except (FileNotFoundError, ValueError):
+            owner = 0
+
+        if owner == os.getpid():
+            return True
+        if owner and _pid_alive(owner):
+            return False
+
+        try:
+            fd = os.open(f"{lock}.claim", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            _write_atomic(lock, str(os.getpid()))
+            logger.info(f"Adopted event log segment {segment.name} from process {owner}")
+        finally:
+            os.unlink(f"{lock}.claim")
+        return True
+
+    def replay(self, max_batches=None):
+        """
+        Replay pending records from every segment owned by this process.
+
+        Args:
+            max_batches (int): Stop after this many batches (None for all)
+
+        Returns:
+            int: Number of events written
+        """
+        replayed = 0
+        batches = 0
+        with self._replay_lock:
+            for segment in self.log.segments():
+                if not self._claim(segment):
+                    continue
+
+                offset = _read_checkpoint(segment)
+                sealed = segment != self.log.active_segment()
+                with open(segment, "rb") as f:
+                    f.seek(offset)
+                    while max_batches is None or batches < max_batches:
+                        batch, end = self._read_batch(f, offset, sealed)
+                        if end == offset:
+                            break
+                        if batch:
+                            self.writer(batch)
+                            replayed += len(batch)
+                            batches += 1
+                        _write_atomic(segment.with_suffix(".ckpt"), str(end))
+                        offset = end
+
+                if sealed and offset >= segment.stat().st_size:
+                    for path in (segment, segment.with_suffix(".ckpt"), segment.with_suffix(".lock")):
+                        try:
+                            path.unlink()
+                        except FileNotFoundError:
+                            pass
+
+        self._replayed += replayed
+        return replayed
+
+    def _read_batch(self, f, offset, sealed):
+        """Read up to batch_size complete records starting at `offset`."""
+        batch = []
+        end = offset
+        while len(batch) < self.batch_size:
+            line = f.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                if sealed:
+                    # Torn write from a crashed process: nothing more will arrive
+                    logger.warning(f"Skipping torn event log record at offset {end}")
+                    end += len(line)
+                else:
+                    # Record still being written: retry later
+                    f.seek(end)
+                break
+            end += len(line)
+            event = _decode(line)
+            if event is None:
+                logger.warning(f"Skipping corrupt event log record at offset {end - len(line)}")
+                continue
+            batch.append(event)
+        return batch, end
+
+    def get_stats(self):
+        """Get replay counters and the last replay error."""
+        return {
+            "replayed": self._replayed,
+            "retry_in_s": self._backoff,
+            "last_error": self._last_error,
+        }
@@ -0,0 +1,400 @@
+"""
+Compact (v2) storage layout for tracking events.
+
+A v1 event stores every request parameter twice (as a field and again in
+raw_params) and repeats long strings such as the user agent, the page URLs
+and the host on every document. A v2 event (marked "v": 2):
+
+- keeps the fields that are filtered, indexed or rolled up under their
+  usual names (timestamp, created_at, ingested_at, session_id, utm_*,
+  campaign_id, event_type, platform_detected, click ids, conversion_value),
+  so queries, indexes and the time-series layout are the same for v1 and v2
+  documents;
+- stores the other fields under short names (COMPACT_FIELDS);
+- replaces user agents, hosts and page URLs with integer ids from the
+  lookup collections (LOOKUPS);
+- drops domain/subdomain when they are derived from the host, and full_url's
+  query string when it is raw_params encoded in one of the usual ways;
+- keeps in raw_params ("p") only the parameters that are not already stored
+  as a field with the same value, and lists the others by code ("pk", a
+  short string that also records the original key order).
+
+expand_event() restores the exact v1 document, so readers return the same
+output for both layouts.
+"""
+
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, urlencode
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+import logging
+
+logger = logging.getLogger(__name__)
+
+VERSION_FIELD = "v"
+SCHEMA_V2 = 2
+
+# Lookup kind -> collection of {"_id": int id, "value": str}
+LOOKUPS = {
+    "ua": "lookup_user_agents",
+    "host": "lookup_hosts",
+    "url": "lookup_urls",
+}
+# Next free id per lookup collection
+COUNTERS_COLLECTION = "counters"
+
+# v1 field -> (v2 field, lookup kind or None)
+COMPACT_FIELDS = {
+    "utm_content": ("uc", None),
+    "utm_term": ("ut", None),
+    "adset_id": ("as", None),
+    "ad_id": ("ad", None),
+    "placement": ("pl", None),
+    "igshid": ("ig", None),
+    "referrer_url": ("rf", None),
+    "ip_address": ("ip", None),
+    "user_agent": ("ua", "ua"),
+    "current_page": ("cp", "url"),
+    "previous_page": ("pp", "url"),
+    "sequence_step": ("sq", None),
+    "element_tag": ("et", None),
+    "element_id": ("ei", None),
+    "element_class": ("ec", None),
+    "element_text": ("ex", None),
+    "target_url": ("tu", "url"),
+    "screen_resolution": ("sr", None),
+    "language": ("lg", None),
+    "host": ("h", "host"),
+    "domain": ("dm", None),
+    "subdomain": ("sd", None),
+}
+EXPANDED_FIELDS = {short: (field, kind) for field, (short, kind) in COMPACT_FIELDS.items()}
+
+# Request parameters that process_tracking_event copies into a field.
+# Append only: stored documents refer to these by position ("pk").
+PARAM_CODES = (
+    "utm_source", "utm_medium", "utm_campaign", "utm_content", "utm_term",
+    "campaign_id", "adset_id", "ad_id", "placement", "igshid", "igsh",
+    "gclid", "fbclid", "ttclid", "msclkid", "session_id", "referrer_url",
+    "event_type", "conversion_value", "current_page", "previous_page", "sequence_step",
+    "element_tag", "element_id", "element_class", "element_text", "target_url",
+    "screen_resolution", "language",
+)
+_PARAM_FIELD = {"igsh": "igshid"}
+# "pk" is a string with one character per raw_params key: the parameter's
+# code, or _REST_CHAR for the next key kept in "p"
+_CODE_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_REST_CHAR = "-"
+
+
+def split_host(host):
+    """(domain, subdomain) of a host name, as stored on events."""
+    if host.count(".") > 1:
+        return ".".join(host.split(".")[-2:]), host.split(".")[0]
+    return host, "www"
+
+
+def _same(a, b):
+    return type(a) is type(b) and a == b
+
+
+def lookup_values(event):
+    """(kind, value) pairs of an event that compact_event() interns."""
+    for field, (_, kind) in COMPACT_FIELDS.items():
+        if kind is not None and isinstance(event.get(field), str):
+            yield kind, event[field]
+    full_url = event.get("full_url")
+    if isinstance(full_url, str):
+        yield "url", full_url.split("?", 1)[0]
+
+
+def compact_event(event, ids):
+    """
+    Convert a v1 event to the v2 layout.
+
+    Args:
+        event (dict): v1 event (not modified)
+        ids (dict): {kind: {value: id}} covering lookup_values(event)
+
+    Returns:
+        dict: v2 document
+    """
+    doc = {VERSION_FIELD: SCHEMA_V2}
+    host = event.get("host")
+    derived = dict(zip(("domain", "subdomain"), split_host(host))) if isinstance(host, str) else {}
+
+    for field, value in event.items():
+        if field in ("raw_params", "full_url"):
+            continue
+        if field in derived and _same(value, derived[field]):
+            continue
+        spec = COMPACT_FIELDS.get(field)
+        if spec is None:
+            doc[field] = value
+        elif spec[1] is None:
+            doc[spec[0]] = value
+        elif isinstance(value, str):
+            doc[spec[0]] = ids[spec[1]][value]
+        else:
+            # Only strings are interned; anything else keeps its v1 name
+            doc[field] = value
+
+    params = event.get("raw_params")
+    rebuilt = None
+    if isinstance(params, dict):
+        codes = []
+        rest = {}
+        for key, value in params.items():
+            if key in PARAM_CODES and _same(event.get(_PARAM_FIELD.get(key, key)), value):
+                codes.append(_CODE_CHARS[PARAM_CODES.index(key)])
+            else:
+                codes.append(_REST_CHAR)
+                rest[key] = value
+        codes = "".join(codes).rstrip(_REST_CHAR)
+        if codes:
+            doc["pk"] = codes
+        if rest or not codes:
+            doc["p"] = rest
+        rebuilt = params
+    elif "raw_params" in event:
+        doc["raw_params"] = params
+
+    full_url = event.get("full_url")
+    if isinstance(full_url, str):
+        base, _, query = full_url.partition("?")
+        doc["fu"] = ids["url"][base]
+        if "?" in full_url:
+            doc["fq"] = _query_encoding(rebuilt, query) if rebuilt is not None else query
+    elif "full_url" in event:
+        doc["full_url"] = full_url
+
+    return doc
+
+
+# Ways clients encode a query string: urlencode() arguments that reproduce it
+_QUERY_ENCODINGS = (
+    {},                                 # application/x-www-form-urlencoded
+    {"quote_via": quote},               # encodeURIComponent
+    {"safe": "/:"},                     # slashes and colons left as is
+    {"quote_via": quote, "safe": "/:"},
+)
+
+
+def _query_encoding(params, query):
+    """Position in _QUERY_ENCODINGS that reproduces `query` from params, else the query itself."""
+    for position, options in enumerate(_QUERY_ENCODINGS):
+        try:
+            if urlencode(params, **options) == query:
+                return position
+        except TypeError:
+            break
+    return query
+
+
+def _raw_params(event, doc):
+    """raw_params of a v2 document, from the expanded fields (pk) and the rest (p), in order."""
+    rest = iter(doc.get("p", {}).items())
+    params = {}
+    for char in doc.get("pk", ""):
+        if char == _REST_CHAR:
+            key, value = next(rest)
+            params[key] = value
+        else:
+            key = PARAM_CODES[_CODE_CHARS.index(char)]
+            params[key] = event.get(_PARAM_FIELD.get(key, key))
+    params.update(rest)
+    return params
+
+
+def stored_projection(fields):
+    """
+    MongoDB projection that reads the given v1 fields from either layout.
+
+    Args:
+        fields (iterable): v1 field names
+
+    Returns:
+        dict | None: The projection, or None when a field is rebuilt from the
+        whole document (raw_params, full_url)
+    """
+    fields = set(fields)
+    if fields & {"raw_params", "full_url"}:
+        return None
+    if fields & {"domain", "subdomain"}:
+        # Derived from the host when a compact event does not store them
+        fields.add("host")
+    projection = {VERSION_FIELD: 1}
+    for field in fields:
+        projection[field] = 1
+        if field in COMPACT_FIELDS:
+            projection[COMPACT_FIELDS[field][0]] = 1
+    return projection
+
+
+def lookup_ids(doc):
+    """(kind, id) pairs a v2 document refers to."""
+    for short, (_, kind) in EXPANDED_FIELDS.items():
+        if kind is not None and isinstance(doc.get(short), int):
+            yield kind, doc[short]
+    if isinstance(doc.get("fu"), int):
+        yield "url", doc["fu"]
+
+
+def expand_event(doc, values):
+    """
+    Convert a stored event to the v1 layout (v1 documents are returned as is).
+
+    Args:
+        doc (dict): Stored document
+        values (dict): {kind: {id: value}} covering lookup_ids(doc)
+
+    Returns:
+        dict: v1 event
+    """
+    if doc.get(VERSION_FIELD) != SCHEMA_V2:
+        return doc
+
+    event = {}
+    for key, value in doc.items():
+        if key in (VERSION_FIELD, "pk", "p", "fu", "fq"):
+            continue
+        if key not in EXPANDED_FIELDS:
+            event[key] = value
+            continue
+        field, kind = EXPANDED_FIELDS[key]
+        event[field] = values[kind].get(value) if kind is not None and isinstance(value, int) else value
+
+    if "pk" in doc or "p" in doc:
+        event["raw_params"] = _raw_params(event, doc)
+
+    if "fu" in doc:
+        url = values["url"].get(doc["fu"])
+        query = doc.get("fq")
+        if isinstance(query, int):
+            query = urlencode(event.get("raw_params", {}), **_QUERY_ENCODINGS[query])
+        event["full_url"] = url if query is None else f"{url}?{query}"
+
+    host = event.get("host")
+    if isinstance(host, str):
+        domain, subdomain = split_host(host)
+        event.setdefault("domain", domain)
+        event.setdefault("subdomain", subdomain)
+    return event
+
+
+class StringLookup:
+    """
+    Interns strings as small integer ids in the lookup collections.
+
+    Both directions are cached in process (LRU); misses are resolved with one
+    query per kind and batch. New ids are reserved in blocks from the
+    counters collection, so concurrent workers never hand out the same id;
+    if two workers intern the same string at once, the unique index on
+    "value" keeps the first and the other re-reads it.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ids = {kind: OrderedDict() for kind in LOOKUPS}
+        self._values = {kind: OrderedDict() for kind in LOOKUPS}
+
+    def _remember(self, kind, value, id_):
+        """Cache a mapping (called with the lock held)."""
+        for cache, key, item in ((self._ids[kind], value, id_), (self._values[kind], id_, value)):
+            cache[key] = item
+            cache.move_to_end(key)
+            if len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def _cached(self, cache, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in cache:
+                    cache.move_to_end(key)
+                    found[key] = cache[key]
+        return found
+
+    def ids(self, db, kind, values):
+        """
+        Ids for strings, interning the ones seen for the first time.
+
+        Returns:
+            dict: {value: id}
+        """
+        found = self._cached(self._ids[kind], set(values))
+        missing = set(values) - set(found)
+        if not missing:
+            return found
+
+        collection = db[LOOKUPS[kind]]
+        found.update(self._load(collection, {"value": {"$in": list(missing)}}, kind, by_value=True))
+        missing -= set(found)
+        if missing:
+            counter = db[COUNTERS_COLLECTION].find_one_and_update(
+                {"_id": LOOKUPS[kind]}, {"$inc": {"seq": len(missing)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            first = counter["seq"] - len(missing) + 1
+            new = [{"_id": first + i, "value": value} for i, value in enumerate(sorted(missing))]
+            try:
+                collection.insert_many(new, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+                # Interned concurrently by another worker: use its ids
+                lost = [new[err["index"]]["value"] for err in e.details["writeErrors"]]
+                new = [d for d in new if d["value"] not in lost]
+                found.update(self._load(collection, {"value": {"$in": lost}}, kind, by_value=True))
+            with self._lock:
+                for d in new:
+                    self._remember(kind, d["value"], d["_id"])
+            found.update({d["value"]: d["_id"] for d in new})
+        return found
+
+    def values(self, db, kind, ids):
+        """
+        Strings for ids.
+
+        Returns:
+            dict: {id: value}
+        """
+        found = self._cached(self._values[kind], set(ids))
+        missing = set(ids) - set(found)
+        if missing:
+            found.update(self._load(db[LOOKUPS[kind]], {"_id": {"$in": list(missing)}}, kind, by_value=False))
+        return found
+
+    def _load(self, collection, query, kind, by_value):
+        loaded = {}
+        with self._lock:
+            for d in collection.find(query):
+                self._remember(kind, d["value"], d["_id"])
+                loaded[d["value"] if by_value else d["_id"]] = d["_id"] if by_value else d["value"]
+        return loaded
+
+    def compact(self, db, events):
+        """Convert a batch of v1 events to v2 documents."""
+        wanted = {kind: set() for kind in LOOKUPS}
+        for event in events:
+            for kind, value in lookup_values(event):
+                wanted[kind].add(value)
+        ids = {kind: self.ids(db, kind, values) if values else {} for kind, values in wanted.items()}
+        return [compact_event(event, ids) for event in events]
+
+    def expand(self, db, docs):
+        """Convert a batch of stored events (v1 or v2) to v1 events."""
+        wanted = {kind: set() for kind in LOOKUPS}
+        for doc in docs:
+            if doc.get(VERSION_FIELD) == SCHEMA_V2:
+                for kind, id_ in lookup_ids(doc):
+                    wanted[kind].add(id_)
+        values = {kind: self.values(db, kind, ids) if ids else {} for kind, ids in wanted.items()}
+        return [expand_event(doc, values) for doc in docs]
+
+    def clear(self):
+        with self._lock:
+            for cache in (*self._ids.values(), *self._values.values()):
+                cache.clear()
@@ -0,0 +1,95 @@
+"""
+Streaming export of raw events as NDJSON or CSV.
+
+Events are read from one cursor in EXPORT_BATCH_SIZE batches
+(database.iter_events) and each batch is encoded and handed to the response
+before the next one is read, optionally through an incremental gzip
+compressor. A worker holds one batch and one encoded chunk at a time, so
+exporting a month of events takes the same memory as exporting an hour.
+"""
+
+import csv
+import io
+import zlib
+from .config import EXPORT_BATCH_SIZE, EXPORT_GZIP_LEVEL
+from .database import iter_events
+from .serialization import dumps
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# CSV columns when no fields are requested (nested values are written as JSON)
+DEFAULT_CSV_COLUMNS = (
+    "_id", "timestamp", "event_type", "session_id", "campaign_id", "utm_source", "utm_medium",
+    "utm_campaign", "utm_content", "utm_term", "platform_detected", "domain", "current_page",
+    "referrer", "ip_address", "user_agent",
+)
+
+
+def ndjson_chunks(batches):
+    """One chunk of JSON lines per batch of events."""
+    for batch in batches:
+        yield b"".join(dumps(event) + b"\n" for event in batch)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return dumps(value).decode("utf-8")
+    return value
+
+
+def csv_chunks(batches, columns):
+    """A header chunk, then one chunk of CSV rows per batch of events."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([_cell(event.get(column)) for column in columns] for event in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # No events: the header alone
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    """Compress a stream of chunks into one gzip member as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_events(filter_dict=None, fmt="ndjson", fields=None, compress=False, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Encoded chunks of an event export.
+
+    Args:
+        filter_dict (dict): Filter criteria
+        fmt (str): "ndjson" or "csv"
+        fields (list): Fields to export (plus _id); None for whole events
+            (NDJSON) or DEFAULT_CSV_COLUMNS (CSV)
+        compress (bool): gzip the output
+        batch_size (int): Events read and encoded at a time
+
+    Returns:
+        generator: bytes chunks; nothing is read until it is iterated
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt} (expected one of: {', '.join(FORMATS)})")
+    if fmt == "csv":
+        columns = ["_id", *(f for f in fields if f != "_id")] if fields else list(DEFAULT_CSV_COLUMNS)
+        chunks = csv_chunks(iter_events(filter_dict, fields or columns, batch_size), columns)
+    else:
+        chunks = ndjson_chunks(iter_events(filter_dict, fields, batch_size))
+    return gzip_chunks(chunks) if compress else chunks
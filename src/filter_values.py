@@ -0,0 +1,228 @@
+"""
+Distinct values of the filterable event fields, maintained incrementally.
+
+/api/events/filters used to run distinct() over raw_events on every
+dashboard load. Instead each worker keeps one in-memory set per field:
+
+- seeded once from the shared filter_values collection
+  ({_id: field, values: [...], reconciled_at: datetime});
+- updated from the ingest path: values the worker has not seen yet are
+  $addToSet'd to the shared document and then added to its set, so a known
+  value costs no write and a failed write is retried with the next batch;
+- refreshed from the shared documents every FILTER_VALUES_REFRESH_S, which
+  picks up values ingested by other workers;
+- reconciled against raw_events (one distinct per field) when a field's
+  document is missing or older than FILTER_VALUES_RECONCILE_S, which drops
+  values whose events are gone. Only the fields that are requested are
+  reconciled, so a new filter field costs one scan per interval.
+
+Values are read from events in the v1 layout; "domain" is derived from the
+host when it is not stored (compact events drop it). domain_filter() matches
+compact events by their interned host ids, mapped from domains in memory
+(HostDomains).
+"""
+
+import threading
+import time
+from datetime import datetime
+from pymongo import UpdateOne
+from .config import FILTER_VALUES_REFRESH_S, FILTER_VALUES_RECONCILE_S
+from .database import get_collection, lookup_values
+from .event_schema import COMPACT_FIELDS, LOOKUPS, VERSION_FIELD, SCHEMA_V2, split_host
+import logging
+
+logger = logging.getLogger(__name__)
+
+FILTER_VALUES = "filter_values"
+
+FILTER_FIELDS = ("campaign_id", "utm_source", "utm_medium", "platform_detected", "domain")
+DEFAULT_FILTER_FIELDS = ("campaign_id", "utm_source")
+
+_HOST_FIELD = COMPACT_FIELDS["host"][0]
+
+
+def event_value(event, field):
+    """Filterable value of a v1 event, or None."""
+    value = event.get(field)
+    if field == "domain" and not value and isinstance(event.get("host"), str):
+        value = split_host(event["host"])[0]
+    return value if isinstance(value, (str, int, float)) and value != "" else None
+
+
+def _sorted(values):
+    return sorted(values, key=str)
+
+
+def distinct_values(field):
+    """Values of a field over all of raw_events (a full index or collection scan)."""
+    raw_events = get_collection("raw_events")
+    values = {v for v in raw_events.distinct(field) if v not in (None, "")}
+    if field == "domain":
+        # Compact events only store the interned id of their host
+        host_ids = raw_events.distinct(_HOST_FIELD, {VERSION_FIELD: SCHEMA_V2})
+        values.update(split_host(host)[0] for host in lookup_values("host", host_ids).values())
+    return values
+
+
+class HostDomains:
+    """
+    Interned host ids per domain, for filtering compact events by domain.
+
+    Host ids only ever grow, so each lookup reads just the hosts interned
+    since the last one ({_id: {$gt: last id}}, usually nothing). Workers
+    reserve ids in blocks and may insert them out of order, so the whole map
+    is re-read every `reload_interval` seconds to pick up ids below the last
+    one seen.
+    """
+
+    def __init__(self, get_collection, reload_interval=30.0, clock=time.monotonic):
+        self.get_collection = get_collection
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._ids = {}  # domain -> set of host ids
+        self._last_id = 0
+        self._loaded_at = None
+
+    def ids(self, domain):
+        """Host ids whose domain is `domain`."""
+        with self._lock:
+            if self._loaded_at is None or self.clock() - self._loaded_at >= self.reload_interval:
+                self._ids, self._last_id, self._loaded_at = {}, 0, self.clock()
+            hosts = self.get_collection(LOOKUPS["host"]).find({"_id": {"$gt": self._last_id}}, {"_id": 1, "value": 1})
+            for doc in hosts:
+                self._ids.setdefault(split_host(doc["value"])[0], set()).add(doc["_id"])
+                self._last_id = max(self._last_id, doc["_id"])
+            return set(self._ids.get(domain, ()))
+
+    def clear(self):
+        with self._lock:
+            self._ids, self._last_id, self._loaded_at = {}, 0, None
+
+
+_host_domains = HostDomains(lambda name: get_collection(name), FILTER_VALUES_REFRESH_S)
+
+
+def domain_filter(domain):
+    """raw_events filter for the events of a domain, in either storage layout."""
+    ids = _host_domains.ids(domain)
+    if not ids:
+        return {"domain": domain}
+    return {"$or": [{"domain": domain}, {_HOST_FIELD: {"$in": sorted(ids)}}]}
+
+
+class FilterValues:
+    """Per-worker filter value sets backed by the shared filter_values collection."""
+
+    def __init__(self, get_collection, refresh_interval=30.0, reconcile_interval=21600.0, clock=time.monotonic):
+        """
+        Args:
+            get_collection (callable): Returns a collection by name
+            refresh_interval (float): Seconds between re-reads of the shared documents
+            reconcile_interval (float): Seconds after which a field is recomputed from raw_events
+            clock (callable): Monotonic time source in seconds
+        """
+        self.get_collection = get_collection
+        self.refresh_interval = refresh_interval
+        self.reconcile_interval = reconcile_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._values = {}  # field -> set
+        self._reconciled_at = {}  # field -> datetime of the shared document's last reconciliation
+        self._refreshed_at = None
+
+    def refresh(self):
+        """Replace the local sets with the shared documents."""
+        cursor = self.get_collection(FILTER_VALUES).find({"_id": {"$in": list(FILTER_FIELDS)}})
+        docs = {doc["_id"]: doc for doc in cursor}
+        with self._lock:
+            self._values = {field: set(docs[field].get("values", [])) if field in docs else set()
+                            for field in FILTER_FIELDS}
+            self._reconciled_at = {field: docs[field].get("reconciled_at") for field in docs}
+            self._refreshed_at = self.clock()
+
+    def reconcile(self, field):
+        """Recompute one field from raw_events and store it as the shared document."""
+        values = distinct_values(field)
+        reconciled_at = datetime.utcnow()
+        self.get_collection(FILTER_VALUES).update_one(
+            {"_id": field}, {"$set": {"values": _sorted(values), "reconciled_at": reconciled_at}}, upsert=True
+        )
+        with self._lock:
+            self._values[field] = values
+            self._reconciled_at[field] = reconciled_at
+        logger.info(f"Reconciled {len(values)} filter values for {field}")
+
+    def _due(self, field, now):
+        reconciled_at = self._reconciled_at.get(field)
+        return reconciled_at is None or (now - reconciled_at).total_seconds() >= self.reconcile_interval
+
+    def get(self, fields=DEFAULT_FILTER_FIELDS):
+        """
+        Sorted values per field.
+
+        Args:
+            fields (iterable): Names from FILTER_FIELDS
+
+        Returns:
+            dict: {field: [values]}
+        """
+        with self._lock:
+            stale = self._refreshed_at is None or self.clock() - self._refreshed_at >= self.refresh_interval
+        if stale:
+            self.refresh()
+        now = datetime.utcnow()
+        for field in fields:
+            with self._lock:
+                due = self._due(field, now)
+            if due:
+                self.reconcile(field)
+        with self._lock:
+            return {field: _sorted(self._values.get(field, ())) for field in fields}
+
+    def add(self, events):
+        """
+        Record the values of newly stored events (called by the ingest path).
+
+        Values join the local sets only once the shared documents have them:
+        if the write fails, the next batch with the same values retries it.
+        """
+        with self._lock:
+            loaded = self._refreshed_at is not None
+        if not loaded:
+            self.refresh()
+        with self._lock:
+            new = {}
+            for event in events:
+                for field in FILTER_FIELDS:
+                    value = event_value(event, field)
+                    if value is not None and value not in self._values[field]:
+                        new.setdefault(field, set()).add(value)
+        if not new:
+            return
+        self.get_collection(FILTER_VALUES).bulk_write([
+            UpdateOne({"_id": field}, {"$addToSet": {"values": {"$each": _sorted(values)}}}, upsert=True)
+            for field, values in new.items()
+        ], ordered=False)
+        with self._lock:
+            for field, values in new.items():
+                self._values.setdefault(field, set()).update(values)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+            self._reconciled_at = {}
+            self._refreshed_at = None
+
+
+_filter_values = FilterValues(lambda name: get_collection(name), FILTER_VALUES_REFRESH_S, FILTER_VALUES_RECONCILE_S)
+
+
+def get_filter_values(fields=DEFAULT_FILTER_FIELDS):
+    """Distinct values of filterable fields, for the dashboard's dropdowns."""
+    return _filter_values.get(fields)
+
+
+def update_filter_values(events):
+    """Add the values of a batch of newly stored events."""
+    _filter_values.add(events)
@@ -0,0 +1,220 @@
+"""
+Declarative index registry for every collection the app writes.
+
+Compound indexes follow the ESR rule: Equality fields first, then the Sort
+field, then Range fields. /api/events filters on campaign_id / utm_source
+(equality), sorts on timestamp and _id (keyset pagination) and narrows by a
+timestamp range, so {campaign_id: 1, timestamp: -1, _id: -1} serves both the
+sort and the range without an in-memory SORT stage.
+
+sync_indexes() makes a database match the registry and is safe to run on
+every deploy (scripts/sync_indexes.py).
+"""
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from .config import RAW_EVENTS_TIMESERIES_COLLECTION
+from .event_schema import LOOKUPS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared partial filter for conversion-only indexes
+CONVERSIONS = {"event_type": "conversion"}
+
+ROLLUP_KEY = [(field, ASCENDING) for field in (
+    "bucket", "site", "utm_source", "utm_medium", "utm_campaign", "platform_detected", "event_type"
+)]
+
+# collection -> list of index definitions (create_index keyword arguments)
+INDEXES = {
+    "raw_events": [
+        # /api/events keyset pages and the date-range $match of the aggregations
+        {"name": "timestamp_id", "keys": [("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        # /api/events filtered by campaign or source (E, S, R)
+        {"name": "campaign_id_timestamp_id",
+         "keys": [("campaign_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "utm_source_timestamp_id",
+         "keys": [("utm_source", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "utm_campaign_timestamp",
+         "keys": [("utm_campaign", ASCENDING), ("timestamp", DESCENDING)]},
+        # /api/events filtered by medium, or by domain (v1 field or compact host id)
+        {"name": "utm_medium_timestamp_id",
+         "keys": [("utm_medium", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "domain_timestamp_id",
+         "keys": [("domain", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "h_timestamp_id",
+         "keys": [("h", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "platform_detected_timestamp",
+         "keys": [("platform_detected", ASCENDING), ("timestamp", DESCENDING)]},
+        # Session reconstruction, in event order
+        {"name": "session_id_timestamp", "keys": [("session_id", ASCENDING), ("timestamp", ASCENDING)]},
+        # Incremental jobs reading everything ingested since a high-water mark
+        {"name": "ingested_at_id", "keys": [("ingested_at", ASCENDING), ("_id", ASCENDING)]},
+        # Click id lookups; most events carry none, so keep the indexes sparse
+        {"name": "gclid", "keys": [("gclid", ASCENDING)], "sparse": True},
+        {"name": "fbclid", "keys": [("fbclid", ASCENDING)], "sparse": True},
+        {"name": "ttclid", "keys": [("ttclid", ASCENDING)], "sparse": True},
+        {"name": "msclkid", "keys": [("msclkid", ASCENDING)], "sparse": True},
+        # Conversions are a small fraction of events: partial indexes stay tiny
+        {"name": "conversions_timestamp", "keys": [("timestamp", DESCENDING)],
+         "partialFilterExpression": CONVERSIONS},
+        {"name": "conversions_campaign_timestamp",
+         "keys": [("utm_campaign", ASCENDING), ("timestamp", DESCENDING)],
+         "partialFilterExpression": CONVERSIONS},
+    ],
+    # Time-series layout of raw_events (RAW_EVENTS_TIMESERIES). Buckets are
+    # already clustered by meta and time; secondary indexes cannot be unique,
+    # sparse or partial on measurement fields, so only the read paths are kept
+    RAW_EVENTS_TIMESERIES_COLLECTION: [
+        {"name": "meta_timestamp",
+         "keys": [("meta.site", ASCENDING), ("meta.platform", ASCENDING), ("timestamp", DESCENDING)]},
+        {"name": "timestamp_id", "keys": [("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "campaign_id_timestamp_id",
+         "keys": [("campaign_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "utm_source_timestamp_id",
+         "keys": [("utm_source", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "utm_medium_timestamp_id",
+         "keys": [("utm_medium", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "domain_timestamp_id",
+         "keys": [("domain", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "h_timestamp_id",
+         "keys": [("h", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "session_id_timestamp", "keys": [("session_id", ASCENDING), ("timestamp", ASCENDING)]},
+        {"name": "ingested_at_id", "keys": [("ingested_at", ASCENDING), ("_id", ASCENDING)]},
+    ],
+    # Strings interned by compact (v2) events: resolved by id on read, by value at ingest
+    **{name: [{"name": "value", "keys": [("value", ASCENDING)], "unique": True}] for name in LOOKUPS.values()},
+    # Rollups: ingest upserts on the full key, reports read a bucket range
+    "rollups_hourly": [
+        {"name": "bucket_dimensions", "keys": ROLLUP_KEY, "unique": True},
+    ],
+    "rollups_daily": [
+        {"name": "bucket_dimensions", "keys": ROLLUP_KEY, "unique": True},
+    ],
+    # Sessions: point lookups by _id (the session ID), reports read a first_seen range
+    "sessions": [
+        {"name": "first_seen", "keys": [("first_seen", DESCENDING)]},
+    ],
+    # Page pathways (src/pathways.py): upserts on the full key, /api/pathways
+    # reads the top rows of one site/campaign
+    "pathway_sessions": [
+        {"name": "last_at", "keys": [("last_at", ASCENDING)]},
+    ],
+    "pathway_transitions": [
+        {"name": "site_campaign_pages",
+         "keys": [("site", ASCENDING), ("campaign", ASCENDING), ("from_page", ASCENDING), ("to_page", ASCENDING)],
+         "unique": True},
+        {"name": "site_campaign_count",
+         "keys": [("site", ASCENDING), ("campaign", ASCENDING), ("count", DESCENDING)]},
+    ],
+    "pathway_paths": [
+        {"name": "site_campaign_path",
+         "keys": [("site", ASCENDING), ("campaign", ASCENDING), ("path", ASCENDING)], "unique": True},
+        {"name": "site_campaign_sessions",
+         "keys": [("site", ASCENDING), ("campaign", ASCENDING), ("sessions", DESCENDING)]},
+    ],
+    # Attribution results per conversion day (src/analysis/attribution.py): a day
+    # is replaced as a whole, reports read a day range of one model
+    "attribution_daily": [
+        {"name": "day", "keys": [("day", ASCENDING)]},
+        {"name": "model_day", "keys": [("model", ASCENDING), ("day", ASCENDING)]},
+    ],
+    "conversations": [
+        {"name": "customer_id_created_at", "keys": [("customer_id", ASCENDING), ("created_at", DESCENDING)]},
+        {"name": "created_at", "keys": [("created_at", DESCENDING)]},
+    ],
+    "therapist_ratings": [
+        # /therapist/history/<therapist_id>: equality on therapist, newest first
+        {"name": "therapist_id_created_at", "keys": [("therapist_id", ASCENDING), ("created_at", DESCENDING)]},
+        {"name": "patient_id_created_at", "keys": [("patient_id", ASCENDING), ("created_at", DESCENDING)],
+         "sparse": True},
+    ],
+    "surveys": [
+        # Matching a response to the survey sent to an address
+        {"name": "email_type_triggered_at",
+         "keys": [("email", ASCENDING), ("type", ASCENDING), ("triggered_at", DESCENDING)]},
+        {"name": "type_received_at", "keys": [("type", ASCENDING), ("received_at", DESCENDING)]},
+    ],
+}
+
+_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _normalize(keys, options):
+    """Comparable form of an index: key pattern plus the options that matter."""
+    pattern = tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                    for field, direction in keys)
+    return pattern, {k: options[k] for k in _OPTIONS if options.get(k)}
+
+
+def sync_indexes(db, collections=None, drop_unknown=False, dry_run=False):
+    """
+    Make the indexes of each registered collection match the registry.
+
+    Missing indexes are created; an index whose name matches but whose
+    definition changed is dropped and rebuilt. Running it again is a no-op.
+
+    Args:
+        db: Database (pymongo Database or MockDatabase)
+        collections (list): Collection names to sync (default: all registered)
+        drop_unknown (bool): Also drop indexes that are not in the registry
+        dry_run (bool): Only report what would change
+
+    Returns:
+        dict: {collection: {"created": [...], "rebuilt": [...], "dropped": [...],
+               "unchanged": [...], "unknown": [...]}}
+    """
+    report = {}
+    for name in collections or INDEXES:
+        collection = db[name]
+        existing = {
+            index_name: _normalize(info["key"], info)
+            for index_name, info in collection.index_information().items()
+            if index_name != "_id_"
+        }
+        result = {"created": [], "rebuilt": [], "dropped": [], "unchanged": [], "unknown": []}
+        wanted = set()
+
+        for definition in INDEXES[name]:
+            index_name = definition["name"]
+            options = {k: v for k, v in definition.items() if k not in ("name", "keys")}
+            spec = _normalize(definition["keys"], options)
+            wanted.add(index_name)
+
+            if existing.get(index_name) == spec:
+                result["unchanged"].append(index_name)
+                continue
+
+            # Mongo refuses a second index with the same key pattern and options
+            duplicate = next((n for n, s in existing.items() if s == spec and n not in wanted), None)
+            if duplicate is not None:
+                logger.warning(f"{name}: index {duplicate} already covers {index_name}; leaving it in place")
+                result["unchanged"].append(duplicate)
+                wanted.add(duplicate)
+                continue
+
+            if index_name in existing:
+                result["rebuilt"].append(index_name)
+                if not dry_run:
+                    collection.drop_index(index_name)
+            else:
+                result["created"].append(index_name)
+            if not dry_run:
+                collection.create_index(definition["keys"], name=index_name, **options)
+
+        for index_name in existing:
+            if index_name in wanted:
+                continue
+            if drop_unknown:
+                result["dropped"].append(index_name)
+                if not dry_run:
+                    try:
+                        collection.drop_index(index_name)
+                    except OperationFailure as e:
+                        logger.warning(f"{name}: could not drop index {index_name}: {e}")
+            else:
+                result["unknown"].append(index_name)
+
+        report[name] = result
+    return report
@@ -0,0 +1,619 @@
+"""
+Aggregation pipeline executor for the local mock database.
+
+Pipelines that start with an optional $match followed by a $group on plain
+field paths (the shape of every reporting query in the app) run on columns:
+each group-key field is dictionary-encoded into integer codes, the codes are
+combined into one group id per row and accumulators are computed with NumPy
+bincount/ufunc reductions instead of per-row dictionaries. Everything else,
+and every stage after the $group, runs through a general row-wise evaluator.
+NumPy is optional; without it all stages run row-wise.
+"""
+
+from datetime import datetime, timedelta, timezone
+import logging
+
+from .mock_query import _MISSING, get_path, matches, normalize_sort, sort_documents, sort_key
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional for the mock DB
+    np = None
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------
+# Expressions (row-wise)
+# ----------------------------------------------------------------------
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _tz(name):
+    if not name or name in ("UTC", "Z", "GMT"):
+        return timezone.utc
+    if ZoneInfo is None:
+        raise ValueError("Time zones other than UTC require Python 3.9+")
+    return ZoneInfo(name)
+
+
+def _to_local(value, tz_name):
+    """Convert a stored (naive UTC) datetime to the given time zone."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(_tz(tz_name))
+
+
+def _date_trunc(value, unit, tz_name=None, bin_size=1, start_of_week="sunday"):
+    """$dateTrunc: truncate a date in a time zone, returned as naive UTC."""
+    local = _to_local(value, tz_name)
+    if unit == "year":
+        local = local.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif unit == "month":
+        local = local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif unit == "week":
+        first = 6 if start_of_week.lower().startswith("sun") else 0
+        local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        local -= timedelta(days=(local.weekday() - first) % 7)
+    elif unit == "day":
+        local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif unit == "hour":
+        local = local.replace(hour=(local.hour // bin_size) * bin_size, minute=0, second=0, microsecond=0)
+    elif unit == "minute":
+        local = local.replace(minute=(local.minute // bin_size) * bin_size, second=0, microsecond=0)
+    else:
+        raise ValueError(f"Unsupported $dateTrunc unit: {unit}")
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _date_to_string(value, fmt="%Y-%m-%dT%H:%M:%S.%LZ", tz_name=None):
+    local = _to_local(value, tz_name)
+    return local.strftime(fmt.replace("%L", f"{local.microsecond // 1000:03d}"))
+
+
+def evaluate(expr, doc):
+    """Evaluate an aggregation expression against one document."""
+    if isinstance(expr, str):
+        if expr.startswith("$$"):
+            if expr == "$$ROOT":
+                return doc
+            raise ValueError(f"Unsupported variable: {expr}")
+        if expr.startswith("$"):
+            return get_path(doc, expr[1:])
+        return expr
+    if isinstance(expr, list):
+        return [_value(evaluate(e, doc)) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1:
+        op, args = next(iter(expr.items()))
+        if op.startswith("$"):
+            return _operator(op, args, doc)
+    return {k: _value(evaluate(v, doc)) for k, v in expr.items()}
+
+
+def _value(v):
+    """Missing fields evaluate to null inside expressions."""
+    return None if v is _MISSING else v
+
+
+def _args(args, doc):
+    if not isinstance(args, list):
+        args = [args]
+    return [_value(evaluate(a, doc)) for a in args]
+
+
+def _cmp(a, b):
+    ka, kb = sort_key(a), sort_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def _operator(op, args, doc):
+    if op == "$literal":
+        return args
+    if op == "$cond":
+        if isinstance(args, dict):
+            args = [args["if"], args["then"], args["else"]]
+        condition = _value(evaluate(args[0], doc))
+        return _value(evaluate(args[1] if _truthy(condition) else args[2], doc))
+    if op == "$ifNull":
+        for a in args:
+            v = _value(evaluate(a, doc))
+            if v is not None:
+                return v
+        return None
+    if op == "$and":
+        return all(_truthy(v) for v in _args(args, doc))
+    if op == "$or":
+        return any(_truthy(v) for v in _args(args, doc))
+    if op == "$not":
+        return not _truthy(_args(args, doc)[0])
+    if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        a, b = _args(args, doc)
+        c = _cmp(a, b)
+        return {"$eq": c == 0, "$ne": c != 0, "$gt": c > 0, "$gte": c >= 0, "$lt": c < 0, "$lte": c <= 0}[op]
+    if op == "$in":
+        value, array = _args(args, doc)
+        return any(_cmp(value, a) == 0 for a in (array or []))
+    if op in ("$add", "$subtract", "$multiply", "$divide", "$mod"):
+        values = _args(args, doc)
+        if any(v is None for v in values):
+            return None
+        if op == "$add":
+            if any(isinstance(v, datetime) for v in values):
+                base = next(v for v in values if isinstance(v, datetime))
+                return base + timedelta(milliseconds=sum(v for v in values if _is_number(v)))
+            return sum(values)
+        if op == "$subtract":
+            a, b = values
+            if isinstance(a, datetime) and isinstance(b, datetime):
+                return int((a - b).total_seconds() * 1000)
+            if isinstance(a, datetime):
+                return a - timedelta(milliseconds=b)
+            return a - b
+        if op == "$multiply":
+            result = 1
+            for v in values:
+                result *= v
+            return result
+        if op == "$divide":
+            return values[0] / values[1]
+        return values[0] % values[1]
+    if op == "$sum":
+        values = _args(args, doc)
+        if len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        return sum(v for v in values if _is_number(v))
+    if op in ("$max", "$min"):
+        values = [v for v in _args(args, doc) if v is not None]
+        if len(values) == 1 and isinstance(values[0], list):
+            values = [v for v in values[0] if v is not None]
+        if not values:
+            return None
+        return (max if op == "$max" else min)(values, key=sort_key)
+    if op == "$size":
+        return len(_args(args, doc)[0] or [])
+    if op == "$arrayElemAt":
+        array, position = _args(args, doc)
+        try:
+            return array[position]
+        except (IndexError, TypeError):
+            return None
+    if op == "$concat":
+        values = _args(args, doc)
+        return None if any(v is None for v in values) else "".join(values)
+    if op in ("$toLower", "$toUpper", "$toString"):
+        v = _args(args, doc)[0]
+        if v is None:
+            return "" if op != "$toString" else None
+        v = str(v) if not isinstance(v, datetime) else v.isoformat()
+        return v.lower() if op == "$toLower" else v.upper() if op == "$toUpper" else v
+    if op == "$dateToString":
+        date = _value(evaluate(args["date"], doc))
+        if not isinstance(date, datetime):
+            return None
+        return _date_to_string(date, args.get("format", "%Y-%m-%dT%H:%M:%S.%LZ"),
+                               _value(evaluate(args.get("timezone"), doc)))
+    if op == "$dateTrunc":
+        date = _value(evaluate(args["date"], doc))
+        if not isinstance(date, datetime):
+            return None
+        return _date_trunc(date, args["unit"], _value(evaluate(args.get("timezone"), doc)),
+                           args.get("binSize", 1), args.get("startOfWeek", "sunday"))
+    if op in ("$year", "$month", "$dayOfMonth", "$hour", "$minute", "$dayOfWeek"):
+        if isinstance(args, dict):
+            date, tz_name = _value(evaluate(args["date"], doc)), args.get("timezone")
+        else:
+            date, tz_name = _args(args, doc)[0], None
+        if not isinstance(date, datetime):
+            return None
+        local = _to_local(date, tz_name)
+        if op == "$dayOfWeek":
+            return (local.isoweekday() % 7) + 1  # 1 = Sunday
+        return {"$year": local.year, "$month": local.month, "$dayOfMonth": local.day,
+                "$hour": local.hour, "$minute": local.minute}[op]
+    raise ValueError(f"Unsupported aggregation operator: {op}")
+
+
+def _truthy(value):
+    return value not in (None, False, 0, _MISSING)
+
+
+# ----------------------------------------------------------------------
+# Stages (row-wise)
+# ----------------------------------------------------------------------
+
+def _group_rows(rows, spec):
+    key_expr = spec["_id"]
+    accumulators = {k: v for k, v in spec.items() if k != "_id"}
+    groups = {}
+    for row in rows:
+        key = _value(evaluate(key_expr, row))
+        state = groups.get(sort_key(key))
+        if state is None:
+            state = groups[sort_key(key)] = {"_id": key, "_acc": {k: _Accumulator(v) for k, v in accumulators.items()}}
+        for name, acc in state["_acc"].items():
+            acc.add(row)
+    results = []
+    for state in groups.values():
+        result = {"_id": state["_id"]}
+        for name, acc in state["_acc"].items():
+            result[name] = acc.result()
+        results.append(result)
+    return results
+
+
+class _Accumulator:
+    def __init__(self, spec):
+        (self.op, self.expr), = spec.items()
+        self.values = []
+        self.total = 0
+        self.count = 0
+        self.value = _MISSING
+
+    def add(self, row):
+        if self.op == "$count":
+            self.count += 1
+            return
+        v = _value(evaluate(self.expr, row))
+        if self.op in ("$sum", "$avg"):
+            if _is_number(v):
+                self.total += v
+                self.count += 1
+        elif self.op in ("$min", "$max"):
+            if v is not None and (self.value is _MISSING
+                                  or (self.op == "$min" and _cmp(v, self.value) < 0)
+                                  or (self.op == "$max" and _cmp(v, self.value) > 0)):
+                self.value = v
+        elif self.op == "$first":
+            if self.value is _MISSING:
+                self.value = v
+        elif self.op == "$last":
+            self.value = v
+        elif self.op == "$push":
+            self.values.append(v)
+        elif self.op == "$addToSet":
+            if all(_cmp(v, x) != 0 for x in self.values):
+                self.values.append(v)
+        else:
+            raise ValueError(f"Unsupported accumulator: {self.op}")
+
+    def result(self):
+        if self.op == "$count":
+            return self.count
+        if self.op == "$sum":
+            return self.total
+        if self.op == "$avg":
+            return self.total / self.count if self.count else None
+        if self.op in ("$push", "$addToSet"):
+            return self.values
+        return None if self.value is _MISSING else self.value
+
+
+def _project_rows(rows, spec, add_fields=False):
+    include_id = spec.get("_id", 1) not in (0, False)
+    exclusions = [k for k, v in spec.items() if v in (0, False) and k != "_id"]
+    if exclusions and not add_fields:
+        results = []
+        for row in rows:
+            row = dict(row)
+            for field in exclusions:
+                row.pop(field, None)
+            if not include_id:
+                row.pop("_id", None)
+            results.append(row)
+        return results
+
+    results = []
+    for row in rows:
+        result = dict(row) if add_fields else {}
+        if not add_fields and include_id and "_id" in row:
+            result["_id"] = row["_id"]
+        for field, expr in spec.items():
+            if field == "_id" and expr in (0, 1, True, False):
+                continue
+            if expr in (1, True) and not add_fields:
+                v = get_path(row, field)
+            else:
+                v = _value(evaluate(expr, row))
+            if v is not _MISSING:
+                result[field] = v
+        if not include_id:
+            result.pop("_id", None)
+        results.append(result)
+    return results
+
+
+def _unwind_rows(rows, spec):
+    path = spec if isinstance(spec, str) else spec["path"]
+    keep_empty = isinstance(spec, dict) and spec.get("preserveNullAndEmptyArrays", False)
+    field = path[1:]
+    results = []
+    for row in rows:
+        value = row.get(field, _MISSING)
+        if isinstance(value, list) and value:
+            for item in value:
+                results.append({**row, field: item})
+        elif value in (None, _MISSING) or value == []:
+            if keep_empty:
+                results.append({k: v for k, v in row.items() if k != field})
+        else:
+            results.append(row)
+    return results
+
+
+def _run_stage(rows, stage):
+    (name, spec), = stage.items()
+    if name == "$match":
+        return [r for r in rows if matches(r, spec)]
+    if name == "$group":
+        return _group_rows(rows, spec)
+    if name == "$project":
+        return _project_rows(rows, spec)
+    if name in ("$addFields", "$set"):
+        return _project_rows(rows, spec, add_fields=True)
+    if name == "$sort":
+        return sort_documents(list(rows), normalize_sort(spec))
+    if name == "$limit":
+        return list(rows)[:spec]
+    if name == "$skip":
+        return list(rows)[spec:]
+    if name == "$count":
+        rows = list(rows)
+        return [{spec: len(rows)}] if rows else []
+    if name == "$unwind":
+        return _unwind_rows(rows, spec)
+    if name == "$sortByCount":
+        grouped = _group_rows(rows, {"_id": spec, "count": {"$sum": 1}})
+        return sorted(grouped, key=lambda r: -r["count"])
+    raise ValueError(f"Unsupported aggregation stage: {name}")
+
+
+# ----------------------------------------------------------------------
+# Columnar $group
+# ----------------------------------------------------------------------
+
+def _field_ref(expr):
+    """Field name of a plain "$field" reference, or None."""
+    if isinstance(expr, str) and expr.startswith("$") and not expr.startswith("$$"):
+        return expr[1:]
+    return None
+
+
+def _columnar_group_plan(spec):
+    """
+    Check whether a $group can run on columns.
+
+    Returns:
+        tuple | None: (key_layout, accumulators) where key_layout is None,
+        a field name, or a list of (name, field); None if unsupported
+    """
+    key = spec["_id"]
+    if key is None:
+        layout = None
+    elif _field_ref(key):
+        layout = _field_ref(key)
+    elif isinstance(key, dict) and key and all(_field_ref(v) for v in key.values()):
+        layout = [(name, _field_ref(v)) for name, v in key.items()]
+    else:
+        return None
+
+    accumulators = {}
+    for name, acc in spec.items():
+        if name == "_id":
+            continue
+        if not isinstance(acc, dict) or len(acc) != 1:
+            return None
+        (op, expr), = acc.items()
+        if op == "$count":
+            accumulators[name] = ("$sum", 1)
+        elif op in ("$sum", "$avg", "$min", "$max") and _columnar_value(expr):
+            accumulators[name] = (op, expr)
+        else:
+            return None
+    return layout, accumulators
+
+
+def _columnar_value(expr):
+    """Expressions the columnar path can evaluate: constants, fields, $cond on an $eq test."""
+    if _is_number(expr) or _field_ref(expr):
+        return True
+    if isinstance(expr, dict) and set(expr) == {"$cond"}:
+        cond = expr["$cond"]
+        if isinstance(cond, dict):
+            cond = [cond.get("if"), cond.get("then"), cond.get("else")]
+        test, then, otherwise = cond
+        if not (isinstance(test, dict) and set(test) == {"$eq"}):
+            return False
+        a, b = test["$eq"]
+        return (_field_ref(a) and not isinstance(b, (dict, list)) and not _field_ref(b)
+                and _columnar_value(then) and _columnar_value(otherwise))
+    return False
+
+
+class _Frame:
+    """Columns extracted once from a list of documents."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.n = len(rows)
+        self._encoded = {}
+        self._numeric = {}
+
+    def _column(self, field):
+        if "." in field:
+            return [_value(get_path(row, field)) for row in self.rows]
+        return [row.get(field) for row in self.rows]
+
+    def encoded(self, field):
+        """Dictionary-encode a column: (codes array, list of distinct values, value -> code)."""
+        if field not in self._encoded:
+            dictionary = {}
+            values = []
+            codes = np.empty(self.n, dtype=np.int64)
+            for i, v in enumerate(self._column(field)):
+                # Strings key themselves; other types go through sort_key so 1 == 1.0 but True != 1
+                key = v if type(v) is str else sort_key(v)
+                code = dictionary.get(key)
+                if code is None:
+                    code = dictionary[key] = len(values)
+                    values.append(v)
+                codes[i] = code
+            self._encoded[field] = (codes, values, dictionary)
+        return self._encoded[field]
+
+    def code_of(self, field, value):
+        _, _, dictionary = self.encoded(field)
+        return dictionary.get(value if type(value) is str else sort_key(value))
+
+    def numeric(self, field):
+        """Numeric column: (float values, mask of rows holding a number, all-int flag)."""
+        if field not in self._numeric:
+            column = self._column(field)
+            present = np.fromiter((_is_number(v) for v in column), dtype=bool, count=self.n)
+            values = np.fromiter((v if _is_number(v) else 0.0 for v in column), dtype=np.float64, count=self.n)
+            all_int = all(isinstance(v, int) for v in column if _is_number(v))
+            self._numeric[field] = (values, present, all_int)
+        return self._numeric[field]
+
+    def extreme(self, field, inverse, n_groups, op):
+        """
+        $min or $max of a column per group, in the comparison order of the
+        row-wise accumulator; None for groups with only null/missing values.
+        """
+        codes, values, _ = self.encoded(field)
+        order = sorted(range(len(values)), key=lambda i: sort_key(values[i]))
+        rank = np.empty(len(values), dtype=np.int64)
+        rank[order] = np.arange(len(values))
+        present = np.array([v is not None for v in values], dtype=bool)[codes]
+        fill = len(values) if op == "$min" else -1
+        reduced = np.full(n_groups, fill, dtype=np.int64)
+        ufunc = np.minimum if op == "$min" else np.maximum
+        ufunc.at(reduced, inverse, np.where(present, rank[codes], fill))
+        return [values[order[r]] if 0 <= r < len(values) else None for r in reduced]
+
+    def value(self, expr):
+        """Evaluate a columnar expression: (float values, mask of numeric rows, all-int flag)."""
+        if _is_number(expr):
+            return np.full(self.n, float(expr)), np.ones(self.n, dtype=bool), isinstance(expr, int)
+        field = _field_ref(expr)
+        if field:
+            return self.numeric(field)
+        cond = expr["$cond"]
+        if isinstance(cond, dict):
+            cond = [cond["if"], cond["then"], cond["else"]]
+        (a, b), then, otherwise = cond[0]["$eq"], cond[1], cond[2]
+        codes = self.encoded(_field_ref(a))[0]
+        code = self.code_of(_field_ref(a), b)
+        test = codes == code if code is not None else np.zeros(self.n, dtype=bool)
+        t_values, t_present, t_int = self.value(then)
+        o_values, o_present, o_int = self.value(otherwise)
+        return (np.where(test, t_values, o_values), np.where(test, t_present, o_present), t_int and o_int)
+
+
+def _group_columnar(rows, layout, accumulators):
+    frame = _Frame(rows)
+    if not rows:
+        return []
+
+    if layout is None:
+        key_fields = []
+    elif isinstance(layout, str):
+        key_fields = [layout]
+    else:
+        key_fields = [field for _, field in layout]
+
+    # Combine per-field codes into a single group id (mixed radix)
+    gid = np.zeros(frame.n, dtype=np.int64)
+    for field in key_fields:
+        codes, values, _ = frame.encoded(field)
+        gid = gid * len(values) + codes
+    unique, inverse = np.unique(gid, return_inverse=True)
+    n_groups = len(unique)
+
+    # First row of each group gives the decoded key values
+    first_row = np.full(n_groups, frame.n, dtype=np.int64)
+    np.minimum.at(first_row, inverse, np.arange(frame.n))
+
+    results = [{} for _ in range(n_groups)]
+    for g, row_index in enumerate(first_row):
+        if layout is None:
+            key = None
+        elif isinstance(layout, str):
+            codes, values, _ = frame.encoded(layout)
+            key = values[codes[row_index]]
+        else:
+            key = {}
+            for name, field in layout:
+                codes, values, _ = frame.encoded(field)
+                key[name] = values[codes[row_index]]
+        results[g]["_id"] = key
+
+    for name, (op, expr) in accumulators.items():
+        values, present, all_int = frame.value(expr)
+        if op in ("$sum", "$avg"):
+            totals = np.bincount(inverse, weights=np.where(present, values, 0.0), minlength=n_groups)
+            counts = np.bincount(inverse, weights=present.astype(np.float64), minlength=n_groups)
+            for g in range(n_groups):
+                if op == "$sum":
+                    results[g][name] = int(totals[g]) if all_int else float(totals[g])
+                else:
+                    results[g][name] = float(totals[g] / counts[g]) if counts[g] else None
+        elif _field_ref(expr):
+            # Any BSON type: reduce the ranks of the field's distinct values
+            for g, v in enumerate(frame.extreme(_field_ref(expr), inverse, n_groups, op)):
+                results[g][name] = v
+        else:
+            fill = np.inf if op == "$min" else -np.inf
+            reduced = np.full(n_groups, fill)
+            ufunc = np.minimum if op == "$min" else np.maximum
+            ufunc.at(reduced, inverse, np.where(present, values, fill))
+            for g in range(n_groups):
+                v = reduced[g]
+                results[g][name] = None if np.isinf(v) else (int(v) if all_int else float(v))
+    return results
+
+
+# ----------------------------------------------------------------------
+# Entry point
+# ----------------------------------------------------------------------
+
+def aggregate(collection, pipeline):
+    """
+    Run an aggregation pipeline against a mock collection.
+
+    Args:
+        collection (MockCollection): Source collection
+        pipeline (list): Aggregation stages
+
+    Returns:
+        list: Result documents
+    """
+    pipeline = list(pipeline)
+    position = 0
+
+    # A leading $match uses the collection's indexes
+    if pipeline and "$match" in pipeline[0]:
+        rows = collection._find_raw(pipeline[0]["$match"])
+        position = 1
+    else:
+        rows = collection._find_raw({})
+
+    if np is not None and position < len(pipeline) and "$group" in pipeline[position]:
+        plan = _columnar_group_plan(pipeline[position]["$group"])
+        if plan is not None:
+            rows = _group_columnar(rows, *plan)
+            position += 1
+
+    for stage in pipeline[position:]:
+        rows = _run_stage(rows, stage)
+
+    # Never hand out the collection's own documents
+    return [dict(r) for r in rows]
@@ -0,0 +1,1020 @@
+"""
+Embedded local stand-in for MongoDB, used when Atlas is unavailable and for
+local development and load testing.
+
+Each collection is stored as append-only JSONL segment files:
+
+    <directory>/<collection>/00000001.jsonl
+    <directory>/<collection>/00000002.jsonl
+    ...
+
+Every line is one operation: "i" followed by a JSON document (insert or
+replace, last write for an _id wins) or "d" followed by a JSON _id (delete).
+Writes only append, so an insert costs one line regardless of collection
+size. When superseded lines outweigh live documents the collection is
+compacted into a fresh segment, which is fsynced before the old segments are
+removed. A torn last line (crash mid-write) is ignored on load.
+
+Collections are loaded lazily, the first time they are used. Secondary
+indexes created with create_index() are kept in memory (their definitions
+are saved in <collection>/indexes.json and rebuilt on load) and used by the
+query planner for equality, $in, range and sorted queries. aggregate() runs
+pipelines through the columnar executor in mock_aggregate.
+"""
+
+import bisect
+import copy
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, InvalidOperation, OperationFailure
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+from .mock_aggregate import aggregate
+from .mock_query import (
+    MAX_KEY,
+    _MISSING,
+    apply_update,
+    equality_value,
+    get_path,
+    matches,
+    normalize_projection,
+    normalize_sort,
+    project,
+    range_bounds,
+    sort_documents,
+    sort_key,
+    upsert_seed,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# Compact once this many superseded lines exist and they outnumber live documents
+COMPACT_MIN_GARBAGE = 10000
+
+
+def _default(value):
+    """JSON encoder for the BSON types the app stores."""
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    return str(value)
+
+
+def _object_hook(d):
+    """JSON decoder counterpart of _default."""
+    if len(d) == 1:
+        if "$date" in d:
+            return datetime.fromisoformat(d["$date"])
+        if "$oid" in d:
+            return ObjectId(d["$oid"])
+    return d
+
+
+_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+_decoder = json.JSONDecoder(object_hook=_object_hook)
+
+
+class MockCollection:
+    def __init__(self, name, db):
+        self.name = name
+        self.db = db
+        self.path = db.directory / name if db.directory else None
+
+        self._lock = threading.RLock()
+        self._docs = None  # {_id: document}, loaded lazily
+        self._indexes = {}  # {name: _Index}
+        self._file = None
+        self._segment_seq = 0
+        self._garbage = 0
+
+    @property
+    def database(self):
+        return self.db
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _segments(self):
+        if self.path is None or not self.path.exists():
+            return []
+        return sorted(self.path.glob("*.jsonl"))
+
+    def _ensure_loaded(self):
+        if self._docs is not None:
+            return self._docs
+        with self._lock:
+            if self._docs is None:
+                self._load()
+        return self._docs
+
+    def _load(self):
+        """Replay all segments into memory (called with the lock held)."""
+        docs = {}
+        garbage = 0
+        segments = self._segments()
+
+        if not segments and self.path is not None:
+            legacy = self.db.legacy_documents(self.name)
+            if legacy:
+                logger.info(f"Importing {len(legacy)} {self.name} documents from legacy mock_db.json")
+                for doc in legacy:
+                    doc.setdefault("_id", str(uuid.uuid4()))
+                    docs[doc["_id"]] = doc
+                self._docs = docs
+                self._write_lines([self._encode_put(d) for d in docs.values()])
+                segments = []
+
+        for segment in segments:
+            with open(segment, "rb") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.endswith(b"\n"):
+                        logger.warning(f"Ignoring torn record at end of {segment}")
+                        break
+                    try:
+                        op, payload = line[:1], _decoder.decode(line[1:].decode("utf-8"))
+                    except ValueError:
+                        logger.warning(f"Ignoring corrupt record {segment}:{line_no}")
+                        continue
+                    if op == b"i":
+                        if payload["_id"] in docs:
+                            garbage += 1
+                        docs[payload["_id"]] = payload
+                    elif op == b"d":
+                        garbage += 1 + (docs.pop(payload, None) is not None)
+
+        if segments:
+            self._segment_seq = int(segments[-1].stem)
+        self._garbage = garbage
+        self._docs = docs
+
+        for spec in self._load_index_specs():
+            index = _Index(spec["name"], [tuple(k) for k in spec["key"]],
+                           unique=spec.get("unique", False), partial=spec.get("partialFilterExpression"),
+                           sparse=spec.get("sparse", False))
+            for doc in docs.values():
+                index.add(doc)
+            self._indexes[index.name] = index
+
+    @staticmethod
+    def _encode_put(doc):
+        return "i" + _encoder.encode(doc) + "\n"
+
+    @staticmethod
+    def _encode_delete(doc_id):
+        return "d" + _encoder.encode(doc_id) + "\n"
+
+    def _open_segment(self):
+        """Start a new segment file (called with the lock held)."""
+        if self._file is not None:
+            self._file.close()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._segment_seq += 1
+        self._file = open(self.path / f"{self._segment_seq:08d}.jsonl", "a", encoding="utf-8")
+
+    def _write_lines(self, lines):
+        """Append operation lines to the active segment (called with the lock held)."""
+        if self.path is None or not lines:
+            return
+        try:
+            if self._file is None or self._file.tell() >= SEGMENT_MAX_BYTES:
+                self._open_segment()
+            self._file.write("".join(lines))
+            self._file.flush()
+        except OSError as e:
+            logger.warning(f"Failed to persist mock DB collection {self.name}: {e}")
+
+    def _maybe_compact(self):
+        if self._garbage >= COMPACT_MIN_GARBAGE and self._garbage > len(self._docs):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the collection as a single segment holding only live documents."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            old_segments = self._segments()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            self._segment_seq += 1
+            target = self.path / f"{self._segment_seq:08d}.jsonl"
+            tmp = target.with_suffix(".tmp")
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                for doc in self._docs.values():
+                    f.write(self._encode_put(doc))
+                f.flush()
+                os.fsync(f.fileno())
+            # The compacted segment sorts after every old one, so a crash
+            # before the old ones are removed still loads the right state
+            os.replace(tmp, target)
+            for segment in old_segments:
+                segment.unlink()
+
+            self._garbage = 0
+            logger.info(f"Compacted mock DB collection {self.name} ({len(self._docs)} documents)")
+
+    def _put(self, documents):
+        """Store documents, update indexes and log them (called with the lock held)."""
+        for document in documents:
+            old = self._docs.get(document["_id"])
+            if old is not None:
+                self._garbage += 1
+                for index in self._indexes.values():
+                    index.remove(old)
+            self._docs[document["_id"]] = document
+            for index in self._indexes.values():
+                index.add(document)
+        self._write_lines([self._encode_put(d) for d in documents])
+        self._maybe_compact()
+
+    def _remove(self, doc_ids):
+        """Delete documents by _id and log tombstones (called with the lock held)."""
+        for doc_id in doc_ids:
+            old = self._docs.pop(doc_id)
+            for index in self._indexes.values():
+                index.remove(old)
+        self._garbage += 2 * len(doc_ids)
+        self._write_lines([self._encode_delete(i) for i in doc_ids])
+        self._maybe_compact()
+
+    def _save_index_specs(self):
+        """Persist index definitions so they are rebuilt on load."""
+        if self.path is None:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        specs = [index.spec() for index in self._indexes.values()]
+        tmp = self.path / "indexes.json.tmp"
+        tmp.write_text(_encoder.encode(specs), encoding="utf-8")
+        os.replace(tmp, self.path / "indexes.json")
+
+    def _load_index_specs(self):
+        if self.path is None or not (self.path / "indexes.json").exists():
+            return []
+        try:
+            return _decoder.decode((self.path / "indexes.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read index definitions for {self.name}: {e}")
+            return []
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # ------------------------------------------------------------------
+    # Query planning
+    # ------------------------------------------------------------------
+
+    def _plan(self, filter_dict, sort_spec=None):
+        """
+        Choose how to find candidate documents for a query.
+
+        Returns:
+            _Plan: IDHACK for _id equality, IXSCAN when an index covers an
+            equality/$in/range condition (or the sort when there is no usable
+            condition), otherwise COLLSCAN
+        """
+        conditions = _field_conditions(filter_dict or {})
+
+        if "_id" in conditions:
+            values = equality_value(conditions["_id"])
+            if values is not None:
+                return _Plan("IDHACK", ids=[v for v in values if v in self._docs])
+
+        best = None
+        for index in self._indexes.values():
+            if not index.usable_for(filter_dict):
+                continue
+            condition = conditions.get(index.field, _NO_CONDITION)
+            if condition is _NO_CONDITION:
+                continue
+            values = equality_value(condition)
+            if values is not None:
+                plan = _Plan("IXSCAN", index=index, ids=index.lookup(values))
+            else:
+                bounds = range_bounds(condition)
+                if bounds is None:
+                    continue
+                plan = _Plan("IXSCAN", index=index, ids=index.range(*bounds), ordered=True)
+            if best is None or len(plan.ids) < len(best.ids):
+                best = plan
+        if best is not None:
+            # The index answers the whole filter exactly: no need to re-check documents
+            best.covered = (len(filter_dict) == 1 and best.index.field in filter_dict
+                            and not best.index.partial and not best.index.multikey)
+            return best
+
+        if sort_spec:
+            field, direction = sort_spec[0]
+            for index in self._indexes.values():
+                if index.field == field and index.usable_for(filter_dict):
+                    return _Plan("IXSCAN", index=index, ordered=True, direction=direction)
+
+        return _Plan("COLLSCAN")
+
+    def _find_raw(self, filter_dict):
+        """Matching documents themselves (not copies), found through the planner."""
+        filter_dict = filter_dict or {}
+        self._ensure_loaded()
+        with self._lock:
+            plan = self._plan(filter_dict)
+            candidates = self._docs.values() if plan.ids is None else (self._docs[i] for i in plan.ids)
+            if not filter_dict or plan.covered:
+                return list(candidates)
+            return [d for d in candidates if matches(d, filter_dict)]
+
+    def _execute(self, filter_dict, projection=None, sort_spec=None, skip=0, limit=0):
+        """Run a query and return projected copies of the matching documents."""
+        filter_dict = filter_dict or {}
+        self._ensure_loaded()
+        with self._lock:
+            plan = self._plan(filter_dict, sort_spec)
+            docs = self._docs
+
+            if plan.ordered and sort_spec and sort_spec[0][0] == plan.index.field:
+                # Walk the index in sort order. Ties are ordered by _id in the
+                # index, so a (field, _id) sort in one direction needs no re-sort
+                # and the walk stops as soon as the page is filled.
+                direction = sort_spec[0][1]
+                exact = len(sort_spec) == 1 or list(sort_spec[1:]) == [("_id", direction)]
+                ids = plan.index.ordered_ids(direction) if plan.ids is None else plan.ids.iter(direction)
+                wanted = skip + limit if limit and exact else None
+                matched = []
+                for doc_id in ids:
+                    doc = docs[doc_id]
+                    if plan.covered or matches(doc, filter_dict):
+                        matched.append(doc)
+                        if wanted is not None and len(matched) >= wanted:
+                            break
+                if not exact:
+                    sort_documents(matched, sort_spec)
+            else:
+                candidates = docs.values() if plan.ids is None else (docs[i] for i in plan.ids)
+                if not filter_dict or plan.covered:
+                    matched = list(candidates)
+                else:
+                    matched = [d for d in candidates if matches(d, filter_dict)]
+                if sort_spec:
+                    sort_documents(matched, sort_spec)
+
+            matched = matched[skip:skip + limit] if limit else matched[skip:]
+            projection = normalize_projection(projection)
+            return [project(d, projection) for d in matched]
+
+    # ------------------------------------------------------------------
+    # Collection API (the subset of pymongo the app uses)
+    # ------------------------------------------------------------------
+
+    def _check_duplicates(self, document, pending=(), pending_ids=()):
+        """Raise DuplicateKeyError if the document violates _id or a unique index."""
+        if document["_id"] in self._docs or document["_id"] in pending_ids:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_",
+                                    11000, {"keyValue": {"_id": document["_id"]}})
+        for index in self._indexes.values():
+            if index.unique and index.conflicts(document, pending):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {index.name}",
+                                        11000, {"keyValue": {index.field: get_path(document, index.field)}})
+
+    def insert_one(self, document):
+        if "_id" not in document:
+            document["_id"] = str(uuid.uuid4())
+
+        self._ensure_loaded()
+        with self._lock:
+            self._check_duplicates(document)
+            self._put([document])
+
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        for document in documents:
+            if "_id" not in document:
+                document["_id"] = str(uuid.uuid4())
+
+        self._ensure_loaded()
+        with self._lock:
+            accepted = []
+            accepted_ids = set()
+            errors = []
+            for position, document in enumerate(documents):
+                try:
+                    self._check_duplicates(document, accepted, accepted_ids)
+                except DuplicateKeyError as e:
+                    errors.append({"index": position, "code": 11000, "errmsg": str(e), "op": document})
+                    if ordered:
+                        break
+                    continue
+                accepted.append(document)
+                accepted_ids.add(document["_id"])
+            self._put(accepted)
+
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors,
+                "writeConcernErrors": [],
+                "nInserted": len(accepted),
+                "nUpserted": 0,
+                "nMatched": 0,
+                "nModified": 0,
+                "nRemoved": 0,
+                "upserted": [],
+            })
+        return InsertManyResult([d["_id"] for d in documents], True)
+
+    def _check_unique(self, document):
+        """Raise DuplicateKeyError if a modified document collides on a unique index."""
+        for index in self._indexes.values():
+            if index.unique and index.conflicts(document, exclude=document["_id"]):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {index.name}",
+                                        11000, {"keyValue": {index.field: get_path(document, index.field)}})
+
+    def _update(self, filter_dict, update, upsert=False, multi=False, replace=False):
+        """
+        Apply an update or replacement (called with the lock held).
+
+        Returns:
+            tuple: (matched, modified, upserted _id or None)
+        """
+        if replace:
+            if any(k.startswith("$") for k in update):
+                raise ValueError("replacement can not include $ operators")
+        elif not update or not all(k.startswith("$") for k in update):
+            raise ValueError("update only works with $ operators")
+
+        targets = self._find_raw(filter_dict or {})
+        if not multi:
+            targets = targets[:1]
+
+        if not targets:
+            if not upsert:
+                return 0, 0, None
+            if replace:
+                document = copy.deepcopy(update)
+                seed_id = upsert_seed(filter_dict or {}).get("_id")
+                if seed_id is not None:
+                    document.setdefault("_id", seed_id)
+            else:
+                document = apply_update(upsert_seed(filter_dict or {}), update, inserting=True)
+            document.setdefault("_id", ObjectId())
+            self._check_duplicates(document)
+            self._put([document])
+            return 0, 0, document["_id"]
+
+        modified = []
+        for old in targets:
+            if replace:
+                document = {"_id": old["_id"], **copy.deepcopy(update)}
+            else:
+                document = apply_update(copy.deepcopy(old), update)
+            if document != old:
+                self._check_unique(document)
+                modified.append(document)
+        self._put(modified)
+        return len(targets), len(modified), None
+
+    def _update_result(self, matched, modified, upserted_id):
+        raw = {"n": 1 if upserted_id is not None else matched, "nModified": modified,
+               "updatedExisting": bool(matched), "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter_dict, update, upsert=False, **kwargs):
+        self._ensure_loaded()
+        with self._lock:
+            return self._update_result(*self._update(filter_dict, update, upsert=upsert))
+
+    def update_many(self, filter_dict, update, upsert=False, **kwargs):
+        self._ensure_loaded()
+        with self._lock:
+            return self._update_result(*self._update(filter_dict, update, upsert=upsert, multi=True))
+
+    def replace_one(self, filter_dict, replacement, upsert=False, **kwargs):
+        self._ensure_loaded()
+        with self._lock:
+            return self._update_result(*self._update(filter_dict, replacement, upsert=upsert, replace=True))
+
+    def find_one_and_update(self, filter_dict, update, projection=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        self._ensure_loaded()
+        with self._lock:
+            targets = self._find_raw(filter_dict or {})[:1]
+            before = copy.deepcopy(targets[0]) if targets else None
+            _, _, upserted_id = self._update(filter_dict, update, upsert=upsert)
+            if return_document == ReturnDocument.AFTER:
+                doc_id = upserted_id if upserted_id is not None else (before or {}).get("_id")
+                result = copy.deepcopy(self._docs[doc_id]) if doc_id is not None else None
+            else:
+                result = before
+        if result is None:
+            return None
+        return project(result, normalize_projection(projection))
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        """Run InsertOne / UpdateOne / UpdateMany / ReplaceOne / DeleteOne / DeleteMany operations."""
+        result = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        self._ensure_loaded()
+        with self._lock:
+            for position, op in enumerate(requests):
+                try:
+                    if isinstance(op, InsertOne):
+                        document = op._doc
+                        document.setdefault("_id", ObjectId())
+                        self._check_duplicates(document)
+                        self._put([document])
+                        result["nInserted"] += 1
+                    elif isinstance(op, (UpdateOne, UpdateMany, ReplaceOne)):
+                        matched, modified, upserted_id = self._update(
+                            op._filter, op._doc, upsert=bool(op._upsert),
+                            multi=isinstance(op, UpdateMany), replace=isinstance(op, ReplaceOne))
+                        result["nMatched"] += matched
+                        result["nModified"] += modified
+                        if upserted_id is not None:
+                            result["nUpserted"] += 1
+                            result["upserted"].append({"index": position, "_id": upserted_id})
+                    elif isinstance(op, (DeleteOne, DeleteMany)):
+                        doc_ids = [d["_id"] for d in self._find_raw(op._filter)]
+                        if isinstance(op, DeleteOne):
+                            doc_ids = doc_ids[:1]
+                        self._remove(doc_ids)
+                        result["nRemoved"] += len(doc_ids)
+                    else:
+                        raise TypeError(f"{op!r} is not a valid request")
+                except DuplicateKeyError as e:
+                    result["writeErrors"].append({"index": position, "code": 11000, "errmsg": str(e), "op": op})
+                    if ordered:
+                        break
+
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def delete_many(self, filter_dict=None):
+        self._ensure_loaded()
+        with self._lock:
+            doc_ids = [d["_id"] for d in self._execute(filter_dict, projection={"_id": 1})]
+            self._remove(doc_ids)
+        return DeleteResult({"n": len(doc_ids)}, True)
+
+    def find(self, filter_dict=None, projection=None, sort=None, skip=0, limit=0, **kwargs):
+        cursor = MockCursor(self, filter_dict, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    def find_one(self, filter_dict=None, projection=None, sort=None, **kwargs):
+        for doc in self.find(filter_dict, projection, sort=sort, limit=1):
+            return doc
+        return None
+
+    def count_documents(self, filter_dict=None, skip=0, limit=0, **kwargs):
+        if not filter_dict and not skip and not limit:
+            return len(self._ensure_loaded())
+        return len(self._execute(filter_dict, projection={"_id": 1}, skip=skip, limit=limit))
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._ensure_loaded())
+
+    def distinct(self, field, filter_dict=None, **kwargs):
+        self._ensure_loaded()
+        with self._lock:
+            if not filter_dict:
+                for index in self._indexes.values():
+                    if index.field == field and not index.partial:
+                        return index.distinct_values()
+            docs = self._execute(filter_dict, projection={field: 1})
+        values = {}
+        for doc in docs:
+            value = get_path(doc, field)
+            for v in (value if isinstance(value, list) else [value]):
+                if v is not _MISSING:
+                    values.setdefault(sort_key(v), v)
+        return list(values.values())
+
+    def aggregate(self, pipeline, **kwargs):
+        return MockCommandCursor(aggregate(self, pipeline))
+
+    def create_index(self, keys, name=None, unique=False, partialFilterExpression=None, sparse=False, **kwargs):
+        keys = normalize_sort(keys, 1)
+        name = name or "_".join(f"{f}_{d}" for f, d in keys)
+        self._ensure_loaded()
+        with self._lock:
+            existing = self._indexes.get(name)
+            if existing is not None:
+                if (existing.keys != keys or existing.partial != partialFilterExpression
+                        or existing.unique != unique or existing.sparse != sparse):
+                    raise OperationFailure(f"Index with name: {name} already exists with different options", 85)
+                return name
+            index = _Index(name, keys, unique=unique, partial=partialFilterExpression, sparse=sparse)
+            for doc in self._docs.values():
+                index.add(doc)
+            self._indexes[name] = index
+            self._save_index_specs()
+        return name
+
+    def create_indexes(self, indexes):
+        return [self.create_index(i.document["key"].items(), **{k: v for k, v in i.document.items() if k != "key"})
+                for i in indexes]
+
+    def drop_index(self, name):
+        self._ensure_loaded()
+        with self._lock:
+            if name not in self._indexes:
+                raise OperationFailure(f"index not found with name [{name}]", 27)
+            del self._indexes[name]
+            self._save_index_specs()
+
+    def index_information(self):
+        self._ensure_loaded()
+        info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        for index in self._indexes.values():
+            info[index.name] = index.spec(info=True)
+        return info
+
+
+class _Plan:
+    """Access path chosen by MockCollection._plan."""
+
+    def __init__(self, stage, index=None, ids=None, ordered=False, direction=1):
+        self.stage = stage
+        self.index = index
+        self.ids = ids
+        self.ordered = ordered
+        self.direction = direction
+        self.covered = False
+
+    def explain(self):
+        if self.stage == "COLLSCAN":
+            return {"stage": "COLLSCAN"}
+        if self.stage == "IDHACK":
+            return {"stage": "IDHACK"}
+        return {
+            "stage": "FETCH",
+            "inputStage": {
+                "stage": "IXSCAN",
+                "indexName": self.index.name,
+                "keyPattern": dict(self.index.keys),
+                "isPartial": bool(self.index.partial),
+            }
+        }
+
+
+_NO_CONDITION = object()
+
+
+def _field_conditions(filter_dict):
+    """Top-level field conditions of a filter, including those inside $and."""
+    conditions = {}
+    for key, condition in filter_dict.items():
+        if key == "$and":
+            for clause in condition:
+                for k, c in _field_conditions(clause).items():
+                    conditions.setdefault(k, c)
+        elif not key.startswith("$"):
+            conditions[key] = condition
+    return conditions
+
+
+class _Index:
+    """
+    In-memory secondary index on a collection.
+
+    Lookups use the first key field: a hash map answers equality and $in,
+    and a sorted list of (value, _id) keys answers ranges and ordered scans.
+    Remaining compound key fields are checked by the query filter; a unique
+    compound index also keeps a map of full keys to enforce uniqueness.
+    """
+
+    def __init__(self, name, keys, unique=False, partial=None, sparse=False):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.unique = unique
+        self.partial = partial
+        self.sparse = sparse  # Recorded for index_information(); missing values are still indexed
+        self._hash = {}     # sort_key(value) -> set of _ids
+        self._values = {}   # sort_key(value) -> original value
+        self._sorted = []   # [(sort_key(value), sort_key(_id), _id)]
+        self._pending = []  # Out-of-order entries merged into _sorted on the next read
+        self.multikey = False  # Some document has an array value (one entry per element)
+        # Full compound key -> set of _ids, for unique compound indexes only
+        self._compound = {} if unique and len(keys) > 1 else None
+
+    def spec(self, info=False):
+        spec = {"name": self.name, "key": [list(k) for k in self.keys]}
+        if info:
+            spec = {"key": [tuple(k) for k in self.keys], "v": 2}
+        if self.unique:
+            spec["unique"] = True
+        if self.sparse:
+            spec["sparse"] = True
+        if self.partial:
+            spec["partialFilterExpression"] = self.partial
+        return spec
+
+    def usable_for(self, filter_dict):
+        """A partial index only answers queries that imply its filter."""
+        if not self.partial:
+            return True
+        conditions = _field_conditions(filter_dict or {})
+        return all(
+            field in conditions and sort_key(conditions[field]) == sort_key(value)
+            for field, value in self.partial.items()
+        )
+
+    def _entries(self, doc):
+        value = get_path(doc, self.field)
+        if isinstance(value, list) and value:
+            self.multikey = True
+            return {sort_key(v): v for v in value}
+        return {sort_key(None if value is _MISSING else value): None if value is _MISSING else value}
+
+    def _compound_key(self, doc):
+        return tuple(sort_key(get_path(doc, field)) for field, _ in self.keys)
+
+    def add(self, doc):
+        if self.partial and not matches(doc, self.partial):
+            return
+        if self._compound is not None:
+            self._compound.setdefault(self._compound_key(doc), set()).add(doc["_id"])
+        id_key = sort_key(doc["_id"])
+        for key, value in self._entries(doc).items():
+            self._hash.setdefault(key, set()).add(doc["_id"])
+            self._values.setdefault(key, value)
+            entry = (key, id_key, doc["_id"])
+            if not self._pending and (not self._sorted or self._sorted[-1][:2] < entry[:2]):
+                self._sorted.append(entry)
+            else:
+                self._pending.append(entry)
+
+    def _settle(self):
+        """Merge pending entries into the sorted list (Timsort merges the two runs in linear time)."""
+        if self._pending:
+            # (value, _id) prefixes are unique, so tuple order never reaches the raw _id
+            self._pending.sort()
+            self._sorted.extend(self._pending)
+            self._sorted.sort()
+            self._pending = []
+
+    def remove(self, doc):
+        if self.partial and not matches(doc, self.partial):
+            return
+        if self._compound is not None:
+            ids = self._compound.get(self._compound_key(doc))
+            if ids is not None:
+                ids.discard(doc["_id"])
+                if not ids:
+                    del self._compound[self._compound_key(doc)]
+        id_key = sort_key(doc["_id"])
+        for key in self._entries(doc):
+            ids = self._hash.get(key)
+            if ids is not None:
+                ids.discard(doc["_id"])
+                if not ids:
+                    del self._hash[key]
+                    del self._values[key]
+            self._settle()
+            position = bisect.bisect_left(self._sorted, (key, id_key))
+            if position < len(self._sorted) and self._sorted[position][:2] == (key, id_key):
+                del self._sorted[position]
+
+    def conflicts(self, doc, pending=(), exclude=_MISSING):
+        """Check whether inserting `doc` would duplicate a unique key (ignoring _id `exclude`)."""
+        if self.partial and not matches(doc, self.partial):
+            return False
+        if self._compound is not None:
+            key = self._compound_key(doc)
+            if self._compound.get(key, set()) - {exclude}:
+                return True
+            return any(self._compound_key(p) == key for p in pending)
+        keys = set(self._entries(doc))
+        if any(self._hash.get(key, set()) - {exclude} for key in keys):
+            return True
+        return any(keys & set(self._entries(p)) for p in pending)
+
+    def lookup(self, values):
+        ids = set()
+        for value in values:
+            ids |= self._hash.get(sort_key(value), set())
+        return ids
+
+    def range(self, lower, lower_inclusive, upper, upper_inclusive):
+        """_ids with a first-field value in range, as a lazy _IndexRange (same BSON type only)."""
+        self._settle()
+        rank = sort_key(lower if lower is not None else upper)[0]
+        if lower is None:
+            start = bisect.bisect_left(self._sorted, ((rank,),))
+        elif lower_inclusive:
+            start = bisect.bisect_left(self._sorted, (sort_key(lower),))
+        else:
+            start = bisect.bisect_right(self._sorted, (sort_key(lower), MAX_KEY))
+        if upper is None:
+            end = bisect.bisect_left(self._sorted, ((rank + 1,),))
+        elif upper_inclusive:
+            end = bisect.bisect_right(self._sorted, (sort_key(upper), MAX_KEY))
+        else:
+            end = bisect.bisect_left(self._sorted, (sort_key(upper),))
+        return _IndexRange(self, start, end)
+
+    def ordered_ids(self, direction=1):
+        self._settle()
+        entries = self._sorted if direction > 0 else reversed(self._sorted)
+        seen = set()
+        for entry in entries:
+            if entry[2] not in seen:
+                seen.add(entry[2])
+                yield entry[2]
+
+    def distinct_values(self):
+        return [v for k, v in self._values.items() if v is not None]
+
+
+class _IndexRange:
+    """
+    Slice of an index's sorted entries, iterated lazily in either direction so
+    that a bounded range scan does not copy every entry in the range.
+    """
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = max(start, end)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __iter__(self):
+        return self.iter(1)
+
+    def iter(self, direction=1):
+        entries = self.index._sorted
+        positions = range(self.start, self.end) if direction > 0 else range(self.end - 1, self.start - 1, -1)
+        seen = set() if self.index.multikey else None
+        for position in positions:
+            doc_id = entries[position][2]
+            if seen is not None:
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+            yield doc_id
+
+
+class MockCursor:
+    """Lazily evaluated cursor supporting sort, skip, limit and projection."""
+
+    def __init__(self, collection, filter_dict=None, projection=None):
+        self.collection = collection
+        self.filter = filter_dict or {}
+        self.projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def _check_unevaluated(self):
+        if self._results is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def sort(self, key_or_list, direction=None):
+        self._check_unevaluated()
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self._check_unevaluated()
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._check_unevaluated()
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def _evaluate(self):
+        if self._results is None:
+            self._results = iter(self.collection._execute(
+                self.filter, self.projection, self._sort, self._skip, self._limit
+            ))
+        return self._results
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._evaluate())
+
+    def close(self):
+        self._results = iter(())
+
+    def explain(self):
+        self.collection._ensure_loaded()
+        with self.collection._lock:
+            plan = self.collection._plan(self.filter, self._sort)
+        winning = plan.explain()
+        if self._sort and not (plan.ordered and plan.index.field == self._sort[0][0]):
+            winning = {"stage": "SORT", "sortPattern": dict(self._sort), "inputStage": winning}
+        return {
+            "queryPlanner": {
+                "namespace": self.collection.name,
+                "parsedQuery": self.filter,
+                "winningPlan": winning,
+            }
+        }
+
+
+class MockCommandCursor:
+    """Cursor over already computed results (aggregation output)."""
+
+    def __init__(self, results):
+        self._results = iter(results)
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._results)
+
+    def close(self):
+        self._results = iter(())
+
+
+class MockDatabase:
+    def __init__(self, directory=None, legacy_file=None):
+        """
+        Args:
+            directory (str | Path): Directory for collection segments
+                (None keeps everything in memory)
+            legacy_file (str | Path): Old single-file mock_db.json to import
+                collections from the first time they are used
+        """
+        self.directory = Path(directory) if directory else None
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.collections = {}
+        self.collection_options = {}
+        self._lock = threading.Lock()
+        self._legacy = None
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            with self._lock:
+                if name not in self.collections:
+                    self.collections[name] = MockCollection(name, self)
+        return self.collections[name]
+
+    def legacy_documents(self, name):
+        """Documents for a collection from the legacy mock_db.json, if any."""
+        if self._legacy is None:
+            self._legacy = {}
+            if self.legacy_file and self.legacy_file.exists():
+                try:
+                    with open(self.legacy_file, "r", encoding="utf-8") as f:
+                        self._legacy = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Failed to read legacy mock DB {self.legacy_file}: {e}")
+        return self._legacy.get(name, [])
+
+    def create_collection(self, name, **options):
+        """
+        Create a collection explicitly, like Database.create_collection.
+
+        Options (e.g. timeseries) are recorded in collection_options but do
+        not change how the mock stores documents.
+        """
+        if name in self.list_collection_names():
+            raise CollectionInvalid(f"collection {name} already exists")
+        self.collection_options[name] = options
+        return self[name]
+
+    def list_collection_names(self):
+        # Like MongoDB, a collection exists once it was written to or created
+        names = {name for name, c in self.collections.items()
+                 if c._docs or c._indexes or name in self.collection_options}
+        names.update(self.collection_options)
+        if self.directory and self.directory.exists():
+            names.update(p.name for p in self.directory.iterdir() if p.is_dir())
+        return sorted(names)
+
+    def close(self):
+        for collection in list(self.collections.values()):
+            collection.close()
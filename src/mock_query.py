@@ -0,0 +1,353 @@
+"""
+Query evaluation for the local mock database: filters, sort keys and
+projections with MongoDB semantics for the operators the app uses.
+"""
+
+import re
+from datetime import datetime
+from bson import ObjectId
+
+_MISSING = object()
+
+# MongoDB's cross-type sort order (BSON comparison order)
+_RANK_NULL = 1
+_RANK_NUMBER = 2
+_RANK_STRING = 3
+_RANK_OBJECT = 4
+_RANK_ARRAY = 5
+_RANK_OBJECTID = 7
+_RANK_BOOL = 8
+_RANK_DATE = 9
+_RANK_OTHER = 10
+
+# Sorts after every real sort key
+MAX_KEY = (99,)
+
+
+def get_path(doc, path):
+    """Get a (possibly dotted) field from a document, or _MISSING."""
+    if "." not in path:
+        return doc.get(path, _MISSING) if isinstance(doc, dict) else _MISSING
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def sort_key(value):
+    """Key that orders values of any type the way MongoDB does."""
+    if value is None or value is _MISSING:
+        return (_RANK_NULL,)
+    if isinstance(value, bool):
+        return (_RANK_BOOL, value)
+    if isinstance(value, (int, float)):
+        return (_RANK_NUMBER, value)
+    if isinstance(value, str):
+        return (_RANK_STRING, value)
+    if isinstance(value, datetime):
+        return (_RANK_DATE, value.replace(tzinfo=None) if value.tzinfo else value)
+    if isinstance(value, ObjectId):
+        return (_RANK_OBJECTID, value.binary)
+    if isinstance(value, dict):
+        return (_RANK_OBJECT, tuple((k, sort_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (_RANK_ARRAY, tuple(sort_key(v) for v in value))
+    return (_RANK_OTHER, str(value))
+
+
+def _equals(value, target):
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(_equals(v, target) for v in value)
+    if value is None or target is None:
+        return value is None and target is None
+    return sort_key(value) == sort_key(target)
+
+
+def _compare(value, target, op):
+    """Ordered comparison; values of different BSON types never match."""
+    if isinstance(value, list):
+        return any(_compare(v, target, op) for v in value)
+    if value is _MISSING or value is None:
+        return target is None and op in ("$gte", "$lte")
+    a, b = sort_key(value), sort_key(target)
+    if a[0] != b[0]:
+        return False
+    if op == "$gt":
+        return a > b
+    if op == "$gte":
+        return a >= b
+    if op == "$lt":
+        return a < b
+    return a <= b
+
+
+_TYPES = {
+    "double": (float,),
+    "string": (str,),
+    "object": (dict,),
+    "array": (list,),
+    "objectId": (ObjectId,),
+    "bool": (bool,),
+    "date": (datetime,),
+    "null": (type(None),),
+    "int": (int,),
+    "long": (int,),
+    "number": (int, float),
+}
+
+
+def _has_type(value, alias):
+    """$type by alias (or a list of aliases); bool is not a number."""
+    if isinstance(alias, list):
+        return any(_has_type(value, a) for a in alias)
+    if value is _MISSING:
+        return False
+    if isinstance(value, bool) and alias != "bool":
+        return False
+    if isinstance(value, list) and alias != "array":
+        return any(_has_type(v, alias) for v in value)
+    if alias not in _TYPES:
+        raise ValueError(f"Unsupported $type alias: {alias}")
+    return isinstance(value, _TYPES[alias])
+
+
+def _match_condition(value, condition):
+    """Match one field value against a literal or an operator document."""
+    if not (isinstance(condition, dict) and condition and next(iter(condition)).startswith("$")):
+        return _equals(value, condition)
+
+    for op, arg in condition.items():
+        if op == "$eq":
+            ok = _equals(value, arg)
+        elif op == "$ne":
+            ok = not _equals(value, arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _compare(value, arg, op)
+        elif op == "$in":
+            ok = any(_equals(value, a) for a in arg)
+        elif op == "$nin":
+            ok = not any(_equals(value, a) for a in arg)
+        elif op == "$exists":
+            ok = (value is not _MISSING) == bool(arg)
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            ok = isinstance(value, str) and re.search(arg, value, flags) is not None
+        elif op == "$options":
+            ok = True
+        elif op == "$not":
+            ok = not _match_condition(value, arg)
+        elif op == "$type":
+            ok = _has_type(value, arg)
+        else:
+            raise ValueError(f"Unsupported query operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, filter_dict):
+    """Check whether a document matches a MongoDB filter."""
+    for key, condition in filter_dict.items():
+        if key == "$and":
+            if not all(matches(doc, f) for f in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, f) for f in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, f) for f in condition):
+                return False
+        elif not _match_condition(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def normalize_sort(key_or_list, direction=None):
+    """Normalize pymongo sort arguments to a list of (field, direction)."""
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(k, d) for k, d in key_or_list]
+
+
+def sort_documents(docs, spec):
+    """Sort documents in place by a normalized sort spec (stable, multi-key)."""
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda d: sort_key(get_path(d, field)), reverse=direction < 0)
+    return docs
+
+
+def normalize_projection(projection):
+    """Normalize a projection (dict or list of fields) to (mode, fields, include_id)."""
+    if not projection:
+        return None
+    if isinstance(projection, (list, tuple)):
+        projection = {f: 1 for f in projection}
+
+    include_id = bool(projection.get("_id", 1))
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if not fields:
+        return ("include", [], True) if include_id else ("exclude", [], False)
+    mode = "include" if any(bool(v) for v in fields.values()) else "exclude"
+    return mode, list(fields), include_id
+
+
+def project(doc, projection):
+    """Apply a normalized projection, always returning a new dict."""
+    if projection is None:
+        return dict(doc)
+
+    mode, fields, include_id = projection
+    if mode == "include":
+        result = {}
+        if include_id and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for field in fields:
+            if "." not in field:
+                if field in doc:
+                    result[field] = doc[field]
+                continue
+            value = get_path(doc, field)
+            if value is _MISSING:
+                continue
+            target = result
+            parts = field.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+        return result
+
+    result = dict(doc)
+    if not include_id:
+        result.pop("_id", None)
+    for field in fields:
+        result.pop(field, None)
+    return result
+
+
+def equality_value(condition):
+    """
+    Values an equality-style condition can take, for index lookups.
+
+    Returns:
+        list | None: Candidate values, or None if the condition is not an
+        equality or $in match
+    """
+    if isinstance(condition, dict) and condition and next(iter(condition)).startswith("$"):
+        if set(condition) == {"$eq"}:
+            return [condition["$eq"]]
+        if set(condition) == {"$in"}:
+            return list(condition["$in"])
+        return None
+    if isinstance(condition, (dict, list)):
+        return None
+    return [condition]
+
+
+def range_bounds(condition):
+    """
+    Index bounds for a range condition.
+
+    Returns:
+        tuple | None: (lower, lower_inclusive, upper, upper_inclusive); a bound is
+        None when open, or None if the condition has no range operators
+    """
+    if not isinstance(condition, dict):
+        return None
+    ops = set(condition) & {"$gt", "$gte", "$lt", "$lte"}
+    if not ops or set(condition) - {"$gt", "$gte", "$lt", "$lte"}:
+        return None
+    lower = upper = None
+    lower_inc = upper_inc = True
+    if "$gte" in condition:
+        lower = condition["$gte"]
+    if "$gt" in condition:
+        lower, lower_inc = condition["$gt"], False
+    if "$lte" in condition:
+        upper = condition["$lte"]
+    if "$lt" in condition:
+        upper, upper_inc = condition["$lt"], False
+    return lower, lower_inc, upper, upper_inc
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def apply_update(doc, update, inserting=False):
+    """
+    Apply an update document ($set, $inc, ...) to a document in place.
+
+    Args:
+        doc (dict): Document to modify
+        update (dict): Update operators
+        inserting (bool): True when the update creates the document (upsert),
+            so $setOnInsert applies
+    """
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in fields.items():
+            current = get_path(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                _set_path(doc, path, arg)
+            elif op == "$unset":
+                _unset_path(doc, path)
+            elif op == "$inc":
+                _set_path(doc, path, arg if current is _MISSING or current is None else current + arg)
+            elif op in ("$min", "$max"):
+                if current is _MISSING or current is None:
+                    _set_path(doc, path, arg)
+                else:
+                    a, b = sort_key(arg), sort_key(current)
+                    if (a < b) if op == "$min" else (a > b):
+                        _set_path(doc, path, arg)
+            elif op == "$push":
+                values = list(current) if isinstance(current, list) else []
+                values.extend(arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg])
+                _set_path(doc, path, values)
+            elif op == "$addToSet":
+                values = list(current) if isinstance(current, list) else []
+                for v in (arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]):
+                    if all(sort_key(v) != sort_key(x) for x in values):
+                        values.append(v)
+                _set_path(doc, path, values)
+            else:
+                raise ValueError(f"Unsupported update operator: {op}")
+    return doc
+
+
+def upsert_seed(filter_dict):
+    """Fields an upsert copies from its filter into the new document (equality conditions)."""
+    seed = {}
+    for key, condition in filter_dict.items():
+        if key == "$and":
+            for clause in condition:
+                seed.update(upsert_seed(clause))
+        elif not key.startswith("$"):
+            values = equality_value(condition)
+            if values is not None and len(values) == 1:
+                _set_path(seed, key, values[0])
+    return seed
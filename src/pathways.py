@@ -0,0 +1,337 @@
+"""
+Page pathways: ordered page paths per session, page-to-page transition
+counts and the most common paths per site and campaign.
+
+run_pathways_job() processes raw_events incrementally. Each run reads the
+events ingested since the high-water mark (ingested_at, _id) of the previous
+run, split into time partitions that are scanned in parallel threads. The
+partitions are merged in time order, appended to the open sessions' paths
+and folded into the precomputed tables with $inc upserts:
+
+    pathway_sessions     one document per recent session: its pages so far
+    pathway_transitions  {site, campaign, from_page, to_page, count}
+    pathway_paths        {site, campaign, path, pages, sessions, conversions}
+
+A session's path key is its first PATHWAYS_MAX_DEPTH pages. When a session
+grows, its count moves from the old path to the new one. Every row is also
+counted under site "*" and/or campaign "*", so /api/pathways answers any
+site/campaign combination with one indexed read.
+
+The mark is the time an event was written to raw_events (ingested_at,
+stamped by database.insert_events), not the time it was received
+(created_at): events replayed from the event log or retried by the event
+buffer long after their request are written after the mark and are still
+processed. Only events written at least PATHWAYS_LAG_S ago are read, so
+writes still in flight on other workers are not skipped. A run that fails
+after writing the tables but before moving the mark counts its events again
+on the next run; rebuild_pathways() starts over from scratch (and also reads
+events stored before ingested_at was stamped, by created_at).
+"""
+
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .config import PATHWAYS_WORKERS, PATHWAYS_MAX_DEPTH, PATHWAYS_LAG_S
+from .database import get_collection, expand_events
+from .event_schema import COMPACT_FIELDS, VERSION_FIELD
+import logging
+
+logger = logging.getLogger(__name__)
+
+SESSION_PATHS = "pathway_sessions"
+TRANSITIONS = "pathway_transitions"
+PATHS = "pathway_paths"
+# Job state: high-water mark and lease, one document per job
+JOBS = "jobs"
+JOB_ID = "pathways"
+
+ALL = "*"
+ENTRANCE = "(entrance)"
+PATH_SEPARATOR = " > "
+
+# Pages kept per session; transitions are counted past this, paths are not
+_MAX_SESSION_PAGES = 50
+# Sessions idle this long cannot receive new events and are dropped
+_SESSION_RETENTION = timedelta(days=2)
+# A run holds the job lease this long; a crashed run's lease expires
+_LEASE = timedelta(minutes=30)
+_BATCH_SIZE = 2000
+_WRITE_CHUNK = 1000
+
+_FIELDS = ("session_id", "timestamp", "ingested_at", "event_type", "current_page",
+           "sequence_step", "host", "utm_campaign")
+# Both layouts: v1 names and the compact (v2) names of the same fields
+_PROJECTION = {
+    VERSION_FIELD: 1,
+    **{field: 1 for field in _FIELDS},
+    **{COMPACT_FIELDS[field][0]: 1 for field in _FIELDS if field in COMPACT_FIELDS},
+}
+
+
+def _scopes(site, campaign):
+    return {(site, campaign), (site, ALL), (ALL, campaign), (ALL, ALL)}
+
+
+def _step(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _partition_filter(lower, upper, mark):
+    """ingested_at in [lower, upper), strictly after the (ingested_at, _id) mark."""
+    condition = {"ingested_at": {"$gte": lower, "$lt": upper}}
+    if mark is None or lower > mark[0]:
+        return condition
+    return {"$and": [condition, {"$or": [
+        {"ingested_at": {"$gt": mark[0]}},
+        {"ingested_at": mark[0], "_id": {"$gt": mark[1]}},
+    ]}]}
+
+
+def _legacy_filter(upper):
+    """Events stored before ingested_at was stamped, received before `upper`."""
+    return {"ingested_at": None, "created_at": {"$lt": upper}}
+
+
+def _scan_partition(filter_dict, sort_field="ingested_at"):
+    """
+    Read one partition and group its page hits by session.
+
+    Returns:
+        tuple: ({session_id: [(timestamp, step, page, converted, host, campaign)]},
+                last (ingested_at, _id) read, events read)
+    """
+    cursor = get_collection("raw_events").find(
+        filter_dict, _PROJECTION
+    ).sort([(sort_field, 1), ("_id", 1)]).batch_size(_BATCH_SIZE)
+
+    hits = defaultdict(list)
+    last = None
+    count = 0
+    batch = []
+
+    def fold(documents):
+        for event in expand_events(documents):
+            session_id = event.get("session_id")
+            timestamp = event.get("timestamp")
+            if not session_id or not isinstance(timestamp, datetime):
+                continue
+            page = event.get("current_page") if event.get("event_type") == "page_view" else None
+            converted = event.get("event_type") == "conversion"
+            if page or converted:
+                hits[session_id].append((timestamp, _step(event.get("sequence_step")), page, converted,
+                                         event.get("host"), event.get("utm_campaign")))
+
+    for doc in cursor:
+        batch.append(doc)
+        if doc.get("ingested_at"):
+            last = (doc["ingested_at"], doc["_id"])
+        count += 1
+        if len(batch) >= _BATCH_SIZE:
+            fold(batch)
+            batch = []
+    fold(batch)
+    return hits, last, count
+
+
+def _partitions(lower, upper, parts):
+    span = (upper - lower) / parts
+    bounds = [lower + span * i for i in range(parts)] + [upper]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+def _path_key(pages):
+    return PATH_SEPARATOR.join(pages[:PATHWAYS_MAX_DEPTH])
+
+
+def _extend_sessions(hits, states, transitions, path_deltas):
+    """
+    Append new hits (in time order) to the sessions' stored paths.
+
+    Updates `states` in place and accumulates transition counts and path
+    count moves.
+    """
+    for session_id, session_hits in hits.items():
+        session_hits.sort(key=lambda hit: (hit[0], hit[1]))
+        state = states.get(session_id)
+        if state is None:
+            first = next((hit for hit in session_hits if hit[4] or hit[5]), session_hits[0])
+            state = states[session_id] = {
+                "_id": session_id, "site": first[4], "campaign": first[5],
+                "pages": [], "last_page": None, "converted": False,
+            }
+        old_key = _path_key(state["pages"]) if state["pages"] else None
+        old_converted = state["converted"]
+
+        for timestamp, _, page, converted, _, _ in session_hits:
+            state["last_at"] = max(state.get("last_at") or timestamp, timestamp)
+            state["converted"] = state["converted"] or converted
+            if not page or page == state["last_page"]:
+                continue
+            for scope in _scopes(state["site"], state["campaign"]):
+                transitions[scope + (state["last_page"] or ENTRANCE, page)] += 1
+            if len(state["pages"]) < _MAX_SESSION_PAGES:
+                state["pages"].append(page)
+            state["last_page"] = page
+
+        new_key = _path_key(state["pages"]) if state["pages"] else None
+        if (old_key, old_converted) == (new_key, state["converted"]):
+            continue
+        for scope in _scopes(state["site"], state["campaign"]):
+            if old_key is not None:
+                deltas = path_deltas[scope + (old_key,)]
+                deltas[0] -= 1
+                deltas[1] -= old_converted
+            if new_key is not None:
+                deltas = path_deltas[scope + (new_key,)]
+                deltas[0] += 1
+                deltas[1] += state["converted"]
+
+
+def _bulk(collection, operations):
+    for i in range(0, len(operations), _WRITE_CHUNK):
+        collection.bulk_write(operations[i:i + _WRITE_CHUNK], ordered=False)
+
+
+def _acquire(jobs, now):
+    """Take the job lease; returns the job document, or None if another run holds it."""
+    try:
+        return jobs.find_one_and_update(
+            {"_id": JOB_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_until": now + _LEASE}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None
+
+
+def run_pathways_job(workers=None, until=None):
+    """
+    Process the events ingested since the last run.
+
+    Args:
+        workers (int): Parallel partitions (default: PATHWAYS_WORKERS)
+        until (datetime): Process events written before this (default: now - PATHWAYS_LAG_S)
+
+    Returns:
+        dict: {"events", "sessions", "partitions", "duration_ms"}, or
+        {"skipped": True} if another run holds the lease
+    """
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    until = until or now - timedelta(seconds=PATHWAYS_LAG_S)
+    jobs = get_collection(JOBS)
+    job = _acquire(jobs, now)
+    if job is None:
+        logger.info("Pathways job already running")
+        return {"skipped": True}
+
+    try:
+        raw_events = get_collection("raw_events")
+        mark = (job["mark_ingested_at"], job["mark_id"]) if job.get("mark_ingested_at") else None
+        if mark is not None:
+            lower = mark[0]
+        else:
+            first = raw_events.find_one({"ingested_at": {"$ne": None}}, {"ingested_at": 1},
+                                        sort=[("ingested_at", 1)])
+            lower = first["ingested_at"] if first else until
+        partitions = _partitions(lower, until, max(1, workers or PATHWAYS_WORKERS))
+        scans = [(_partition_filter(*bounds, mark),) for bounds in partitions]
+        if mark is None:
+            scans.append((_legacy_filter(until), "created_at"))
+
+        with ThreadPoolExecutor(max_workers=max(1, len(scans))) as pool:
+            results = list(pool.map(lambda scan: _scan_partition(*scan), scans))
+
+        hits = defaultdict(list)
+        for partition_hits, last, _ in results:
+            for session_id, session_hits in partition_hits.items():
+                hits[session_id].extend(session_hits)
+            mark = max(filter(None, (mark, last)), default=None)
+        events = sum(count for _, _, count in results)
+        if mark is None:
+            # Nothing written since ingested_at was stamped: start after `until`
+            # so the pre-ingested_at events are not read again
+            mark = (until, ObjectId("0" * 24))
+
+        session_paths = get_collection(SESSION_PATHS)
+        states = {}
+        session_ids = list(hits)
+        for i in range(0, len(session_ids), _WRITE_CHUNK):
+            for state in session_paths.find({"_id": {"$in": session_ids[i:i + _WRITE_CHUNK]}}):
+                states[state["_id"]] = state
+
+        transitions = defaultdict(int)
+        path_deltas = defaultdict(lambda: [0, 0])
+        _extend_sessions(hits, states, transitions, path_deltas)
+
+        _bulk(session_paths, [ReplaceOne({"_id": s["_id"]}, s, upsert=True) for s in states.values()])
+        _bulk(get_collection(TRANSITIONS), [
+            UpdateOne({"site": site, "campaign": campaign, "from_page": from_page, "to_page": to_page},
+                      {"$inc": {"count": count}}, upsert=True)
+            for (site, campaign, from_page, to_page), count in transitions.items()
+        ])
+        paths = get_collection(PATHS)
+        _bulk(paths, [
+            UpdateOne({"site": site, "campaign": campaign, "path": path},
+                      {"$inc": {"sessions": sessions, "conversions": conversions},
+                       "$setOnInsert": {"pages": path.split(PATH_SEPARATOR)}},
+                      upsert=True)
+            for (site, campaign, path), (sessions, conversions) in path_deltas.items()
+            if sessions or conversions
+        ])
+        paths.delete_many({"sessions": {"$lte": 0}})
+        session_paths.delete_many({"last_at": {"$lt": now - _SESSION_RETENTION}})
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        state = {"last_run": now, "last_events": events, "last_duration_ms": duration_ms, "lease_until": None}
+        if mark is not None:
+            state.update(mark_ingested_at=mark[0], mark_id=mark[1])
+        jobs.update_one({"_id": JOB_ID}, {"$set": state})
+    except Exception:
+        jobs.update_one({"_id": JOB_ID}, {"$set": {"lease_until": None}})
+        raise
+
+    logger.info(f"Pathways: {events} events, {len(hits)} sessions in {duration_ms} ms")
+    return {"events": events, "sessions": len(hits), "partitions": len(partitions), "duration_ms": duration_ms}
+
+
+def rebuild_pathways(workers=None):
+    """Drop the pathway tables and the high-water mark, then process every event again."""
+    for name in (SESSION_PATHS, TRANSITIONS, PATHS):
+        get_collection(name).delete_many({})
+    get_collection(JOBS).delete_many({"_id": JOB_ID})
+    return run_pathways_job(workers=workers)
+
+
+def get_pathways(site=None, campaign=None, limit=20):
+    """
+    Top paths and transitions for a site and campaign (None: all of them).
+
+    Returns:
+        dict: {"paths": [...], "transitions": [...], "updated_at", "through"}
+    """
+    scope = {"site": site or ALL, "campaign": campaign or ALL}
+    paths = get_collection(PATHS).find(
+        scope, {"_id": 0, "pages": 1, "sessions": 1, "conversions": 1}
+    ).sort([("sessions", -1)]).limit(limit)
+    transitions = get_collection(TRANSITIONS).find(
+        scope, {"_id": 0, "from_page": 1, "to_page": 1, "count": 1}
+    ).sort([("count", -1)]).limit(limit)
+    job = get_collection(JOBS).find_one({"_id": JOB_ID}) or {}
+    return {
+        "paths": [
+            {**path, "conversion_rate": path["conversions"] / path["sessions"] if path["sessions"] else 0}
+            for path in paths
+        ],
+        "transitions": list(transitions),
+        "updated_at": job.get("last_run"),
+        "through": job.get("mark_ingested_at"),
+    }
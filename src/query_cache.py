@@ -0,0 +1,121 @@
+"""
+In-memory cache of query results, bounded by entries, bytes and age.
+
+Keys include the data version of the collection the query reads (see
+src/data_version.py). The ingest path bumps that version after every write,
+so a cached result is served until new events actually arrive and is then
+never read again; it ages out of the LRU or expires after `ttl`. The TTL
+only bounds how long a result computed from a backend that later changes
+(e.g. the mock fallback) can be served.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from bson import json_util
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def query_key(*parts):
+    """Stable key for query arguments (filters may hold dates and ObjectIds)."""
+    return json_util.dumps(parts, sort_keys=True)
+
+
+def result_size(value):
+    """Approximate memory cost of a result: the length of its JSON form."""
+    return len(json_util.dumps(value))
+
+
+class QueryCache:
+    """LRU of query results with a TTL and a total size limit."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300.0, clock=time.monotonic):
+        """
+        Args:
+            max_entries (int): Maximum number of results (0 disables the cache)
+            max_bytes (int): Maximum total result_size() of the cached results
+            ttl (float): Seconds a result is served at most
+            clock (callable): Monotonic time source in seconds
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "oversized": 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (True, value) on a hit, (False, None) on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[2] >= self.ttl:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return True, entry[0]
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = result_size(value)
+        with self._lock:
+            if size > self.max_bytes:
+                self._stats["oversized"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, self.clock())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def discard(self, keys):
+        """Drop the entries of keys whose results are known to be stale."""
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def _remove(self, key):
+        """Drop an entry (called with the lock held)."""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
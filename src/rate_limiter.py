@@ -1,73 +1,241 @@
 """
-Rate limiting module for tracking endpoint.
-Limits requests to 20 per second per IP address.
+Rate limiting per client IP with token buckets.
+
+Each tracked key holds two floats (tokens left and the time they were
+counted), refilled lazily on the next request, so a check is O(1) and
+memory per key is constant. Keys are spread over independently locked
+shards kept in LRU order: a bucket that has been idle long enough to refill
+completely is indistinguishable from a new one and is dropped, and each
+shard has a hard cap on the number of keys it tracks.
+
+Routes have separate limits (see LIMITS): /track and /track/batch, the
+/api/* endpoints, and /api/analysis/ask, which calls the LLM.
+
+With RATE_LIMIT_BACKEND=shared the buckets and the allowed/limited counters
+live in shared memory (src/shared_memory.py), so all gunicorn workers on a
+host enforce one limit instead of one each.
 """
 
-from collections import defaultdict, deque
-from datetime import datetime, timedelta
+import threading
 import time
+from collections import OrderedDict
+from pathlib import Path
+from flask import jsonify
+from .config import (
+    RATE_LIMIT_TRACK_PER_S,
+    RATE_LIMIT_TRACK_BURST,
+    RATE_LIMIT_API_PER_S,
+    RATE_LIMIT_API_BURST,
+    RATE_LIMIT_ASK_PER_S,
+    RATE_LIMIT_ASK_BURST,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_SHARED_SLOTS,
+    SHARED_MEMORY_DIR,
+    SHARED_MEMORY_NAMESPACE,
+)
+from .shared_memory import (
+    LocalCounters,
+    SharedCounters,
+    SharedTokenBucketLimiter,
+    default_directory,
+    is_supported,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # key -> [tokens, updated_at], least recently used first
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by client (e.g. IP address).
+
+    A bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second; each request takes `cost` tokens (one by default). A request
+    costing more than the burst is let through when the bucket is full and
+    leaves it in debt, so later requests wait until the whole cost has
+    refilled.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000, shards=16, clock=time.monotonic):
+        """
+        Args:
+            rate (float): Tokens added per second (sustained requests per second)
+            burst (int): Bucket size (requests allowed at once)
+            max_keys (int): Maximum number of tracked keys
+            shards (int): Number of independently locked shards
+            clock (callable): Monotonic time source in seconds
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self._shards = [_Shard() for _ in range(shards)]
+        self._max_per_shard = max(1, max_keys // shards)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _evict(self, shard, now):
+        """Drop idle buckets and enforce the key cap (called with the shard lock held)."""
+        buckets = shard.buckets
+        while buckets:
+            tokens, updated = next(iter(buckets.values()))
+            # A full bucket is indistinguishable from a new one
+            if len(buckets) <= self._max_per_shard and tokens + (now - updated) * self.rate < self.burst:
+                break
+            buckets.popitem(last=False)
+
+    def hit(self, key, cost=1):
+        """
+        Take tokens for one request.
+
+        Returns:
+            tuple: (limited: bool, remaining: int, reset_after: float seconds
+            until the bucket is full again, or until the request would be
+            allowed when limited)
+        """
+        now = self.clock()
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [self.burst, now]
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            limited = bucket[0] < min(cost, self.burst)
+            if limited:
+                reset_after = (min(cost, self.burst) - bucket[0]) / self.rate
+            else:
+                bucket[0] -= cost
+                reset_after = (self.burst - bucket[0]) / self.rate
+            remaining = max(0, int(bucket[0]))
+            self._evict(shard, now)
+        return limited, remaining, reset_after
+
+    def peek(self, key):
+        """Tokens currently available to a key, without taking one."""
+        now = self.clock()
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                return self.burst
+            return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def __len__(self):
+        return sum(len(shard.buckets) for shard in self._shards)
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.buckets.clear()
 
-# Store request timestamps per IP
-_ip_requests = defaultdict(deque)
-# Lock for thread safety (simple implementation)
-_request_lock = {}
 
+_ROUTE_LIMITS = {
+    "track": (RATE_LIMIT_TRACK_PER_S, RATE_LIMIT_TRACK_BURST),
+    "api": (RATE_LIMIT_API_PER_S, RATE_LIMIT_API_BURST),
+    "ask": (RATE_LIMIT_ASK_PER_S, RATE_LIMIT_ASK_BURST),
+}
+_COUNTER_NAMES = [f"{route}_{outcome}" for route in _ROUTE_LIMITS for outcome in ("allowed", "limited")]
 
-def is_rate_limited(ip_address, max_requests=20, time_window=1):
+
+def _shared_path(name):
+    directory = Path(SHARED_MEMORY_DIR) if SHARED_MEMORY_DIR else default_directory()
+    return directory / f"{SHARED_MEMORY_NAMESPACE}-{name}.bin"
+
+
+def _create_backend():
+    """Limiters per route group and the request counters, for the configured backend."""
+    if RATE_LIMIT_BACKEND == "shared":
+        if is_supported():
+            try:
+                limits = {
+                    route: SharedTokenBucketLimiter(rate, burst, _shared_path(f"ratelimit-{route}"),
+                                                    slots=RATE_LIMIT_SHARED_SLOTS)
+                    for route, (rate, burst) in _ROUTE_LIMITS.items()
+                }
+                return limits, SharedCounters(_shared_path("ratelimit-counters"), _COUNTER_NAMES)
+            except OSError as e:
+                logger.warning(f"Shared-memory rate limiter unavailable, limiting per process: {e}")
+        else:
+            logger.warning("Shared-memory rate limiter needs fcntl; limiting per process")
+    limits = {
+        route: TokenBucketLimiter(rate, burst, RATE_LIMIT_MAX_KEYS)
+        for route, (rate, burst) in _ROUTE_LIMITS.items()
+    }
+    return limits, LocalCounters(_COUNTER_NAMES)
+
+
+# Route group -> limiter, and allowed/limited request counters per route group
+LIMITS, _counters = _create_backend()
+
+
+def is_rate_limited(ip_address, route="track", cost=1):
     """
-    Check if an IP address has exceeded the rate limit.
-    
+    Check if an IP address has exceeded the rate limit of a route group.
+
     Args:
         ip_address (str): Client IP address
-        max_requests (int): Maximum requests allowed (default: 20)
-        time_window (int): Time window in seconds (default: 1 second)
-        
+        route (str): Route group in LIMITS ("track", "api" or "ask")
+        cost (int): Tokens the request takes (e.g. one per event of a batch)
+
     Returns:
-        tuple: (is_limited: bool, remaining_requests: int, reset_time: float)
+        tuple: (is_limited: bool, remaining_requests: int, reset_time: float epoch seconds)
     """
-    now = time.time()
-    
-    # Get request history for this IP
-    requests = _ip_requests[ip_address]
-    
-    # Remove requests older than the time window
-    cutoff_time = now - time_window
-    while requests and requests[0] < cutoff_time:
-        requests.popleft()
-    
-    # Check if limit exceeded
-    if len(requests) >= max_requests:
-        # Calculate when the oldest request will expire
-        oldest_request = requests[0] if requests else now
-        reset_time = oldest_request + time_window
-        return True, 0, reset_time
-    
-    # Add current request
-    requests.append(now)
-    
-    # Calculate remaining requests
-    remaining = max_requests - len(requests)
-    reset_time = now + time_window
-    
-    return False, remaining, reset_time
-
-
-def get_rate_limit_info(ip_address, max_requests=20):
+    limited, remaining, reset_after = LIMITS[route].hit(ip_address, cost)
+    _counters.add(f"{route}_{'limited' if limited else 'allowed'}")
+    return limited, remaining, time.time() + reset_after
+
+
+def get_rate_limit_stats():
+    """Allowed and rejected requests per route group (all workers with the shared backend)."""
+    counts = _counters.snapshot()
+    return {
+        "backend": "shared" if isinstance(_counters, SharedCounters) else "memory",
+        "routes": {
+            route: {"allowed": counts[f"{route}_allowed"], "limited": counts[f"{route}_limited"]}
+            for route in _ROUTE_LIMITS
+        }
+    }
+
+
+def get_rate_limit_info(ip_address, route="track"):
     """Get rate limit information for an IP address."""
-    now = time.time()
-    requests = _ip_requests[ip_address]
-    
-    # Remove old requests
-    cutoff_time = now - 1  # 1 second window
-    while requests and requests[0] < cutoff_time:
-        requests.popleft()
-    
-    remaining = max(0, max_requests - len(requests))
-    reset_time = now + 1
-    
+    limiter = LIMITS[route]
+    tokens = limiter.peek(ip_address)
     return {
-        "remaining": remaining,
-        "limit": max_requests,
-        "reset_time": reset_time
+        "remaining": int(tokens),
+        "limit": int(limiter.burst),
+        "reset_time": time.time() + (limiter.burst - tokens) / limiter.rate
     }
 
+
+def rate_limit_exceeded(ip_address, route):
+    """
+    Flask helper for before_request hooks.
+
+    Returns:
+        tuple | None: A 429 JSON response if the IP is over the route's limit, else None
+    """
+    is_limited, _, reset_time = is_rate_limited(ip_address, route)
+    if not is_limited:
+        return None
+    retry_after = max(0.0, reset_time - time.time())
+    response = jsonify({
+        "success": False,
+        "error": "Rate limit exceeded",
+        "retry_after": reset_time
+    })
+    response.headers["Retry-After"] = str(int(retry_after) + 1)
+    return response, 429
@@ -0,0 +1,212 @@
+"""
+Pre-aggregated hourly and daily event counts.
+
+Every batch written by the ingest path is folded into one $inc upsert per
+(bucket, site, utm_source, utm_medium, utm_campaign, platform_detected,
+event_type) and applied with a single unordered bulk write per collection.
+Reports read a few hundred rollup documents instead of scanning raw_events.
+backfill_rollups() rebuilds the rollups of a past period from raw_events.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import InsertOne, UpdateOne
+from .database import get_collection, lookup_values
+import logging
+
+logger = logging.getLogger(__name__)
+
+HOURLY = "rollups_hourly"
+DAILY = "rollups_daily"
+
+# Rollup document key, besides the time bucket
+DIMENSIONS = ("site", "utm_source", "utm_medium", "utm_campaign", "platform_detected", "event_type")
+COUNTERS = ("events", "conversions", "revenue")
+
+
+def _hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _dimensions(event):
+    """Rollup key fields of an event (site is the host the event was recorded on)."""
+    return (event.get("host"),) + tuple(event.get(field) for field in DIMENSIONS[1:])
+
+
+def _revenue(event):
+    value = event.get("conversion_value")
+    if event.get("event_type") != "conversion" or isinstance(value, bool):
+        return 0
+    return value if isinstance(value, (int, float)) else 0
+
+
+def build_rollup_updates(events):
+    """
+    Fold a batch of events into one $inc upsert per rollup document.
+
+    Args:
+        events (list): Event documents
+
+    Returns:
+        dict: {collection name: [UpdateOne, ...]}
+    """
+    totals = {HOURLY: defaultdict(lambda: [0, 0, 0]), DAILY: defaultdict(lambda: [0, 0, 0])}
+    for event in events:
+        timestamp = event.get("timestamp")
+        if not isinstance(timestamp, datetime):
+            continue
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.replace(tzinfo=None) - timestamp.utcoffset()
+        dimensions = _dimensions(event)
+        conversion = event.get("event_type") == "conversion"
+        revenue = _revenue(event)
+        for name, bucket in ((HOURLY, _hour(timestamp)), (DAILY, _day(timestamp))):
+            counters = totals[name][(bucket,) + dimensions]
+            counters[0] += 1
+            counters[1] += conversion
+            counters[2] += revenue
+
+    updates = {}
+    for name, groups in totals.items():
+        updates[name] = [
+            UpdateOne(
+                {"bucket": key[0], **dict(zip(DIMENSIONS, key[1:]))},
+                {"$inc": dict(zip(COUNTERS, counters))},
+                upsert=True
+            )
+            for key, counters in groups.items()
+        ]
+    return updates
+
+
+def update_rollups(events):
+    """
+    Add a batch of newly stored events to the hourly and daily rollups.
+
+    Args:
+        events (list): Event documents that were just inserted
+    """
+    for name, updates in build_rollup_updates(events).items():
+        if updates:
+            get_collection(name).bulk_write(updates, ordered=False)
+
+
+def _rollup_pipeline(start, end, match, group_by):
+    return [
+        {"$match": {"bucket": {"$gte": start, "$lt": end}, **(match or {})}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in group_by},
+            **{counter: {"$sum": f"${counter}"} for counter in COUNTERS}
+        }}
+    ]
+
+
+def query_rollups(start, end, group_by, match=None):
+    """
+    Sum rollup counters over a time range.
+
+    Whole days are read from the daily rollups; the partial days at either
+    end from the hourly ones. `start` is rounded down to the hour.
+
+    Args:
+        start (datetime): Start of the range (UTC)
+        end (datetime): End of the range, exclusive (UTC)
+        group_by (list): Dimension fields to group by
+        match (dict): Extra equality filters on dimension fields
+
+    Returns:
+        list: Dicts with the group_by fields and events, conversions, revenue
+    """
+    start = _hour(start)
+    first_day = _day(start) if start == _day(start) else _day(start) + timedelta(days=1)
+    last_day = _day(end)
+
+    ranges = []
+    if first_day < last_day:
+        ranges += [(HOURLY, start, first_day), (DAILY, first_day, last_day), (HOURLY, last_day, end)]
+    else:
+        ranges.append((HOURLY, start, end))
+
+    totals = {}
+    for name, range_start, range_end in ranges:
+        if range_start >= range_end:
+            continue
+        pipeline = _rollup_pipeline(range_start, range_end, match, group_by)
+        for row in get_collection(name).aggregate(pipeline):
+            key = tuple(row["_id"].get(field) for field in group_by)
+            result = totals.setdefault(key, {**dict(zip(group_by, key)), "events": 0, "conversions": 0, "revenue": 0})
+            for counter in COUNTERS:
+                result[counter] += row[counter] or 0
+    return list(totals.values())
+
+
+def backfill_rollups(start, end):
+    """
+    Rebuild the rollups for [start, end) from raw_events, one day at a time.
+
+    Existing rollup documents in the range are replaced. Run it for periods
+    that are no longer receiving events (live ingest keeps the current hour).
+
+    Args:
+        start (datetime): First day to rebuild (rounded down to midnight UTC)
+        end (datetime): End of the range, exclusive (rounded up to midnight UTC)
+
+    Returns:
+        int: Number of raw events rolled up
+    """
+    day = _day(start)
+    end = _day(end) if end == _day(end) else _day(end) + timedelta(days=1)
+    conversion = {"$eq": ["$event_type", "conversion"]}
+    total = 0
+
+    while day < end:
+        next_day = day + timedelta(days=1)
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": day, "$lt": next_day}}},
+            {"$group": {
+                "_id": {
+                    "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": "hour"}},
+                    # Compact (v2) events store the interned host id in "h"
+                    "site": {"$ifNull": ["$host", "$h"]},
+                    **{field: f"${field}" for field in DIMENSIONS[1:]}
+                },
+                "events": {"$sum": 1},
+                "conversions": {"$sum": {"$cond": [conversion, 1, 0]}},
+                "revenue": {"$sum": {"$cond": [conversion, "$conversion_value", 0]}}
+            }}
+        ]
+        rows = list(get_collection("raw_events").aggregate(pipeline))
+        host_ids = {row["_id"]["site"] for row in rows if isinstance(row["_id"].get("site"), int)}
+        hosts = lookup_values("host", host_ids) if host_ids else {}
+
+        hourly = defaultdict(lambda: [0, 0, 0])
+        daily = defaultdict(lambda: [0, 0, 0])
+        for row in rows:
+            site = row["_id"].get("site")
+            key = (hosts.get(site, site),) + tuple(row["_id"].get(field) for field in DIMENSIONS[1:])
+            for counters in (hourly[(row["_id"]["bucket"],) + key], daily[key]):
+                for i, counter in enumerate(COUNTERS):
+                    counters[i] += row[counter]
+            total += row["events"]
+
+        hourly_collection = get_collection(HOURLY)
+        daily_collection = get_collection(DAILY)
+        hourly_collection.delete_many({"bucket": {"$gte": day, "$lt": next_day}})
+        daily_collection.delete_many({"bucket": day})
+        if hourly:
+            hourly_collection.bulk_write([
+                InsertOne({"bucket": key[0], **dict(zip(DIMENSIONS, key[1:])), **dict(zip(COUNTERS, counters))})
+                for key, counters in hourly.items()
+            ], ordered=False)
+            daily_collection.bulk_write([
+                InsertOne({"bucket": day, **dict(zip(DIMENSIONS, key)), **dict(zip(COUNTERS, counters))})
+                for key, counters in daily.items()
+            ], ordered=False)
+        logger.info(f"Rolled up {day.date()}: {len(hourly)} hourly documents")
+        day = next_day
+
+    return total
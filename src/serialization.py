@@ -0,0 +1,75 @@
+"""
+JSON serialization of documents read from MongoDB.
+
+to_json() converts the BSON types the app stores (ObjectId, datetime, date,
+nested documents and arrays) in a single pass, dispatching on the exact
+type so plain strings and numbers cost one dict lookup. dumps() and
+json_response() encode a payload with orjson when it is installed, which
+also handles datetimes natively, and fall back to the standard json module.
+"""
+
+import json
+from datetime import date, datetime
+from bson import ObjectId
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+
+def _convert_dict(value):
+    return {key: _CONVERTERS.get(type(item), _same)(item) for key, item in value.items()}
+
+
+def _convert_list(value):
+    return [_CONVERTERS.get(type(item), _same)(item) for item in value]
+
+
+def _same(value):
+    return value
+
+
+# Exact type -> converter; types not listed are already JSON-compatible
+_CONVERTERS = {
+    ObjectId: str,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    dict: _convert_dict,
+    list: _convert_list,
+    tuple: _convert_list,
+}
+
+
+def to_json(value):
+    """Copy of a document (or list of documents) with BSON types as JSON-compatible values."""
+    return _CONVERTERS.get(type(value), _same)(value)
+
+
+def _default(value):
+    """Fallback for types the encoder does not know (ObjectId, subclasses)."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """
+    Encode a payload as compact JSON.
+
+    Returns:
+        bytes: UTF-8 JSON
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_response(payload, status=200):
+    """Flask JSON response encoded with dumps()."""
+    return Response(dumps(payload), status=status, mimetype="application/json")
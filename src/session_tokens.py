@@ -0,0 +1,95 @@
+"""
+Stateless session tokens.
+
+A token is the session ID, the time of the session's last activity and an
+HMAC over both:
+
+    sess_1a2b3c4d5e.<last activity, base-36 epoch seconds>.<signature>
+
+Any worker holding the secret can check a token and hand back a refreshed
+one, so sessions need no shared state and survive restarts. Events keep
+storing the plain session ID.
+"""
+
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SIGNATURE_BYTES = 16
+# Tolerated clock difference between the workers that issue and check a token
+_CLOCK_SKEW_S = 60
+
+
+def _to_base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        number, rest = divmod(number, 36)
+        encoded = digits[rest] + encoded
+        if not number:
+            return encoded
+
+
+class SessionTokenSigner:
+    """Issues and checks signed session tokens."""
+
+    def __init__(self, secret, timeout_s, clock=time.time):
+        """
+        Args:
+            secret (str | bytes): HMAC key; every worker must use the same one.
+                Empty: a random key for this process only.
+            timeout_s (float): Inactivity after which a session ends
+            clock (callable): Wall-clock time in epoch seconds
+        """
+        if not secret:
+            logger.warning("No SESSION_SECRET or SECRET_KEY set; session tokens are only valid in this process")
+            secret = secrets.token_bytes(32)
+        self._key = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.timeout_s = timeout_s
+        self.clock = clock
+
+    def _sign(self, payload):
+        digest = hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:_SIGNATURE_BYTES]).rstrip(b"=").decode("ascii")
+
+    def issue(self, session_id, last_activity=None):
+        """
+        Token for a session, active at `last_activity` (default: now).
+
+        Returns:
+            str: Signed token
+        """
+        if last_activity is None:
+            last_activity = self.clock()
+        payload = f"{session_id}.{_to_base36(int(last_activity))}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """
+        Check a token.
+
+        Returns:
+            str | None: The session ID if the signature is valid and the session
+            has not timed out, else None
+        """
+        if not isinstance(token, str) or token.count(".") != 2:
+            return None
+        payload, _, signature = token.rpartition(".")
+        try:
+            if not hmac.compare_digest(signature.encode("ascii"), self._sign(payload).encode("ascii")):
+                return None
+        except UnicodeEncodeError:
+            return None
+        session_id, _, last_activity = payload.partition(".")
+        try:
+            idle = self.clock() - int(last_activity, 36)
+        except ValueError:
+            return None
+        if not -_CLOCK_SKEW_S <= idle < self.timeout_s:
+            return None
+        return session_id
@@ -0,0 +1,270 @@
+"""
+One summary document per session, maintained at ingest.
+
+Every batch written by the ingest path is folded into one upsert per
+session ID and applied with a single unordered bulk write:
+
+    {
+        "_id": "sess_1a2b3c4d5e",
+        "first_seen": datetime, "last_seen": datetime,
+        "entry": {"at": datetime, "landing_page": "/pricing", "host": ...,
+                  "utm_source": ..., "gclid": ..., ...},
+        "events": 12, "page_views": 5, "clicks": 6,
+        "conversions": 1, "conversion_value": 49.0,
+        "max_sequence_step": 5
+    }
+
+Counters are $inc'd, first/last seen are $min/$max'd, and "entry" (the
+session's earliest event) is $min'd as a whole: embedded documents compare
+field by field and "at" comes first, so the earliest event wins even when
+batches of one session are written out of order by different workers.
+
+Pages per session, session duration and landing page -> conversion are read
+from here instead of grouping raw_events by session_id.
+rebuild_sessions() recomputes the sessions seen in a past period.
+"""
+
+from datetime import datetime
+from pymongo import ReplaceOne, UpdateOne
+from .database import get_collection, expand_events
+import logging
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = "sessions"
+
+# Fields of a session's first event kept in its "entry" document
+ENTRY_FIELDS = (
+    "host", "referrer_url", "platform_detected",
+    "utm_source", "utm_medium", "utm_campaign", "utm_content", "utm_term", "campaign_id",
+    "gclid", "fbclid", "ttclid", "msclkid",
+)
+COUNTERS = ("events", "page_views", "clicks", "conversions", "conversion_value")
+
+# Session IDs per query when rebuilding
+_REBUILD_CHUNK = 500
+
+
+def _utc(timestamp):
+    if timestamp.tzinfo is not None:
+        return timestamp.replace(tzinfo=None) - timestamp.utcoffset()
+    return timestamp
+
+
+def _sequence_step(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _conversion_value(event):
+    value = event.get("conversion_value")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return value
+
+
+def _entry(event, timestamp):
+    entry = {"at": timestamp, "landing_page": event.get("current_page")}
+    entry.update((field, event[field]) for field in ENTRY_FIELDS if event.get(field) is not None)
+    return entry
+
+
+def _fold(events):
+    """Per-session totals of a list of events: {session_id: summary}."""
+    sessions = {}
+    for event in events:
+        session_id = event.get("session_id")
+        timestamp = event.get("timestamp")
+        if not session_id or not isinstance(timestamp, datetime):
+            continue
+        timestamp = _utc(timestamp)
+        summary = sessions.get(session_id)
+        if summary is None:
+            summary = sessions[session_id] = {
+                "first_seen": timestamp, "last_seen": timestamp, "entry": _entry(event, timestamp),
+                "max_sequence_step": None, **dict.fromkeys(COUNTERS, 0)
+            }
+        elif timestamp < summary["first_seen"]:
+            summary["first_seen"] = timestamp
+            summary["entry"] = _entry(event, timestamp)
+        summary["last_seen"] = max(summary["last_seen"], timestamp)
+
+        event_type = event.get("event_type")
+        summary["events"] += 1
+        summary["page_views"] += event_type == "page_view"
+        summary["clicks"] += event_type == "click"
+        if event_type == "conversion":
+            summary["conversions"] += 1
+            summary["conversion_value"] += _conversion_value(event)
+        step = _sequence_step(event.get("sequence_step"))
+        if step is not None and (summary["max_sequence_step"] is None or step > summary["max_sequence_step"]):
+            summary["max_sequence_step"] = step
+    return sessions
+
+
+def build_session_updates(events):
+    """
+    Fold a batch of events into one upsert per session.
+
+    Args:
+        events (list): Event documents (events without a session_id or
+            timestamp are skipped)
+
+    Returns:
+        list: UpdateOne operations for the sessions collection
+    """
+    updates = []
+    for session_id, summary in _fold(events).items():
+        update = {
+            "$min": {"first_seen": summary["first_seen"], "entry": summary["entry"]},
+            "$max": {"last_seen": summary["last_seen"]},
+            "$inc": {counter: summary[counter] for counter in COUNTERS},
+        }
+        if summary["max_sequence_step"] is not None:
+            update["$max"]["max_sequence_step"] = summary["max_sequence_step"]
+        updates.append(UpdateOne({"_id": session_id}, update, upsert=True))
+    return updates
+
+
+def update_sessions(events):
+    """
+    Add a batch of newly stored events to their sessions.
+
+    Args:
+        events (list): Event documents that were just inserted
+    """
+    updates = build_session_updates(events)
+    if updates:
+        get_collection(SESSIONS).bulk_write(updates, ordered=False)
+
+
+def get_session(session_id):
+    """
+    Summary of one session.
+
+    Returns:
+        dict | None: The session document, with duration_s added
+    """
+    session = get_collection(SESSIONS).find_one({"_id": session_id})
+    if session:
+        session["duration_s"] = (session["last_seen"] - session["first_seen"]).total_seconds()
+    return session
+
+
+def _range_match(start, end, match):
+    return {"first_seen": {"$gte": start, "$lt": end}, **(match or {})}
+
+
+def _session_totals():
+    converted = {"$gt": ["$conversions", 0]}
+    return {
+        "sessions": {"$sum": 1},
+        "page_views": {"$sum": "$page_views"},
+        "clicks": {"$sum": "$clicks"},
+        "converted_sessions": {"$sum": {"$cond": [converted, 1, 0]}},
+        "bounces": {"$sum": {"$cond": [{"$lte": ["$events", 1]}, 1, 0]}},
+        "conversion_value": {"$sum": "$conversion_value"},
+        "avg_duration_ms": {"$avg": {"$subtract": ["$last_seen", "$first_seen"]}},
+    }
+
+
+def _rates(row):
+    sessions = row["sessions"]
+    return {
+        "sessions": sessions,
+        "page_views": row["page_views"],
+        "clicks": row["clicks"],
+        "converted_sessions": row["converted_sessions"],
+        "conversion_value": row["conversion_value"],
+        "pages_per_session": row["page_views"] / sessions if sessions else 0,
+        "avg_duration_s": (row["avg_duration_ms"] or 0) / 1000,
+        "bounce_rate": row["bounces"] / sessions if sessions else 0,
+        "conversion_rate": row["converted_sessions"] / sessions if sessions else 0,
+    }
+
+
+def session_summary(start, end, match=None):
+    """
+    Pages per session, duration, bounce and conversion rate of the sessions
+    that started in [start, end).
+
+    Args:
+        start (datetime): Start of the range (UTC)
+        end (datetime): End of the range, exclusive (UTC)
+        match (dict): Extra filters on session fields (e.g. {"entry.utm_source": "google"})
+
+    Returns:
+        dict: Session totals and rates
+    """
+    pipeline = [
+        {"$match": _range_match(start, end, match)},
+        {"$group": {"_id": None, **_session_totals()}},
+    ]
+    rows = list(get_collection(SESSIONS).aggregate(pipeline))
+    if not rows:
+        return _rates({"sessions": 0, "page_views": 0, "clicks": 0, "converted_sessions": 0,
+                       "bounces": 0, "conversion_value": 0, "avg_duration_ms": 0})
+    return _rates(rows[0])
+
+
+def landing_page_performance(start, end, match=None, limit=20):
+    """
+    Sessions and conversions per landing page, for sessions that started in [start, end).
+
+    Returns:
+        list: Dicts with host, landing_page and the session_summary fields,
+        most sessions first
+    """
+    pipeline = [
+        {"$match": _range_match(start, end, match)},
+        {"$group": {"_id": {"host": "$entry.host", "landing_page": "$entry.landing_page"}, **_session_totals()}},
+        {"$sort": {"sessions": -1}},
+        {"$limit": limit},
+    ]
+    return [
+        {"host": row["_id"].get("host"), "landing_page": row["_id"].get("landing_page"), **_rates(row)}
+        for row in get_collection(SESSIONS).aggregate(pipeline)
+    ]
+
+
+def rebuild_sessions(start, end):
+    """
+    Recompute every session that has events in [start, end) from raw_events.
+
+    All events of those sessions are re-read (by session_id, through the
+    session_id_timestamp index), so sessions that span the range boundaries
+    are rebuilt completely. Safe to re-run.
+
+    Args:
+        start (datetime): Start of the range (UTC)
+        end (datetime): End of the range, exclusive (UTC)
+
+    Returns:
+        int: Number of sessions rebuilt
+    """
+    raw_events = get_collection("raw_events")
+    session_ids = [
+        session_id for session_id in raw_events.distinct(
+            "session_id", {"timestamp": {"$gte": start, "$lt": end}})
+        if session_id
+    ]
+    sessions = get_collection(SESSIONS)
+    total = 0
+    for i in range(0, len(session_ids), _REBUILD_CHUNK):
+        chunk = session_ids[i:i + _REBUILD_CHUNK]
+        events = expand_events(list(raw_events.find({"session_id": {"$in": chunk}})))
+        folded = _fold(events)
+        replacements = []
+        for session_id, summary in folded.items():
+            if summary["max_sequence_step"] is None:
+                del summary["max_sequence_step"]
+            replacements.append(ReplaceOne({"_id": session_id}, summary, upsert=True))
+        if replacements:
+            sessions.bulk_write(replacements, ordered=False)
+        total += len(replacements)
+        logger.info(f"Rebuilt {total}/{len(session_ids)} sessions")
+    return total
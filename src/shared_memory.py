@@ -0,0 +1,291 @@
+"""
+Counters shared by every worker process on the host.
+
+gunicorn runs several worker processes, each with its own memory, so
+in-process counters and rate limits only see a fraction of the traffic.
+These tables live in a memory-mapped file (in /dev/shm where available)
+that every worker maps, and each update holds a POSIX byte-range lock on
+the part of the file it touches (plus a thread lock, since POSIX locks are
+per process). Nothing goes over the network.
+
+SharedTokenBucketLimiter is a fixed-size hash table of token buckets with
+the same interface as rate_limiter.TokenBucketLimiter. SharedCounters is a
+set of named int64 counters.
+
+Byte-range locks need fcntl, so is_supported() is False on Windows and
+callers fall back to the in-process implementations.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_HEADER = struct.Struct("<8sQQ")  # magic, slot count, slots per group
+_SLOT = struct.Struct("<Qdd")  # key hash, tokens, updated_at
+_COUNTER = struct.Struct("<q")
+
+_LIMITER_MAGIC = b"DNSTB001"
+_COUNTERS_MAGIC = b"DNSCT001"
+_HEADER_SIZE = 64
+
+# Thread locks per table; POSIX locks do not exclude threads of one process
+_THREAD_STRIPES = 64
+
+
+def is_supported():
+    """Whether shared tables can be used on this platform."""
+    return fcntl is not None
+
+
+def default_directory():
+    """tmpfs when available, so the table never touches the disk."""
+    shm = Path("/dev/shm")
+    return shm if shm.is_dir() else Path(tempfile.gettempdir())
+
+
+class _MappedFile:
+    """A file of fixed size mapped into memory, created or reset under a lock."""
+
+    def __init__(self, path, size, magic, geometry):
+        self.path = Path(path)
+        self.size = size
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock(0, _HEADER_SIZE)
+        try:
+            header = os.pread(self.fd, _HEADER.size, 0)
+            if (os.fstat(self.fd).st_size != size or len(header) < _HEADER.size
+                    or _HEADER.unpack(header) != (magic, *geometry)):
+                # New file, or one left by a different layout: start empty
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, _HEADER.pack(magic, *geometry), 0)
+        finally:
+            self._unlock(0, _HEADER_SIZE)
+        self.map = mmap.mmap(self.fd, size)
+        self._stripes = [threading.Lock() for _ in range(_THREAD_STRIPES)]
+
+    def _lock(self, start, length):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+
+    def _unlock(self, start, length):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+
+    def locked(self, start, length):
+        return _RangeLock(self, start, length)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class _RangeLock:
+    __slots__ = ("file", "start", "length", "stripe")
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.stripe = file._stripes[(start // length) % _THREAD_STRIPES]
+
+    def __enter__(self):
+        self.stripe.acquire()
+        try:
+            self.file._lock(self.start, self.length)
+        except BaseException:
+            self.stripe.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            self.file._unlock(self.start, self.length)
+        finally:
+            self.stripe.release()
+
+
+def _key_hash(key):
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1  # 0 marks an empty slot
+
+
+class SharedTokenBucketLimiter:
+    """
+    Token buckets in a shared-memory hash table.
+
+    A key hashes to one group of `group_size` slots, locked as a unit. A new
+    key takes an empty slot, a bucket that has been idle long enough to be
+    full again, or else the least recently used bucket of the group, so the
+    table never grows and every request costs one lock and a few slot reads.
+    """
+
+    def __init__(self, rate, burst, path, slots=65536, group_size=8, clock=time.monotonic):
+        """
+        Args:
+            rate (float): Tokens added per second (sustained requests per second)
+            burst (int): Bucket size (requests allowed at once)
+            path (str | Path): Backing file; every worker must use the same one
+            slots (int): Table size (maximum number of tracked keys)
+            group_size (int): Slots per locked group
+            clock (callable): Time source shared by all processes (CLOCK_MONOTONIC is system-wide)
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.group_size = group_size
+        self.groups = max(1, slots // group_size)
+        self._group_bytes = group_size * _SLOT.size
+        size = _HEADER_SIZE + self.groups * self._group_bytes
+        self._file = _MappedFile(path, size, _LIMITER_MAGIC, (self.groups * group_size, group_size))
+
+    def _is_full(self, tokens, updated, now):
+        return tokens + (now - updated) * self.rate >= self.burst
+
+    def _group(self, key_hash):
+        return _HEADER_SIZE + (key_hash % self.groups) * self._group_bytes
+
+    def hit(self, key, cost=1):
+        """
+        Take tokens for one request.
+
+        Returns:
+            tuple: (limited, remaining, reset_after), as TokenBucketLimiter.hit
+        """
+        key_hash = _key_hash(key)
+        start = self._group(key_hash)
+        mm = self._file.map
+        with self._file.locked(start, self._group_bytes):
+            # Read the clock under the lock: another process may have updated the
+            # bucket while we waited, and an update "in the future" means a reset
+            now = self.clock()
+            slot = None
+            victim = None
+            victim_age = -1.0
+            for offset in range(start, start + self._group_bytes, _SLOT.size):
+                slot_hash, tokens, updated = _SLOT.unpack_from(mm, offset)
+                if slot_hash == key_hash:
+                    slot = offset
+                    break
+                # Empty slots and full (idle) buckets are free; otherwise evict the least recently used
+                age = float("inf") if slot_hash == 0 or self._is_full(tokens, updated, now) else now - updated
+                if age > victim_age:
+                    victim, victim_age = offset, age
+
+            if slot is None or updated > now:
+                slot = slot if slot is not None else victim
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            # Costs above the burst are admitted from a full bucket and leave it in debt
+            limited = tokens < min(cost, self.burst)
+            if limited:
+                reset_after = (min(cost, self.burst) - tokens) / self.rate
+            else:
+                tokens -= cost
+                reset_after = (self.burst - tokens) / self.rate
+            _SLOT.pack_into(mm, slot, key_hash, tokens, now)
+        return limited, max(0, int(tokens)), reset_after
+
+    def peek(self, key):
+        """Tokens currently available to a key, without taking one."""
+        key_hash = _key_hash(key)
+        start = self._group(key_hash)
+        with self._file.locked(start, self._group_bytes):
+            now = self.clock()
+            for offset in range(start, start + self._group_bytes, _SLOT.size):
+                slot_hash, tokens, updated = _SLOT.unpack_from(self._file.map, offset)
+                if slot_hash == key_hash and updated <= now:
+                    return min(self.burst, tokens + (now - updated) * self.rate)
+        return self.burst
+
+    def __len__(self):
+        """Number of buckets that are not full (approximate, unlocked read)."""
+        now = self.clock()
+        count = 0
+        for offset in range(_HEADER_SIZE, _HEADER_SIZE + self.groups * self._group_bytes, _SLOT.size):
+            slot_hash, tokens, updated = _SLOT.unpack_from(self._file.map, offset)
+            if slot_hash and not self._is_full(tokens, updated, now):
+                count += 1
+        return count
+
+    def clear(self):
+        for group in range(self.groups):
+            start = _HEADER_SIZE + group * self._group_bytes
+            with self._file.locked(start, self._group_bytes):
+                self._file.map[start:start + self._group_bytes] = bytes(self._group_bytes)
+
+    def close(self):
+        self._file.close()
+
+
+class SharedCounters:
+    """Named int64 counters shared by all worker processes."""
+
+    def __init__(self, path, names):
+        """
+        Args:
+            path (str | Path): Backing file; every worker must use the same one
+            names (list): Counter names (their order fixes the layout)
+        """
+        self.names = list(names)
+        self._offsets = {name: _HEADER_SIZE + i * _COUNTER.size for i, name in enumerate(self.names)}
+        size = _HEADER_SIZE + len(self.names) * _COUNTER.size
+        self._file = _MappedFile(path, size, _COUNTERS_MAGIC, (len(self.names), 0))
+
+    def add(self, name, amount=1):
+        """Atomically add to a counter and return the new value."""
+        offset = self._offsets[name]
+        with self._file.locked(offset, _COUNTER.size):
+            value = _COUNTER.unpack_from(self._file.map, offset)[0] + amount
+            _COUNTER.pack_into(self._file.map, offset, value)
+        return value
+
+    def get(self, name):
+        return _COUNTER.unpack_from(self._file.map, self._offsets[name])[0]
+
+    def snapshot(self):
+        """All counters as a dict."""
+        return {name: self.get(name) for name in self.names}
+
+    def reset(self):
+        for name in self.names:
+            offset = self._offsets[name]
+            with self._file.locked(offset, _COUNTER.size):
+                _COUNTER.pack_into(self._file.map, offset, 0)
+
+    def close(self):
+        self._file.close()
+
+
+class LocalCounters:
+    """In-process stand-in for SharedCounters (single worker, or no fcntl)."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(self.names, 0)
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._values[name] += amount
+            return self._values[name]
+
+    def get(self, name):
+        return self._values[name]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self.names, 0)
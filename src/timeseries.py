@@ -0,0 +1,226 @@
+"""
+Optional MongoDB time-series storage for raw_events.
+
+With RAW_EVENTS_TIMESERIES enabled, events are written to a time-series
+collection (timeField "timestamp", metaField "meta" = {site, platform}).
+MongoDB groups events of the same site and platform into compressed buckets
+and prunes whole buckets on time-range scans. Every other field is stored
+as before, so readers and aggregations work unchanged.
+
+Time-series collections do not enforce unique _id, so inserts check the
+batch's _ids within its time range first and report duplicates as 11000
+write errors, the same way a regular collection would.
+
+migrate_to_timeseries() copies an existing raw_events collection in
+parallel time chunks and can be resumed.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, CollectionInvalid
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIME_FIELD = "timestamp"
+META_FIELD = "meta"
+
+# Progress of resumable migrations: one document per finished chunk
+MIGRATIONS_COLLECTION = "migrations"
+
+
+def ensure_timeseries_collection(db, name, granularity="seconds"):
+    """
+    Create the time-series collection if it does not exist yet.
+
+    Returns:
+        bool: True if the collection was created
+    """
+    if name in db.list_collection_names():
+        return False
+    try:
+        db.create_collection(name, timeseries={
+            "timeField": TIME_FIELD,
+            "metaField": META_FIELD,
+            "granularity": granularity,
+        })
+    except CollectionInvalid:
+        # Created concurrently by another worker
+        return False
+    logger.info(f"Created time-series collection {name}")
+    return True
+
+
+def to_timeseries_document(event):
+    """Add the metaField (site and platform) to an event, in place."""
+    # Compact (v2) events carry the interned host id instead of the host
+    site = event["host"] if "host" in event else event.get("h")
+    event[META_FIELD] = {"site": site, "platform": event.get("platform_detected")}
+    return event
+
+
+def insert_timeseries(collection, documents):
+    """
+    Insert events into a time-series collection, skipping _ids already stored.
+
+    Args:
+        collection: Time-series collection
+        documents (list): Events with datetime timestamps
+
+    Returns:
+        list: _ids of the inserted documents
+
+    Raises:
+        BulkWriteError: With code 11000 entries for the skipped duplicates,
+            after the other documents have been inserted
+    """
+    for document in documents:
+        document.setdefault("_id", ObjectId())
+        to_timeseries_document(document)
+
+    timestamps = [d[TIME_FIELD] for d in documents]
+    existing = {
+        d["_id"] for d in collection.find(
+            {TIME_FIELD: {"$gte": min(timestamps), "$lte": max(timestamps)},
+             "_id": {"$in": [d["_id"] for d in documents]}},
+            {"_id": 1}
+        )
+    } if documents else set()
+
+    new = []
+    positions = []
+    errors = []
+    for position, document in enumerate(documents):
+        if document["_id"] in existing:
+            errors.append({"index": position, "code": 11000, "op": document,
+                           "errmsg": f"E11000 duplicate key error collection: {collection.name} _id"})
+            continue
+        existing.add(document["_id"])
+        new.append(document)
+        positions.append(position)
+
+    inserted = len(new)
+    if new:
+        try:
+            collection.insert_many(new, ordered=False)
+        except BulkWriteError as e:
+            # Report positions in the caller's batch, not in the filtered one
+            for error in e.details.get("writeErrors", []):
+                errors.append({**error, "index": positions[error["index"]]})
+            inserted = e.details.get("nInserted", 0)
+    if errors:
+        raise BulkWriteError({
+            "writeErrors": sorted(errors, key=lambda error: error["index"]),
+            "writeConcernErrors": [],
+            "nInserted": inserted,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        })
+    return [d["_id"] for d in new]
+
+
+def _time_bounds(collection):
+    """Oldest and newest datetime timestamps in a collection, or None if empty."""
+    query = {TIME_FIELD: {"$type": "date"}}
+    first = list(collection.find(query, {TIME_FIELD: 1}).sort(TIME_FIELD, 1).limit(1))
+    last = list(collection.find(query, {TIME_FIELD: 1}).sort(TIME_FIELD, -1).limit(1))
+    if not first:
+        return None
+    return first[0][TIME_FIELD], last[0][TIME_FIELD]
+
+
+def migrate_to_timeseries(db, source, target, chunk=timedelta(days=1), workers=4,
+                          batch_size=1000, granularity="seconds"):
+    """
+    Copy a regular events collection into a time-series collection.
+
+    The source is split into time chunks copied by `workers` threads. Each
+    finished chunk is recorded in the migrations collection, so an
+    interrupted migration resumes where it stopped; a chunk that was half
+    copied is copied again and its already stored _ids are skipped. The
+    newest chunk is never recorded, so running the migration again after
+    switching writes over picks up the events stored in the meantime.
+    Documents without a datetime timestamp cannot be stored in a time-series
+    collection and are counted as skipped.
+
+    Args:
+        db: Database holding both collections
+        source (str): Regular collection name
+        target (str): Time-series collection name
+        chunk (timedelta): Time span copied per task
+        workers (int): Number of parallel copy threads
+        batch_size (int): Documents per insert
+        granularity (str): Time-series granularity if the target is created
+
+    Returns:
+        dict: {"chunks": n, "resumed": n, "copied": n, "duplicates": n, "skipped": n}
+    """
+    ensure_timeseries_collection(db, target, granularity)
+    source_collection = db[source]
+    target_collection = db[target]
+    progress = db[MIGRATIONS_COLLECTION]
+    migration = f"{source}->{target}"
+
+    stats = {"chunks": 0, "resumed": 0, "copied": 0, "duplicates": 0,
+             "skipped": source_collection.count_documents({TIME_FIELD: {"$not": {"$type": "date"}}})}
+    stats_lock = threading.Lock()
+
+    bounds = _time_bounds(source_collection)
+    if bounds is None:
+        return stats
+    start, end = bounds
+    done = {d["chunk_start"] for d in progress.find({"migration": migration}, {"chunk_start": 1})}
+
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunks.append((chunk_start, chunk_start + chunk))
+        chunk_start += chunk
+
+    def copy_chunk(bounds):
+        chunk_start, chunk_end = bounds
+        if chunk_start in done:
+            with stats_lock:
+                stats["resumed"] += 1
+            return
+        copied = duplicates = 0
+        batch = []
+        cursor = source_collection.find({TIME_FIELD: {"$gte": chunk_start, "$lt": chunk_end}}).batch_size(batch_size)
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                c, d = _copy_batch(target_collection, batch)
+                copied, duplicates, batch = copied + c, duplicates + d, []
+        if batch:
+            c, d = _copy_batch(target_collection, batch)
+            copied, duplicates = copied + c, duplicates + d
+        if chunk_end <= end:
+            # The newest chunk is still receiving events: copy it again next run
+            progress.insert_one({"migration": migration, "chunk_start": chunk_start, "chunk_end": chunk_end,
+                                 "copied": copied, "finished_at": datetime.utcnow()})
+        with stats_lock:
+            stats["chunks"] += 1
+            stats["copied"] += copied
+            stats["duplicates"] += duplicates
+        logger.info(f"Migrated {copied} events from {chunk_start} to {chunk_end}")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="timeseries-migration") as executor:
+        # list() re-raises the first failed chunk
+        list(executor.map(copy_chunk, chunks))
+    return stats
+
+
+def _copy_batch(collection, batch):
+    """Insert one batch, returning (copied, duplicates)."""
+    try:
+        return len(insert_timeseries(collection, batch)), 0
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        return e.details["nInserted"], len(errors)
@@ -3,18 +3,46 @@ Track handler for processing and storing tracking events.
 """
 
 import uuid
+import atexit
 from datetime import datetime, timedelta
 from urllib.parse import urlparse, parse_qs
-from flask import request
-from .database import insert_event, get_collection
-from .config import BASE_URL
+from bson import ObjectId
+from flask import g, request
+from .database import MongoUnavailableError, insert_events, get_collection
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from .event_buffer import EventBuffer
+from .event_schema import split_host
+from .event_log import EventLog, EventLogReplayer
+from .session_tokens import SessionTokenSigner
+from .rollups import update_rollups
+from .sessions import update_sessions
+from .click_ids import attach_first_touches, update_click_ids
+from .filter_values import update_filter_values
+from .config import (
+    BASE_URL,
+    EVENT_BUFFER_ENABLED,
+    EVENT_BUFFER_MAX_SIZE,
+    EVENT_BATCH_SIZE,
+    EVENT_BATCH_MAX_AGE_MS,
+    EVENT_LOG_ENABLED,
+    EVENT_LOG_DIR,
+    EVENT_LOG_SEGMENT_BYTES,
+    EVENT_LOG_FSYNC_INTERVAL_MS,
+    ROLLUPS_ENABLED,
+    SESSIONS_ENABLED,
+    CLICK_IDS_ENABLED,
+    FILTER_VALUES_ENABLED,
+    SESSION_SECRET,
+    TRACK_CLIENT_TIMESTAMP_MAX_SKEW_S,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Session management: 60-minute timeout
+# Session management: 60-minute timeout, tracked in signed tokens
 SESSION_TIMEOUT = timedelta(minutes=60)
-_active_sessions = {}  # Store active sessions: {session_id: last_activity}
+SESSION_COOKIE = "dns_session"
+_session_tokens = SessionTokenSigner(SESSION_SECRET, SESSION_TIMEOUT.total_seconds())
 
 
 def detect_platform(params):
@@ -57,11 +85,58 @@ def detect_platform(params):
     return "Unknown"
 
 
+def parse_conversion_value(value):
+    """
+    Parse a conversion value sent as a number or numeric string.
+    
+    Returns:
+        float | int | None: The value, or None if missing or not numeric
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+
+def parse_client_timestamp(value, received_at):
+    """
+    Event time sent by the client, if it is plausible.
+    
+    Batched events reach the server up to a flush interval after they
+    happened, so their own timestamp is kept when it is an ISO datetime
+    within TRACK_CLIENT_TIMESTAMP_MAX_SKEW_S of `received_at`.
+    
+    Returns:
+        datetime | None: Naive UTC time, or None to use the receive time
+    """
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    if abs((parsed - received_at).total_seconds()) > TRACK_CLIENT_TIMESTAMP_MAX_SKEW_S:
+        return None
+    return parsed
+
+
 def get_or_create_session_id(params, ip_address):
     """
     Get existing session ID or create a new one.
     Sessions expire after 60 minutes of inactivity.
     
+    The session is carried by a signed token (see src/session_tokens.py) sent
+    as the session_token parameter or the dns_session cookie, so any worker
+    can continue it. Events later in the same request (a batch) continue the
+    session of the events before them. The refreshed token is left in
+    flask.g.session_token for the response.
+    
     Args:
         params (dict): Request parameters
         ip_address (str): Client IP address
@@ -69,36 +144,17 @@ def get_or_create_session_id(params, ip_address):
     Returns:
         str: Session ID
     """
-    now = datetime.utcnow()
-    
-    # Check if session_id is provided
-    provided_session_id = params.get("session_id")
-    
-    if provided_session_id:
-        # Validate existing session
-        if provided_session_id in _active_sessions:
-            last_activity = _active_sessions[provided_session_id]
-            if now - last_activity < SESSION_TIMEOUT:
-                # Session is still active, update last activity
-                _active_sessions[provided_session_id] = now
-                return provided_session_id
-            else:
-                # Session expired, create new one
-                del _active_sessions[provided_session_id]
-    
-    # Create new session
-    session_id = f"sess_{uuid.uuid4().hex[:10]}"
-    _active_sessions[session_id] = now
-    
-    # Clean up expired sessions periodically
-    if len(_active_sessions) > 1000:  # Prevent memory bloat
-        expired_sessions = [
-            sid for sid, last_activity in _active_sessions.items()
-            if now - last_activity >= SESSION_TIMEOUT
-        ]
-        for sid in expired_sessions:
-            del _active_sessions[sid]
+    session_id = None
+    for token in (params.get("session_token"), g.get("session_token"), request.cookies.get(SESSION_COOKIE)):
+        session_id = _session_tokens.verify(token)
+        if session_id:
+            break
+    
+    if not session_id:
+        # No valid session, or it expired: create new one
+        session_id = f"sess_{uuid.uuid4().hex[:10]}"
     
+    g.session_token = _session_tokens.issue(session_id)
     return session_id
 
 
@@ -114,22 +170,33 @@ def get_client_ip():
         return request.remote_addr or 'unknown'
 
 
-def process_tracking_event():
+def get_request_params():
+    """Get all tracking parameters from the request (works for both GET and POST)."""
+    if request.method == 'GET':
+        return request.args.to_dict()
+    
+    # POST: try JSON first, then form data, then query string
+    if request.is_json:
+        return request.get_json() or {}
+    return {**request.form.to_dict(), **request.args.to_dict()}
+
+
+def process_tracking_event(params=None):
     """
     Process and store a tracking event from the request.
     
+    Args:
+        params (dict): Event parameters. Defaults to the parameters of the
+            current request; the batch endpoint passes each event in turn.
+    
     Returns:
         dict: Event data dictionary ready for storage
     """
-    # Get all parameters (works for both GET and POST)
-    if request.method == 'GET':
-        params = request.args.to_dict()
-    else:
-        # POST: try JSON first, then form data, then query string
-        if request.is_json:
-            params = request.get_json() or {}
-        else:
-            params = {**request.form.to_dict(), **request.args.to_dict()}
+    if params is None:
+        params = get_request_params()
+    
+    if not isinstance(params, dict):
+        raise ValueError("Event must be a JSON object")
     
     # Validate required UTM parameters
     required_utms = ["utm_source", "utm_medium", "utm_campaign"]
@@ -151,10 +218,11 @@ def process_tracking_event():
     platform_detected = detect_platform(params)
     
     # Build event data
+    received_at = datetime.utcnow()
     event_data = {
-        # Timestamps
-        "timestamp": datetime.utcnow(),
-        "created_at": datetime.utcnow(),
+        # Timestamps (the client's own time keeps batched events in order)
+        "timestamp": parse_client_timestamp(params.get("timestamp"), received_at) or received_at,
+        "created_at": received_at,
         
         # UTM Parameters
         "utm_source": params.get("utm_source", ""),
@@ -190,6 +258,7 @@ def process_tracking_event():
         
         # Behavioral & Pathway Data
         "event_type": params.get("event_type", "page_view"),
+        "conversion_value": parse_conversion_value(params.get("conversion_value")),
         "current_page": params.get("current_page"),
         "previous_page": params.get("previous_page"),
         "sequence_step": params.get("sequence_step"),
@@ -203,13 +272,13 @@ def process_tracking_event():
         "screen_resolution": params.get("screen_resolution"),
         "language": params.get("language"),
         
-        "raw_params": params,  # Store all params as dict for flexibility
+        # Store all params as dict for flexibility (but not the session's credential)
+        "raw_params": {key: value for key, value in params.items() if key != "session_token"},
         
         # Domain & Host Data (Auto-detected)
         "host": request.host,
-        "domain": ".".join(request.host.split(".")[-2:]) if request.host.count(".") > 1 else request.host,
-        "subdomain": request.host.split(".")[0] if request.host.count(".") > 1 else "www"
     }
+    event_data["domain"], event_data["subdomain"] = split_host(request.host)
 
     # Override host/domain/subdomain if 'url' parameter is present (from client-side script)
     if params.get("url"):
@@ -218,8 +287,7 @@ def process_tracking_event():
             hostname = parsed_url.netloc
             if hostname:
                 event_data["host"] = hostname
-                event_data["domain"] = ".".join(hostname.split(".")[-2:]) if hostname.count(".") > 1 else hostname
-                event_data["subdomain"] = hostname.split(".")[0] if hostname.count(".") > 1 else "www"
+                event_data["domain"], event_data["subdomain"] = split_host(hostname)
         except Exception as e:
             logger.warning(f"Failed to parse URL for host detection: {e}")
     
@@ -233,10 +301,163 @@ def process_tracking_event():
     return event_data
 
 
+def write_events(events):
+    """
+    Persist a batch of events and update the collections derived from them.
+    
+    Every write path goes through here: the event buffer's writer thread,
+    the event log replayer and synchronous writes. When MONGODB_URI is set,
+    events are never written to the process-local mock database: while
+    MongoDB is unavailable this raises MongoUnavailableError, so the event
+    log keeps its checkpoint and the event buffer retries the batch.
+    Conversions get their first touch here rather than in the request.
+    
+    Args:
+        events (list): List of event data dictionaries
+    """
+    if CLICK_IDS_ENABLED:
+        # Conversions (often reported by the backend) carry the first touch of their click id / session
+        try:
+            attach_first_touches(events)
+        except Exception as e:
+            logger.warning(f"Failed to resolve the first touch of conversions: {e}")
+    try:
+        insert_events(events, require_mongodb=True)
+    except BulkWriteError as e:
+        # Events that were inserted still count; the failed ones are not stored
+        failed = {err.get("index") for err in e.details.get("writeErrors", [])}
+        _update_derived([event for i, event in enumerate(events) if i not in failed])
+        raise
+    _update_derived(events)
+
+
+def _update_derived(events):
+    """
+    Fold newly stored events into the rollup, session, click id and filter
+    value collections.
+    
+    The events are already stored, so a failure here is logged rather than
+    raised (a retry would insert them twice); backfill_rollups,
+    rebuild_sessions and rebuild_click_ids repair gaps, and filter values are
+    reconciled periodically.
+    """
+    if not events:
+        return
+    if ROLLUPS_ENABLED:
+        try:
+            update_rollups(events)
+        except Exception as e:
+            logger.error(f"Failed to update rollups for {len(events)} events: {e}")
+    if SESSIONS_ENABLED:
+        try:
+            update_sessions(events)
+        except Exception as e:
+            logger.error(f"Failed to update sessions for {len(events)} events: {e}")
+    if CLICK_IDS_ENABLED:
+        try:
+            update_click_ids(events)
+        except Exception as e:
+            logger.error(f"Failed to update click ids for {len(events)} events: {e}")
+    if FILTER_VALUES_ENABLED:
+        try:
+            update_filter_values(events)
+        except Exception as e:
+            logger.error(f"Failed to update filter values for {len(events)} events: {e}")
+
+
+def replay_events(events):
+    """
+    Persist events that may have been written before: event log replays and
+    event buffer retries.
+    
+    A crash between a write and its checkpoint replays that batch again, and
+    a batch retried after a lost connection may be partly stored, so
+    duplicate-key errors for events that are already stored are ignored.
+    """
+    try:
+        write_events(events)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        logger.info(f"Skipped {len(errors)} already stored events during replay")
+
+
+# Write-behind buffer: /track returns as soon as the event is queued. While
+# MongoDB is unavailable a batch is retried rather than written to the mock
+# database (which other workers and instances do not see)
+_event_buffer = EventBuffer(
+    replay_events,
+    max_size=EVENT_BUFFER_MAX_SIZE,
+    batch_size=EVENT_BATCH_SIZE,
+    max_age=EVENT_BATCH_MAX_AGE_MS / 1000,
+    retry_errors=(MongoUnavailableError, ConnectionFailure)
+)
+atexit.register(_event_buffer.stop)
+
+# Durable event log: /track returns once the event is fsynced to disk
+_event_log = EventLog(
+    EVENT_LOG_DIR,
+    segment_max_bytes=EVENT_LOG_SEGMENT_BYTES,
+    fsync_interval=EVENT_LOG_FSYNC_INTERVAL_MS / 1000
+)
+_event_log_replayer = EventLogReplayer(_event_log, replay_events, batch_size=EVENT_BATCH_SIZE)
+
+
+def _shutdown_event_log():
+    if EVENT_LOG_ENABLED:
+        _event_log_replayer.stop()
+        _event_log.close()
+
+
+atexit.register(_shutdown_event_log)
+
+
+def get_ingest_stats():
+    """Get event buffer queue depth and flush latency, and event log backlog."""
+    stats = _event_buffer.get_stats()
+    stats["enabled"] = EVENT_BUFFER_ENABLED
+    if EVENT_LOG_ENABLED:
+        stats["event_log"] = {**_event_log.get_stats(), **_event_log_replayer.get_stats()}
+    return stats
+
+
+def flush_events():
+    """Write all buffered and logged events now."""
+    _event_buffer.flush()
+    if EVENT_LOG_ENABLED:
+        _event_log_replayer.replay()
+
+
+def _accept_events(events):
+    """
+    Hand events to the event log or the write-behind buffer.
+    
+    Returns:
+        bool: False if the caller must write the events synchronously
+    """
+    if EVENT_LOG_ENABLED:
+        _event_log.append(events)
+        _event_log_replayer.start()
+        return True
+    
+    if EVENT_BUFFER_ENABLED:
+        if _event_buffer.put_many(events):
+            return True
+        logger.warning(f"Event buffer full, writing {len(events)} events synchronously")
+    
+    return False
+
+
 def store_event(event_data):
     """
     Store event in MongoDB.
     
+    When the event log or event buffer is enabled the event is accepted
+    there and written in the background; the document ID is assigned up front
+    so it can be returned immediately. If the buffer is full the event is
+    written synchronously.
+    
     Args:
         event_data (dict): Event data dictionary
         
@@ -244,10 +465,46 @@ def store_event(event_data):
         str: Inserted document ID
     """
     try:
-        doc_id = insert_event(event_data)
-        logger.info(f"Event stored: {doc_id}")
-        return doc_id
+        if "_id" not in event_data:
+            event_data["_id"] = ObjectId()
+        if _accept_events([event_data]):
+            logger.debug(f"Event accepted: {event_data['_id']}")
+            return str(event_data["_id"])
+        
+        write_events([event_data])
+        logger.info(f"Event stored: {event_data['_id']}")
+        return str(event_data["_id"])
     except Exception as e:
         logger.error(f"Error storing event: {e}")
         raise
 
+
+def store_events(events):
+    """
+    Store a batch of events in MongoDB with one bulk write.
+    
+    Args:
+        events (list): List of event data dictionaries
+        
+    Returns:
+        list: Inserted document IDs, in the same order as `events`
+    """
+    if not events:
+        return []
+    
+    try:
+        for event_data in events:
+            if "_id" not in event_data:
+                event_data["_id"] = ObjectId()
+        
+        if _accept_events(events):
+            logger.debug(f"{len(events)} events accepted")
+            return [str(e["_id"]) for e in events]
+        
+        write_events(events)
+        logger.info(f"{len(events)} events stored")
+        return [str(e["_id"]) for e in events]
+    except Exception as e:
+        logger.error(f"Error storing events: {e}")
+        raise
+
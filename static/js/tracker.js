@@ -8,9 +8,18 @@
 
     const CONFIG = {
         endpoint: 'https://digitaltrackingsite.onrender.com/track',
+        batchEndpoint: 'https://digitaltrackingsite.onrender.com/track/batch',
         sessionTimeout: 30 * 60 * 1000, // 30 minutes
+        batchSize: 10,          // Flush once this many events are queued
+        flushInterval: 5000,    // Flush queued events every 5 seconds
+        maxBatchBytes: 60000,   // sendBeacon payloads are capped at ~64KB
+        tokenKey: 'dns_session_token'
     };
 
+    // Events waiting to be sent in the next batch
+    const queue = [];
+    let flushTimer = null;
+
     // Helper to generate UUID
     function generateUUID() {
         return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function (c) {
@@ -47,6 +56,25 @@
         return sessionId;
     }
 
+    // Signed session token from the last /track/batch response. Third-party
+    // cookies are often blocked, so it is kept here and sent with each batch.
+    function getSessionToken() {
+        try {
+            return sessionStorage.getItem(CONFIG.tokenKey);
+        } catch (e) {
+            return null;
+        }
+    }
+
+    function saveSessionToken(token) {
+        if (!token) return;
+        try {
+            sessionStorage.setItem(CONFIG.tokenKey, token);
+        } catch (e) {
+            // Storage disabled: the dns_session cookie is all we have
+        }
+    }
+
     // Pathway Tracking
     function getPathwayData() {
         const currentPath = window.location.pathname;
@@ -95,21 +123,54 @@
         };
     }
 
-    // Send Data
+    // Send a JSON payload to an endpoint. Beacons are only used while the
+    // page is going away: their response (with the session token) is lost.
+    function post(url, payload, unloading) {
+        const body = JSON.stringify(payload);
+        if (unloading && navigator.sendBeacon && body.length <= CONFIG.maxBatchBytes) {
+            const blob = new Blob([body], { type: 'application/json' });
+            if (navigator.sendBeacon(url, blob)) {
+                return;
+            }
+        }
+        fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: body,
+            credentials: 'include', // carries the dns_session cookie
+            keepalive: true
+        }).then(function (response) {
+            return response.ok ? response.json() : null;
+        }).then(function (data) {
+            saveSessionToken(data && data.session_token);
+        }).catch(console.error);
+    }
+
+    // Send all queued events as one batch request
+    function flush(unloading) {
+        if (flushTimer) {
+            clearTimeout(flushTimer);
+            flushTimer = null;
+        }
+        const token = getSessionToken();
+        while (queue.length) {
+            const batch = queue.splice(0, CONFIG.batchSize);
+            if (token) {
+                batch.forEach(function (event) { event.session_token = token; });
+            }
+            post(CONFIG.batchEndpoint, batch, unloading === true);
+        }
+    }
+
+    // Queue Data (sent on a timer, when the batch is full or when the page is hidden)
     function sendData(data) {
-        // Use sendBeacon if available for reliability during unload
-        if (navigator.sendBeacon) {
-            const blob = new Blob([JSON.stringify(data)], { type: 'application/json' });
-            navigator.sendBeacon(CONFIG.endpoint, blob);
-        } else {
-            fetch(CONFIG.endpoint, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(data),
-                keepalive: true
-            }).catch(console.error);
+        queue.push(data);
+        if (queue.length >= CONFIG.batchSize) {
+            flush();
+        } else if (!flushTimer) {
+            flushTimer = setTimeout(function () { flush(false); }, CONFIG.flushInterval);
         }
     }
 
@@ -140,6 +201,16 @@
     function init() {
         trackPageView();
         document.addEventListener('click', trackClick);
+
+        // Deliver queued events before the page goes away
+        document.addEventListener('visibilitychange', function () {
+            if (document.visibilityState === 'hidden') {
+                flush(true);
+            }
+        });
+        window.addEventListener('pagehide', function () {
+            flush(true);
+        });
     }
 
     // Start tracking when DOM is ready
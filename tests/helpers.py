@@ -0,0 +1,42 @@
+"""
+Shared test fixtures.
+"""
+
+from unittest.mock import patch
+from src import click_ids, database, filter_values
+from src.analysis import dashboard_summary, funnel
+from src.event_schema import StringLookup
+from src.indexes import sync_indexes
+from src.mock_db import MockDatabase
+
+
+def use_database(test, db=None):
+    """
+    Point every get_collection() at an in-memory database for one test.
+
+    The database module's connection and mock handles are swapped (not each
+    module's get_collection), so the collections derived at ingest (rollups,
+    sessions, click_ids, filter values) land in the same database as the
+    events instead of in data/mock_db. Caches of data read from another
+    database are emptied before and after the test.
+
+    Args:
+        test (unittest.TestCase): The test; patches are undone on cleanup
+        db (MockDatabase): Database to use (default: a new one with the app's indexes)
+
+    Returns:
+        MockDatabase: The database
+    """
+    if db is None:
+        db = MockDatabase()
+        sync_indexes(db)
+    for name, value in (("_db", db), ("_mock_db", db), ("_lookups", StringLookup())):
+        patcher = patch.object(database, name, value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    for cache in (database._query_cache, database._data_versions, click_ids._cache,
+                  filter_values._filter_values, filter_values._host_domains, funnel._cache,
+                  dashboard_summary._cache):
+        cache.clear()
+        test.addCleanup(cache.clear)
+    return db
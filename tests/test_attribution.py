@@ -0,0 +1,119 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import track_handler
+from src.analysis import attribution
+from tests.helpers import use_database
+
+class TestAttribution(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        for name in ("ROLLUPS_ENABLED", "SESSIONS_ENABLED"):
+            patcher = patch.object(track_handler, name, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def store(self, session_id, at, event_type="page_view", **fields):
+        track_handler.write_events([{"session_id": session_id, "timestamp": at, "created_at": at,
+                                     "event_type": event_type, **fields}])
+
+    def convert(self, session_id, at, value=100.0, **fields):
+        # Bookings are reported by the Easy!Appointments backend
+        self.store(session_id, at, "conversion", conversion_value=value,
+                   utm_source="easyappointments", utm_medium="backend", **fields)
+
+    def credits(self, day, model):
+        return {row["utm_source"]: round(row["revenue"], 6)
+                for row in self.db[attribution.ATTRIBUTION].find({"day": day, "model": model})}
+
+    def journey(self):
+        """google (day -3), facebook (day -2, clicked again), tiktok (day -1), booked today."""
+        day = self.today
+        self.store("s1", day - timedelta(days=3), utm_source="google", gclid="g1")
+        self.store("s2", day - timedelta(days=2), utm_source="facebook", fbclid="f1")
+        self.store("s2", day - timedelta(days=2) + timedelta(minutes=1), utm_source="facebook")
+        self.store("s3", day - timedelta(days=1), utm_source="tiktok", ttclid="t1")
+        # The booking carries the click ids the backend was given, not the sessions
+        self.convert("s4", day + timedelta(hours=1), gclid="g1", fbclid="f1", ttclid="t1")
+
+    def test_models(self):
+        self.journey()
+        attribution.attribute_day(self.today)
+        self.assertEqual(self.credits(self.today, "first_touch"), {"google": 100})
+        self.assertEqual(self.credits(self.today, "last_touch"), {"tiktok": 100})
+        linear = self.credits(self.today, "linear")
+        self.assertEqual(set(linear), {"google", "facebook", "tiktok"})
+        self.assertAlmostEqual(linear["facebook"], 100 / 3, places=4)
+        self.assertEqual(self.credits(self.today, "position_based"),
+                         {"google": 40, "facebook": 20, "tiktok": 40})
+        decay = self.credits(self.today, "time_decay")
+        self.assertGreater(decay["tiktok"], decay["facebook"])
+        self.assertGreater(decay["facebook"], decay["google"])
+        self.assertAlmostEqual(sum(decay.values()), 100, places=4)
+
+    def test_session_and_linked_session_touches(self):
+        day = self.today
+        # Same session, and the second page of a session found by its click id
+        self.store("s1", day + timedelta(minutes=1), utm_source="newsletter", utm_medium="email")
+        self.convert("s1", day + timedelta(minutes=5))
+        self.store("s2", day + timedelta(minutes=1), gclid="g9", platform_detected="Google Ads")
+        self.store("s2", day + timedelta(minutes=2), utm_source="partner")
+        self.convert(None, day + timedelta(minutes=5), value=50, gclid="g9")
+        # Touches after the conversion or from another session do not count
+        self.store("s3", day + timedelta(minutes=1), utm_source="bing")
+        self.store("s1", day + timedelta(minutes=9), utm_source="bing")
+        self.convert("s5", day + timedelta(minutes=5), value=10)
+
+        attribution.attribute_day(day)
+        self.assertEqual(self.credits(day, "last_touch"), {"newsletter": 100, "partner": 50, "(direct)": 10})
+        self.assertEqual(self.credits(day, "first_touch"), {"newsletter": 100, None: 50, "(direct)": 10})
+
+    def test_incremental_days(self):
+        self.store("s1", self.today - timedelta(days=2), utm_source="google")
+        self.convert("s1", self.today - timedelta(days=2, minutes=-5))
+        self.assertEqual(len(attribution.run_attribution()["days"]), 3)
+
+        self.store("s2", self.today + timedelta(minutes=1), utm_source="bing")
+        self.convert("s2", self.today + timedelta(minutes=2))
+        with patch.object(attribution, "attribute_day", wraps=attribution.attribute_day) as attribute_day:
+            result = attribution.run_attribution()
+        # Only today is recomputed
+        self.assertEqual(result["days"], [self.today])
+        attribute_day.assert_called_once_with(self.today)
+
+        rows = attribution.get_attribution(self.today - timedelta(days=7), self.today + timedelta(days=1),
+                                           model="last_touch", group_by=["utm_source"])
+        self.assertEqual({row["utm_source"]: row["conversions"] for row in rows}, {"google": 1, "bing": 1})
+        with self.assertRaises(ValueError):
+            attribution.get_attribution(self.today, self.today, model="magic")
+
+    def test_vectorized_join(self):
+        # 3 conversions, 4 touches; conversion 0 reaches touch 1 through two keys
+        pairs = attribution._join((np.array([0, 0, 1, 2]), np.array([10, 11, 10, 12])),
+                                  (np.array([0, 1, 1, 2, 3]), np.array([10, 10, 11, 13, 12])))
+        self.assertEqual(sorted(zip(pairs[0].tolist(), pairs[1].tolist())), [(0, 0), (0, 1), (1, 0), (1, 1), (2, 3)])
+
+    def test_api(self):
+        self.journey()
+        attribution.run_attribution()
+        with patch("src.blueprints.analysis.rate_limit_exceeded", return_value=None):
+            client = app.test_client()
+            ok = client.get('/api/analysis/attribution', query_string={"model": "position_based", "days": 7})
+            bad = client.get('/api/analysis/attribution', query_string={"group_by": "ip_address"})
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual({row["utm_source"]: row["revenue"] for row in ok.json["channels"]},
+                         {"google": 40, "facebook": 20, "tiktok": 40})
+        self.assertEqual(bad.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, base_backoff=0.05, max_backoff=0.2, jitter=0)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure("timeout")
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record_failure("timeout")
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_allows_single_probe(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        time.sleep(0.06)
+        
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_doubles_backoff(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        
+        state = self.breaker.get_state()
+        self.assertEqual(state["state"], OPEN)
+        self.assertEqual(state["backoff_s"], 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
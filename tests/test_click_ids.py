@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import click_ids, database, track_handler
+from tests.helpers import use_database
+
+class TestClickIds(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        for name in ("ROLLUPS_ENABLED", "SESSIONS_ENABLED"):
+            patcher = patch.object(track_handler, name, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.start = datetime.utcnow() - timedelta(hours=1)
+
+    def event(self, minute, session_id="s1", **fields):
+        return {"session_id": session_id, "timestamp": self.start + timedelta(minutes=minute),
+                "event_type": "page_view", **fields}
+
+    def test_first_touch_wins_across_batches(self):
+        track_handler.write_events([self.event(5, gclid="g1", utm_campaign="later", current_page="/b")])
+        # An earlier batch written late still becomes the first touch
+        track_handler.write_events([self.event(1, gclid="g1", utm_campaign="spring", current_page="/",
+                                               platform_detected="Google Ads"),
+                                    self.event(9, gclid="g1", utm_campaign="spring")])
+        doc = click_ids.resolve_click_id("g1")
+        self.assertEqual(doc["kind"], "gclid")
+        self.assertEqual(doc["first_touch"]["utm_campaign"], "spring")
+        self.assertEqual(doc["first_touch"]["current_page"], "/")
+        self.assertEqual(doc["last_seen"], self.start + timedelta(minutes=9))
+        self.assertEqual(click_ids.resolve_click_id("s1", "session_id")["first_touch"]["at"],
+                         self.start + timedelta(minutes=1))
+
+    def test_backend_events_are_not_touches(self):
+        track_handler.write_events([self.event(0, "s9", fbclid="f1", utm_source="easyappointments",
+                                               utm_medium="backend")])
+        self.assertIsNone(click_ids.resolve_click_id("f1"))
+
+    def test_lookups_are_cached(self):
+        track_handler.write_events([self.event(0, ttclid="t1", utm_source="tiktok")])
+        self.assertEqual(click_ids.resolve_click_id("t1")["value"], "t1")
+        with patch.object(click_ids, "get_collection", side_effect=AssertionError("queried")):
+            self.assertEqual(click_ids.first_touch({"ttclid": "t1"})["utm_source"], "tiktok")
+        self.assertEqual(click_ids.get_click_id_cache_stats()["hits"], 1)
+
+    def test_conversions_are_enriched(self):
+        track_handler.write_events([self.event(0, "sess_ad", gclid="g7", utm_source="google",
+                                               utm_campaign="spring")])
+        params = {"utm_source": "easyappointments", "utm_medium": "backend", "utm_campaign": "booking",
+                  "event_type": "conversion", "gclid": "g7", "conversion_value": "80"}
+        # The request does no lookups: the writer resolves the first touch
+        with app.test_request_context('/track', query_string=params), \
+                patch.object(click_ids, "get_collection", side_effect=AssertionError("queried")):
+            conversion = track_handler.process_tracking_event()
+        self.assertNotIn("first_touch", conversion)
+        track_handler.write_events([conversion])
+        stored = self.db["raw_events"].find_one({"event_type": "conversion"})
+        self.assertEqual(stored["first_touch"]["session_id"], "sess_ad")
+        self.assertEqual(stored["first_touch"]["utm_campaign"], "spring")
+
+    def test_touches_in_the_same_batch(self):
+        track_handler.write_events([
+            self.event(0, "s5", fbclid="f5", utm_source="meta"),
+            self.event(1, "s6", fbclid="f5", event_type="conversion", utm_source="easyappointments",
+                       utm_medium="backend"),
+        ])
+        stored = self.db["raw_events"].find_one({"event_type": "conversion"})
+        self.assertEqual(stored["first_touch"]["session_id"], "s5")
+
+    def test_rebuild(self):
+        database.insert_events([self.event(0, msclkid="m1", utm_source="bing"), self.event(1)])
+        self.assertIsNone(click_ids.resolve_click_id("m1"))
+        self.assertEqual(click_ids.rebuild_click_ids(), 2)
+        self.assertEqual(click_ids.resolve_click_id("m1")["first_touch"]["utm_source"], "bing")
+
+    def test_api(self):
+        track_handler.write_events([self.event(0, gclid="g1", utm_source="google")])
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            client = app.test_client()
+            found = client.get('/api/clicks/g1')
+            missing = client.get('/api/clicks/g1', query_string={"kind": "fbclid"})
+            bad = client.get('/api/clicks/g1', query_string={"kind": "ip_address"})
+        self.assertEqual(found.json["first_touch"]["session_id"], "s1")
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(bad.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
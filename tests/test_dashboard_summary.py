@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import rollups, track_handler
+from src.analysis import dashboard_summary as summary
+from tests.helpers import use_database
+
+class TestDashboardSummary(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        for name in ("SESSIONS_ENABLED", "CLICK_IDS_ENABLED", "FILTER_VALUES_ENABLED"):
+            patcher = patch.object(track_handler, name, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(track_handler, "ROLLUPS_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Two days of hourly events from 2025-01-01 00:00 UTC; every fourth is a conversion
+        self.events = [
+            {"timestamp": datetime(2025, 1, 1) + timedelta(hours=i),
+             "host": ["www.example.com", "book.clinic.com"][i % 2],
+             "utm_source": ["google", "meta", "tiktok"][i % 3], "utm_medium": "cpc", "utm_campaign": f"c{i % 2}",
+             "platform_detected": "Google Ads" if i % 3 == 0 else "Meta Ads",
+             "event_type": "conversion" if i % 4 == 0 else "page_view",
+             **({"conversion_value": 10.0} if i % 4 == 0 else {})}
+            for i in range(48)
+        ]
+        track_handler.write_events(self.events)
+
+    def get(self, date_from=date(2025, 1, 1), date_to=date(2025, 1, 2), **kwargs):
+        return summary.dashboard_summary(date_from, date_to, **kwargs)
+
+    def test_totals_and_breakdowns(self):
+        result = self.get()
+        self.assertEqual(result["totals"], {"events": 48, "conversions": 12, "revenue": 120.0, "conversion_rate": 0.25})
+        sources = {item["value"]: item["events"] for item in result["breakdowns"]["utm_source"]}
+        self.assertEqual(sources, {"google": 16, "meta": 16, "tiktok": 16})
+        domains = {item["value"]: item for item in result["breakdowns"]["domain"]}
+        self.assertEqual(domains["example.com"]["conversions"], 12)
+        self.assertEqual(domains["clinic.com"]["conversions"], 0)
+        self.assertEqual(len(self.get(limit=1)["breakdowns"]["platform_detected"]), 1)
+
+    def test_series(self):
+        days = self.get()["series"]
+        self.assertEqual([(p["bucket"], p["events"]) for p in days],
+                         [("2025-01-01T00:00:00+00:00", 24), ("2025-01-02T00:00:00+00:00", 24)])
+        hours = self.get(date_to=date(2025, 1, 3), interval="hour")["series"]
+        self.assertEqual(len(hours), 72)
+        self.assertEqual(sum(p["events"] for p in hours), 48)
+        self.assertEqual(hours[-1]["events"], 0)
+
+    def test_timezones(self):
+        # UTC-5: the first five UTC hours fall on the previous local day
+        new_york = self.get(date(2024, 12, 31), date(2025, 1, 2), tz="America/New_York")
+        self.assertEqual([p["events"] for p in new_york["series"]], [5, 24, 19])
+        self.assertEqual(new_york["series"][1]["bucket"], "2025-01-01T00:00:00-05:00")
+        # UTC+5:30: each UTC hour counts in the local day it starts in
+        # (2025-01-01 local is 2024-12-31 18:30 to 2025-01-01 18:30 UTC: hours 00:00-18:00)
+        kolkata = self.get(date(2025, 1, 1), date(2025, 1, 1), tz="Asia/Kolkata")
+        self.assertEqual(kolkata["totals"]["events"], 19)
+        self.assertEqual([p["events"] for p in kolkata["series"]], [19])
+
+    def test_filters(self):
+        result = self.get(filters={"utm_source": "google", "domain": "example.com"})
+        self.assertEqual(result["totals"]["events"], 8)
+        self.assertEqual(sum(p["events"] for p in result["series"]), 8)
+        with self.assertRaises(ValueError):
+            self.get(filters={"campaign_id": "x"})
+
+    def test_cached(self):
+        self.assertFalse(self.get()["cached"])
+        with patch.object(self.db[rollups.HOURLY], "aggregate", side_effect=AssertionError("aggregated")), \
+                patch.object(self.db[rollups.DAILY], "aggregate", side_effect=AssertionError("aggregated")):
+            self.assertTrue(self.get()["cached"])
+
+    def test_api(self):
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            client = app.test_client()
+            ok = client.get('/api/dashboard/summary', query_string={
+                "date_from": "2025-01-01", "date_to": "2025-01-02", "tz": "UTC", "utm_source": "meta"})
+            default = client.get('/api/dashboard/summary')
+            bad_tz = client.get('/api/dashboard/summary', query_string={"tz": "Mars/Olympus"})
+            bad_interval = client.get('/api/dashboard/summary', query_string={"interval": "week"})
+        self.assertEqual(ok.json["totals"]["events"], 16)
+        self.assertEqual(set(ok.json["breakdowns"]), set(summary.BREAKDOWN_FIELDS))
+        self.assertEqual(len(default.json["series"]), 7)
+        self.assertEqual((bad_tz.status_code, bad_interval.status_code), (400, 400))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.event_buffer import EventBuffer
+
+class TestEventBuffer(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.buffer = EventBuffer(self.batches.append, max_size=10, batch_size=3, max_age=0.05)
+
+    def tearDown(self):
+        self.buffer.stop()
+
+    def test_flush_writes_in_batches(self):
+        for i in range(7):
+            self.assertTrue(self.buffer.put({"n": i}))
+        self.buffer.stop()
+        
+        written = [e["n"] for batch in self.batches for e in batch]
+        self.assertEqual(sorted(written), list(range(7)))
+        self.assertTrue(all(len(batch) <= 3 for batch in self.batches))
+        self.assertEqual(self.buffer.get_stats()["written"], 7)
+
+    def test_background_writer_flushes_by_age(self):
+        self.buffer.put({"n": 1})
+        deadline = time.time() + 2
+        while not self.batches and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.batches, [[{"n": 1}]])
+        self.assertEqual(self.buffer.get_stats()["queue_depth"], 0)
+
+    def test_full_buffer_rejects_whole_batch(self):
+        small = EventBuffer(self.batches.append, max_size=2, batch_size=10, max_age=10)
+        self.assertTrue(small.put_many([{"n": 1}, {"n": 2}]))
+        self.assertFalse(small.put({"n": 3}))
+        self.assertEqual(small.get_stats()["rejected"], 1)
+        small.stop()
+
+    def test_unavailable_database_is_retried(self):
+        attempts = []
+        
+        def writer(batch):
+            attempts.append(batch)
+            if len(attempts) < 3:
+                raise ConnectionError("database unavailable")
+            self.batches.append(batch)
+        
+        retrying = EventBuffer(writer, batch_size=10, max_age=0.01, retry_errors=(ConnectionError,), max_backoff=0.01)
+        retrying.put({"n": 1})
+        retrying.flush()
+        self.assertEqual(self.batches, [[{"n": 1}]])
+        stats = retrying.get_stats()
+        self.assertEqual((stats["retries"], stats["written"], stats["failed"]), (2, 1, 0))
+        retrying.stop()
+
+if __name__ == '__main__':
+    unittest.main()
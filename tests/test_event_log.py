@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import patch
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bson import ObjectId
+from src import database, track_handler
+from src.database import MongoUnavailableError
+from src.event_log import EventLog, EventLogReplayer
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = EventLog(self.tmp.name, segment_max_bytes=200, fsync_interval=0)
+        self.written = []
+        self.replayer = EventLogReplayer(self.log, self.written.extend, batch_size=2)
+
+    def tearDown(self):
+        self.log.close()
+        self.tmp.cleanup()
+
+    def test_append_and_replay_round_trip(self):
+        event = {"_id": ObjectId(), "timestamp": datetime(2025, 1, 1, 12, 0), "utm_source": "google"}
+        self.log.append([event])
+        
+        self.assertEqual(self.replayer.replay(), 1)
+        self.assertEqual(self.written, [event])
+        # Nothing is replayed twice
+        self.assertEqual(self.replayer.replay(), 0)
+
+    def test_rotated_segments_are_deleted_after_replay(self):
+        for i in range(10):
+            self.log.append([{"n": i, "padding": "x" * 50}])
+        self.assertGreater(len(self.log.segments()), 1)
+        
+        self.replayer.replay()
+        self.assertEqual([e["n"] for e in self.written], list(range(10)))
+        # Only the active segment remains
+        self.assertEqual(self.log.segments(), [self.log.active_segment()])
+
+    def test_failed_write_is_retried_from_checkpoint(self):
+        self.log.append([{"n": 1}, {"n": 2}, {"n": 3}])
+        
+        def failing_writer(batch):
+            raise RuntimeError("database unavailable")
+        
+        with self.assertRaises(RuntimeError):
+            EventLogReplayer(self.log, failing_writer).replay()
+        
+        self.replayer.replay()
+        self.assertEqual([e["n"] for e in self.written], [1, 2, 3])
+
+    def test_replay_waits_for_configured_mongodb(self):
+        self.log.append([{"n": 1}])
+        # MongoDB configured but down: get_collection() falls back to the mock database
+        with patch.object(database, "MONGODB_URI", "mongodb://db.invalid"), \
+                patch.object(database, "get_collection", lambda name="raw_events": database._mock_db[name]), \
+                patch.object(database._mock_db["raw_events"], "insert_many",
+                             side_effect=AssertionError("written to the mock database")):
+            with self.assertRaises(MongoUnavailableError):
+                EventLogReplayer(self.log, track_handler.replay_events).replay()
+        
+        # The checkpoint did not move: the event is replayed once MongoDB is back
+        self.replayer.replay()
+        self.assertEqual([e["n"] for e in self.written], [1])
+
+    def test_torn_record_in_sealed_segment_is_skipped(self):
+        self.log.append([{"n": 1}])
+        segment = self.log.active_segment()
+        self.log.close()
+        with open(segment, "ab") as f:
+            f.write(b'0badc0de {"n": 2')
+        
+        # A new log instance (e.g. after a restart) starts a fresh segment
+        restarted = EventLog(self.tmp.name, fsync_interval=0)
+        restarted.append([{"n": 3}])
+        EventLogReplayer(restarted, self.written.extend).replay()
+        restarted.close()
+        
+        self.assertEqual(sorted(e["n"] for e in self.written), [1, 3])
+        self.assertNotIn(segment, restarted.segments())
+
+if __name__ == '__main__':
+    unittest.main()
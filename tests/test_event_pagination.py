@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bson import ObjectId
+from app import app
+from src import database
+from src.count_cache import CountCache
+from src.mock_db import MockDatabase
+from tests.helpers import use_database
+
+class TestEventPagination(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+        self.db = MockDatabase()
+        self.events = self.db["raw_events"]
+        self.events.create_index([("timestamp", -1), ("_id", -1)])
+        start = datetime(2025, 1, 1)
+        # Pairs of events share a timestamp so pages must break ties on _id
+        self.events.insert_many([
+            {"_id": ObjectId(), "timestamp": start + timedelta(minutes=i // 2),
+             "utm_source": "google" if i % 3 else "meta"}
+            for i in range(23)
+        ])
+        use_database(self, self.db)
+
+    def expected_ids(self, query=None):
+        cursor = self.events.find(query or {}).sort([("timestamp", -1), ("_id", -1)])
+        return [str(e["_id"]) for e in cursor]
+
+    def walk(self, **params):
+        ids = []
+        cursor = None
+        while True:
+            args = dict(params, limit=5)
+            if cursor:
+                args["cursor"] = cursor
+            data = self.app.get('/api/events', query_string=args).get_json()
+            self.assertTrue(data["success"])
+            ids.extend(e["_id"] for e in data["events"])
+            cursor = data["pagination"]["next_cursor"]
+            if not cursor:
+                return ids, data
+
+    def test_cursor_walk_returns_every_event_once(self):
+        ids, last = self.walk(count="exact")
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(last["pagination"]["total"], 23)
+        self.assertFalse(last["pagination"]["has_more"])
+
+    def test_cursor_walk_with_filter(self):
+        ids, _ = self.walk(utm_source="meta", count="none")
+        self.assertEqual(ids, self.expected_ids({"utm_source": "meta"}))
+
+    def test_page_queries_use_the_index(self):
+        page = database.get_events_page(limit=5)
+        timestamp, event_id = database.decode_cursor(page["next_cursor"])
+        query = {"$and": [{"timestamp": {"$lte": timestamp}},
+                          {"$or": [{"timestamp": {"$lt": timestamp}},
+                                   {"timestamp": timestamp, "_id": {"$lt": event_id}}]}]}
+        plan = self.events.find(query).sort([("timestamp", -1), ("_id", -1)]).explain()
+        self.assertEqual(plan["queryPlanner"]["winningPlan"]["stage"], "FETCH")
+
+    def test_filtered_total_is_counted_in_background(self):
+        cache = CountCache(database.count_events, ttl=60)
+        with patch.object(database, "_count_cache", cache):
+            first = self.app.get('/api/events?utm_source=meta').get_json()["pagination"]
+            deadline = time.time() + 5
+            while cache.get({"utm_source": "meta"})[0] is None and time.time() < deadline:
+                time.sleep(0.01)
+            second = self.app.get('/api/events?utm_source=meta').get_json()["pagination"]
+        self.assertIsNone(first["total"])
+        self.assertEqual(second["total"], 8)
+        self.assertTrue(second["total_is_estimate"])
+
+    def test_invalid_limits(self):
+        cursor = database.get_events_page(limit=5)["next_cursor"]
+        for limit in ("0", "-1", "101", "ten"):
+            for params in ({"limit": limit}, {"limit": limit, "cursor": cursor}):
+                response = self.app.get('/api/events', query_string=params)
+                self.assertEqual(response.status_code, 400, params)
+                self.assertFalse(response.get_json()["success"])
+        self.assertEqual(len(self.app.get('/api/events?limit=100').get_json()["events"]), 23)
+        for limit in (0, -1):
+            with self.assertRaises(ValueError):
+                database.get_events_page(limit=limit, cursor=cursor)
+
+    def test_invalid_cursor(self):
+        response = self.app.get('/api/events?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_legacy_page_parameter(self):
+        data = self.app.get('/api/events?page=2&limit=10').get_json()
+        self.assertEqual(data["pagination"]["page"], 2)
+        self.assertEqual(data["pagination"]["total_pages"], 3)
+        self.assertEqual([e["_id"] for e in data["events"]], self.expected_ids()[10:20])
+
+if __name__ == '__main__':
+    unittest.main()
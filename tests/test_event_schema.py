@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch
+import copy
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import bson
+from app import app
+from src import database, rollups, track_handler
+from src.event_schema import LOOKUPS, StringLookup
+from src.mock_db import MockDatabase
+
+UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+def tracked_event(**params):
+    """An event built by process_tracking_event for a GET /track request."""
+    params = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "spring", "gclid": "abc123",
+              "current_page": "/pricing", "url": "https://www.example.com/pricing", **params}
+    with app.test_request_context('/track', query_string=params, headers={"User-Agent": UA}):
+        return track_handler.process_tracking_event()
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return datetime(2025, 1, 1)
+
+class TestEventSchema(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.db = MockDatabase()
+        for name, value in (("_mock_db", self.db), ("_db", None), ("_lookups", StringLookup())):
+            patcher = patch.object(database, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(track_handler, "ROLLUPS_ENABLED", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, events, version):
+        # Both layouts get the same write time, so the read-back events compare equal
+        with patch.object(database, "EVENT_SCHEMA_VERSION", version), \
+                patch.object(database, "datetime", FrozenDatetime):
+            database.insert_events(events)
+
+    def test_v2_documents_read_back_unchanged(self):
+        events = [tracked_event(), tracked_event(event_type="click", element_text="Buy", extra="1"),
+                  tracked_event(igsh="xyz", session_id="sess_given")]
+        for event in events:
+            event["_id"] = bson.ObjectId()
+        v1 = copy.deepcopy(events)
+        self.store(v1, 1)
+        expected = database.get_events(limit=10)
+        self.db["raw_events"].delete_many({})
+
+        self.store(events, 2)
+        stored = self.db["raw_events"].find_one({"event_type": "click"})
+        self.assertEqual(stored["v"], 2)
+        self.assertNotIn("user_agent", stored)
+        self.assertEqual(stored["p"], {"url": "https://www.example.com/pricing", "extra": "1"})
+        self.assertEqual(database.get_events(limit=10), expected)
+
+        data = self.app.get('/api/events?limit=10').get_json()
+        self.assertEqual(data["events"], expected)
+
+    def test_v2_documents_are_much_smaller(self):
+        events = [tracked_event(sequence_step=str(i)) for i in range(20)]
+        v1 = copy.deepcopy(events)
+        self.store(events, 2)
+        v1_size = sum(len(bson.encode(e)) for e in v1)
+        v2_size = sum(len(bson.encode(d)) for d in self.db["raw_events"].find())
+        self.assertLess(v2_size * 2, v1_size)
+
+    def test_strings_are_interned_once(self):
+        self.store([tracked_event() for _ in range(3)], 2)
+        self.store([tracked_event(current_page="/signup")], 2)
+        self.assertEqual([d["value"] for d in self.db[LOOKUPS["ua"]].find()], [UA])
+        urls = sorted(d["value"] for d in self.db[LOOKUPS["url"]].find())
+        self.assertEqual(urls, ["/pricing", "/signup", "http://localhost/track"])
+
+        # A fresh process resolves the same ids from the lookup collections
+        with patch.object(database, "_lookups", StringLookup()):
+            self.assertEqual(database.get_events(limit=1)[0]["current_page"], "/signup")
+
+    def test_backfill_merges_v1_and_v2_hosts(self):
+        now = datetime.utcnow().replace(minute=30)
+        self.store([tracked_event() for _ in range(2)], 1)
+        self.store([tracked_event() for _ in range(3)], 2)
+        for name in ("raw_events", rollups.DAILY):
+            self.db[name]
+        with patch.object(rollups, "get_collection", lambda name="raw_events": self.db[name]):
+            rollups.backfill_rollups(now - timedelta(days=1), now + timedelta(days=1))
+        daily = list(self.db[rollups.DAILY].find())
+        self.assertEqual([(d["site"], d["events"]) for d in daily], [("www.example.com", 5)])
+
+if __name__ == '__main__':
+    unittest.main()
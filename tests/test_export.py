@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, export
+from tests.helpers import use_database
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        self.start = datetime(2025, 1, 1)
+
+    def insert(self, count, source="google", version=1):
+        events = [{"timestamp": self.start + timedelta(hours=i), "utm_source": source, "host": "www.example.com",
+                   "current_page": f"/p{i}", "raw_params": {"utm_source": source, "x": str(i)}}
+                  for i in range(count)]
+        with patch.object(database, "EVENT_SCHEMA_VERSION", version):
+            database.insert_events(events)
+
+    def test_ndjson_in_batches(self):
+        self.insert(3)
+        self.insert(2, source="meta", version=2)
+        chunks = export.export_events(batch_size=2)
+        lines = b"".join(chunks).decode("utf-8").splitlines()
+        events = [json.loads(line) for line in lines]
+        self.assertEqual(len(events), 5)
+        self.assertEqual([e["timestamp"] for e in events], sorted(e["timestamp"] for e in events))
+        self.assertEqual({e["current_page"] for e in events}, {"/p0", "/p1", "/p2"})
+        self.assertEqual(events[0]["raw_params"]["x"], "0")
+
+        # One encoded chunk per cursor batch; nothing is read before iterating
+        with patch.object(self.db["raw_events"], "find", side_effect=AssertionError("read")):
+            chunks = export.export_events(batch_size=2)
+        self.assertEqual(len(list(chunks)), 3)
+
+    def test_csv(self):
+        self.insert(2)
+        rows = list(csv.reader(io.StringIO(b"".join(export.export_events(fmt="csv")).decode("utf-8"))))
+        self.assertEqual(rows[0], list(export.DEFAULT_CSV_COLUMNS))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][rows[0].index("utm_source")], "google")
+
+        rows = list(csv.reader(io.StringIO(b"".join(
+            export.export_events(fmt="csv", fields=["utm_source", "raw_params"])).decode("utf-8"))))
+        self.assertEqual(rows[0], ["_id", "utm_source", "raw_params"])
+        self.assertEqual(json.loads(rows[1][2]), {"utm_source": "google", "x": "0"})
+
+        empty = b"".join(export.export_events({"utm_source": "none"}, fmt="csv")).decode("utf-8")
+        self.assertEqual(empty.splitlines(), [",".join(export.DEFAULT_CSV_COLUMNS)])
+        with self.assertRaises(ValueError):
+            export.export_events(fmt="xml")
+
+    def test_gzip(self):
+        self.insert(3)
+        plain = b"".join(export.export_events())
+        self.assertEqual(gzip.decompress(b"".join(export.export_events(compress=True))), plain)
+
+    def test_api(self):
+        self.insert(3)
+        self.insert(2, source="meta")
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            client = app.test_client()
+            ndjson = client.get('/api/events/export', query_string={"utm_source": "meta", "fields": "utm_source"},
+                                buffered=True)
+            compressed = client.get('/api/events/export', query_string={"format": "csv", "gzip": "1"},
+                                    buffered=True)
+            bad = client.get('/api/events/export', query_string={"format": "xml"})
+        self.assertEqual(ndjson.mimetype, "application/x-ndjson")
+        self.assertEqual([set(json.loads(line)) for line in ndjson.data.splitlines()],
+                         [{"_id", "utm_source"}] * 2)
+        self.assertIn('.csv.gz"', compressed.headers["Content-Disposition"])
+        self.assertEqual(len(gzip.decompress(compressed.data).splitlines()), 6)
+        self.assertEqual(bad.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, filter_values, track_handler
+from src.event_schema import LOOKUPS, split_host
+from src.filter_values import FilterValues
+from tests.helpers import use_database
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestFilterValues(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        for name in ("ROLLUPS_ENABLED", "SESSIONS_ENABLED", "CLICK_IDS_ENABLED"):
+            patcher = patch.object(track_handler, name, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.clock = FakeClock()
+
+    def worker(self):
+        return FilterValues(lambda name: self.db[name], refresh_interval=30, reconcile_interval=3600, clock=self.clock)
+
+    def ingest(self, host="www.example.com", **fields):
+        # Like process_tracking_event: domain and subdomain come from the host
+        domain, subdomain = split_host(host)
+        track_handler.write_events([{"timestamp": datetime.utcnow(), "host": host, "domain": domain,
+                                     "subdomain": subdomain, **fields}])
+
+    def test_seeded_once_then_updated_from_ingest(self):
+        self.ingest(utm_source="google", campaign_id="c1")
+        worker = self.worker()
+        self.assertEqual(worker.get(), {"campaign_id": ["c1"], "utm_source": ["google"]})
+
+        with patch.object(self.db["raw_events"], "distinct", side_effect=AssertionError("scanned")):
+            worker.add([{"utm_source": "meta", "utm_medium": "cpc", "host": "shop.other.org"}])
+            self.assertEqual(worker.get(), {"campaign_id": ["c1"], "utm_source": ["google", "meta"]})
+
+    def test_new_fields_without_new_scans(self):
+        self.ingest(utm_source="google", utm_medium="cpc", platform_detected="Google Ads")
+        worker = self.worker()
+        fields = ["utm_medium", "platform_detected", "domain"]
+        self.assertEqual(worker.get(fields), {"utm_medium": ["cpc"], "platform_detected": ["Google Ads"],
+                                              "domain": ["example.com"]})
+        with patch.object(self.db["raw_events"], "distinct", side_effect=AssertionError("scanned")):
+            self.clock.now += 60
+            self.assertEqual(worker.get(fields)["domain"], ["example.com"])
+
+    def test_workers_share_values(self):
+        first, second = self.worker(), self.worker()
+        self.assertEqual(second.get(), {"campaign_id": [], "utm_source": []})
+        first.add([{"utm_source": "tiktok"}])
+        # Seen by the other worker once it re-reads the shared documents
+        self.assertEqual(second.get()["utm_source"], [])
+        self.clock.now += 30
+        self.assertEqual(second.get()["utm_source"], ["tiktok"])
+
+    def test_failed_shared_write_is_retried(self):
+        worker = self.worker()
+        worker.get()
+        with patch.object(self.db[filter_values.FILTER_VALUES], "bulk_write", side_effect=ConnectionError("down")):
+            with self.assertRaises(ConnectionError):
+                worker.add([{"utm_source": "tiktok"}])
+        self.assertEqual(worker.get()["utm_source"], [])
+        worker.add([{"utm_source": "tiktok"}])
+        self.assertEqual(self.db[filter_values.FILTER_VALUES].find_one({"_id": "utm_source"})["values"], ["tiktok"])
+
+    def test_reconcile_drops_removed_values(self):
+        self.ingest(utm_source="google")
+        self.ingest(utm_source="bing")
+        worker = self.worker()
+        self.assertEqual(worker.get()["utm_source"], ["bing", "google"])
+        self.db["raw_events"].delete_many({"utm_source": "bing"})
+        worker.reconcile("utm_source")
+        self.assertEqual(self.worker().get()["utm_source"], ["google"])
+
+    def test_ingest_updates_the_shared_sets(self):
+        self.ingest(utm_source="google")
+        self.assertEqual(filter_values.get_filter_values(["utm_source"]), {"utm_source": ["google"]})
+        self.ingest(utm_source="meta")
+        self.assertEqual(filter_values.get_filter_values(["utm_source"]), {"utm_source": ["google", "meta"]})
+
+    def test_ingest_updates_can_be_disabled(self):
+        with patch.object(track_handler, "FILTER_VALUES_ENABLED", False):
+            self.ingest(utm_source="google")
+        self.assertIsNone(self.db[filter_values.FILTER_VALUES].find_one({"_id": "utm_source"}))
+
+    def test_domains_of_compact_events(self):
+        with patch.object(database, "EVENT_SCHEMA_VERSION", 2):
+            self.ingest(host="book.clinic.com", utm_source="google")
+        self.ingest(host="www.example.com", utm_source="meta")
+        self.assertEqual(filter_values.distinct_values("domain"), {"clinic.com", "example.com"})
+        events = database.get_events(filter_values.domain_filter("clinic.com"))
+        self.assertEqual([e["utm_source"] for e in events], ["google"])
+
+    def test_domain_filter_reads_new_hosts_only(self):
+        hosts = self.db[LOOKUPS["host"]]
+        hosts.insert_many([{"_id": 1, "value": "www.clinic.com"}, {"_id": 2, "value": "www.example.com"}])
+        self.assertEqual(filter_values.domain_filter("clinic.com"),
+                         {"$or": [{"domain": "clinic.com"}, {"h": {"$in": [1]}}]})
+        hosts.insert_one({"_id": 3, "value": "book.clinic.com"})
+        with patch.object(hosts, "find", wraps=hosts.find) as find:
+            self.assertEqual(filter_values.domain_filter("clinic.com")["$or"][1], {"h": {"$in": [1, 3]}})
+        self.assertEqual(find.call_args[0][0], {"_id": {"$gt": 2}})
+        self.assertEqual(filter_values.domain_filter("other.org"), {"domain": "other.org"})
+
+    def test_api(self):
+        self.ingest(utm_source="google", campaign_id="c1", platform_detected="Google Ads")
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            client = app.test_client()
+            default = client.get('/api/events/filters')
+            extra = client.get('/api/events/filters', query_string={"fields": "platform_detected,domain"})
+            bad = client.get('/api/events/filters', query_string={"fields": "ip_address"})
+            events = client.get('/api/events', query_string={"domain": "example.com",
+                                                             "platform_detected": "Google Ads"})
+        self.assertEqual(default.json["campaign_ids"], ["c1"])
+        self.assertEqual(default.json["utm_sources"], ["google"])
+        self.assertEqual(extra.json["values"], {"platform_detected": ["Google Ads"], "domain": ["example.com"]})
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(len(events.json["events"]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
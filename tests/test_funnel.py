@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, track_handler
+from src.analysis import funnel
+from tests.helpers import use_database
+
+STEPS = [
+    {"name": "Landing", "event_type": "page_view", "page": "/"},
+    {"name": "Booking", "page": "/booking*"},
+    {"name": "Conversion", "event_type": "conversion"},
+]
+
+class TestFunnel(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        for name in ("ROLLUPS_ENABLED", "SESSIONS_ENABLED"):
+            patcher = patch.object(track_handler, name, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.start = datetime.utcnow() - timedelta(days=1)
+        self.minute = 0
+
+    def visit(self, session_id, *hits, campaign="spring", platform="Google Ads"):
+        events = []
+        for event_type, page in hits:
+            self.minute += 1
+            events.append({"session_id": session_id, "timestamp": self.start + timedelta(minutes=self.minute),
+                           "event_type": event_type, "current_page": page,
+                           "utm_campaign": campaign, "platform_detected": platform})
+        track_handler.write_events(events)
+
+    def run_funnel(self, **definition):
+        return funnel.run_funnel({"steps": STEPS, **definition}, self.start, self.start + timedelta(days=1))
+
+    def test_ordered_step_completion(self):
+        self.visit("a", ("page_view", "/"), ("page_view", "/booking/new"), ("conversion", "/booking/done"))
+        self.visit("b", ("page_view", "/"), ("page_view", "/booking"))
+        # Booked before landing: only the landing step counts
+        self.visit("c", ("page_view", "/booking"), ("page_view", "/"), campaign="summer", platform="TikTok")
+        # Converted without booking
+        self.visit("d", ("page_view", "/"), ("conversion", "/thanks"), campaign="summer", platform="TikTok")
+        self.visit("e", ("page_view", "/pricing"))
+
+        result = self.run_funnel()
+        self.assertEqual([s["sessions"] for s in result["steps"]], [4, 2, 1])
+        self.assertEqual(result["steps"][1]["step_rate"], 0.5)
+        self.assertEqual(result["steps"][2]["overall_rate"], 0.25)
+
+        campaigns = {g["value"]: [s["sessions"] for s in g["steps"]] for g in result["breakdowns"]["utm_campaign"]}
+        self.assertEqual(campaigns, {"spring": [2, 2, 1], "summer": [2, 0, 0]})
+        platforms = {g["value"]: [s["sessions"] for s in g["steps"]] for g in result["breakdowns"]["platform_detected"]}
+        self.assertEqual(platforms, {"Google Ads": [2, 2, 1], "TikTok": [2, 0, 0]})
+
+    def test_one_event_completes_one_step(self):
+        self.visit("a", ("page_view", "/"))
+        result = funnel.run_funnel({"steps": [{"page": "/"}, {"event_type": "page_view"}]},
+                                   self.start, self.start + timedelta(days=1))
+        self.assertEqual([s["sessions"] for s in result["steps"]], [1, 0])
+
+    def test_cached_until_new_events(self):
+        self.visit("a", ("page_view", "/"), ("page_view", "/booking"))
+        self.assertFalse(self.run_funnel()["cached"])
+        with patch.object(funnel, "load_columns", side_effect=AssertionError("reloaded")):
+            self.assertTrue(self.run_funnel()["cached"])
+        self.visit("b", ("page_view", "/"))
+        result = self.run_funnel()
+        self.assertFalse(result["cached"])
+        self.assertEqual(result["steps"][0]["sessions"], 2)
+
+    def test_compact_events(self):
+        with patch.object(database, "EVENT_SCHEMA_VERSION", 2):
+            self.visit("a", ("page_view", "/"), ("page_view", "/booking"), ("conversion", "/done"))
+        self.visit("b", ("page_view", "/"), ("page_view", "/booking"))
+        self.assertEqual([s["sessions"] for s in self.run_funnel()["steps"]], [2, 2, 1])
+
+    def test_invalid_definitions(self):
+        for definition in ({}, {"steps": []}, {"steps": [{"name": "x"}]}, {"steps": STEPS, "breakdowns": ["ip_address"]}):
+            with self.assertRaises(ValueError):
+                funnel.normalize_definition(definition)
+
+    def test_vectorized_engine_speed(self):
+        # Columns for about 30 days of a busy site: 1M events, 200k sessions
+        rng = np.random.default_rng(7)
+        n = 1_000_000
+        columns = {
+            "session": rng.integers(0, 200_000, n),
+            "session_values": list(range(200_000)),
+            "time": rng.integers(0, 30 * 86_400_000, n),
+            "event_type": rng.integers(0, 2, n),
+            "event_type_values": ["page_view", "conversion"],
+            "page": rng.integers(0, 3, n),
+            "page_values": ["/", "/booking", "/pricing"],
+            "utm_campaign": rng.integers(0, 50, n),
+            "utm_campaign_values": [f"c{i}" for i in range(50)],
+        }
+        steps = funnel.normalize_definition({"steps": STEPS})["steps"]
+        started = time.perf_counter()
+        result = funnel.compute_funnel(columns, steps, ["utm_campaign"])
+        self.assertLess(time.perf_counter() - started, 1.0)
+        counts = [s["sessions"] for s in result["steps"]]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(sum(g["steps"][0]["sessions"] for g in result["breakdowns"]["utm_campaign"]), counts[0])
+
+    def test_api(self):
+        self.visit("a", ("page_view", "/"), ("page_view", "/booking"))
+        client = app.test_client()
+        with patch("src.blueprints.analysis.rate_limit_exceeded", return_value=None):
+            ok = client.post('/api/analysis/funnel', json={"steps": STEPS, "days": 7})
+            bad = client.post('/api/analysis/funnel', json={"steps": "nope"})
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual([s["sessions"] for s in ok.json["steps"]], [1, 1, 0])
+        self.assertEqual(bad.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
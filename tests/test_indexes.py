@@ -0,0 +1,162 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, rollups
+from src.analysis import llm_preprocessor
+from src.indexes import INDEXES, sync_indexes
+from src.mock_db import MockDatabase
+from src.modules.therapist import routes as therapist_routes
+from tests.helpers import use_database
+
+
+def plan_stages(plan):
+    """All stage names in an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        stages += plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+class RecordingCollection:
+    """Collection proxy that records the queries the app sends."""
+
+    def __init__(self, collection, queries):
+        self._collection = collection
+        self._queries = queries
+
+    def find(self, filter_dict=None, *args, **kwargs):
+        cursor = self._collection.find(filter_dict, *args, **kwargs)
+        self._queries.append((self._collection, "find", cursor))
+        return cursor
+
+    def count_documents(self, filter_dict, **kwargs):
+        self._queries.append((self._collection, "count", filter_dict))
+        return self._collection.count_documents(filter_dict, **kwargs)
+
+    def distinct(self, field, filter_dict=None, **kwargs):
+        self._queries.append((self._collection, "distinct", field))
+        return self._collection.distinct(field, filter_dict, **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._queries.append((self._collection, "aggregate", pipeline))
+        return self._collection.aggregate(pipeline, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class TestIndexRegistry(unittest.TestCase):
+    def make_database(self):
+        return MockDatabase()
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.db = use_database(self, self.make_database())
+        sync_indexes(self.db)
+
+        now = datetime.utcnow()
+        self.db["raw_events"].insert_many([
+            {"timestamp": now - timedelta(hours=i), "campaign_id": f"c{i % 2}", "utm_source": "google",
+             "event_type": "conversion" if i % 4 == 0 else "page_view", "conversion_value": 10}
+            for i in range(12)
+        ])
+        # A compact event's interned host, so a domain filter also matches host ids
+        self.db["lookup_hosts"].insert_one({"_id": 1, "value": "book.clinic.com"})
+        self.db["therapist_ratings"].insert_one({"therapist_id": "t1", "rating": 5, "created_at": now})
+
+        self.queries = []
+        get_collection = lambda name="raw_events": RecordingCollection(self.db[name], self.queries)
+        for module in (database, rollups, therapist_routes):
+            patcher = patch.object(module, "get_collection", get_collection)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def explain(self, collection, kind, query):
+        if kind == "find":
+            return query.explain()
+        if kind == "count":
+            return collection.find(query).explain()
+        match = query[0]["$match"] if query and "$match" in query[0] else {}
+        return collection.find(match).explain()
+
+    def test_sync_is_idempotent(self):
+        report = sync_indexes(self.db)
+        for collection, result in report.items():
+            self.assertEqual(result["created"] + result["rebuilt"], [], collection)
+            self.assertEqual(len(result["unchanged"]), len(INDEXES[collection]))
+
+    def test_changed_definition_is_rebuilt(self):
+        self.db["surveys"].drop_index("type_received_at")
+        self.db["surveys"].create_index([("type", 1)], name="type_received_at")
+        self.db["surveys"].create_index([("legacy", 1)])
+        report = sync_indexes(self.db, collections=["surveys"], drop_unknown=True)["surveys"]
+        self.assertEqual(report["rebuilt"], ["type_received_at"])
+        self.assertEqual(report["dropped"], ["legacy_1"])
+
+    def test_api_queries_use_indexes(self):
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        requests = [
+            "/api/events",
+            "/api/events?campaign_id=c1",
+            "/api/events?utm_source=google&count=exact",
+            f"/api/events?date_from={today}&date_to={today}&count=exact",
+            f"/api/events?campaign_id=c0&utm_source=google&date_from={today}",
+            "/api/events?page=2&limit=5",
+            "/api/events?utm_source=google&page=1",
+            "/api/events/filters",
+            "/api/events?utm_medium=cpc&count=exact",
+            "/api/events?domain=example.com&count=exact",
+            f"/api/events?domain=clinic.com&date_from={today}&count=exact",
+            "/api/therapist/history/t1",
+            "/api/analysis/campaigns?days=30",
+        ]
+        for url in requests:
+            self.assertEqual(self.app.get(url).status_code, 200, url)
+
+        data = self.app.get("/api/events?limit=5").get_json()
+        self.app.get(f"/api/events?limit=5&cursor={data['pagination']['next_cursor']}")
+        data = self.app.get("/api/events?utm_source=google&limit=5").get_json()
+        self.app.get(f"/api/events?utm_source=google&limit=5&cursor={data['pagination']['next_cursor']}")
+
+        with patch("src.blueprints.analysis.llm_service.analyze_marketing_data", return_value="ok"):
+            self.app.post("/api/analysis/ask", json={"query": "How are campaigns doing?"})
+        llm_preprocessor.aggregate_campaign_performance()
+
+        self.assertGreater(len(self.queries), 10)
+        for collection, kind, query in self.queries:
+            if kind == "distinct":
+                first_fields = [d["keys"][0][0] for d in INDEXES[collection.name] if "partialFilterExpression" not in d]
+                self.assertIn(query, first_fields, f"distinct({query!r}) on {collection.name} has no index")
+                continue
+            plan = self.explain(collection, kind, query)["queryPlanner"]["winningPlan"]
+            self.assertNotIn("COLLSCAN", plan_stages(plan),
+                             f"{kind} on {collection.name} scans the collection: {plan}")
+
+
+@unittest.skipUnless(os.getenv("MONGODB_TEST_URI"), "MONGODB_TEST_URI not set")
+class TestIndexRegistryMongo(TestIndexRegistry):
+    """Same checks against a real (disposable) MongoDB database."""
+
+    def make_database(self):
+        from pymongo import MongoClient
+        client = MongoClient(os.getenv("MONGODB_TEST_URI"), serverSelectionTimeoutMS=5000)
+        name = f"index_registry_test_{os.getpid()}"
+        self.addCleanup(client.close)
+        self.addCleanup(client.drop_database, name)
+        return client[name]
+
+if __name__ == '__main__':
+    unittest.main()
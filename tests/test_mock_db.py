@@ -0,0 +1,252 @@
+import unittest
+import sys
+import json
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from unittest import mock
+from src import mock_aggregate, mock_db
+from src.mock_db import MockDatabase
+
+class TestMockDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name) / "db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def reopen(self, db):
+        db.close()
+        return MockDatabase(self.dir)
+
+    def test_documents_survive_reopen(self):
+        db = MockDatabase(self.dir)
+        event_id = ObjectId()
+        db["raw_events"].insert_one({"_id": event_id, "timestamp": datetime(2025, 1, 1), "utm_source": "google"})
+        db["raw_events"].insert_many([{"utm_source": "meta"}, {"utm_source": "tiktok"}])
+        db["raw_events"].create_index("utm_source")
+        
+        db = self.reopen(db)
+        self.assertIn("utm_source_1", db["raw_events"].index_information())
+        events = list(db["raw_events"].find({"_id": event_id}))
+        self.assertEqual(events[0]["timestamp"], datetime(2025, 1, 1))
+        self.assertEqual(db["raw_events"].count_documents(), 3)
+        self.assertEqual(db.list_collection_names(), ["raw_events"])
+
+    def test_inserts_only_append(self):
+        db = MockDatabase(self.dir)
+        collection = db["raw_events"]
+        collection.insert_one({"n": 1})
+        segment = next((self.dir / "raw_events").glob("*.jsonl"))
+        size = segment.stat().st_size
+        collection.insert_one({"n": 2})
+        self.assertLess(segment.stat().st_size, 2 * size + 10)
+        self.assertEqual(len(segment.read_text().splitlines()), 2)
+        db.close()
+
+    def test_torn_last_line_is_ignored(self):
+        db = MockDatabase(self.dir)
+        db["raw_events"].insert_one({"n": 1})
+        db.close()
+        segment = next((self.dir / "raw_events").glob("*.jsonl"))
+        with open(segment, "a") as f:
+            f.write('i{"_id": "x", "n"')
+        
+        db = MockDatabase(self.dir)
+        self.assertEqual(db["raw_events"].count_documents(), 1)
+        db.close()
+
+    def test_compaction_keeps_live_documents(self):
+        original = mock_db.COMPACT_MIN_GARBAGE
+        mock_db.COMPACT_MIN_GARBAGE = 5
+        try:
+            db = MockDatabase(self.dir)
+            collection = db["raw_events"]
+            for i in range(10):
+                collection.delete_many({"_id": "same"})
+                collection.insert_one({"_id": "same", "n": i})
+            collection.insert_one({"_id": "other", "n": 99})
+            
+            db = self.reopen(db)
+            docs = sorted(db["raw_events"].find(), key=lambda d: d["_id"])
+            self.assertEqual([(d["_id"], d["n"]) for d in docs], [("other", 99), ("same", 9)])
+            lines = sum(len(p.read_text().splitlines()) for p in (self.dir / "raw_events").glob("*.jsonl"))
+            self.assertLess(lines, 11)
+            db.close()
+        finally:
+            mock_db.COMPACT_MIN_GARBAGE = original
+
+    def test_legacy_file_is_imported_once(self):
+        legacy = Path(self.tmp.name) / "mock_db.json"
+        legacy.write_text(json.dumps({"surveys": [{"_id": "s1", "email": "a@example.com"}]}))
+        
+        db = MockDatabase(self.dir, legacy_file=legacy)
+        self.assertEqual(db["surveys"].count_documents(), 1)
+        db.close()
+        legacy.write_text(json.dumps({}))
+        
+        db = MockDatabase(self.dir, legacy_file=legacy)
+        self.assertEqual(db["surveys"].count_documents({"email": "a@example.com"}), 1)
+        db.close()
+
+class TestMockQueries(unittest.TestCase):
+    def setUp(self):
+        self.db = MockDatabase()
+        self.events = self.db["raw_events"]
+        self.events.insert_many([
+            {"_id": i, "timestamp": datetime(2025, 1, i + 1), "utm_source": src, "campaign_id": cid, "n": i}
+            for i, (src, cid) in enumerate([
+                ("google", "c1"), ("meta", "c1"), ("google", "c2"), ("tiktok", None), ("google", "c1")
+            ])
+        ])
+
+    def ids(self, cursor):
+        return [d["_id"] for d in cursor]
+
+    def test_comparison_operators(self):
+        query = {"timestamp": {"$gte": datetime(2025, 1, 2), "$lte": datetime(2025, 1, 4)}}
+        self.assertEqual(sorted(self.ids(self.events.find(query))), [1, 2, 3])
+        self.assertEqual(sorted(self.ids(self.events.find({"utm_source": {"$in": ["meta", "tiktok"]}}))), [1, 3])
+        self.assertEqual(sorted(self.ids(self.events.find({"campaign_id": {"$exists": False}}))), [])
+        self.assertEqual(sorted(self.ids(self.events.find({"campaign_id": None}))), [3])
+        # Values of a different BSON type never match a range
+        self.assertEqual(self.events.count_documents({"timestamp": {"$gte": "2025-01-01"}}), 0)
+
+    def test_sort_skip_limit_projection(self):
+        cursor = self.events.find({"utm_source": "google"}, {"n": 1, "_id": 0}).sort("timestamp", -1).skip(1).limit(1)
+        self.assertEqual(list(cursor), [{"n": 2}])
+
+    def test_results_are_copies(self):
+        doc = self.events.find_one({"_id": 0})
+        doc["_id"] = "changed"
+        self.assertEqual(self.events.count_documents({"_id": 0}), 1)
+
+    def test_indexes_are_used_and_maintained(self):
+        self.events.create_index([("utm_source", 1), ("timestamp", -1)])
+        self.events.create_index("timestamp")
+        
+        plan = self.events.find({"utm_source": "google"}).explain()["queryPlanner"]["winningPlan"]
+        self.assertEqual(plan["inputStage"]["indexName"], "utm_source_1_timestamp_-1")
+        plan = self.events.find({}).sort("timestamp", -1).explain()["queryPlanner"]["winningPlan"]
+        self.assertEqual(plan["inputStage"]["indexName"], "timestamp_1")
+        plan = self.events.find({"n": 1}).explain()["queryPlanner"]["winningPlan"]
+        self.assertEqual(plan["stage"], "COLLSCAN")
+        
+        self.events.insert_one({"_id": 9, "timestamp": datetime(2025, 2, 1), "utm_source": "google"})
+        self.events.delete_many({"_id": 0})
+        self.assertEqual(sorted(self.ids(self.events.find({"utm_source": "google"}))), [2, 4, 9])
+        self.assertEqual(self.ids(self.events.find({}).sort("timestamp", -1).limit(2)), [9, 4])
+        query = {"timestamp": {"$gt": datetime(2025, 1, 4)}}
+        self.assertEqual(sorted(self.ids(self.events.find(query))), [4, 9])
+
+    def test_partial_index_only_serves_matching_queries(self):
+        self.events.create_index("n", name="conversions", partialFilterExpression={"utm_source": "meta"})
+        plan = self.events.find({"n": 1, "utm_source": "meta"}).explain()["queryPlanner"]["winningPlan"]
+        self.assertEqual(plan["inputStage"]["indexName"], "conversions")
+        plan = self.events.find({"n": 1}).explain()["queryPlanner"]["winningPlan"]
+        self.assertEqual(plan["stage"], "COLLSCAN")
+        self.assertEqual(self.ids(self.events.find({"n": 1, "utm_source": "meta"})), [1])
+
+    def test_duplicate_keys_are_rejected(self):
+        with self.assertRaises(DuplicateKeyError):
+            self.events.insert_one({"_id": 0})
+        with self.assertRaises(BulkWriteError) as ctx:
+            self.events.insert_many([{"_id": 10}, {"_id": 1}, {"_id": 11}], ordered=False)
+        self.assertEqual(ctx.exception.details["writeErrors"][0]["code"], 11000)
+        self.assertEqual(self.events.count_documents({"_id": {"$in": [10, 11]}}), 2)
+
+class TestMockAggregation(unittest.TestCase):
+    def setUp(self):
+        self.db = MockDatabase()
+        self.events = self.db["raw_events"]
+        rows = [
+            ("google", "c1", "page_view", None), ("google", "c1", "conversion", 50.0),
+            ("google", "c1", "conversion", 25.5), ("meta", "c2", "page_view", None),
+            ("meta", "c2", "conversion", 10), ("tiktok", None, "page_view", None),
+        ]
+        self.events.insert_many([
+            {"_id": i, "timestamp": datetime(2025, 1, 1, i), "utm_source": src, "utm_campaign": camp,
+             "event_type": event_type, **({"conversion_value": value} if value is not None else {})}
+            for i, (src, camp, event_type, value) in enumerate(rows)
+        ])
+        self.events.insert_one({"_id": 99, "timestamp": datetime(2024, 1, 1), "utm_source": "old"})
+
+    def campaign_pipeline(self):
+        # Same shape as llm_preprocessor.aggregate_campaign_performance
+        conversion = {"$eq": ["$event_type", "conversion"]}
+        return [
+            {"$match": {"timestamp": {"$gte": datetime(2025, 1, 1)}}},
+            {"$group": {
+                "_id": {"source": "$utm_source", "campaign": "$utm_campaign"},
+                "total_clicks": {"$sum": 1},
+                "conversions": {"$sum": {"$cond": [conversion, 1, 0]}},
+                "total_revenue": {"$sum": {"$cond": [conversion, "$conversion_value", 0]}},
+            }},
+            {"$project": {
+                "_id": 0, "source": "$_id.source", "campaign": "$_id.campaign",
+                "clicks": "$total_clicks", "conversions": 1, "revenue": "$total_revenue",
+                "conversion_rate": {"$cond": [{"$eq": ["$total_clicks", 0]}, 0,
+                                              {"$divide": ["$conversions", "$total_clicks"]}]},
+            }},
+            {"$sort": {"revenue": -1}},
+        ]
+
+    def test_campaign_pipeline(self):
+        results = list(self.events.aggregate(self.campaign_pipeline()))
+        self.assertEqual(results, [
+            {"source": "google", "campaign": "c1", "clicks": 3, "conversions": 2, "revenue": 75.5,
+             "conversion_rate": 2 / 3},
+            {"source": "meta", "campaign": "c2", "clicks": 2, "conversions": 1, "revenue": 10,
+             "conversion_rate": 0.5},
+            {"source": "tiktok", "campaign": None, "clicks": 1, "conversions": 0, "revenue": 0,
+             "conversion_rate": 0.0},
+        ])
+
+    def test_columnar_and_row_paths_agree(self):
+        pipeline = self.campaign_pipeline()
+        columnar = list(self.events.aggregate(pipeline))
+        with mock.patch.object(mock_aggregate, "np", None):
+            rows = list(self.events.aggregate(pipeline))
+        self.assertEqual(columnar, rows)
+
+    def test_columnar_min_max_of_any_type(self):
+        pipeline = [{"$group": {"_id": "$utm_source", "first": {"$min": "$timestamp"}, "last": {"$max": "$timestamp"},
+                                "campaign": {"$max": "$utm_campaign"}, "value": {"$max": "$conversion_value"}}},
+                    {"$sort": {"_id": 1}}]
+        columnar = list(self.events.aggregate(pipeline))
+        with mock.patch.object(mock_aggregate, "np", None):
+            rows = list(self.events.aggregate(pipeline))
+        self.assertEqual(columnar, rows)
+        self.assertTrue(all(isinstance(r["first"], datetime) for r in columnar))
+        self.assertIsNone(next(r for r in columnar if r["_id"] == "tiktok")["campaign"])
+
+    def test_other_stages(self):
+        results = list(self.events.aggregate([
+            {"$match": {"event_type": "conversion"}},
+            {"$group": {"_id": "$utm_source", "avg": {"$avg": "$conversion_value"},
+                        "max": {"$max": "$conversion_value"}, "n": {"$count": {}}}},
+            {"$sort": {"_id": 1}},
+        ]))
+        self.assertEqual(results, [{"_id": "google", "avg": 37.75, "max": 50.0, "n": 2},
+                                   {"_id": "meta", "avg": 10.0, "max": 10, "n": 1}])
+        
+        hours = list(self.events.aggregate([
+            {"$match": {"utm_source": "google"}},
+            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d %H", "date": "$timestamp",
+                                                  "timezone": "America/New_York"}},
+                        "n": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+            {"$limit": 1},
+        ]))
+        self.assertEqual(hours, [{"_id": "2024-12-31 19", "n": 1}])
+        self.assertEqual(list(self.events.aggregate([{"$count": "total"}])), [{"total": 7}])
+
+if __name__ == '__main__':
+    unittest.main()
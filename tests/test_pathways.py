@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from bson import ObjectId
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, pathways
+from tests.helpers import use_database
+
+class TestPathways(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        patcher = patch.object(pathways, "PATHWAYS_LAG_S", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.start = datetime.utcnow() - timedelta(hours=3)
+
+    def store(self, session_id, minute, page=None, event_type="page_view", campaign="spring", host="a.example.com"):
+        at = self.start + timedelta(minutes=minute)
+        event = {"session_id": session_id, "timestamp": at, "created_at": at, "event_type": event_type,
+                 "host": host, "utm_campaign": campaign}
+        if page:
+            event["current_page"] = page
+        database.insert_events([event])
+
+    def rows(self, name, **scope):
+        return {
+            (row.get("path") or (row["from_page"], row["to_page"])): row.get("sessions", row.get("count"))
+            for row in self.db[name].find({"site": "*", "campaign": "*", **scope})
+        }
+
+    def test_paths_and_transitions(self):
+        for minute, page in enumerate(["/", "/pricing", "/pricing", "/signup"]):
+            self.store("s1", minute, page)
+        self.store("s1", 4, event_type="conversion")
+        self.store("s2", 1, "/", campaign="summer")
+        self.store("s2", 2, "/pricing", campaign="summer")
+        self.store("s3", 2, "/blog", host="b.example.com")
+
+        result = pathways.run_pathways_job(workers=4)
+        self.assertEqual(result["events"], 8)
+
+        self.assertEqual(self.rows(pathways.PATHS),
+                         {"/ > /pricing > /signup": 1, "/ > /pricing": 1, "/blog": 1})
+        self.assertEqual(self.rows(pathways.TRANSITIONS), {
+            ("(entrance)", "/"): 2, ("/", "/pricing"): 2, ("/pricing", "/signup"): 1, ("(entrance)", "/blog"): 1,
+        })
+        top = pathways.get_pathways(site="a.example.com", campaign="spring")
+        self.assertEqual(top["paths"][0]["pages"], ["/", "/pricing", "/signup"])
+        self.assertEqual(top["paths"][0]["conversion_rate"], 1)
+        self.assertEqual(len(pathways.get_pathways(campaign="summer")["paths"]), 1)
+
+    def test_incremental_runs_continue_sessions(self):
+        self.store("s1", 0, "/")
+        self.store("s1", 1, "/pricing")
+        pathways.run_pathways_job(workers=2)
+        self.store("s1", 2, "/signup")
+        self.store("s2", 2, "/")
+
+        self.assertEqual(pathways.run_pathways_job(workers=3)["events"], 2)
+        self.assertEqual(pathways.run_pathways_job(workers=3)["events"], 0)
+        # The session's count moved from its old path to the longer one
+        self.assertEqual(self.rows(pathways.PATHS), {"/ > /pricing > /signup": 1, "/": 1})
+        self.assertEqual(self.rows(pathways.TRANSITIONS)[("/pricing", "/signup")], 1)
+
+    def test_events_in_the_same_millisecond_as_the_mark(self):
+        at = self.start
+        first = {"_id": ObjectId(), "session_id": "s1", "timestamp": at, "created_at": at, "ingested_at": at,
+                 "event_type": "page_view", "current_page": "/"}
+        self.db["raw_events"].insert_one(dict(first))
+        pathways.run_pathways_job(workers=1)
+        self.db["raw_events"].insert_one({**first, "_id": ObjectId(), "session_id": "s2"})
+        self.assertEqual(pathways.run_pathways_job(workers=1)["events"], 1)
+
+    def test_late_writes_are_processed(self):
+        self.store("s1", 60, "/")
+        pathways.run_pathways_job(workers=2)
+        # Received before the last run, written after it (event log replay, buffer retry)
+        self.store("s1", 10, "/pricing")
+        self.assertEqual(pathways.run_pathways_job(workers=2)["events"], 1)
+        self.assertEqual(self.rows(pathways.TRANSITIONS)[("/", "/pricing")], 1)
+
+    def test_events_without_ingested_at_are_read_once(self):
+        at = self.start
+        self.db["raw_events"].insert_one({"session_id": "s1", "timestamp": at, "created_at": at,
+                                          "event_type": "page_view", "current_page": "/old"})
+        self.assertEqual(pathways.run_pathways_job()["events"], 1)
+        self.assertEqual(pathways.run_pathways_job()["events"], 0)
+        self.store("s2", 0, "/")
+        self.assertEqual(pathways.run_pathways_job()["events"], 1)
+        pathways.rebuild_pathways()
+        self.assertEqual(self.rows(pathways.PATHS), {"/old": 1, "/": 1})
+
+    def test_rebuild_matches_incremental(self):
+        for i in range(30):
+            self.store(f"s{i % 7}", i, ["/", "/pricing", "/signup", "/blog"][i % 4])
+            if i % 10 == 9:
+                pathways.run_pathways_job(workers=3)
+        incremental = self.rows(pathways.PATHS), self.rows(pathways.TRANSITIONS)
+        pathways.rebuild_pathways(workers=5)
+        self.assertEqual((self.rows(pathways.PATHS), self.rows(pathways.TRANSITIONS)), incremental)
+
+    def test_concurrent_run_is_skipped(self):
+        self.db[pathways.JOBS].insert_one({"_id": pathways.JOB_ID,
+                                           "lease_until": datetime.utcnow() + timedelta(minutes=5)})
+        self.assertEqual(pathways.run_pathways_job(), {"skipped": True})
+
+    def test_api(self):
+        self.store("s1", 0, "/")
+        pathways.run_pathways_job()
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            response = app.test_client().get('/api/pathways', query_string={"site": "a.example.com"})
+        self.assertEqual(response.json["paths"][0]["pages"], ["/"])
+        self.assertIsNotNone(response.json["through"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database
+from src.query_cache import QueryCache, result_size
+from tests.helpers import use_database
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=10, clock=self.clock)
+        cache.put("k", [1])
+        self.assertEqual(cache.get("k"), (True, [1]))
+        self.clock.now += 10
+        self.assertEqual(cache.get("k"), (False, None))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_lru_and_byte_limits(self):
+        cache = QueryCache(max_entries=2, clock=self.clock)
+        for key in ("a", "b", "c"):
+            cache.put(key, key)
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertTrue(cache.get("b")[0])
+
+        value = {"events": ["x" * 100]}
+        cache = QueryCache(max_bytes=result_size(value) * 2, clock=self.clock)
+        cache.put("a", value)
+        cache.put("b", value)
+        cache.get("a")
+        cache.put("c", value)
+        # "b" was the least recently used
+        self.assertEqual([cache.get(k)[0] for k in "abc"], [True, False, True])
+        cache.put("huge", "y" * result_size(value) * 3)
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"], stats["oversized"]), (2, 1, 1))
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_discard(self):
+        cache = QueryCache(clock=self.clock)
+        cache.put("a", [1])
+        cache.put("b", [2])
+        cache.discard(["a", "c"])
+        self.assertEqual([cache.get(k)[0] for k in "ab"], [False, True])
+        self.assertEqual(cache.stats()["bytes"], result_size([2]))
+
+    def test_disabled(self):
+        cache = QueryCache(max_entries=0)
+        cache.put("k", 1)
+        self.assertEqual(cache.get("k"), (False, None))
+
+class TestCachedQueries(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        self.start = datetime(2025, 1, 1)
+
+    def insert(self, count, source="google"):
+        database.insert_events([{"timestamp": self.start + timedelta(minutes=i), "utm_source": source}
+                                for i in range(count)])
+
+    def test_served_from_memory_until_new_events(self):
+        self.insert(3)
+        self.assertEqual(database.count_events({"utm_source": "google"}), 3)
+        first = database.get_events(limit=10)
+        with patch.object(self.db["raw_events"], "find", side_effect=AssertionError("queried")), \
+                patch.object(self.db["raw_events"], "count_documents", side_effect=AssertionError("queried")):
+            self.assertEqual(database.count_events({"utm_source": "google"}), 3)
+            self.assertEqual(database.get_events(limit=10), first)
+
+        self.insert(2, source="meta")
+        self.assertEqual(database.count_events({"utm_source": "google"}), 3)
+        self.assertEqual(len(database.get_events(limit=10)), 5)
+        self.assertEqual(sorted(database.get_unique_values("utm_source")), ["google", "meta"])
+
+        stats = database.get_query_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 5))
+
+    def test_one_version_per_write(self):
+        database.insert_event({"utm_source": "google"})
+        self.assertEqual(database.get_data_version(), 1)
+        with patch.object(database, "EVENT_SCHEMA_VERSION", 2):
+            database.insert_event({"utm_source": "google"})
+        self.assertEqual(database.get_data_version(), 2)
+        self.insert(3)
+        self.assertEqual(database.get_data_version(), 3)
+
+    def test_arguments_are_part_of_the_key(self):
+        self.insert(3)
+        self.assertEqual(len(database.get_events(limit=2)), 2)
+        self.assertEqual(len(database.get_events(limit=3)), 3)
+        self.assertEqual(database.count_events({"timestamp": {"$gte": self.start + timedelta(minutes=1)}}), 2)
+        self.assertEqual(database.count_events({"timestamp": {"$gte": self.start + timedelta(minutes=2)}}), 1)
+
+    def test_stats_in_health(self):
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            response = app.test_client().get('/api/health')
+        for cache in ("query_cache", "click_id_cache", "funnel_cache"):
+            self.assertIn("hit_rate", response.json[cache])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+from unittest.mock import patch
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import rate_limiter
+from src.config import TRACK_BATCH_MAX_EVENTS
+from src.rate_limiter import TokenBucketLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = TokenBucketLimiter(rate=2, burst=4, max_keys=64, shards=4, clock=self.clock)
+
+    def test_burst_then_refill(self):
+        results = [self.limiter.hit("1.2.3.4")[0] for _ in range(5)]
+        self.assertEqual(results, [False] * 4 + [True])
+        limited, remaining, reset_after = self.limiter.hit("1.2.3.4")
+        self.assertTrue(limited)
+        self.assertAlmostEqual(reset_after, 0.5)
+
+        self.clock.now += 1  # two tokens back
+        self.assertEqual([self.limiter.hit("1.2.3.4")[0] for _ in range(3)], [False, False, True])
+        # Other keys are independent
+        self.assertFalse(self.limiter.hit("5.6.7.8")[0])
+
+    def test_cost_above_burst_leaves_debt(self):
+        # Only admitted from a full bucket
+        self.limiter.hit("1.2.3.4")
+        limited, _, reset_after = self.limiter.hit("1.2.3.4", cost=10)
+        self.assertTrue(limited)
+        self.assertAlmostEqual(reset_after, 0.5)
+
+        self.clock.now += 0.5
+        limited, remaining, _ = self.limiter.hit("1.2.3.4", cost=10)
+        self.assertFalse(limited)
+        self.assertEqual(remaining, 0)
+        self.assertAlmostEqual(self.limiter.peek("1.2.3.4"), -6)
+        # The debt is paid back before the next request: 7 tokens at 2 per second
+        limited, _, reset_after = self.limiter.hit("1.2.3.4")
+        self.assertTrue(limited)
+        self.assertAlmostEqual(reset_after, 3.5)
+        self.clock.now += 3
+        self.assertTrue(self.limiter.hit("1.2.3.4")[0])
+        self.clock.now += 0.5
+        self.assertFalse(self.limiter.hit("1.2.3.4")[0])
+
+    def test_idle_buckets_are_evicted(self):
+        # One shard: idle buckets are dropped lazily, by hits on their own shard
+        limiter = TokenBucketLimiter(rate=2, burst=4, max_keys=64, shards=1, clock=self.clock)
+        for i in range(10):
+            limiter.hit(f"10.0.0.{i}")
+        self.assertEqual(len(limiter), 10)
+        self.clock.now += 2  # burst / rate: every bucket is full again
+        for i in range(10):
+            limiter.hit(f"10.0.2.{i}")
+        self.assertEqual(len(limiter), 10)
+
+    def test_key_cap(self):
+        for i in range(10000):
+            self.limiter.hit(f"ip-{i}")
+        self.assertLessEqual(len(self.limiter), 64)
+
+    def test_concurrent_hits_share_one_bucket(self):
+        limiter = TokenBucketLimiter(rate=0.001, burst=100)
+        allowed = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(50):
+                if not limiter.hit("shared")[0]:
+                    with lock:
+                        allowed.append(1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(allowed), 100)
+
+    def test_constant_time_with_many_keys(self):
+        limiter = TokenBucketLimiter(rate=20, burst=20, max_keys=20000)
+        start = time.perf_counter()
+        for i in range(50000):
+            limiter.hit(f"192.168.{i // 256 % 256}.{i % 256}-{i}")
+        elapsed = time.perf_counter() - start
+        self.assertLessEqual(len(limiter), 20000)
+        self.assertLess(elapsed, 5)
+
+class TestRouteLimits(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.clock = FakeClock()
+        limits = {
+            "track": TokenBucketLimiter(rate=1, burst=3, clock=self.clock),
+            "api": TokenBucketLimiter(rate=1, burst=2, clock=self.clock),
+            "ask": TokenBucketLimiter(rate=1, burst=1, clock=self.clock),
+        }
+        patcher = patch.object(rate_limiter, "LIMITS", limits)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_api_routes_share_a_limit(self):
+        codes = [self.app.get('/api/history').status_code for _ in range(2)]
+        response = self.app.get('/api/health')
+        self.assertEqual(codes, [200, 200])
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+
+    def test_ask_has_its_own_limit(self):
+        with patch("src.blueprints.analysis.llm_service") as llm:
+            llm.analyze_marketing_data.return_value = "answer"
+            first = self.app.post('/api/analysis/ask', json={"query": "hi"})
+            second = self.app.post('/api/analysis/ask', json={"query": "hi"})
+        self.assertNotEqual(first.status_code, 429)
+        self.assertEqual(second.status_code, 429)
+        # The /api budget is untouched
+        self.assertEqual(self.app.get('/api/history').status_code, 200)
+
+    def test_track_limit(self):
+        params = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "spring"}
+        with patch("src.blueprints.tracking.store_event", return_value="id"):
+            codes = [self.app.get('/track', query_string=params).status_code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+
+    def test_track_batch_costs_one_token_per_event(self):
+        ip = {"REMOTE_ADDR": "10.1.1.1"}
+        event = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "spring"}
+        batch = [event] * TRACK_BATCH_MAX_EVENTS
+        with patch("src.blueprints.tracking.store_events", side_effect=lambda events: ["id"] * len(events)), \
+             patch("src.blueprints.tracking.store_event", return_value="id"):
+            self.assertEqual(self.app.post('/track/batch', json=batch, environ_base=ip).status_code, 200)
+            # The bucket is as drained as after 100 /track calls: 3 from the burst, 97 on credit
+            self.assertAlmostEqual(rate_limiter.LIMITS["track"].peek("10.1.1.1"), 3 - TRACK_BATCH_MAX_EVENTS)
+            response = self.app.get('/track', query_string=event, environ_base=ip)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(self.app.post('/track/batch', json=[event], environ_base=ip).status_code, 429)
+            self.clock.now += TRACK_BATCH_MAX_EVENTS - 3
+            self.assertEqual(self.app.get('/track', query_string=event, environ_base=ip).status_code, 429)
+            self.clock.now += 1
+            self.assertEqual(self.app.get('/track', query_string=event, environ_base=ip).status_code, 200)
+
+    def test_oversized_batch_is_not_charged(self):
+        event = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "spring"}
+        response = self.app.post('/track/batch', json=[event] * (TRACK_BATCH_MAX_EVENTS + 1))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(rate_limiter.LIMITS["track"].peek("127.0.0.1"), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src import rollups, track_handler
+from src.analysis.llm_preprocessor import aggregate_campaign_performance
+from tests.helpers import use_database
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+
+        now = datetime.utcnow()
+        self.events = [
+            {"timestamp": now - timedelta(hours=i), "host": "www.example.com",
+             "utm_source": ["google", "meta"][i % 2], "utm_medium": "cpc", "utm_campaign": f"c{i % 3}",
+             "platform_detected": "Google Ads", "event_type": "conversion" if i % 4 == 0 else "page_view",
+             **({"conversion_value": 25.0} if i % 4 == 0 else {})}
+            for i in range(40)
+        ]
+
+    def rollup_docs(self, name):
+        docs = [{k: v for k, v in d.items() if k != "_id"} for d in self.db[name].find()]
+        return sorted(docs, key=lambda d: (d["bucket"], d["utm_source"], d["utm_campaign"], d["event_type"]))
+
+    def test_ingest_increments_rollups(self):
+        track_handler.write_events(self.events[:25])
+        track_handler.write_events(self.events[25:])
+
+        daily = self.rollup_docs(rollups.DAILY)
+        self.assertEqual(sum(d["events"] for d in daily), 40)
+        self.assertEqual(sum(d["conversions"] for d in daily), 10)
+        self.assertEqual(sum(d["revenue"] for d in daily), 250.0)
+        self.assertEqual(sum(d["events"] for d in self.rollup_docs(rollups.HOURLY)), 40)
+        # One document per key, however many batches touched it
+        self.assertLess(len(daily), 40)
+
+    def test_replayed_events_are_not_counted_twice(self):
+        track_handler.write_events(self.events[:30])
+        track_handler.replay_events(self.events)
+        self.assertEqual(sum(d["events"] for d in self.rollup_docs(rollups.DAILY)), 40)
+
+    def test_backfill_matches_ingest(self):
+        track_handler.write_events(self.events)
+        ingested = {name: self.rollup_docs(name) for name in (rollups.HOURLY, rollups.DAILY)}
+
+        now = datetime.utcnow()
+        total = rollups.backfill_rollups(now - timedelta(days=30), now)
+        self.assertEqual(total, 40)
+        for name, docs in ingested.items():
+            self.assertEqual(self.rollup_docs(name), docs)
+
+    def test_campaign_performance_reads_rollups(self):
+        track_handler.write_events(self.events)
+        with patch.object(self.db["raw_events"], "aggregate", side_effect=AssertionError("raw scan")):
+            results = aggregate_campaign_performance(days=30)
+        self.assertEqual(sum(r["clicks"] for r in results), 40)
+        top = results[0]
+        self.assertEqual(top["revenue"], max(r["revenue"] for r in results))
+        self.assertEqual(top["conversion_rate"], top["conversions"] / top["clicks"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import patch
+import json
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+from bson import ObjectId
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, serialization, track_handler
+from src.event_schema import stored_projection
+from tests.helpers import use_database
+
+class TestSerialization(unittest.TestCase):
+    def test_to_json(self):
+        oid = ObjectId()
+        value = {"_id": oid, "timestamp": datetime(2025, 1, 2, 3, 4, 5), "day": date(2025, 1, 2),
+                 "nested": {"ids": [oid, (1, "a")]}, "n": 1.5, "none": None}
+        self.assertEqual(serialization.to_json(value), {
+            "_id": str(oid), "timestamp": "2025-01-02T03:04:05", "day": "2025-01-02",
+            "nested": {"ids": [str(oid), [1, "a"]]}, "n": 1.5, "none": None,
+        })
+
+    def test_dumps_with_and_without_orjson(self):
+        payload = {"_id": ObjectId("0123456789abcdef01234567"), "at": datetime(2025, 1, 2), "s": "é"}
+        expected = {"_id": "0123456789abcdef01234567", "at": "2025-01-02T00:00:00", "s": "é"}
+        self.assertEqual(json.loads(serialization.dumps(payload)), expected)
+        with patch.object(serialization, "HAS_ORJSON", False):
+            encoded = serialization.dumps(payload)
+        self.assertNotIn(b" ", encoded)
+        self.assertEqual(json.loads(encoded), expected)
+
+    def test_stored_projection(self):
+        self.assertEqual(stored_projection(["ip_address", "utm_source"]),
+                         {"v": 1, "ip_address": 1, "ip": 1, "utm_source": 1})
+        self.assertIn("h", stored_projection(["domain"]))
+        self.assertIsNone(stored_projection(["raw_params"]))
+
+class TestFieldProjection(unittest.TestCase):
+    FIELDS = ["timestamp", "utm_source", "ip_address", "current_page", "domain"]
+
+    def setUp(self):
+        self.db = use_database(self)
+        for name in ("ROLLUPS_ENABLED", "SESSIONS_ENABLED", "CLICK_IDS_ENABLED", "FILTER_VALUES_ENABLED"):
+            patcher = patch.object(track_handler, name, False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def event(self, day):
+        return {"timestamp": datetime(2025, 1, day), "host": "book.clinic.com", "domain": "clinic.com",
+                "subdomain": "book", "utm_source": "google", "ip_address": "1.2.3.4",
+                "current_page": "/book", "user_agent": "Mozilla/5.0 " * 20, "session_id": "s1"}
+
+    def ingest(self):
+        database.insert_events([self.event(1)])
+        with patch.object(database, "EVENT_SCHEMA_VERSION", 2):
+            database.insert_events([self.event(2)])
+
+    def test_both_layouts(self):
+        self.ingest()
+        events = database.get_events(fields=self.FIELDS)
+        self.assertEqual(len(events), 2)
+        for event in events:
+            self.assertEqual(set(event), {"_id", *self.FIELDS})
+            self.assertEqual((event["ip_address"], event["current_page"], event["domain"]),
+                             ("1.2.3.4", "/book", "clinic.com"))
+        page = database.get_events_page(fields=["utm_source"])
+        self.assertEqual([set(e) for e in page["events"]], [{"_id", "utm_source"}] * 2)
+
+    def test_api(self):
+        self.ingest()
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            client = app.test_client()
+            full = client.get('/api/events')
+            projected = client.get('/api/events', query_string={"fields": ",".join(self.FIELDS)})
+            offset = client.get('/api/events', query_string={"fields": "utm_source", "page": 1})
+            bad = client.get('/api/events', query_string={"fields": "utm_source,$where"})
+        self.assertEqual(projected.status_code, 200)
+        self.assertEqual(set(projected.json["events"][0]), {"_id", *self.FIELDS})
+        self.assertLess(len(projected.data), len(full.data) / 2)
+        self.assertEqual(set(offset.json["events"][0]), {"_id", "utm_source"})
+        self.assertEqual(bad.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
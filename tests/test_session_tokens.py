@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import track_handler
+from src.session_tokens import SessionTokenSigner
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def __call__(self):
+        return self.now
+
+class TestSessionTokenSigner(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.signer = SessionTokenSigner("secret", 3600, clock=self.clock)
+
+    def test_round_trip_and_timeout(self):
+        token = self.signer.issue("sess_0123456789")
+        self.assertTrue(token.startswith("sess_0123456789."))
+        self.clock.now += 3599
+        self.assertEqual(self.signer.verify(token), "sess_0123456789")
+        self.clock.now += 1
+        self.assertIsNone(self.signer.verify(token))
+
+    def test_other_workers_accept_tokens(self):
+        token = self.signer.issue("sess_0123456789")
+        other_worker = SessionTokenSigner("secret", 3600, clock=self.clock)
+        self.assertEqual(other_worker.verify(token), "sess_0123456789")
+        self.assertIsNone(SessionTokenSigner("other", 3600, clock=self.clock).verify(token))
+
+    def test_tampered_tokens_are_rejected(self):
+        token = self.signer.issue("sess_0123456789")
+        session_id, last_activity, signature = token.split(".")
+        forged = [
+            f"sess_9999999999.{last_activity}.{signature}",
+            f"{session_id}.{last_activity}0.{signature}",
+            f"{session_id}.{last_activity}.{signature[:-1]}",
+            "sess_0123456789",
+            "a.b.c.d",
+            "sess_é.1.x",
+            None,
+        ]
+        for value in forged:
+            self.assertIsNone(self.signer.verify(value), value)
+
+class TestTrackSessions(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.stored = []
+        for target, value in (
+            ('src.blueprints.tracking.store_event', lambda event: self.stored.append(event) or "id"),
+            ('src.blueprints.tracking.store_events', lambda events: self.stored.extend(events) or ["id"] * len(events)),
+            ('src.blueprints.tracking.is_rate_limited', lambda *args: (False, 10, 0)),
+        ):
+            patcher = patch(target, side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.params = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "spring"}
+
+    def test_token_continues_the_session(self):
+        first = self.app.get('/track', query_string=self.params).json
+        # A different worker (no shared memory) continues it from the token alone
+        self.app.delete_cookie(track_handler.SESSION_COOKIE)
+        second = self.app.get('/track', query_string={**self.params, "session_token": first["session_token"]}).json
+        self.assertEqual(self.stored[0]["session_id"], self.stored[1]["session_id"])
+        self.assertTrue(self.stored[0]["session_id"].startswith("sess_"))
+        self.assertNotIn("session_token", self.stored[0])
+        self.assertNotIn("session_token", self.stored[1]["raw_params"])
+        self.assertEqual(self.stored[1]["raw_params"]["utm_source"], "google")
+        self.assertTrue(second["session_token"].startswith(self.stored[0]["session_id"] + "."))
+
+    def test_cookie_continues_the_session(self):
+        self.app.get('/track', query_string=self.params)
+        self.app.get('/track', query_string=self.params)
+        self.assertEqual(self.stored[0]["session_id"], self.stored[1]["session_id"])
+
+    def test_expired_or_unknown_sessions_start_new_ones(self):
+        with patch.object(track_handler._session_tokens, "clock", return_value=1700000000.0):
+            token = self.app.get('/track', query_string=self.params).json["session_token"]
+        self.app.delete_cookie(track_handler.SESSION_COOKIE)
+        self.app.get('/track', query_string={**self.params, "session_token": token})
+        self.app.delete_cookie(track_handler.SESSION_COOKIE)
+        self.app.get('/track', query_string={**self.params, "session_id": "sess_made_up"})
+        session_ids = [event["session_id"] for event in self.stored]
+        self.assertEqual(len(set(session_ids)), 3)
+        self.assertNotIn("sess_made_up", session_ids)
+
+    def test_batch_events_share_a_session(self):
+        response = self.app.post('/track/batch', json=[self.params, self.params, self.params])
+        self.assertEqual(len({event["session_id"] for event in self.stored}), 1)
+        self.assertTrue(response.json["session_token"].startswith(self.stored[0]["session_id"] + "."))
+        # The tracker sends the token from that response with its next batch
+        self.app.delete_cookie(track_handler.SESSION_COOKIE)
+        self.app.post('/track/batch', json=[{**self.params, "session_token": response.json["session_token"]}])
+        self.assertEqual(self.stored[3]["session_id"], self.stored[0]["session_id"])
+        self.assertNotIn("session_token", self.stored[3]["raw_params"])
+
+if __name__ == '__main__':
+    unittest.main()
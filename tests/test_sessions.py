@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import sessions, track_handler
+from src.analysis.llm_preprocessor import aggregate_session_performance
+from tests.helpers import use_database
+
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.db = use_database(self)
+        patcher = patch.object(track_handler, "ROLLUPS_ENABLED", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.start = datetime.utcnow() - timedelta(hours=2)
+        # Session A lands on /pricing from Google, browses and converts; B bounces
+        self.events = [
+            self.event("sess_a", 0, "page_view", current_page="/pricing", utm_source="google", gclid="g-1", sequence_step=1),
+            self.event("sess_a", 1, "click", current_page="/pricing", sequence_step=1),
+            self.event("sess_a", 2, "page_view", current_page="/signup", sequence_step=2),
+            self.event("sess_a", 5, "conversion", current_page="/signup", conversion_value=49.0, sequence_step="3"),
+            self.event("sess_b", 3, "page_view", current_page="/blog", utm_source="meta", fbclid="f-1", sequence_step=1),
+        ]
+
+    def event(self, session_id, minutes, event_type, **fields):
+        return {"session_id": session_id, "timestamp": self.start + timedelta(minutes=minutes),
+                "event_type": event_type, "host": "www.example.com", "utm_medium": "cpc",
+                "utm_campaign": "spring", **fields}
+
+    def test_ingest_maintains_sessions(self):
+        track_handler.write_events(self.events[:2])
+        track_handler.write_events(self.events[2:])
+
+        a = sessions.get_session("sess_a")
+        self.assertEqual(a["first_seen"], self.start)
+        self.assertEqual(a["duration_s"], 300)
+        self.assertEqual(a["entry"]["landing_page"], "/pricing")
+        self.assertEqual(a["entry"]["utm_source"], "google")
+        self.assertEqual(a["entry"]["gclid"], "g-1")
+        self.assertEqual((a["events"], a["page_views"], a["clicks"], a["conversions"]), (4, 2, 1, 1))
+        self.assertEqual(a["conversion_value"], 49.0)
+        self.assertEqual(a["max_sequence_step"], 3)
+        self.assertEqual(self.db[sessions.SESSIONS].count_documents({}), 2)
+
+    def test_out_of_order_batches_keep_the_first_event_as_entry(self):
+        track_handler.write_events(self.events[2:4])
+        track_handler.write_events(self.events[:2])
+        a = sessions.get_session("sess_a")
+        self.assertEqual(a["entry"]["landing_page"], "/pricing")
+        self.assertEqual(a["entry"]["utm_source"], "google")
+        self.assertEqual(a["first_seen"], self.start)
+        self.assertEqual(a["last_seen"], self.start + timedelta(minutes=5))
+
+    def test_replayed_events_are_not_counted_twice(self):
+        track_handler.write_events(self.events[:3])
+        track_handler.replay_events(self.events)
+        self.assertEqual(sessions.get_session("sess_a")["events"], 4)
+
+    def test_reports_read_sessions_not_raw_events(self):
+        track_handler.write_events(self.events)
+        with patch.object(self.db["raw_events"], "aggregate", side_effect=AssertionError("raw scan")):
+            summary = aggregate_session_performance(days=1)
+        self.assertEqual(summary["sessions"], 2)
+        self.assertEqual(summary["pages_per_session"], 1.5)
+        self.assertEqual(summary["bounce_rate"], 0.5)
+        self.assertEqual(summary["conversion_rate"], 0.5)
+        self.assertEqual(summary["avg_duration_s"], 150)
+        pricing = next(p for p in summary["landing_pages"] if p["landing_page"] == "/pricing")
+        self.assertEqual((pricing["sessions"], pricing["conversion_value"]), (1, 49.0))
+
+    def test_rebuild_matches_ingest(self):
+        track_handler.write_events(self.events)
+        ingested = sorted(self.db[sessions.SESSIONS].find(), key=lambda s: s["_id"])
+        self.db[sessions.SESSIONS].delete_many({})
+
+        # Only sess_b has events in this window, but sess_a is rebuilt from all of its events too
+        total = sessions.rebuild_sessions(self.start, self.start + timedelta(minutes=10))
+        self.assertEqual(total, 2)
+        self.assertEqual(sorted(self.db[sessions.SESSIONS].find(), key=lambda s: s["_id"]), ingested)
+
+    def test_api(self):
+        track_handler.write_events(self.events)
+        client = app.test_client()
+        with patch("src.blueprints.api.rate_limit_exceeded", return_value=None):
+            session = client.get('/api/sessions/sess_a').json["session"]
+            missing = client.get('/api/sessions/sess_missing')
+            summary = client.get('/api/sessions/summary', query_string={"utm_source": "meta"}).json
+        self.assertEqual(session["entry"]["landing_page"], "/pricing")
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(summary["summary"]["sessions"], 1)
+        self.assertEqual(summary["landing_pages"][0]["landing_page"], "/blog")
+
+if __name__ == '__main__':
+    unittest.main()
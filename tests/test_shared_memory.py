@@ -0,0 +1,111 @@
+import unittest
+import multiprocessing
+import sys
+import tempfile
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.shared_memory import SharedCounters, SharedTokenBucketLimiter, is_supported
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def hammer(path, key, attempts, results):
+    """Worker process: count how many requests one key gets through."""
+    limiter = SharedTokenBucketLimiter(rate=0.001, burst=50, path=path, slots=1024)
+    results.put(sum(not limiter.hit(key)[0] for _ in range(attempts)))
+
+def count(path, names, times):
+    counters = SharedCounters(path, names)
+    for _ in range(times):
+        counters.add("requests")
+
+@unittest.skipUnless(is_supported(), "shared-memory tables need fcntl")
+class TestSharedMemory(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+        self.clock = FakeClock()
+
+    def limiter(self, **kwargs):
+        options = dict(rate=2, burst=4, path=self.dir / "limits.bin", slots=256, clock=self.clock)
+        options.update(kwargs)
+        limiter = SharedTokenBucketLimiter(**options)
+        self.addCleanup(limiter.close)
+        return limiter
+
+    def test_token_bucket(self):
+        limiter = self.limiter()
+        self.assertEqual([limiter.hit("1.2.3.4")[0] for _ in range(5)], [False] * 4 + [True])
+        self.clock.now += 1
+        self.assertEqual([limiter.hit("1.2.3.4")[0] for _ in range(3)], [False, False, True])
+        self.assertFalse(limiter.hit("5.6.7.8")[0])
+        self.assertEqual(len(limiter), 2)
+
+    def test_cost_above_burst_leaves_debt(self):
+        limiter = self.limiter()
+        self.assertEqual(limiter.hit("1.2.3.4", cost=10)[:2], (False, 0))
+        limited, _, reset_after = limiter.hit("1.2.3.4")
+        self.assertTrue(limited)
+        self.assertAlmostEqual(reset_after, 3.5)
+        # Still counted while in debt, even after the plain idle time (burst / rate)
+        self.clock.now += 2
+        self.assertEqual(len(limiter), 1)
+        self.clock.now += 1.5
+        self.assertFalse(limiter.hit("1.2.3.4")[0])
+
+    def test_workers_share_buckets(self):
+        worker_a, worker_b = self.limiter(), self.limiter()
+        results = [worker.hit("1.2.3.4")[0] for _ in range(3) for worker in (worker_a, worker_b)]
+        self.assertEqual(results, [False] * 4 + [True] * 2)
+        self.assertEqual(worker_b.peek("1.2.3.4"), 0)
+
+    def test_full_table_evicts_least_recently_used(self):
+        limiter = self.limiter(slots=16, group_size=4)
+        for i in range(1000):
+            self.clock.now += 0.001
+            limiter.hit(f"ip-{i}")
+        self.assertLessEqual(len(limiter), 16)
+        # A key that was just used is still tracked
+        limiter.hit("ip-999")
+        self.assertLess(limiter.peek("ip-999"), 3)
+
+    def test_one_limit_across_processes(self):
+        context = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+        results = context.Queue()
+        path = self.dir / "shared.bin"
+        processes = [context.Process(target=hammer, args=(path, "9.9.9.9", 40, results)) for _ in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join(30)
+        self.assertEqual(sum(results.get(timeout=5) for _ in processes), 50)
+
+    def test_counters_across_processes(self):
+        context = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+        path = self.dir / "counters.bin"
+        names = ["requests", "errors"]
+        processes = [context.Process(target=count, args=(path, names, 500)) for _ in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join(30)
+        counters = SharedCounters(path, names)
+        self.addCleanup(counters.close)
+        self.assertEqual(counters.snapshot(), {"requests": 2000, "errors": 0})
+
+    def test_layout_change_resets_the_table(self):
+        limiter = self.limiter()
+        limiter.hit("1.2.3.4")
+        resized = self.limiter(slots=512)
+        self.assertEqual(resized.peek("1.2.3.4"), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+from src import database, track_handler
+from src.config import RAW_EVENTS_TIMESERIES_COLLECTION as TS
+from src.mock_db import MockDatabase
+from src.timeseries import migrate_to_timeseries
+
+def make_events(count, start=datetime(2025, 3, 1)):
+    return [
+        {"timestamp": start + timedelta(hours=i), "host": ["a.example.com", "b.example.com"][i % 2],
+         "platform_detected": "Google Ads", "utm_source": "google" if i % 3 else "meta",
+         "event_type": "page_view", "raw_params": {"utm_source": "google" if i % 3 else "meta"}}
+        for i in range(count)
+    ]
+
+class TestTimeseriesStorage(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.db = MockDatabase()
+        for name, value in (("_mock_db", self.db), ("_db", None), ("_timeseries_ready", False),
+                            ("RAW_EVENTS_TIMESERIES", True)):
+            patcher = patch.object(database, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(track_handler, "ROLLUPS_ENABLED", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_events_are_written_to_the_timeseries_collection(self):
+        track_handler.write_events(make_events(10))
+
+        options = self.db.collection_options[TS]["timeseries"]
+        self.assertEqual((options["timeField"], options["metaField"]), ("timestamp", "meta"))
+        self.assertEqual(self.db["raw_events"].count_documents({}), 0)
+        stored = self.db[TS].find_one({"host": "b.example.com"})
+        self.assertEqual(stored["meta"], {"site": "b.example.com", "platform": "Google Ads"})
+
+    def test_replayed_events_are_not_duplicated(self):
+        events = make_events(10)
+        track_handler.write_events(events[:6])
+        track_handler.replay_events(events)
+        self.assertEqual(self.db[TS].count_documents({}), 10)
+
+    def test_readers_work_unchanged(self):
+        track_handler.write_events(make_events(12))
+
+        self.assertEqual(database.count_events({"utm_source": "meta"}), 4)
+        events = database.get_events(limit=5)
+        self.assertEqual(len(events), 5)
+        self.assertNotIn("meta", events[0])
+        self.assertEqual(events[0]["timestamp"], datetime(2025, 3, 1, 11).isoformat())
+
+        data = self.app.get('/api/events?limit=5&count=exact').get_json()
+        self.assertEqual(data["pagination"]["total"], 12)
+        second = self.app.get('/api/events', query_string={
+            "limit": 5, "cursor": data["pagination"]["next_cursor"]}).get_json()
+        self.assertEqual(second["events"][0]["timestamp"], datetime(2025, 3, 1, 6).isoformat())
+
+    def test_index_sync_creates_the_timeseries_collection(self):
+        report = database.create_indexes()
+        self.assertIn(TS, report)
+        self.assertIn("timeseries", self.db.collection_options[TS])
+        with patch.object(database, "RAW_EVENTS_TIMESERIES", False):
+            self.assertNotIn(TS, database.create_indexes())
+
+class TestTimeseriesMigration(unittest.TestCase):
+    def setUp(self):
+        self.db = MockDatabase()
+        self.source = self.db["raw_events"]
+        self.source.create_index([("timestamp", -1), ("_id", -1)])
+        # 3 days of hourly events, plus one that cannot go into a time-series collection
+        self.source.insert_many(make_events(72) + [{"timestamp": "not a date", "host": "a.example.com"}])
+
+    def migrate(self):
+        return migrate_to_timeseries(self.db, "raw_events", TS, chunk=timedelta(hours=12), workers=3, batch_size=7)
+
+    def test_parallel_migration_copies_every_event(self):
+        stats = self.migrate()
+        self.assertEqual(stats["chunks"], 6)
+        self.assertEqual(stats["copied"], 72)
+        self.assertEqual(stats["skipped"], 1)
+        self.assertIn("timeseries", self.db.collection_options[TS])
+
+        copied = {d["_id"]: d for d in self.db[TS].find()}
+        for event in self.source.find({"timestamp": {"$type": "date"}}):
+            self.assertEqual({k: v for k, v in copied[event["_id"]].items() if k != "meta"}, event)
+
+    def test_migration_resumes_and_picks_up_new_events(self):
+        self.migrate()
+        self.source.insert_many(make_events(2, start=datetime(2025, 3, 3, 23, 30)))
+
+        stats = self.migrate()
+        # Finished chunks are skipped; the newest one is copied again
+        self.assertEqual(stats["resumed"], 5)
+        self.assertEqual(stats["copied"], 2)
+        self.assertEqual(stats["duplicates"], 12)
+        self.assertEqual(self.db[TS].count_documents({}), 74)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from unittest.mock import patch, MagicMock
 import sys
 from pathlib import Path
 import json
+from datetime import datetime, timedelta
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -50,5 +51,57 @@ class TestTrackingJSON(unittest.TestCase):
             self.assertEqual(event_data['sequence_step'], 2)
             self.assertEqual(event_data['screen_resolution'], '1920x1080')
 
+    @patch('src.blueprints.tracking.store_events')
+    def test_track_batch_payload(self, mock_store):
+        mock_store.return_value = ["a1", "a2"]
+        
+        with patch('src.blueprints.tracking.get_client_ip', return_value='127.0.0.1'), \
+             patch('src.blueprints.tracking.is_rate_limited', return_value=(False, 10, 0)):
+            
+            base = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "summer_sale"}
+            payload = [
+                {**base, "event_type": "page_view", "current_page": "/"},
+                {"utm_source": "google"},
+                {**base, "event_type": "click", "element_id": "signup-btn"}
+            ]
+            
+            response = self.app.post('/track/batch', json=payload)
+            
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['accepted'], 2)
+            self.assertEqual(response.json['rejected'][0]['index'], 1)
+            
+            # Both valid events go to storage in a single call
+            events = mock_store.call_args[0][0]
+            self.assertEqual([e['event_type'] for e in events], ['page_view', 'click'])
+            self.assertEqual(events[1]['element_id'], 'signup-btn')
+
+    @patch('src.blueprints.tracking.store_events')
+    def test_track_batch_keeps_client_timestamps(self, mock_store):
+        mock_store.return_value = ["a1", "a2", "a3"]
+        now = datetime.utcnow()
+        base = {"utm_source": "google", "utm_medium": "cpc", "utm_campaign": "summer_sale"}
+        payload = [
+            {**base, "timestamp": (now - timedelta(seconds=4)).isoformat() + "Z"},
+            {**base, "timestamp": (now - timedelta(seconds=2)).isoformat() + "Z"},
+            # A client clock a day off is not trusted
+            {**base, "timestamp": (now - timedelta(days=1)).isoformat() + "Z"},
+        ]
+        with patch('src.blueprints.tracking.get_client_ip', return_value='127.0.0.1'):
+            response = self.app.post('/track/batch', json=payload)
+        
+        self.assertEqual(response.status_code, 200)
+        events = mock_store.call_args[0][0]
+        self.assertEqual(events[0]["timestamp"], now - timedelta(seconds=4))
+        self.assertEqual(events[1]["timestamp"], now - timedelta(seconds=2))
+        self.assertEqual(events[2]["timestamp"], events[2]["created_at"])
+        self.assertGreaterEqual(events[2]["timestamp"], now)
+
+    def test_track_batch_rejects_non_list(self):
+        with patch('src.blueprints.tracking.get_client_ip', return_value='127.0.0.1'), \
+             patch('src.blueprints.tracking.is_rate_limited', return_value=(False, 10, 0)):
+            response = self.app.post('/track/batch', json={"utm_source": "google"})
+            self.assertEqual(response.status_code, 400)
+
 if __name__ == '__main__':
     unittest.main()